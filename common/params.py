@@ -51,6 +51,7 @@ class UnknownKeyName(Exception):
 keys = {
   "AccessToken": [TxType.CLEAR_ON_MANAGER_START],
   "AthenadPid": [TxType.PERSISTENT],
+  "AthenadUploadQueue": [TxType.PERSISTENT],
   "CalibrationParams": [TxType.PERSISTENT],
   "CarParams": [TxType.CLEAR_ON_MANAGER_START, TxType.CLEAR_ON_PANDA_DISCONNECT],
   "CarParamsCache": [TxType.CLEAR_ON_MANAGER_START, TxType.CLEAR_ON_PANDA_DISCONNECT],
@@ -345,8 +346,9 @@ def write_db(params_path, key, value):
     lock.release()
 
 class Params():
-  def __init__(self, db=PARAMS):
-    self.db = db
+  def __init__(self, db=None):
+    # PARAMS_PATH is also what the C++ params implementation honors
+    self.db = db if db is not None else os.getenv("PARAMS_PATH", PARAMS)
 
     # create the database if it doesn't exist...
     if not os.path.exists(self.db+"/d"):
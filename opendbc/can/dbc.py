@@ -1,8 +1,11 @@
 import re
 import os
-import struct
 import sys
+import pickle
+import struct
+import hashlib
 import numbers
+import tempfile
 from collections import namedtuple, defaultdict
 
 def int_or_float(s):
@@ -16,99 +19,121 @@ DBCSignal = namedtuple(
   "DBCSignal", ["name", "start_bit", "size", "is_little_endian", "is_signed",
                 "factor", "offset", "tmin", "tmax", "units"])
 
+# bump when the parse output changes, so old cache entries aren't used
+DBC_CACHE_VERSION = 1
+DBC_CACHE_DIR = os.getenv("DBC_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "opendbc"))
 
-class dbc():
-  def __init__(self, fn):
-    self.name, _ = os.path.splitext(os.path.basename(fn))
-    with open(fn, encoding="ascii") as f:
-      self.txt = f.readlines()
-    self._warned_addresses = set()
+# regexps from https://github.com/ebroecker/canmatrix/blob/master/canmatrix/importdbc.py, matched
+# over the whole file at once. The multiplexed and plain SG_ forms are one expression, and none
+# of the patterns can run past the end of a line. The last alternative catches malformed lines.
+_DBC_RE = re.compile(
+  r"^\s*(?:"
+  r"BO_ (\w+) (\w+) *: (\w+) (\w+)"
+  r"|SG_ (\w+)(?: (\w+))? *: (\d+)\|(\d+)@(\d+)([\+|\-]) \(([0-9.+\-eE]+),([0-9.+\-eE]+)\) "
+  r"\[([0-9.+\-eE]+)\|([0-9.+\-eE]+)\] \"(.*)\" (.*)"
+  r"|VAL_ (\w+) (\w+) ([^\S\n]*[-+]?[0-9]+[^\S\n]+\".+?\"[^;\n]*)"
+  r"|(BO_|SG_|VAL_) (.*))", re.M)
 
-    # regexps from https://github.com/ebroecker/canmatrix/blob/master/canmatrix/importdbc.py
-    bo_regexp = re.compile(r"^BO\_ (\w+) (\w+) *: (\w+) (\w+)")
-    sg_regexp = re.compile(r"^SG\_ (\w+) : (\d+)\|(\d+)@(\d+)([\+|\-]) \(([0-9.+\-eE]+),([0-9.+\-eE]+)\) \[([0-9.+\-eE]+)\|([0-9.+\-eE]+)\] \"(.*)\" (.*)")
-    sgm_regexp = re.compile(r"^SG\_ (\w+) (\w+) *: (\d+)\|(\d+)@(\d+)([\+|\-]) \(([0-9.+\-eE]+),([0-9.+\-eE]+)\) \[([0-9.+\-eE]+)\|([0-9.+\-eE]+)\] \"(.*)\" (.*)")
-    val_regexp = re.compile(r"VAL\_ (\w+) (\w+) (\s*[-+]?[0-9]+\s+\".+?\"[^;]*)")
+_parse_cache = {}
 
-    # A dictionary which maps message ids to tuples ((name, size), signals).
-    #   name is the ASCII name of the message.
-    #   size is the size of the message in bytes.
-    #   signals is a list signals contained in the message.
-    # signals is a list of DBCSignal in order of increasing start_bit.
-    self.msgs = {}
 
-    # A dictionary which maps message ids to a list of tuples (signal name, definition value pairs)
-    self.def_vals = defaultdict(list)
+class _Numbers(dict):
+  # memoized int_or_float, the same few factors and limits are used all over a DBC
+  def __missing__(self, s):
+    n = self[s] = int_or_float(s)
+    return n
 
-    # lookup to bit reverse each byte
-    self.bits_index = [(i & ~0b111) + ((-i-1) & 0b111) for i in range(64)]
 
-    for l in self.txt:
-      l = l.strip()
+def parse_dbc(txt, name=""):
+  """Parses DBC text into (msgs, def_vals), see dbc for their layout"""
+  msgs = {}
+  def_vals = defaultdict(list)
+  num = _Numbers()
+  new_signal = tuple.__new__
+
+  sigs = None
+  for m in _DBC_RE.finditer(txt):
+    (bo_id, bo_name, bo_size, _, sg_name, sg_mux, start_bit, size, endian, sign, factor, offset,
+     tmin, tmax, units, _, val_id, val_name, val_defs, bad, bad_rest) = m.groups()
 
-      if l.startswith("BO_ "):
-        # new group
-        dat = bo_regexp.match(l)
+    if sg_name is not None:
+      sigs.append(new_signal(DBCSignal, (sg_name, int(start_bit), int(size), endian == "1", sign == "-",
+                                         num[factor], num[offset], num[tmin], num[tmax], units)))
 
-        if dat is None:
-          print("bad BO {0}".format(l))
+    elif bo_id is not None:
+      ids = int(bo_id, 0)  # could be hex
+      if ids in msgs:
+        sys.exit("Duplicate address detected %d %s" % (ids, name))
+      sigs = []
+      msgs[ids] = ((bo_name, int(bo_size)), sigs)
 
-        name = dat.group(2)
-        size = int(dat.group(3))
-        ids = int(dat.group(1), 0)  # could be hex
-        if ids in self.msgs:
-          sys.exit("Duplicate address detected %d %s" % (ids, self.name))
+    elif val_id is not None:
+      defvals = val_defs.replace("?", r"\?")  # escape sequence in C++
+      defvals = defvals.split('"')[:-1]
 
-        self.msgs[ids] = ((name, size), [])
+      # convert strings to UPPER_CASE_WITH_UNDERSCORES
+      defvals[1::2] = [d.strip().upper().replace(" ", "_") for d in defvals[1::2]]
+      defvals = '"'+"".join(str(i) for i in defvals)+'"'
 
-      if l.startswith("SG_ "):
-        # new signal
-        dat = sg_regexp.match(l)
-        go = 0
-        if dat is None:
-          dat = sgm_regexp.match(l)
-          go = 1
+      def_vals[int(val_id, 0)].append((val_name, defvals))
 
-        if dat is None:
-          print("bad SG {0}".format(l))
+    else:
+      raise ValueError("bad %s %s" % (bad, bad_rest))
 
-        sgname = dat.group(1)
-        start_bit = int(dat.group(go + 2))
-        signal_size = int(dat.group(go + 3))
-        is_little_endian = int(dat.group(go + 4)) == 1
-        is_signed = dat.group(go + 5) == '-'
-        factor = int_or_float(dat.group(go + 6))
-        offset = int_or_float(dat.group(go + 7))
-        tmin = int_or_float(dat.group(go + 8))
-        tmax = int_or_float(dat.group(go + 9))
-        units = dat.group(go + 10)
+  for msg in msgs.values():
+    msg[1].sort(key=lambda x: x.start_bit)
 
-        self.msgs[ids][1].append(
-          DBCSignal(sgname, start_bit, signal_size, is_little_endian,
-                    is_signed, factor, offset, tmin, tmax, units))
+  return msgs, def_vals
 
-      if l.startswith("VAL_ "):
-        # new signal value/definition
-        dat = val_regexp.match(l)
 
-        if dat is None:
-          print("bad VAL {0}".format(l))
+def load_dbc(txt, name="", cache_dir=DBC_CACHE_DIR):
+  """parse_dbc with the results kept in memory and in cache_dir, keyed by the hash
+  of the DBC text. Returns copies, so changing them doesn't change the cache."""
+  key = hashlib.sha1(b"%d\0%s" % (DBC_CACHE_VERSION, txt.encode())).hexdigest()
+  ret = _parse_cache.get(key)
 
-        ids = int(dat.group(1), 0)  # could be hex
-        sgname = dat.group(2)
-        defvals = dat.group(3)
+  if ret is None and cache_dir is not None:
+    try:
+      with open(os.path.join(cache_dir, key + ".pkl"), "rb") as f:
+        ret = pickle.load(f)
+    except Exception:
+      ret = None
 
-        defvals = defvals.replace("?", r"\?")  # escape sequence in C++
-        defvals = defvals.split('"')[:-1]
+  if ret is None:
+    ret = parse_dbc(txt, name)
+    if cache_dir is not None:
+      try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as f:
+          pickle.dump(ret, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f.name, os.path.join(cache_dir, key + ".pkl"))
+      except OSError:
+        pass
 
-        # convert strings to UPPER_CASE_WITH_UNDERSCORES
-        defvals[1::2] = [d.strip().upper().replace(" ", "_") for d in defvals[1::2]]
-        defvals = '"'+"".join(str(i) for i in defvals)+'"'
+  _parse_cache[key] = ret
+  msgs, def_vals = ret
+  return {a: (m[0], list(m[1])) for a, m in msgs.items()}, defaultdict(list, {a: list(v) for a, v in def_vals.items()})
 
-        self.def_vals[ids].append((sgname, defvals))
 
-    for msg in self.msgs.values():
-      msg[1].sort(key=lambda x: x.start_bit)
+class dbc():
+  def __init__(self, fn, cache_dir=DBC_CACHE_DIR):
+    self.name, _ = os.path.splitext(os.path.basename(fn))
+    with open(fn, encoding="ascii") as f:
+      txt = f.read()
+    self.txt = txt.splitlines(True)
+    self._warned_addresses = set()
+
+    # msgs is a dictionary which maps message ids to tuples ((name, size), signals).
+    #   name is the ASCII name of the message.
+    #   size is the size of the message in bytes.
+    #   signals is a list signals contained in the message.
+    # signals is a list of DBCSignal in order of increasing start_bit.
+    #
+    # def_vals is a dictionary which maps message ids to a list of tuples (signal name, definition value pairs)
+    self.msgs, self.def_vals = load_dbc(txt, self.name, cache_dir)
+
+    # lookup to bit reverse each byte
+    self.bits_index = [(i & ~0b111) + ((-i-1) & 0b111) for i in range(64)]
 
     self.msg_name_to_address = {}
     for address, m in self.msgs.items():
@@ -0,0 +1,70 @@
+import os
+import math
+
+from opendbc import DBC_PATH
+from opendbc.can.dbc import dbc
+
+
+def _c_round(x):
+  # round() of C, halfway cases away from zero, as CANPacker rounds
+  return int(math.floor(x + 0.5)) if x >= 0 else -int(math.floor(-x + 0.5))
+
+
+def _signal_bits(sig):
+  """Bit positions of a signal from its lsb up, numbered like bits of the frame read as a little endian int"""
+  if sig.is_little_endian:
+    return list(range(sig.start_bit, sig.start_bit + sig.size))
+  bits, bit = [], sig.start_bit
+  for _ in range(sig.size):
+    bits.append(bit)
+    bit = bit + 15 if bit % 8 == 0 else bit - 1
+  return bits[::-1]
+
+
+class MessagePatcher():
+  """Packs a CAN message by patching signals into the bytes of a received one.
+
+  A frame is handled as an int, the bytes read little endian. mirror keeps the
+  signals in keep of a received frame and zeroes the rest, patching then
+  gives what CANPacker.make_can_msg gives for the parsed values of keep with
+  the patched ones changed, without going through the values of every signal.
+  """
+  def __init__(self, dbc_name, name, keep=None):
+    msgs = dbc(os.path.join(DBC_PATH, dbc_name + ".dbc"))
+    self.address = msgs.msg_name_to_address[name]
+    (_, self.size), signals = msgs.msgs[self.address]
+
+    # name -> (mask, shift, factor, offset, bits), shift is None for big endian signals,
+    # which are written bit by bit
+    self.signals = {}
+    self.keep_mask = 0
+    for sig in signals:
+      bits = _signal_bits(sig)
+      mask = sum(1 << b for b in bits)
+      contiguous = bits == list(range(bits[0], bits[0] + sig.size))
+      self.signals[sig.name] = (mask, bits[0] if contiguous else None, sig.factor, sig.offset, bits)
+      if keep is None or sig.name in keep:
+        self.keep_mask |= mask
+
+  def mirror(self, dat):
+    return int.from_bytes(dat[:self.size], 'little') & self.keep_mask
+
+  def set(self, x, name, value):
+    """x with signal name set to value"""
+    if name not in self.signals:
+      # left out like CANPacker does
+      return x
+    mask, shift, factor, offset, bits = self.signals[name]
+    ival = _c_round((value - offset) / factor)
+    if shift is not None:
+      return (x & ~mask) | ((ival << shift) & mask)
+    x &= ~mask
+    for i, b in enumerate(bits):
+      x |= ((ival >> i) & 1) << b
+    return x
+
+  def to_bytes(self, x):
+    return x.to_bytes(self.size, 'little')
+
+  def make_can_msg(self, x, bus):
+    return [self.address, 0, self.to_bytes(x), bus]
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# Loads every DBC in opendbc with the legacy line parser, parse_dbc, and dbc()
+# with a cold, on-disk and in-memory cache, and prints the time per DBC.
+import time
+import shutil
+import tempfile
+
+import opendbc.can.dbc as dbc_module
+from opendbc.can.tests.test_dbc import ALL_DBCS, legacy_parse
+
+
+def bench(name, f, n=3):
+  times = []
+  for _ in range(n):
+    t = time.perf_counter()
+    f()
+    times.append(time.perf_counter() - t)
+  print("%-12s %8.3f ms/dbc" % (name, min(times) * 1e3 / len(ALL_DBCS)))
+
+
+if __name__ == "__main__":
+  txts = []
+  for fn in ALL_DBCS:
+    with open(fn, encoding="ascii") as f:
+      txts.append(f.read())
+  print("%d DBCs, %d lines" % (len(ALL_DBCS), sum(t.count("\n") for t in txts)))
+
+  cache_dir = tempfile.mkdtemp()
+  try:
+    def cold():
+      shutil.rmtree(cache_dir)
+      dbc_module._parse_cache.clear()
+      for fn in ALL_DBCS:
+        dbc_module.dbc(fn, cache_dir=cache_dir)
+
+    def disk():
+      dbc_module._parse_cache.clear()
+      for fn in ALL_DBCS:
+        dbc_module.dbc(fn, cache_dir=cache_dir)
+
+    bench("legacy", lambda: [legacy_parse(t.splitlines()) for t in txts])
+    bench("parse_dbc", lambda: [dbc_module.parse_dbc(t) for t in txts])
+    bench("dbc cold", cold)
+    bench("dbc disk", disk)
+    bench("dbc memory", lambda: [dbc_module.dbc(fn, cache_dir=cache_dir) for fn in ALL_DBCS])
+  finally:
+    shutil.rmtree(cache_dir)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import os
+import re
+import glob
+import shutil
+import tempfile
+import unittest
+from collections import defaultdict
+
+import opendbc.can.dbc as dbc_module
+from opendbc import DBC_PATH
+from opendbc.can.dbc import dbc, int_or_float, DBCSignal
+
+ALL_DBCS = sorted(glob.glob(os.path.join(DBC_PATH, "*.dbc")))
+
+
+def legacy_parse(lines):
+  """The original line by line parser, as reference for parse_dbc"""
+  bo_regexp = re.compile(r"^BO\_ (\w+) (\w+) *: (\w+) (\w+)")
+  sg_regexp = re.compile(r"^SG\_ (\w+) : (\d+)\|(\d+)@(\d+)([\+|\-]) \(([0-9.+\-eE]+),([0-9.+\-eE]+)\) \[([0-9.+\-eE]+)\|([0-9.+\-eE]+)\] \"(.*)\" (.*)")
+  sgm_regexp = re.compile(r"^SG\_ (\w+) (\w+) *: (\d+)\|(\d+)@(\d+)([\+|\-]) \(([0-9.+\-eE]+),([0-9.+\-eE]+)\) \[([0-9.+\-eE]+)\|([0-9.+\-eE]+)\] \"(.*)\" (.*)")
+  val_regexp = re.compile(r"VAL\_ (\w+) (\w+) (\s*[-+]?[0-9]+\s+\".+?\"[^;]*)")
+
+  msgs = {}
+  def_vals = defaultdict(list)
+  for l in lines:
+    l = l.strip()
+
+    if l.startswith("BO_ "):
+      dat = bo_regexp.match(l)
+      ids = int(dat.group(1), 0)
+      msgs[ids] = ((dat.group(2), int(dat.group(3))), [])
+
+    if l.startswith("SG_ "):
+      dat = sg_regexp.match(l)
+      go = 0
+      if dat is None:
+        dat = sgm_regexp.match(l)
+        go = 1
+      msgs[ids][1].append(
+        DBCSignal(dat.group(1), int(dat.group(go + 2)), int(dat.group(go + 3)), int(dat.group(go + 4)) == 1,
+                  dat.group(go + 5) == '-', int_or_float(dat.group(go + 6)), int_or_float(dat.group(go + 7)),
+                  int_or_float(dat.group(go + 8)), int_or_float(dat.group(go + 9)), dat.group(go + 10)))
+
+    if l.startswith("VAL_ "):
+      dat = val_regexp.match(l)
+      defvals = dat.group(3).replace("?", r"\?").split('"')[:-1]
+      defvals[1::2] = [d.strip().upper().replace(" ", "_") for d in defvals[1::2]]
+      def_vals[int(dat.group(1), 0)].append((dat.group(2), '"'+"".join(str(i) for i in defvals)+'"'))
+
+  for msg in msgs.values():
+    msg[1].sort(key=lambda x: x.start_bit)
+  return msgs, def_vals
+
+
+def as_comparable(msgs):
+  # types included, 1 and 1.0 are different to the generated code
+  return {a: (m[0], [tuple((type(v), v) for v in s) for s in m[1]]) for a, m in msgs.items()}
+
+
+class TestDBCParser(unittest.TestCase):
+  def setUp(self):
+    self.cache_dir = tempfile.mkdtemp()
+    dbc_module._parse_cache.clear()
+
+  def tearDown(self):
+    shutil.rmtree(self.cache_dir)
+    dbc_module._parse_cache.clear()
+
+  def test_same_as_legacy_parser(self):
+    for fn in ALL_DBCS:
+      with self.subTest(dbc=os.path.basename(fn)):
+        with open(fn, encoding="ascii") as f:
+          txt = f.read()
+        msgs, def_vals = dbc_module.parse_dbc(txt)
+        ref_msgs, ref_def_vals = legacy_parse(txt.splitlines())
+        self.assertEqual(as_comparable(msgs), as_comparable(ref_msgs))
+        self.assertEqual(dict(def_vals), dict(ref_def_vals))
+        for sigs in msgs.values():
+          self.assertTrue(all(type(s) is DBCSignal for s in sigs[1]))
+
+  def test_multiplexed_signal(self):
+    txt = 'BO_ 1024 MUX_MSG: 8 XXX\n SG_ MUX M : 0|8@1+ (1,0) [0|255] "" XXX\n SG_ A m0 : 8|16@1- (0.5,-3) [-10|10.5] "m/s" XXX\n'
+    msgs, _ = dbc_module.parse_dbc(txt)
+    self.assertEqual(msgs[1024][0], ("MUX_MSG", 8))
+    self.assertEqual(msgs[1024][1][1], DBCSignal("A", 8, 16, True, True, 0.5, -3., -10., 10.5, "m/s"))
+
+  def test_bad_line(self):
+    with self.assertRaises(ValueError):
+      dbc_module.parse_dbc('BO_ 1024 MSG: 8 XXX\n SG_ A : 0|8@1+ (1,0) [0|255 "" XXX\n')
+
+  def test_cache(self):
+    fn = os.path.join(DBC_PATH, "honda_civic_touring_2016_can_generated.dbc")
+    ref = dbc(fn, cache_dir=None)
+    dbc_module._parse_cache.clear()
+
+    parses = []
+    parse_dbc = dbc_module.parse_dbc
+    dbc_module.parse_dbc = lambda *args: parses.append(args) or parse_dbc(*args)
+    try:
+      first = dbc(fn, cache_dir=self.cache_dir)
+      self.assertEqual(len(parses), 1)
+      self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+      # from memory, then from disk
+      second = dbc(fn, cache_dir=self.cache_dir)
+      dbc_module._parse_cache.clear()
+      third = dbc(fn, cache_dir=self.cache_dir)
+      self.assertEqual(len(parses), 1)
+    finally:
+      dbc_module.parse_dbc = parse_dbc
+
+    for d in (first, second, third):
+      self.assertEqual(as_comparable(d.msgs), as_comparable(ref.msgs))
+      self.assertEqual(dict(d.def_vals), dict(ref.def_vals))
+      self.assertEqual(d.msg_name_to_address, ref.msg_name_to_address)
+
+    # changing a loaded dbc doesn't change the next one
+    first.msgs[0x1fa][1].clear()
+    first.def_vals[0x1fa].append(("X", '""'))
+    self.assertEqual(as_comparable(dbc(fn, cache_dir=self.cache_dir).msgs), as_comparable(ref.msgs))
+    self.assertEqual(dict(dbc(fn, cache_dir=self.cache_dir).def_vals), dict(ref.def_vals))
+
+  def test_cache_keyed_by_content(self):
+    fn = os.path.join(self.cache_dir, "test.dbc")
+    with open(fn, "w") as f:
+      f.write('BO_ 100 MSG: 8 XXX\n SG_ A : 0|8@1+ (1,0) [0|255] "" XXX\n')
+    self.assertEqual(dbc(fn, cache_dir=self.cache_dir).msgs[100][1][0].factor, 1)
+
+    with open(fn, "w") as f:
+      f.write('BO_ 100 MSG: 8 XXX\n SG_ A : 0|8@1+ (2,0) [0|255] "" XXX\n')
+    self.assertEqual(dbc(fn, cache_dir=self.cache_dir).msgs[100][1][0].factor, 2)
+
+  def test_corrupt_cache(self):
+    fn = os.path.join(DBC_PATH, "toyota_prius_2017_pt_generated.dbc")
+    ref = dbc(fn, cache_dir=self.cache_dir)
+    for cache_fn in os.listdir(self.cache_dir):
+      with open(os.path.join(self.cache_dir, cache_fn), "wb") as f:
+        f.write(b"garbage")
+    dbc_module._parse_cache.clear()
+    self.assertEqual(as_comparable(dbc(fn, cache_dir=self.cache_dir).msgs), as_comparable(ref.msgs))
+
+
+if __name__ == "__main__":
+  unittest.main()
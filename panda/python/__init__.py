@@ -16,6 +16,8 @@ from .flash_release import flash_release  # noqa pylint: disable=import-error
 from .update import ensure_st_up_to_date  # noqa pylint: disable=import-error
 from .serial import PandaSerial  # noqa pylint: disable=import-error
 from .isotp import isotp_send, isotp_recv  # pylint: disable=import-error
+from .can_buffer import parse_can_buffer as _parse_can_buffer, pack_can_buffer  # pylint: disable=import-error
+from .can_reader import CanReader, DEFAULT_CAPACITY  # pylint: disable=import-error
 
 
 __version__ = '0.0.9'
@@ -36,19 +38,10 @@ def build_st(target, mkfile="Makefile", clean=True):
     raise
 
 def parse_can_buffer(dat):
-  ret = []
-  for j in range(0, len(dat), 0x10):
-    ddat = dat[j:j+0x10]
-    f1, f2 = struct.unpack("II", ddat[0:8])
-    extended = 4
-    if f1 & extended:
-      address = f1 >> 3
-    else:
-      address = f1 >> 21
-    dddat = ddat[8:8+(f2&0xF)]
-    if DEBUG:
+  ret = _parse_can_buffer(dat)
+  if DEBUG:
+    for address, _, dddat, _ in ret:
       print("  R %x: %s" % (address, binascii.hexlify(dddat)))
-    ret.append((address, f2>>16, dddat, (f2>>4)&0xFF))
   return ret
 
 class PandaWifiStreaming(object):
@@ -154,9 +147,11 @@ class Panda(object):
   def __init__(self, serial=None, claim=True):
     self._serial = serial
     self._handle = None
+    self._can_reader = None
     self.connect(claim)
 
   def close(self):
+    self.stop_can_reader()
     self._handle.close()
     self._handle = None
 
@@ -487,29 +482,18 @@ class Panda(object):
   CAN_SEND_TIMEOUT_MS = 10
 
   def can_send_many(self, arr, timeout=CAN_SEND_TIMEOUT_MS):
-    snds = []
-    transmit = 1
-    extended = 4
-    for addr, _, dat, bus in arr:
-      assert len(dat) <= 8
-      if DEBUG:
+    if DEBUG:
+      for addr, _, dat, _ in arr:
         print("  W %x: %s" % (addr, binascii.hexlify(dat)))
-      if addr >= 0x800:
-        rir = (addr << 3) | transmit | extended
-      else:
-        rir = (addr << 21) | transmit
-      snd = struct.pack("II", rir, len(dat) | (bus << 4)) + dat
-      snd = snd.ljust(0x10, b'\x00')
-      snds.append(snd)
+    snd = pack_can_buffer(arr)
 
     while True:
       try:
-        #print("DAT: %s"%b''.join(snds).__repr__())
         if self.wifi:
-          for s in snds:
-            self._handle.bulkWrite(3, s)
+          for j in range(0, len(snd), 0x10):
+            self._handle.bulkWrite(3, snd[j:j+0x10])
         else:
-          self._handle.bulkWrite(3, b''.join(snds), timeout=timeout)
+          self._handle.bulkWrite(3, snd, timeout=timeout)
         break
       except (usb1.USBErrorIO, usb1.USBErrorOverflow):
         print("CAN: BAD SEND MANY, RETRYING")
@@ -517,7 +501,32 @@ class Panda(object):
   def can_send(self, addr, dat, bus, timeout=CAN_SEND_TIMEOUT_MS):
     self.can_send_many([[addr, None, dat, bus]], timeout=timeout)
 
+  def start_can_reader(self, capacity=DEFAULT_CAPACITY):
+    """Starts a thread that keeps draining the CAN endpoint into a ring buffer
+    of capacity frames. While it runs can_recv and can_recv_batch don't block."""
+    if self._can_reader is None:
+      self._can_reader = CanReader(self._handle, capacity)
+      self._can_reader.start()
+
+  def stop_can_reader(self):
+    if self._can_reader is not None:
+      self._can_reader.stop()
+      self._can_reader = None
+
+  def can_reader_stats(self):
+    return self._can_reader.stats() if self._can_reader is not None else None
+
+  def can_recv_batch(self, max_frames=None):
+    """Returns (timestamps, msgs) for everything the reader thread buffered so far,
+    timestamps are time.monotonic() of the bulk read each frame came in"""
+    assert self._can_reader is not None, "start_can_reader() first"
+    dat, ts = self._can_reader.buffer.pop(max_frames)
+    return ts, parse_can_buffer(dat)
+
   def can_recv(self):
+    if self._can_reader is not None:
+      return self.can_recv_batch()[1]
+
     dat = bytearray()
     while True:
       try:
@@ -0,0 +1,78 @@
+# vectorized (de)serialization of the 16 byte USB CAN frames used by the panda
+import numpy as np
+
+CAN_FRAME_SIZE = 0x10
+
+# little endian, as struct.pack("II", ...) on every platform panda runs on
+CAN_FRAME_DTYPE = np.dtype([('rir', '<u4'), ('dlc', '<u4'), ('data', 'u1', (8,))])
+
+CAN_TRANSMIT = 1
+CAN_EXTENDED = 4
+
+
+def decode_can_buffer(dat):
+  """Decodes a whole bulk read into arrays without a Python loop.
+
+  Returns:
+    (address, bus_time, src, length, data) where data is an (n, 8) uint8
+    array, of which only the first length bytes of each row are valid
+  """
+  n = len(dat) // CAN_FRAME_SIZE
+  frames = np.frombuffer(dat, dtype=CAN_FRAME_DTYPE, count=n)
+  rir = frames['rir']
+  dlc = frames['dlc']
+  address = np.where(rir & CAN_EXTENDED, rir >> 3, rir >> 21)
+  # a corrupt length can be up to 15, there are only 8 data bytes in a frame
+  length = np.minimum(dlc & 0xF, 8)
+  return address, dlc >> 16, (dlc >> 4) & 0xFF, length, frames['data']
+
+
+def parse_can_buffer(dat):
+  """Same output as the struct based parse_can_buffer, a list of
+  (address, bus_time, dat, src) tuples"""
+  address, bus_time, src, length, _ = decode_can_buffer(dat)
+  starts = range(8, len(address) * CAN_FRAME_SIZE, CAN_FRAME_SIZE)
+  return [(a, t, dat[j:j + l], s) for a, t, j, l, s in
+          zip(address.tolist(), bus_time.tolist(), starts, length.tolist(), src.tolist())]
+
+
+def _encode_header(frames, address, length, bus):
+  address = np.asarray(address, dtype=np.uint32)
+  frames['rir'] = np.where(address >= 0x800,
+                           (address << 3) | CAN_TRANSMIT | CAN_EXTENDED,
+                           (address << 21) | CAN_TRANSMIT)
+  frames['dlc'] = length | (np.asarray(bus, dtype=np.uint32) << 4)
+
+
+def encode_can_buffer(address, length, data, bus):
+  """Encodes arrays of outgoing messages into one bulk write buffer.
+
+  Args:
+    address: CAN addresses
+    length: data length of each message, at most 8
+    data: (n, 8) uint8 array, only the first length bytes of each row are sent
+    bus: bus of each message
+  """
+  length = np.asarray(length, dtype=np.uint32)
+  if np.any(length > 8):
+    raise ValueError("CAN data must not be longer than 8 bytes")
+
+  frames = np.empty(len(length), dtype=CAN_FRAME_DTYPE)
+  _encode_header(frames, address, length, bus)
+  # zero the bytes past each message's length, struct.pack + ljust does the same
+  frames['data'] = np.where(np.arange(8) < length[:, None], data, 0)
+  return frames.tobytes()
+
+
+def pack_can_buffer(arr):
+  """Same output as can_send_many's packing of (addr, _, dat, bus) tuples"""
+  address = [m[0] for m in arr]
+  dats = [m[2] for m in arr]
+  length = np.fromiter(map(len, dats), dtype=np.uint32, count=len(dats))
+  if len(arr) and length.max() > 8:
+    raise ValueError("CAN data must not be longer than 8 bytes")
+
+  frames = np.empty(len(arr), dtype=CAN_FRAME_DTYPE)
+  _encode_header(frames, address, length, [m[3] for m in arr])
+  frames['data'] = np.frombuffer(b''.join([d.ljust(8, b'\x00') for d in dats]), dtype=np.uint8).reshape(-1, 8)
+  return frames.tobytes()
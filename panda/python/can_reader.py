@@ -0,0 +1,111 @@
+# background reader that keeps draining the panda's CAN endpoint
+import time
+import threading
+import numpy as np
+import usb1
+
+from .can_buffer import CAN_FRAME_SIZE
+
+CAN_RECV_SIZE = 0x10*256
+DEFAULT_CAPACITY = 0x10000  # frames
+
+
+class CanRingBuffer(object):
+  """Preallocated ring of raw 16 byte CAN frames with a receive timestamp each.
+
+  When the consumer falls behind the oldest frames are overwritten and counted
+  in overflows, so a slow reader loses old data instead of stalling the USB
+  endpoint.
+  """
+  def __init__(self, capacity=DEFAULT_CAPACITY):
+    self.capacity = capacity
+    self.frames = np.zeros((capacity, CAN_FRAME_SIZE), dtype=np.uint8)
+    self.ts = np.zeros(capacity, dtype=np.float64)
+    self.head = 0  # next frame to read
+    self.count = 0
+    self.overflows = 0
+    self.lock = threading.Lock()
+
+  def push(self, dat, t):
+    new = np.frombuffer(dat, dtype=np.uint8, count=(len(dat) // CAN_FRAME_SIZE) * CAN_FRAME_SIZE)
+    new = new.reshape(-1, CAN_FRAME_SIZE)
+    n = len(new)
+    if n == 0:
+      return
+
+    with self.lock:
+      if n > self.capacity:
+        self.overflows += n - self.capacity
+        new = new[-self.capacity:]
+        n = self.capacity
+
+      dropped = max(0, self.count + n - self.capacity)
+      if dropped:
+        self.overflows += dropped
+        self.head = (self.head + dropped) % self.capacity
+        self.count -= dropped
+
+      tail = (self.head + self.count) % self.capacity
+      first = min(n, self.capacity - tail)
+      self.frames[tail:tail+first] = new[:first]
+      self.frames[:n-first] = new[first:]
+      self.ts[tail:tail+first] = t
+      self.ts[:n-first] = t
+      self.count += n
+
+  def pop(self, max_frames=None):
+    """Returns (raw frames as bytes, timestamps) for up to max_frames frames"""
+    with self.lock:
+      n = self.count if max_frames is None else min(self.count, max_frames)
+      idx = (self.head + np.arange(n)) % self.capacity
+      dat = self.frames[idx].tobytes()
+      ts = self.ts[idx]
+      self.head = (self.head + n) % self.capacity
+      self.count -= n
+    return dat, ts
+
+  def __len__(self):
+    return self.count
+
+
+class CanReader(object):
+  """Thread doing blocking bulk reads of the CAN endpoint into a CanRingBuffer"""
+  def __init__(self, handle, capacity=DEFAULT_CAPACITY, timeout_ms=100):
+    self.handle = handle
+    self.buffer = CanRingBuffer(capacity)
+    self.timeout_ms = timeout_ms
+    self.usb_errors = 0
+    self.reads = 0
+
+    self._exit = threading.Event()
+    self._thread = threading.Thread(target=self._run, name="panda_can_reader")
+    self._thread.daemon = True
+
+  def start(self):
+    self._thread.start()
+
+  def stop(self):
+    self._exit.set()
+    self._thread.join()
+
+  def _run(self):
+    while not self._exit.is_set():
+      try:
+        dat = self.handle.bulkRead(1, CAN_RECV_SIZE, timeout=self.timeout_ms)
+      except usb1.USBErrorTimeout:
+        continue
+      except (usb1.USBErrorIO, usb1.USBErrorOverflow):
+        self.usb_errors += 1
+        time.sleep(0.1)
+        continue
+      self.reads += 1
+      if len(dat):
+        self.buffer.push(dat, time.monotonic())
+
+  def stats(self):
+    return {
+      "reads": self.reads,
+      "usb_errors": self.usb_errors,
+      "overflows": self.buffer.overflows,
+      "buffered": len(self.buffer),
+    }
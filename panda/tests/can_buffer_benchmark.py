@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../.."))
+from panda.python.can_buffer import decode_can_buffer, pack_can_buffer, parse_can_buffer  # noqa: E402
+from panda.tests.test_can_buffer import pack_can_buffer_struct, parse_can_buffer_struct, random_msgs, random_rx_buffer  # noqa: E402
+
+# one full bulk read is 256 frames, boardd reads at 100Hz
+N_FRAMES = 256
+N_ITER = 2000
+
+
+def bench(name, f, arg):
+  t = time.perf_counter()
+  for _ in range(N_ITER):
+    f(arg)
+  dt = (time.perf_counter() - t) / N_ITER
+  print("%-28s %8.1f us/call %8.0f frames/s" % (name, dt * 1e6, N_FRAMES / dt))
+
+
+if __name__ == "__main__":
+  rx = random_rx_buffer(N_FRAMES)
+  tx = random_msgs(N_FRAMES)
+
+  bench("parse (struct)", parse_can_buffer_struct, rx)
+  bench("parse (numpy)", parse_can_buffer, rx)
+  bench("decode to arrays (numpy)", decode_can_buffer, rx)
+  bench("pack (struct)", pack_can_buffer_struct, tx)
+  bench("pack (numpy)", pack_can_buffer, tx)
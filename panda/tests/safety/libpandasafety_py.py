@@ -71,6 +71,32 @@ void set_honda_bosch_long(bool c);
 int get_honda_hw(void);
 
 bool get_subaru_global(void);
+
+typedef struct
+{
+  uint32_t timer;
+  uint8_t tx;
+  uint8_t bus;
+  uint8_t len;
+  uint8_t pad;
+  uint32_t addr;
+  uint8_t data[8];
+} safety_replay_msg_t;
+
+typedef struct
+{
+  int rx_tot;
+  int rx_invalid;
+  int tx_tot;
+  int tx_blocked;
+  int tx_controls;
+  int tx_controls_blocked;
+  int first_rx_invalid;
+  int first_tx_blocked;
+  int first_tx_controls_blocked;
+} safety_replay_result_t;
+
+void safety_replay(const safety_replay_msg_t *msgs, int n, uint8_t *failed, safety_replay_result_t *res);
 """)
 
 libpandasafety = ffi.dlopen(libpandasafety_fn)
@@ -222,3 +222,79 @@ void reset_gmlan_switch_timeout(void){
 void gmlan_switch_init(int timeout_enable){
 }
 
+
+// batched replay of a drive, see tests/safety_replay/replay_drive.py
+typedef struct
+{
+  uint32_t timer;
+  uint8_t tx;    // 1: safety_tx_hook, 0: safety_rx_hook
+  uint8_t bus;
+  uint8_t len;
+  uint8_t pad;
+  uint32_t addr;
+  uint8_t data[8];
+} safety_replay_msg_t;
+
+typedef struct
+{
+  int rx_tot;
+  int rx_invalid;
+  int tx_tot;
+  int tx_blocked;
+  int tx_controls;
+  int tx_controls_blocked;
+  // index of the first failure of each kind, -1 if there wasn't any
+  int first_rx_invalid;
+  int first_tx_blocked;
+  int first_tx_controls_blocked;
+} safety_replay_result_t;
+
+void safety_replay(const safety_replay_msg_t *msgs, int n, uint8_t *failed, safety_replay_result_t *res){
+  res->rx_tot = 0;
+  res->rx_invalid = 0;
+  res->tx_tot = 0;
+  res->tx_blocked = 0;
+  res->tx_controls = 0;
+  res->tx_controls_blocked = 0;
+  res->first_rx_invalid = -1;
+  res->first_tx_blocked = -1;
+  res->first_tx_controls_blocked = -1;
+
+  for (int i = 0; i < n; i++) {
+    const safety_replay_msg_t *m = &msgs[i];
+    CAN_FIFOMailBox_TypeDef msg;
+    msg.RIR = (m->addr >= 0x800U) ? ((m->addr << 3) | 5U) : ((m->addr << 21) | 1U);
+    msg.RDTR = m->len | ((m->bus & 0xFU) << 4);
+    msg.RDLR = m->data[0] | (m->data[1] << 8) | (m->data[2] << 16) | ((uint32_t)m->data[3] << 24);
+    msg.RDHR = m->data[4] | (m->data[5] << 8) | (m->data[6] << 16) | ((uint32_t)m->data[7] << 24);
+
+    set_timer(m->timer);
+    failed[i] = 0;
+    if (m->tx) {
+      if (!safety_tx_hook(&msg)) {
+        failed[i] = 1;
+        res->tx_blocked++;
+        if (res->first_tx_blocked < 0) {
+          res->first_tx_blocked = i;
+        }
+        if (controls_allowed) {
+          res->tx_controls_blocked++;
+          if (res->first_tx_controls_blocked < 0) {
+            res->first_tx_controls_blocked = i;
+          }
+        }
+      }
+      res->tx_controls += controls_allowed;
+      res->tx_tot++;
+    } else {
+      if (!safety_rx_hook(&msg)) {
+        failed[i] = 1;
+        res->rx_invalid++;
+        if (res->first_rx_invalid < 0) {
+          res->first_rx_invalid = i;
+        }
+      }
+      res->rx_tot++;
+    }
+  }
+}
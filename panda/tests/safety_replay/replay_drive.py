@@ -2,66 +2,91 @@
 
 import os
 import sys
+import numpy as np
 from panda.tests.safety import libpandasafety_py
-from panda.tests.safety_replay.helpers import package_can_msg, init_segment
+from panda.tests.safety_replay.helpers import init_segment
+
+# matches safety_replay_msg_t in tests/safety/test.c
+REPLAY_MSG_DTYPE = np.dtype([('timer', '<u4'), ('tx', 'u1'), ('bus', 'u1'), ('len', 'u1'), ('pad', 'u1'),
+                             ('addr', '<u4'), ('data', 'u1', (8,))])
+
+def pack_drive(lr):
+  """Flattens the can and sendcan msgs of a log into one array of records for safety_replay"""
+  recs = []
+  for msg in lr:
+    timer = (msg.logMonoTime // 1000) % 0xFFFFFFFF
+    if msg.which() == 'sendcan':
+      for canmsg in msg.sendcan:
+        recs.append((timer, 1, canmsg.src, len(canmsg.dat), 0, canmsg.address, canmsg.dat))
+    elif msg.which() == 'can':
+      for canmsg in msg.can:
+        # ignore msgs we sent
+        if canmsg.src >= 128:
+          continue
+        recs.append((timer, 0, canmsg.src, len(canmsg.dat), 0, canmsg.address, canmsg.dat))
+
+  msgs = np.zeros(len(recs), dtype=REPLAY_MSG_DTYPE)
+  if len(recs):
+    timer, tx, bus, length, _, addr, dat = zip(*recs)
+    msgs['timer'] = timer
+    msgs['tx'] = tx
+    msgs['bus'] = bus
+    msgs['len'] = length
+    msgs['addr'] = addr
+    msgs['data'] = np.frombuffer(b''.join(d.ljust(8, b'\x00') for d in dat), dtype=np.uint8).reshape(-1, 8)
+  return msgs
+
+def replay_msgs(safety, msgs):
+  """Runs the rx/tx hooks over all records in one call into C.
+  Returns the safety_replay_result_t and a per record failed flag array."""
+  ffi = libpandasafety_py.ffi
+  msgs = np.ascontiguousarray(msgs, dtype=REPLAY_MSG_DTYPE)
+  failed = np.zeros(len(msgs), dtype=np.uint8)
+  res = ffi.new("safety_replay_result_t *")
+  safety.safety_replay(ffi.cast("safety_replay_msg_t *", ffi.from_buffer(msgs)), len(msgs),
+                       ffi.cast("uint8_t *", ffi.from_buffer(failed)), res)
+  return res[0], failed
 
 # replay a drive to check for safety violations
-def replay_drive(lr, safety_mode, param):
+def replay_drive(lr, safety_mode, param, msgs=None, verbose=True):
   safety = libpandasafety_py.libpandasafety
 
   err = safety.set_safety_hooks(safety_mode, param)
   assert err == 0, "invalid safety mode: %d" % safety_mode
 
   if "SEGMENT" in os.environ:
-    init_segment(safety, lr, mode)
+    init_segment(safety, lr, safety_mode)
 
-  rx_tot, rx_invalid, tx_tot, tx_blocked, tx_controls, tx_controls_blocked = 0, 0, 0, 0, 0, 0
-  blocked_addrs = set()
-  invalid_addrs = set()
-  start_t = None
+  if msgs is None:
+    msgs = pack_drive(lr)
+  res, failed = replay_msgs(safety, msgs)
 
-  for msg in lr:
-    if start_t is None:
-      start_t = msg.logMonoTime
-    safety.set_timer(((msg.logMonoTime // 1000))  % 0xFFFFFFFF)
+  failed = failed.astype(bool)
+  blocked_addrs = set(msgs['addr'][failed & (msgs['tx'] == 1)].tolist())
+  invalid_addrs = set(msgs['addr'][failed & (msgs['tx'] == 0)].tolist())
 
-    if msg.which() == 'sendcan':
-     for canmsg in msg.sendcan:
-        to_send = package_can_msg(canmsg)
-        sent = safety.safety_tx_hook(to_send)
-        if not sent:
-          tx_blocked += 1
-          tx_controls_blocked += safety.get_controls_allowed()
-          blocked_addrs.add(canmsg.address)
-
-          if "DEBUG" in os.environ:
-            print("blocked bus %d msg %d at %f" % (canmsg.src, canmsg.address, (msg.logMonoTime - start_t)/(1e9)))
-        tx_controls += safety.get_controls_allowed()
-        tx_tot += 1
-    elif msg.which() == 'can':
-      for canmsg in msg.can:
-        # ignore msgs we sent
-        if canmsg.src >= 128:
-          continue
-        to_push = package_can_msg(canmsg)
-        recv = safety.safety_rx_hook(to_push)
-        if not recv:
-          rx_invalid += 1
-          invalid_addrs.add(canmsg.address)
-        rx_tot += 1
-
-  print("\nRX")
-  print("total rx msgs:", rx_tot)
-  print("invalid rx msgs:", rx_invalid)
-  print("invalid addrs:", invalid_addrs)
-  print("\nTX")
-  print("total openpilot msgs:", tx_tot)
-  print("total msgs with controls allowed:", tx_controls)
-  print("blocked msgs:", tx_blocked)
-  print("blocked with controls allowed:", tx_controls_blocked)
-  print("blocked addrs:", blocked_addrs)
-
-  return tx_controls_blocked == 0 and rx_invalid == 0
+  if "DEBUG" in os.environ:
+    start_t = msgs['timer'][0] if len(msgs) else 0
+    for i in np.flatnonzero(failed & (msgs['tx'] == 1)):
+      print("blocked bus %d msg %d at %f" % (msgs['bus'][i], msgs['addr'][i], (msgs['timer'][i] - start_t) / 1e6))
+
+  if verbose:
+    print("\nRX")
+    print("total rx msgs:", res.rx_tot)
+    print("invalid rx msgs:", res.rx_invalid)
+    print("invalid addrs:", invalid_addrs)
+    print("\nTX")
+    print("total openpilot msgs:", res.tx_tot)
+    print("total msgs with controls allowed:", res.tx_controls)
+    print("blocked msgs:", res.tx_blocked)
+    print("blocked with controls allowed:", res.tx_controls_blocked)
+    print("blocked addrs:", blocked_addrs)
+    if res.first_tx_controls_blocked >= 0:
+      print("first blocked with controls allowed: record %d" % res.first_tx_controls_blocked)
+    if res.first_rx_invalid >= 0:
+      print("first invalid rx: record %d" % res.first_rx_invalid)
+
+  return res.tx_controls_blocked == 0 and res.rx_invalid == 0
 
 if __name__ == "__main__":
   from tools.lib.route import Route
@@ -75,4 +100,3 @@ if __name__ == "__main__":
   print("replaying drive %s with safety mode %d and param %d" % (sys.argv[1], mode, param))
 
   replay_drive(lr, mode, param)
-
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import io
+import os
+import sys
+import argparse
+import traceback
+import multiprocessing
+from contextlib import redirect_stdout
+
+# builds libpandasafety.so once here, so the workers don't race on make
+from panda.tests.safety import libpandasafety_py  # pylint: disable=unused-import
+from panda.tests.safety_replay.replay_drive import replay_drive
+from tools.lib.logreader import LogReader  # pylint: disable=import-error
+
+
+def replay_log(task):
+  """Runs in a pool worker, returns (route, mode, param, passed, output)"""
+  route, mode, param = task
+  # capture the stats so logs replayed next to each other don't interleave
+  out = io.StringIO()
+  try:
+    with redirect_stdout(out):
+      print("\nreplaying %s with safety mode %d and param %s" % (route, mode, param))
+      passed = replay_drive(LogReader(route), mode, int(param))
+  except Exception:
+    passed = False
+    out.write(traceback.format_exc())
+  return route, mode, param, passed, out.getvalue()
+
+
+def replay_logs(logs, jobs=None):
+  """Replays (route, safety mode, param) sets on a pool of jobs processes and
+  yields the results as they finish. The safety state lives in C globals, so
+  every replay gets a fresh worker (maxtasksperchild=1)."""
+  jobs = jobs or multiprocessing.cpu_count()
+  with multiprocessing.Pool(jobs, maxtasksperchild=1) as pool:
+    yield from pool.imap_unordered(replay_log, logs)
+
+
+if __name__ == "__main__":
+  from panda.tests.safety_replay.test_safety_replay import logs
+
+  parser = argparse.ArgumentParser(description="Replay many drives through the safety model in parallel")
+  parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes, default one per core")
+  parser.add_argument("logs", nargs="*", help="route:mode:param, defaults to the test_safety_replay logs")
+  args = parser.parse_args()
+
+  tasks = logs
+  if len(args.logs):
+    tasks = [tuple(l.rsplit(":", 2)) for l in args.logs]
+    tasks = [(route, int(mode), int(param)) for route, mode, param in tasks]
+
+  missing = [route for route, _, _ in tasks if not os.path.isfile(route)]
+  if len(missing):
+    print("missing logs:", missing)
+    sys.exit(1)
+
+  failed = []
+  for route, _, _, passed, output in replay_logs(tasks, args.jobs):
+    print(output)
+    if not passed:
+      failed.append(route)
+
+  for f in failed:
+    print(f"\n**** failed on {f} ****")
+  assert len(failed) == 0, "\nfailed on %d logs" % len(failed)
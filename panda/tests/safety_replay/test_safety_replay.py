@@ -4,8 +4,7 @@ import os
 import requests
 
 from panda import Panda
-from replay_drive import replay_drive
-from tools.lib.logreader import LogReader  # pylint: disable=import-error
+from replay_many import replay_logs
 
 BASE_URL = "https://commadataci.blob.core.windows.net/openpilotci/"
 
@@ -30,13 +29,11 @@ if __name__ == "__main__":
         f.write(requests.get(BASE_URL + route).content)
 
   failed = []
-  for route, mode, param in logs:
-    lr = LogReader(route)
-
-    print("\nreplaying %s with safety mode %d and param %s" % (route, mode, param))
-    if not replay_drive(lr, mode, int(param)):
+  for route, _, _, passed, output in replay_logs(logs):
+    print(output)
+    if not passed:
       failed.append(route)
 
-    for f in failed: # type: ignore
-      print(f"\n**** failed on {f} ****")
-    assert len(failed) == 0, "\nfailed on %d logs" % len(failed)
+  for f in failed: # type: ignore
+    print(f"\n**** failed on {f} ****")
+  assert len(failed) == 0, "\nfailed on %d logs" % len(failed)
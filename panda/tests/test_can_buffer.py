@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+import os
+import random
+import struct
+import unittest
+import numpy as np
+
+from panda.python.can_buffer import decode_can_buffer, encode_can_buffer, pack_can_buffer, parse_can_buffer
+
+
+# the per frame struct implementations the vectorized ones replace
+def parse_can_buffer_struct(dat):
+  ret = []
+  for j in range(0, len(dat), 0x10):
+    ddat = dat[j:j+0x10]
+    f1, f2 = struct.unpack("II", ddat[0:8])
+    extended = 4
+    if f1 & extended:
+      address = f1 >> 3
+    else:
+      address = f1 >> 21
+    dddat = ddat[8:8+(f2&0xF)]
+    ret.append((address, f2>>16, dddat, (f2>>4)&0xFF))
+  return ret
+
+
+def pack_can_buffer_struct(arr):
+  snds = []
+  transmit = 1
+  extended = 4
+  for addr, _, dat, bus in arr:
+    assert len(dat) <= 8
+    if addr >= 0x800:
+      rir = (addr << 3) | transmit | extended
+    else:
+      rir = (addr << 21) | transmit
+    snd = struct.pack("II", rir, len(dat) | (bus << 4)) + dat
+    snd = snd.ljust(0x10, b'\x00')
+    snds.append(snd)
+  return b''.join(snds)
+
+
+def random_msgs(n):
+  msgs = []
+  for _ in range(n):
+    addr = random.randint(0x800, 0x1FFFFFFF) if random.random() < 0.2 else random.randint(0, 0x7FF)
+    msgs.append((addr, 0, os.urandom(random.randint(0, 8)), random.randint(0, 2)))
+  return msgs
+
+
+def random_rx_buffer(n):
+  # what the panda sends back: bus time in the high half of the second word
+  dat = b''
+  for addr, _, d, bus in random_msgs(n):
+    rir = (addr << 3) | 4 if addr >= 0x800 else addr << 21
+    dat += struct.pack("II", rir, len(d) | (bus << 4) | (random.randint(0, 0xFFFF) << 16)) + d.ljust(8, b'\x00')
+  return dat
+
+
+class TestCanBuffer(unittest.TestCase):
+  def setUp(self):
+    random.seed(0)
+
+  def test_parse_matches_struct(self):
+    for n in [0, 1, 17, 256]:
+      dat = random_rx_buffer(n)
+      self.assertEqual(parse_can_buffer(dat), parse_can_buffer_struct(dat))
+      self.assertEqual(parse_can_buffer(bytearray(dat)), parse_can_buffer_struct(bytearray(dat)))
+
+  def test_parse_corrupt_length(self):
+    # a length above 8 stays within its own frame, like the struct parser
+    dat = b''.join(struct.pack("II", 0x123 << 21, dlc | (1 << 4)) + bytes(range(i * 8, i * 8 + 8)) for i, dlc in enumerate([15, 9, 8]))
+    parsed = parse_can_buffer(dat)
+    self.assertEqual(parsed, parse_can_buffer_struct(dat))
+    self.assertEqual([d for _, _, d, _ in parsed], [bytes(range(0, 8)), bytes(range(8, 16)), bytes(range(16, 24))])
+    self.assertEqual(decode_can_buffer(dat)[3].tolist(), [8, 8, 8])
+
+  def test_pack_matches_struct(self):
+    for n in [0, 1, 17, 256]:
+      msgs = random_msgs(n)
+      self.assertEqual(pack_can_buffer(msgs), pack_can_buffer_struct(msgs))
+
+  def test_array_roundtrip(self):
+    msgs = random_msgs(256)
+    dat = pack_can_buffer(msgs)
+    address, _, src, length, data = decode_can_buffer(dat)
+    self.assertEqual(address.tolist(), [m[0] for m in msgs])
+    self.assertEqual(src.tolist(), [m[3] for m in msgs])
+    self.assertEqual(encode_can_buffer(address, length, data, src), dat)
+
+  def test_encode_masks_unused_bytes(self):
+    data = np.full((2, 8), 0xFF, dtype=np.uint8)
+    dat = encode_can_buffer([0x123, 0x18DAF110], [2, 8], data, [0, 1])
+    self.assertEqual(dat, pack_can_buffer_struct([(0x123, 0, b'\xff\xff', 0), (0x18DAF110, 0, b'\xff' * 8, 1)]))
+
+  def test_too_long(self):
+    with self.assertRaises(ValueError):
+      pack_can_buffer([(0x123, 0, b'\x00' * 9, 0)])
+
+
+if __name__ == "__main__":
+  unittest.main()
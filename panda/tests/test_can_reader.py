@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+import time
+import unittest
+import usb1
+
+from panda import Panda
+from panda.python.can_buffer import pack_can_buffer
+from panda.python.can_reader import CanRingBuffer
+from panda.tests.usb_mock import MockUSBHandle
+
+
+def mock_panda():
+  p = Panda.__new__(Panda)
+  p._serial = "mock"
+  p._handle = MockUSBHandle()
+  p._can_reader = None
+  p.wifi = False
+  return p
+
+
+def frames(start, n):
+  return pack_can_buffer([(0x100 + i, 0, bytes([i % 256]), 0) for i in range(start, start + n)])
+
+
+def wait_for(cond, timeout=2.):
+  end = time.monotonic() + timeout
+  while not cond() and time.monotonic() < end:
+    time.sleep(0.001)
+
+
+class TestCanRingBuffer(unittest.TestCase):
+  def test_wraparound(self):
+    rb = CanRingBuffer(capacity=10)
+    rb.push(frames(0, 6), 1.)
+    dat, ts = rb.pop(4)
+    self.assertEqual(dat, frames(0, 4))
+    self.assertEqual(list(ts), [1.] * 4)
+
+    rb.push(frames(6, 7), 2.)
+    dat, ts = rb.pop()
+    self.assertEqual(dat, frames(4, 9))
+    self.assertEqual(list(ts), [1.] * 2 + [2.] * 7)
+    self.assertEqual(rb.overflows, 0)
+    self.assertEqual(len(rb), 0)
+
+  def test_overflow_drops_oldest(self):
+    rb = CanRingBuffer(capacity=10)
+    rb.push(frames(0, 8), 1.)
+    rb.push(frames(8, 5), 2.)
+    self.assertEqual(rb.overflows, 3)
+    self.assertEqual(rb.pop()[0], frames(3, 10))
+
+    rb.push(frames(0, 25), 3.)
+    self.assertEqual(rb.overflows, 18)
+    self.assertEqual(rb.pop()[0], frames(15, 10))
+
+
+class TestCanReader(unittest.TestCase):
+  def test_background_recv(self):
+    p = mock_panda()
+    p.start_can_reader(capacity=1000)
+    try:
+      for i in range(10):
+        p._handle.queue_read(frames(i * 20, 20))
+      p._handle.queue_read(usb1.USBErrorIO())
+      p._handle.queue_read(frames(200, 20))
+      wait_for(lambda: len(p._can_reader.buffer) == 220)
+
+      ts, msgs = p.can_recv_batch()
+      self.assertEqual([m[0] for m in msgs], [0x100 + i for i in range(220)])
+      self.assertEqual(len(ts), 220)
+      self.assertTrue(all(ts[1:] >= ts[:-1]))
+
+      # nothing buffered, doesn't block
+      self.assertEqual(p.can_recv(), [])
+      stats = p.can_reader_stats()
+      self.assertEqual(stats["usb_errors"], 1)
+      self.assertEqual(stats["overflows"], 0)
+    finally:
+      p.close()
+    self.assertTrue(p._handle is None)
+
+  def test_send_many(self):
+    p = mock_panda()
+    msgs = [(0x123, 0, b'\x01\x02', 0), (0x18DAF110, 0, b'\xff' * 8, 1)]
+    p.can_send_many(msgs)
+    self.assertEqual(p._handle.writes, [(3, pack_can_buffer(msgs))])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,38 @@
+# in-memory stand-in for a usb1 device handle, to test the python library without a panda
+import queue
+import usb1
+
+
+class MockUSBHandle(object):
+  def __init__(self):
+    self.rx = queue.Queue()
+    self.writes = []
+    self.closed = False
+
+  def queue_read(self, dat):
+    """Data returned by a future bulkRead on the CAN endpoint, or an
+    exception instance to raise instead"""
+    self.rx.put(dat)
+
+  def bulkRead(self, endpoint, length, timeout=0):
+    assert endpoint == 1
+    try:
+      dat = self.rx.get(timeout=(timeout or 1000) / 1000.)
+    except queue.Empty:
+      raise usb1.USBErrorTimeout()
+    if isinstance(dat, Exception):
+      raise dat
+    return dat[:length]
+
+  def bulkWrite(self, endpoint, data, timeout=0):
+    self.writes.append((endpoint, bytes(data)))
+    return len(data)
+
+  def controlWrite(self, request_type, request, value, index, data, timeout=0):
+    return len(data)
+
+  def controlRead(self, request_type, request, value, index, length, timeout=0):
+    return b'\x00' * length
+
+  def close(self):
+    self.closed = True
@@ -373,26 +373,74 @@ class EKF_sym():
     self.x, self.P = self._predict(self.x, self.P, dt)
     self.filter_time = t
 
-  def predict_and_update_batch(self, t, kind, z, R, extra_args=[[]], augment=False):
-    # TODO handle rewinding at this level"
-
-    # rewind
+  def _rewind_for(self, t):
+    """Observations to fast forward over after one at time t, None if it's too old"""
     if self.filter_time is not None and t < self.filter_time:
       if len(self.rewind_t) == 0 or t < self.rewind_t[0] or t < self.rewind_t[-1] - 1.0:
         print("observation too old at %.3f with filter at %.3f, ignoring" % (t, self.filter_time))
         return None
-      rewound = self.rewind(t)
-    else:
-      rewound = []
+      return self.rewind(t)
+    return []
+
+  def _fast_forward(self, rewound):
+    for r in rewound:
+      if len(r) == 2:
+        self._predict_and_update_batches(*r)
+      else:
+        self._predict_and_update_batch(*r)
+
+  def predict_and_update_batch(self, t, kind, z, R, extra_args=[[]], augment=False):
+    # TODO handle rewinding at this level"
+
+    # rewind
+    rewound = self._rewind_for(t)
+    if rewound is None:
+      return None
 
     ret = self._predict_and_update_batch(t, kind, z, R, extra_args, augment)
 
     # optional fast forward
-    for r in rewound:
-      self._predict_and_update_batch(*r)
+    self._fast_forward(rewound)
 
     return ret
 
+  def predict_and_update_batches(self, t, batches):
+    """predict_and_update_batch for observations of several kinds made at the
+    same time, with one predict step and one checkpoint for all of them.
+
+    Args:
+      t        (float): Time of observation
+      batches   (list): (kind, z, R, extra_args) per kind
+    """
+    rewound = self._rewind_for(t)
+    if rewound is None:
+      return
+
+    self._predict_and_update_batches(t, batches)
+    self._fast_forward(rewound)
+
+  def _predict_and_update_batches(self, t, batches):
+    self.predict(t)
+    for kind, z, R, extra_args in batches:
+      self._update_batch(kind, z, R, extra_args)
+    self.checkpoint((t, batches))
+
+  def _update_batch(self, kind, z, R, extra_args):
+    assert z.shape[0] == R.shape[0]
+    assert z.shape[1] == R.shape[1]
+    assert z.shape[1] == R.shape[2]
+
+    y = []
+    for i in range(len(z)):
+      # these are from the user, so we canonicalize them
+      z_i = np.array(z[i], dtype=np.float64, order='F')
+      R_i = np.array(R[i], dtype=np.float64, order='F')
+      extra_args_i = np.array(extra_args[i], dtype=np.float64, order='F')
+      # update
+      self.x, self.P, y_i = self._update(self.x, self.P, kind, z_i, R_i, extra_args=extra_args_i)
+      y.append(y_i)
+    return y
+
   def _predict_and_update_batch(self, t, kind, z, R, extra_args, augment=False):
     """The main kalman filter function
     Predicts the state and then updates a batch of observations
@@ -408,31 +456,12 @@ class EKF_sym():
       R  (mat [n,dim_z, dim_z]): Measurement Noise
       extra_args    (list, [n]): Values used in H computations
     """
-    assert z.shape[0] == R.shape[0]
-    assert z.shape[1] == R.shape[1]
-    assert z.shape[1] == R.shape[2]
-
-    # initialize time
-    if self.filter_time is None:
-      self.filter_time = t
-
     # predict
-    dt = t - self.filter_time
-    assert dt >= 0
-    self.x, self.P = self._predict(self.x, self.P, dt)
-    self.filter_time = t
+    self.predict(t)
     xk_km1, Pk_km1 = np.copy(self.x).flatten(), np.copy(self.P)
 
     # update batch
-    y = []
-    for i in range(len(z)):
-      # these are from the user, so we canonicalize them
-      z_i = np.array(z[i], dtype=np.float64, order='F')
-      R_i = np.array(R[i], dtype=np.float64, order='F')
-      extra_args_i = np.array(extra_args[i], dtype=np.float64, order='F')
-      # update
-      self.x, self.P, y_i = self._update(self.x, self.P, kind, z_i, R_i, extra_args=extra_args_i)
-      y.append(y_i)
+    y = self._update_batch(kind, z, R, extra_args)
     xk_k, Pk_k = np.copy(self.x).flatten(), np.copy(self.P)
 
     if augment:
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import base64
+import bisect
 import hashlib
 import io
 import json
@@ -29,15 +30,30 @@ from selfdrive.loggerd.config import ROOT
 from selfdrive.swaglog import cloudlog
 
 ATHENA_HOST = os.getenv('ATHENA_HOST', 'wss://athena.comma.ai')
-HANDLER_THREADS = os.getenv('HANDLER_THREADS', 4)
+HANDLER_THREADS = int(os.getenv('HANDLER_THREADS', 4))
+UPLOAD_THREADS = int(os.getenv('UPLOAD_THREADS', 2))
 LOCAL_PORT_WHITELIST = set([8022])
 
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_TIMEOUT = 10
+MAX_RETRY_COUNT = 10  # ~ 10 minutes with the backoff below
+# besides these any 5xx is retried, other 4xx like an expired url fail right away
+RETRY_STATUS_CODES = (408, 429)
+UPLOAD_QUEUE_PARAM = "AthenadUploadQueue"
+
 dispatcher["echo"] = lambda s: s
 payload_queue: Any = queue.Queue()
 response_queue: Any = queue.Queue()
 upload_queue: Any = queue.Queue()
 cancelled_uploads: Any = set()
-UploadItem = namedtuple('UploadItem', ['path', 'url', 'headers', 'created_at', 'id'])
+cur_upload_items: Any = {}  # upload thread -> item it is uploading
+UploadItem = namedtuple('UploadItem', ['path', 'url', 'headers', 'created_at', 'id', 'retry_count', 'offset', 'progress', 'resumable',
+                                       'retry_at'], defaults=(0, 0, 0., False, 0.))
+
+# one connection pool for all upload threads, so uploads to the same host reuse connections
+upload_session = requests.Session()
+upload_session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=UPLOAD_THREADS))
+upload_session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=UPLOAD_THREADS))
 
 def handle_long_poll(ws):
   end_event = threading.Event()
@@ -45,7 +61,9 @@ def handle_long_poll(ws):
   threads = [
     threading.Thread(target=ws_recv, args=(ws, end_event)),
     threading.Thread(target=ws_send, args=(ws, end_event)),
+  ] + [
     threading.Thread(target=upload_handler, args=(end_event,))
+    for x in range(UPLOAD_THREADS)
   ] + [
     threading.Thread(target=jsonrpc_handler, args=(end_event,))
     for x in range(HANDLER_THREADS)
@@ -76,26 +94,268 @@ def jsonrpc_handler(end_event):
       cloudlog.exception("athena jsonrpc handler failed")
       response_queue.put_nowait(json.dumps({"error": str(e)}))
 
+class UploadFile():
+  """File-like view of path from offset on, reads at most UPLOAD_CHUNK_SIZE at a
+  time and reports the bytes sent so far to callback"""
+  def __init__(self, path, offset=0, callback=None):
+    self.f = open(path, "rb")
+    self.size = os.fstat(self.f.fileno()).st_size
+    self.offset = min(offset, self.size)
+    self.sent = self.offset
+    self.callback = callback
+    self.f.seek(self.offset)
+
+  def __len__(self):
+    return self.size - self.offset
+
+  def read(self, n=-1):
+    n = UPLOAD_CHUNK_SIZE if n is None or n < 0 else min(n, UPLOAD_CHUNK_SIZE)
+    dat = self.f.read(n)
+    self.sent += len(dat)
+    if self.callback is not None:
+      self.callback(self.sent, self.size)
+    return dat
+
+  def close(self):
+    self.f.close()
+
+class UploadQueueCache():
+  """Keeps the queued and in progress uploads in params, so they survive an athenad restart"""
+  lock = threading.Lock()
+
+  @staticmethod
+  def initialize(upload_queue):
+    try:
+      upload_queue_json = Params().get(UPLOAD_QUEUE_PARAM)
+      if upload_queue_json is not None:
+        for item in json.loads(upload_queue_json):
+          upload_queue.put_nowait(UploadItem(**item))
+    except Exception:
+      cloudlog.exception("athena.UploadQueueCache.initialize.exception")
+
+  @staticmethod
+  def cache(upload_queue):
+    try:
+      with UploadQueueCache.lock:
+        items = list(cur_upload_items.values()) + list(upload_queue.queue)
+        Params().put(UPLOAD_QUEUE_PARAM, json.dumps([item._asdict() for item in items if item.id not in cancelled_uploads]))
+    except Exception:
+      cloudlog.exception("athena.UploadQueueCache.cache.exception")
+
+def retry_upload(tid, upload_item):
+  if upload_item.retry_count < MAX_RETRY_COUNT:
+    offset = _get_upload_offset(upload_item)
+    if offset is None:
+      # the server got all of it, only the response was lost
+      cloudlog.event("athena.upload_handler.already_uploaded", path=upload_item.path, url=upload_item.url)
+      cur_upload_items.pop(tid, None)
+      UploadQueueCache.cache(upload_queue)
+      return
+
+    # queued again to be retried after the backoff, the upload threads carry on with others meanwhile
+    retry_count = upload_item.retry_count + 1
+    upload_item = upload_item._replace(retry_count=retry_count, offset=offset, retry_at=time.time() + backoff(retry_count))
+    upload_queue.put_nowait(upload_item)
+  else:
+    cloudlog.event("athena.upload_handler.retries_exceeded", path=upload_item.path, url=upload_item.url)
+  cur_upload_items.pop(tid, None)
+  UploadQueueCache.cache(upload_queue)
+
 def upload_handler(end_event):
+  tid = threading.get_ident()
   while not end_event.is_set():
     try:
       item = upload_queue.get(timeout=1)
       if item.id in cancelled_uploads:
         cancelled_uploads.remove(item.id)
         continue
-      _do_upload(item)
+      if item.retry_at > time.time():
+        # still backing off, back to the queue for later
+        upload_queue.put_nowait(item)
+        end_event.wait(0.1)
+        continue
+      cur_upload_items[tid] = item
+
+      def cb(sent, size):
+        cur_upload_items[tid] = cur_upload_items[tid]._replace(progress=sent / size if size else 1.)
+
+      try:
+        response = _do_upload(item, cb)
+        if response.status_code in (200, 201):
+          cur_upload_items.pop(tid, None)
+          UploadQueueCache.cache(upload_queue)
+        elif response.status_code >= 500 or response.status_code in RETRY_STATUS_CODES:
+          cloudlog.event("athena.upload_handler.retry", status_code=response.status_code, path=item.path)
+          retry_upload(tid, item)
+        else:
+          cloudlog.event("athena.upload_handler.failed", status_code=response.status_code, path=item.path, url=item.url)
+          cur_upload_items.pop(tid, None)
+          UploadQueueCache.cache(upload_queue)
+      except (requests.exceptions.Timeout, requests.exceptions.ConnectionError, requests.exceptions.SSLError):
+        cloudlog.event("athena.upload_handler.timeout", path=item.path)
+        retry_upload(tid, item)
     except queue.Empty:
       pass
     except Exception:
+      cur_upload_items.pop(tid, None)
       cloudlog.exception("athena.upload_handler.exception")
 
-def _do_upload(upload_item):
-  with open(upload_item.path, "rb") as f:
-    size = os.fstat(f.fileno()).st_size
-    return requests.put(upload_item.url,
-                        data=f,
-                        headers={**upload_item.headers, 'Content-Length': str(size)},
-                        timeout=10)
+def _get_upload_offset(upload_item):
+  """Asks the server how much of an interrupted upload it kept, with an empty PUT
+  and Content-Range: bytes */size. Only for uploads marked resumable, to anything
+  else that PUT would write an empty file. A server that can resume answers 308
+  with the Range it has, or 2xx when it has all of it, then this returns None.
+  For anything else the upload starts over."""
+  if not upload_item.resumable:
+    return 0
+
+  try:
+    size = os.path.getsize(upload_item.path)
+    response = upload_session.put(upload_item.url,
+                                  headers={**upload_item.headers, 'Content-Length': '0', 'Content-Range': f'bytes */{size}'},
+                                  timeout=UPLOAD_TIMEOUT)
+    if response.status_code in (200, 201):
+      return None
+    if response.status_code == 308 and response.headers.get('Range', '').startswith('bytes=0-'):
+      return int(response.headers['Range'][len('bytes=0-'):]) + 1
+  except Exception:
+    cloudlog.exception("athena.get_upload_offset.exception")
+  return 0
+
+def _do_upload(upload_item, callback=None):
+  f = UploadFile(upload_item.path, upload_item.offset, callback)
+  try:
+    headers = {**upload_item.headers, 'Content-Length': str(len(f))}
+    if f.offset > 0:
+      headers['Content-Range'] = f'bytes {f.offset}-{f.size - 1}/{f.size}'
+    return upload_session.put(upload_item.url, data=f, headers=headers, timeout=UPLOAD_TIMEOUT)
+  finally:
+    f.close()
+
+class SubscriptionCache():
+  """Long lived conflated sockets for getMessage. A message younger than two
+  periods of its service (at least a second) is answered from the cache,
+  otherwise the next one is waited for like a fresh subscription would."""
+  def __init__(self):
+    self.socks = {}
+    self.latest = {}  # service -> (logMonoTime, message dict)
+    self.locks = {}
+    self.lock = threading.Lock()
+
+  def _max_age(self, service):
+    frequency = service_list[service].frequency
+    return max(1., 2. / frequency) if frequency > 0 else 1.
+
+  def get(self, service, timeout):
+    with self.lock:
+      lock = self.locks.setdefault(service, threading.Lock())
+
+    with lock:
+      sock = self.socks.get(service)
+      if sock is None:
+        sock = self.socks[service] = messaging.sub_sock(service, conflate=True)
+
+      now = sec_since_boot()
+      msg = messaging.recv_one_or_none(sock)
+      if msg is not None:
+        self.latest[service] = (msg.logMonoTime, msg.to_dict())
+
+      latest = self.latest.get(service)
+      if latest is not None and now - latest[0] / 1e9 < self._max_age(service):
+        return latest[1]
+
+      sock.setTimeout(timeout)
+      msg = messaging.recv_one(sock)
+      if msg is None:
+        return None
+      self.latest[service] = (msg.logMonoTime, msg.to_dict())
+      return self.latest[service][1]
+
+subscription_cache = SubscriptionCache()
+
+class DataDirectoryIndex():
+  """Sorted listings of the directories under root, re-listed only when their mtime
+  changed. A prefix query refreshes root and only the directories the prefix can
+  be in, found with a bisect into the sorted subdirectories of root."""
+  def __init__(self, root):
+    self.root = root
+    self.dirs = {}  # relative dir -> (mtime_ns, files, subdirs)
+    self.lock = threading.Lock()
+
+  def _listing(self, rel):
+    """Up to date (files, subdirs) of rel, None if it's gone"""
+    path = os.path.join(self.root, rel)
+    try:
+      st = os.stat(path)
+      cached = self.dirs.get(rel)
+      if cached is None or cached[0] is None or cached[0] != st.st_mtime_ns:
+        files, subdirs = [], []
+        with os.scandir(path) as it:
+          for entry in it:
+            # like os.walk, symlinked dirs are neither listed nor followed
+            if entry.is_dir():
+              if not entry.is_symlink():
+                subdirs.append(entry.name)
+            else:
+              files.append(entry.name)
+        files.sort()
+        subdirs.sort()
+
+        # a file created in the same mtime tick as this listing wouldn't change the mtime, check again next time
+        mtime = st.st_mtime_ns if time.time() - st.st_mtime > 1. else None
+        if cached is not None:
+          for d in set(cached[2]) - set(subdirs):
+            self._drop(os.path.join(rel, d))
+        self.dirs[rel] = cached = (mtime, files, subdirs)
+    except OSError:
+      self._drop(rel)
+      return None
+    return cached[1], cached[2]
+
+  def _drop(self, rel):
+    for d in self.dirs.pop(rel, (None, [], []))[2]:
+      self._drop(os.path.join(rel, d))
+
+  def _walk(self, rel, out):
+    """Adds the files in rel and below it to out"""
+    listing = self._listing(rel)
+    if listing is not None:
+      files, subdirs = listing
+      out.extend(os.path.join(rel, f) for f in files)
+      for d in subdirs:
+        self._walk(os.path.join(rel, d), out)
+
+  def list(self, prefix=''):
+    with self.lock:
+      listing = self._listing('')
+      if listing is None:
+        return []
+      files, subdirs = listing
+
+      # only entries of root starting with the first path component of prefix can match
+      first, sep, _ = prefix.partition('/')
+      if sep:
+        ret, dirs = [], [first] if first in _prefixed(subdirs, first) else []
+      else:
+        ret, dirs = list(_prefixed(files, prefix)), _prefixed(subdirs, prefix)
+      for d in dirs:
+        self._walk(d, ret)
+      return sorted(f for f in ret if f.startswith(prefix))
+
+def _prefixed(names, prefix):
+  """The names in the sorted list names that start with prefix"""
+  start = bisect.bisect_left(names, prefix)
+  end = start
+  while end < len(names) and names[end].startswith(prefix):
+    end += 1
+  return names[start:end]
+
+_data_dir_indexes: Any = {}
+
+def get_data_dir_index(root):
+  if root not in _data_dir_indexes:
+    _data_dir_indexes[root] = DataDirectoryIndex(root)
+  return _data_dir_indexes[root]
 
 # security: user should be able to request any message from their car
 @dispatcher.add_method
@@ -103,18 +363,16 @@ def getMessage(service=None, timeout=1000):
   if service is None or service not in service_list:
     raise Exception("invalid service")
 
-  socket = messaging.sub_sock(service, timeout=timeout)
-  ret = messaging.recv_one(socket)
+  ret = subscription_cache.get(service, timeout)
 
   if ret is None:
     raise TimeoutError
 
-  return ret.to_dict()
+  return ret
 
 @dispatcher.add_method
-def listDataDirectory():
-  files = [os.path.relpath(os.path.join(dp, f), ROOT) for dp, dn, fn in os.walk(ROOT) for f in fn]
-  return files
+def listDataDirectory(prefix=''):
+  return get_data_dir_index(ROOT).list(prefix)
 
 @dispatcher.add_method
 def reboot():
@@ -132,24 +390,26 @@ def reboot():
   return {"success": 1}
 
 @dispatcher.add_method
-def uploadFileToUrl(fn, url, headers):
+def uploadFileToUrl(fn, url, headers, resumable=False):
   if len(fn) == 0 or fn[0] == '/' or '..' in fn:
     return 500
   path = os.path.join(ROOT, fn)
   if not os.path.exists(path):
     return 404
 
-  item = UploadItem(path=path, url=url, headers=headers, created_at=int(time.time()*1000), id=None)
+  item = UploadItem(path=path, url=url, headers=headers, created_at=int(time.time()*1000), id=None, resumable=resumable)
   upload_id = hashlib.sha1(str(item).encode()).hexdigest()
   item = item._replace(id=upload_id)
 
   upload_queue.put_nowait(item)
+  UploadQueueCache.cache(upload_queue)
 
   return {"enqueued": 1, "item": item._asdict()}
 
 @dispatcher.add_method
 def listUploadQueue():
-  return [item._asdict() for item in list(upload_queue.queue)]
+  items = list(cur_upload_items.values()) + list(upload_queue.queue)
+  return [item._asdict() for item in items if item.id not in cancelled_uploads]
 
 @dispatcher.add_method
 def cancelUpload(upload_id):
@@ -158,6 +418,7 @@ def cancelUpload(upload_id):
     return 404
 
   cancelled_uploads.add(upload_id)
+  UploadQueueCache.cache(upload_queue)
   return {"success": 1}
 
 def startLocalProxy(global_end_event, remote_ws_uri, local_port):
@@ -308,6 +569,7 @@ def main():
   ws_uri = ATHENA_HOST + "/ws/v2/" + dongle_id
 
   api = Api(dongle_id)
+  UploadQueueCache.initialize(upload_queue)
 
   conn_retries = 0
   while 1:
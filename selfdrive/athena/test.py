@@ -2,12 +2,14 @@
 import json
 import os
 import requests
+import shutil
 import tempfile
 import time
 import threading
 import queue
 import unittest
 
+from functools import partial
 from multiprocessing import Process
 from pathlib import Path
 from unittest import mock
@@ -16,7 +18,8 @@ from websocket._exceptions import WebSocketConnectionClosedException
 
 from selfdrive.athena import athenad
 from selfdrive.athena.athenad import dispatcher
-from selfdrive.athena.test_helpers import MockWebsocket, MockParams, MockApi, EchoSocket, with_http_server
+from selfdrive.athena.test_helpers import MockWebsocket, MockParams, MockApi, EchoSocket, ResumableHTTPRequestHandler, \
+                                         with_http_server
 from cereal import messaging
 
 class TestAthenadMethods(unittest.TestCase):
@@ -54,8 +57,69 @@ class TestAthenadMethods(unittest.TestCase):
     finally:
       p.terminate()
 
+  def test_getMessage_cached(self):
+    def send_thermal():
+      messaging.context = messaging.Context()
+      pub_sock = messaging.pub_sock("thermal")
+      start = time.time()
+
+      while time.time() - start < 2:
+        msg = messaging.new_message('thermal')
+        pub_sock.send(msg.to_bytes())
+        time.sleep(0.01)
+
+    p = Process(target=send_thermal)
+    p.start()
+    time.sleep(0.1)
+    try:
+      first = dispatcher["getMessage"]("thermal")
+      sock = athenad.subscription_cache.socks["thermal"]
+      # later calls reuse the socket and get a recent message right away
+      for _ in range(10):
+        t = time.monotonic()
+        thermal = dispatcher["getMessage"]("thermal", timeout=1000)
+        self.assertLess(time.monotonic() - t, 0.1)
+        self.assertGreaterEqual(thermal['logMonoTime'], first['logMonoTime'])
+      self.assertIs(athenad.subscription_cache.socks["thermal"], sock)
+    finally:
+      p.terminate()
+
   def test_listDataDirectory(self):
-    print(dispatcher["listDataDirectory"]())
+    def walk(prefix=''):
+      files = [os.path.relpath(os.path.join(dp, f), athenad.ROOT) for dp, dn, fn in os.walk(athenad.ROOT) for f in fn]
+      return sorted(f for f in files if f.startswith(prefix))
+
+    route = '2020-05-25--12-13-36'
+    segments = [f'{route}--{i}' for i in (0, 1, 2, 10, 11)]
+    for segment in segments:
+      os.makedirs(os.path.join(athenad.ROOT, segment))
+      for f in ('rlog.bz2', 'qlog.bz2', 'fcamera.hevc'):
+        Path(os.path.join(athenad.ROOT, segment, f)).touch()
+
+    try:
+      self.assertEqual(dispatcher["listDataDirectory"](), walk())
+      self.assertEqual(dispatcher["listDataDirectory"](f'{route}--1'), walk(f'{route}--1'))
+      self.assertEqual(len(dispatcher["listDataDirectory"](f'{route}--1')), 9)
+      self.assertEqual(dispatcher["listDataDirectory"](f'{route}--2/'), [f'{route}--2/{f}' for f in ('fcamera.hevc', 'qlog.bz2', 'rlog.bz2')])
+      self.assertEqual(dispatcher["listDataDirectory"]('does_not_exist'), [])
+
+      # changes show up in the next listing
+      Path(os.path.join(athenad.ROOT, segments[0], 'qcamera.ts')).touch()
+      shutil.rmtree(os.path.join(athenad.ROOT, segments[1]))
+      os.makedirs(os.path.join(athenad.ROOT, segments[2], 'sub'))
+      Path(os.path.join(athenad.ROOT, segments[2], 'sub', 'x')).touch()
+      self.assertEqual(dispatcher["listDataDirectory"](), walk())
+      self.assertEqual(dispatcher["listDataDirectory"](route), walk(route))
+
+      # only root and the directories the prefix can be in are looked at
+      with mock.patch('os.stat', wraps=os.stat) as stat:
+        self.assertEqual(dispatcher["listDataDirectory"](f'{route}--1'), walk(f'{route}--1'))
+        self.assertEqual(dispatcher["listDataDirectory"](f'{route}--2/sub/'), [f'{route}--2/sub/x'])
+      self.assertEqual(sorted(set(os.path.relpath(c[0][0], athenad.ROOT) for c in stat.call_args_list)),
+                       ['.', f'{route}--10', f'{route}--11', f'{route}--2', f'{route}--2/sub'])
+    finally:
+      for segment in segments:
+        shutil.rmtree(os.path.join(athenad.ROOT, segment), ignore_errors=True)
 
   @with_http_server
   def test_do_upload(self, host):
@@ -75,6 +139,196 @@ class TestAthenadMethods(unittest.TestCase):
     finally:
       os.unlink(fn)
 
+  @partial(with_http_server, handler=ResumableHTTPRequestHandler)
+  def test_do_upload_progress(self, host):
+    fn = os.path.join(athenad.ROOT, 'rlog.bz2')
+    dat = os.urandom(1024*1024)
+    with open(fn, 'wb') as f:
+      f.write(dat)
+
+    try:
+      progress = []
+      item = athenad.UploadItem(path=fn, url=f"{host}/rlog.bz2", headers={}, created_at=int(time.time()*1000), id='')
+      resp = athenad._do_upload(item, lambda sent, size: progress.append((sent, size)))
+      self.assertEqual(resp.status_code, 201)
+      self.assertEqual(requests.get(f"{host}/rlog.bz2").content, dat)
+
+      # streamed in chunks
+      self.assertGreater(len(progress), 1)
+      self.assertTrue(all(b - a <= athenad.UPLOAD_CHUNK_SIZE for (a, _), (b, _) in zip(progress, progress[1:])))
+      self.assertEqual(progress[-1], (len(dat), len(dat)))
+    finally:
+      os.unlink(fn)
+
+  @partial(with_http_server, handler=ResumableHTTPRequestHandler)
+  def test_do_upload_resume(self, host):
+    fn = os.path.join(athenad.ROOT, 'rlog.bz2')
+    dat = os.urandom(1024*1024)
+    with open(fn, 'wb') as f:
+      f.write(dat)
+
+    try:
+      item = athenad.UploadItem(path=fn, url=f"{host}/rlog.bz2", headers={'X-Fail-After': '300000'}, created_at=int(time.time()*1000), id='',
+                                resumable=True)
+      with self.assertRaises(requests.exceptions.ConnectionError):
+        athenad._do_upload(item)
+
+      offset = athenad._get_upload_offset(item)
+      self.assertEqual(offset, 300000)
+
+      progress = []
+      resp = athenad._do_upload(item._replace(offset=offset), lambda sent, size: progress.append(sent))
+      self.assertEqual(resp.status_code, 201)
+      self.assertGreater(progress[0], offset)
+      self.assertEqual(requests.get(f"{host}/rlog.bz2").content, dat)
+
+      # all of it was uploaded, only the response got lost
+      self.assertIsNone(athenad._get_upload_offset(item))
+    finally:
+      os.unlink(fn)
+
+  def test_get_upload_offset_not_resumable(self):
+    # to a store that can't resume, like an Azure SAS URL, the empty PUT would write an empty file
+    fn = os.path.join(athenad.ROOT, 'rlog.bz2')
+    Path(fn).touch()
+
+    try:
+      item = athenad.UploadItem(path=fn, url="http://localhost:44444/rlog.bz2", headers={}, created_at=int(time.time()*1000), id='')
+      with mock.patch.object(athenad.upload_session, 'put') as put:
+        self.assertEqual(athenad._get_upload_offset(item), 0)
+        put.assert_not_called()
+    finally:
+      os.unlink(fn)
+
+  @partial(with_http_server, handler=ResumableHTTPRequestHandler)
+  def test_retry_upload_already_uploaded(self, host):
+    fn = os.path.join(athenad.ROOT, 'rlog.bz2')
+    with open(fn, 'wb') as f:
+      f.write(os.urandom(1024))
+
+    try:
+      item = athenad.UploadItem(path=fn, url=f"{host}/rlog.bz2", headers={}, created_at=int(time.time()*1000), id='', resumable=True)
+      self.assertEqual(athenad._do_upload(item).status_code, 201)
+
+      # not queued again when the server already has all of it
+      athenad.cur_upload_items[0] = item
+      athenad.retry_upload(0, item)
+      self.assertEqual(athenad.upload_queue.qsize(), 0)
+      self.assertNotIn(0, athenad.cur_upload_items)
+    finally:
+      athenad.upload_queue = queue.Queue()
+      os.unlink(fn)
+
+  @partial(with_http_server, handler=ResumableHTTPRequestHandler)
+  def test_upload_handler_retry(self, host):
+    fns = [os.path.join(athenad.ROOT, f'rlog{i}.bz2') for i in range(4)]
+    dats = [os.urandom(256*1024) for _ in fns]
+    for fn, dat in zip(fns, dats):
+      with open(fn, 'wb') as f:
+        f.write(dat)
+
+    end_event = threading.Event()
+    threads = [threading.Thread(target=athenad.upload_handler, args=(end_event,)) for _ in range(2)]
+    for thread in threads:
+      thread.start()
+
+    try:
+      # the first one fails halfway and is resumed
+      for i, fn in enumerate(fns):
+        headers = {'X-Fail-After': '100000'} if i == 0 else {}
+        item = athenad.UploadItem(path=fn, url=f"{host}/rlog{i}.bz2", headers=headers, created_at=int(time.time()*1000), id=str(i),
+                                  resumable=True)
+        athenad.upload_queue.put_nowait(item)
+
+      def uploaded():
+        return [requests.get(f"{host}/rlog{i}.bz2").content == dat for i, dat in enumerate(dats)]
+
+      now = time.time()
+      while time.time() - now < 10 and not all(uploaded()):
+        time.sleep(0.1)
+      self.assertEqual(uploaded(), [True] * len(dats))
+      self.assertEqual(athenad.upload_queue.qsize(), 0)
+    finally:
+      end_event.set()
+      for thread in threads:
+        thread.join()
+      athenad.upload_queue = queue.Queue()
+      for fn in fns:
+        os.unlink(fn)
+
+  def test_upload_handler_status_codes(self):
+    fn = os.path.join(athenad.ROOT, 'qlog.bz2')
+    Path(fn).touch()
+
+    try:
+      for status_code, retried in [(403, False), (404, False), (408, True), (429, True), (503, True)]:
+        item = athenad.UploadItem(path=fn, url="http://localhost:44444/qlog.bz2", headers={}, created_at=int(time.time()*1000), id='')
+        athenad.upload_queue.put_nowait(item)
+
+        end_event = threading.Event()
+        thread = threading.Thread(target=athenad.upload_handler, args=(end_event,))
+        with mock.patch.object(athenad, '_do_upload', return_value=mock.Mock(status_code=status_code)) as do_upload, \
+             mock.patch.object(athenad, 'backoff', return_value=60):
+          thread.start()
+          now = time.time()
+          while time.time() - now < 5 and (do_upload.call_count == 0 or athenad.cur_upload_items):
+            time.sleep(0.01)
+          end_event.set()
+          thread.join()
+
+        self.assertEqual(do_upload.call_count, 1)
+        queued = list(athenad.upload_queue.queue)
+        self.assertEqual([i.retry_count for i in queued], [1] if retried else [], status_code)
+        athenad.upload_queue = queue.Queue()
+    finally:
+      athenad.upload_queue = queue.Queue()
+      os.unlink(fn)
+
+  @with_http_server
+  def test_upload_handler_backoff(self, host):
+    fn = os.path.join(athenad.ROOT, 'qlog.bz2')
+    Path(fn).touch()
+
+    end_event = threading.Event()
+    thread = threading.Thread(target=athenad.upload_handler, args=(end_event,))
+    thread.start()
+
+    try:
+      # an upload backing off doesn't hold up the only upload thread
+      waiting = athenad.UploadItem(path=fn, url=f"{host}/qlog.bz2", headers={}, created_at=0, id='waiting', retry_count=1,
+                                   retry_at=time.time() + 60)
+      item = athenad.UploadItem(path=fn, url=f"{host}/qlog.bz2", headers={}, created_at=0, id='item')
+      athenad.upload_queue.put_nowait(waiting)
+      athenad.upload_queue.put_nowait(item)
+
+      now = time.time()
+      while time.time() - now < 5 and athenad.upload_queue.qsize() > 1:
+        time.sleep(0.01)
+      time.sleep(0.2)
+      self.assertEqual([i.id for i in athenad.upload_queue.queue], ['waiting'])
+      self.assertEqual(athenad.cur_upload_items, {})
+    finally:
+      end_event.set()
+      thread.join()
+      athenad.upload_queue = queue.Queue()
+      os.unlink(fn)
+
+  def test_upload_queue_cache(self):
+    items = [athenad.UploadItem(path=f"rlog{i}.bz2", url=f"http://localhost:44444/rlog{i}.bz2", headers={}, created_at=i, id=str(i), offset=i)
+             for i in range(3)]
+    try:
+      for item in items:
+        athenad.upload_queue.put_nowait(item)
+      athenad.UploadQueueCache.cache(athenad.upload_queue)
+
+      # after a restart
+      athenad.upload_queue = queue.Queue()
+      athenad.UploadQueueCache.initialize(athenad.upload_queue)
+      self.assertEqual(list(athenad.upload_queue.queue), items)
+    finally:
+      athenad.upload_queue = queue.Queue()
+      MockParams().delete(athenad.UPLOAD_QUEUE_PARAM)
+
   @with_http_server
   def test_uploadFileToUrl(self, host):
     not_exists_resp = dispatcher["uploadFileToUrl"]("does_not_exist.bz2", "http://localhost:1238", {})
@@ -112,6 +366,7 @@ class TestAthenadMethods(unittest.TestCase):
       self.assertEqual(athenad.upload_queue.qsize(), 0)
     finally:
       end_event.set()
+      thread.join()
       athenad.upload_queue = queue.Queue()
       os.unlink(fn)
 
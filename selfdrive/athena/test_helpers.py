@@ -40,11 +40,11 @@ class MockApi():
     return "fake-token"
 
 class MockParams():
-  def __init__(self):
-    self.params = {
-      "DongleId": b"0000000000000000",
-      "GithubSshKeys": b"ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQC307aE+nuHzTAgaJhzSf5v7ZZQW9gaperjhCmyPyl4PzY7T1mDGenTlVTN7yoVFZ9UfO9oMQqo0n1OwDIiqbIFxqnhrHU0cYfj88rI85m5BEKlNu5RdaVTj1tcbaPpQc5kZEolaI1nDDjzV0lwS7jo5VYDHseiJHlik3HH1SgtdtsuamGR2T80q1SyW+5rHoMOJG73IH2553NnWuikKiuikGHUYBd00K1ilVAK2xSiMWJp55tQfZ0ecr9QjEsJ+J/efL4HqGNXhffxvypCXvbUYAFSddOwXUPo5BTKevpxMtH+2YrkpSjocWA04VnTYFiPG6U4ItKmbLOTFZtPzoez private"
-    }
+  # shared by all instances, like the params directory
+  params = {
+    "DongleId": b"0000000000000000",
+    "GithubSshKeys": b"ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQC307aE+nuHzTAgaJhzSf5v7ZZQW9gaperjhCmyPyl4PzY7T1mDGenTlVTN7yoVFZ9UfO9oMQqo0n1OwDIiqbIFxqnhrHU0cYfj88rI85m5BEKlNu5RdaVTj1tcbaPpQc5kZEolaI1nDDjzV0lwS7jo5VYDHseiJHlik3HH1SgtdtsuamGR2T80q1SyW+5rHoMOJG73IH2553NnWuikKiuikGHUYBd00K1ilVAK2xSiMWJp55tQfZ0ecr9QjEsJ+J/efL4HqGNXhffxvypCXvbUYAFSddOwXUPo5BTKevpxMtH+2YrkpSjocWA04VnTYFiPG6U4ItKmbLOTFZtPzoez private"
+  }
 
   def get(self, k, encoding=None):
     ret = self.params.get(k)
@@ -52,6 +52,12 @@ class MockParams():
       ret = ret.decode(encoding)
     return ret
 
+  def put(self, k, v):
+    self.params[k] = v.encode() if isinstance(v, str) else v
+
+  def delete(self, k):
+    self.params.pop(k, None)
+
 class MockWebsocket():
   def __init__(self, recv_queue, send_queue):
     self.recv_queue = recv_queue
@@ -73,6 +79,56 @@ class HTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     self.send_response(201, "Created")
     self.end_headers()
 
+class ResumableHTTPRequestHandler(http.server.BaseHTTPRequestHandler):
+  """Keeps uploads in memory and resumes them the way resumable upload APIs do:
+  PUT with Content-Range: bytes */size answers 308 with the Range received so far,
+  or 200 once all of it was, PUT with Content-Range: bytes start-end/size appends. A new upload with an
+  X-Fail-After header drops the connection after that many bytes."""
+  uploads: dict = {}
+
+  def do_PUT(self):
+    length = int(self.headers['Content-Length'])
+    content_range = self.headers.get('Content-Range')
+    dat = self.uploads.get(self.path, b"")
+
+    if content_range is None:
+      fail_after = self.headers.get('X-Fail-After')
+      if fail_after is not None and int(fail_after) < length:
+        self.uploads[self.path] = self.rfile.read(int(fail_after))
+        self.close_connection = True
+        self.connection.shutdown(socket.SHUT_RDWR)
+        return
+      self.uploads[self.path] = self.rfile.read(length)
+      self.send_response(201, "Created")
+    elif content_range.startswith('bytes */'):
+      if len(dat) == int(content_range[len('bytes */'):]):
+        self.send_response(200, "OK")
+      else:
+        self.send_response(308, "Resume Incomplete")
+      if 0 < len(dat) < int(content_range[len('bytes */'):]):
+        self.send_header('Range', f'bytes=0-{len(dat) - 1}')
+    else:
+      start = int(content_range[len('bytes '):].split('-')[0])
+      if start != len(dat):
+        self.send_response(416, "Range Not Satisfiable")
+      else:
+        self.uploads[self.path] = dat + self.rfile.read(length)
+        self.send_response(201, "Created")
+    self.send_header('Content-Length', '0')
+    self.end_headers()
+
+  def do_GET(self):
+    dat = self.uploads.get(self.path)
+    if dat is None:
+      self.send_response(404)
+      self.send_header('Content-Length', '0')
+      self.end_headers()
+      return
+    self.send_response(200)
+    self.send_header('Content-Length', str(len(dat)))
+    self.end_headers()
+    self.wfile.write(dat)
+
 def http_server(port_queue, **kwargs):
   while 1:
     try:
@@ -83,7 +139,7 @@ def http_server(port_queue, **kwargs):
       if e.errno == 98:
         continue
 
-def with_http_server(func):
+def with_http_server(func, handler=HTTPRequestHandler):
   @wraps(func)
   def inner(*args, **kwargs):
     port_queue = multiprocessing.Queue()
@@ -91,22 +147,24 @@ def with_http_server(func):
     p = Process(target=http_server,
                 args=(port_queue,),
                 kwargs={
-                  'HandlerClass': HTTPRequestHandler,
+                  'HandlerClass': handler,
                   'bind': host})
     p.start()
-    now = time.time()
-    port = None
-    while 1:
-      if time.time() - now > 5:
-        raise Exception('HTTP Server did not start')
-      try:
-        port = port_queue.get(timeout=0.1)
-        requests.put(f'http://{host}:{port}/qlog.bz2', data='')
-        break
-      except (requests.exceptions.ConnectionError, queue.Empty):
-        time.sleep(0.1)
-
     try:
+      now = time.time()
+      port = None
+      while 1:
+        if time.time() - now > 5:
+          raise Exception('HTTP Server did not start')
+        try:
+          # the server picks another port if its port was taken
+          while not port_queue.empty() or port is None:
+            port = port_queue.get(timeout=0.1)
+          requests.put(f'http://{host}:{port}/qlog.bz2', data='')
+          break
+        except (requests.exceptions.ConnectionError, queue.Empty):
+          time.sleep(0.1)
+
       return func(*args, f'http://{host}:{port}', **kwargs)
     finally:
       p.terminate()
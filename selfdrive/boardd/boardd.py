@@ -1,8 +1,11 @@
 # pylint: skip-file
+import numpy as np
 
 # Cython, now uses scons to build
-from selfdrive.boardd.boardd_api_impl import can_list_to_can_capnp
+from selfdrive.boardd.boardd_api_impl import can_list_to_can_capnp, can_arrays_to_can_capnp, can_capnp_to_can_arrays
 assert can_list_to_can_capnp
+assert can_arrays_to_can_capnp
+assert can_capnp_to_can_arrays
 
 def can_capnp_to_can_list(can, src_filter=None):
   ret = []
@@ -10,3 +13,85 @@ def can_capnp_to_can_list(can, src_filter=None):
     if src_filter is None or msg.src in src_filter:
       ret.append((msg.address, msg.busTime, msg.dat, msg.src))
   return ret
+
+
+class CanBatch():
+  """CAN messages in arrays that are kept from one frame to the next.
+
+  Message i has address addresses[i], busTime bus_times[i], src srcs[i] and
+  dat dat[offsets[i]:offsets[i + 1]], for i below n. Events are built from and
+  read into the arrays without a Python object per message, they only grow
+  when a frame has more messages or dat than any before.
+  """
+  def __init__(self, capacity=64, dat_capacity=None):
+    self.addresses = np.zeros(capacity, dtype=np.uint32)
+    self.bus_times = np.zeros(capacity, dtype=np.uint16)
+    self.lengths = np.zeros(capacity, dtype=np.uint32)
+    self.srcs = np.zeros(capacity, dtype=np.uint8)
+    self.offsets = np.zeros(capacity + 1, dtype=np.int64)
+    self.dat = bytearray(capacity * 8 if dat_capacity is None else dat_capacity)
+    self.n = 0
+
+  def __len__(self):
+    return self.n
+
+  def clear(self):
+    self.n = 0
+
+  def reserve(self, capacity, dat_capacity):
+    if capacity > len(self.addresses):
+      capacity = max(capacity, 2 * len(self.addresses))
+      for name in ['addresses', 'bus_times', 'lengths', 'srcs']:
+        old = getattr(self, name)
+        new = np.zeros(capacity, dtype=old.dtype)
+        new[:self.n] = old[:self.n]
+        setattr(self, name, new)
+      offsets = np.zeros(capacity + 1, dtype=np.int64)
+      offsets[:self.n + 1] = self.offsets[:self.n + 1]
+      self.offsets = offsets
+    if dat_capacity > len(self.dat):
+      self.dat += bytes(max(dat_capacity, 2 * len(self.dat)) - len(self.dat))
+
+  def add(self, address, dat, src, bus_time=0):
+    n, pos = self.n, int(self.offsets[self.n])
+    end = pos + len(dat)
+    if n == len(self.addresses) or end > len(self.dat):
+      self.reserve(n + 1, end)
+    self.addresses[n] = address
+    self.bus_times[n] = bus_time
+    self.lengths[n] = len(dat)
+    self.srcs[n] = src
+    self.dat[pos:end] = dat
+    self.offsets[n + 1] = end
+    self.n = n + 1
+
+  def extend(self, can_msgs):
+    """Adds (address, busTime, dat, src) messages, as the car controllers send them"""
+    for address, bus_time, dat, src in can_msgs:
+      self.add(address, dat, src, bus_time)
+
+  def get_dat(self, i):
+    return bytes(self.dat[self.offsets[i]:self.offsets[i + 1]])
+
+  def to_can_list(self):
+    """The messages as can_capnp_to_can_list gives them"""
+    return [(int(self.addresses[i]), int(self.bus_times[i]), self.get_dat(i), int(self.srcs[i])) for i in range(self.n)]
+
+  def to_capnp(self, msgtype='can', valid=True):
+    return can_arrays_to_can_capnp(self.addresses, self.bus_times, self.dat, self.lengths, self.srcs,
+                                   n=self.n, msgtype=msgtype, valid=valid)
+
+  def from_capnp(self, event, msgtype='can'):
+    """Replaces the messages with the ones of a raw can or sendcan event, none if it's another event"""
+    while True:
+      n, dat_size = can_capnp_to_can_arrays(event, self.addresses, self.bus_times, self.dat, self.lengths, self.srcs,
+                                            msgtype=msgtype)
+      if n <= len(self.addresses) and dat_size <= len(self.dat):
+        break
+      # nothing is kept, the event is read again
+      self.n = 0
+      self.reserve(n, dat_size)
+
+    self.n = max(n, 0)
+    np.cumsum(self.lengths[:self.n], out=self.offsets[1:self.n + 1])
+    return self.n
@@ -3,6 +3,7 @@
 from libcpp.vector cimport vector
 from libcpp.string cimport string
 from libcpp cimport bool
+from libc.stdint cimport uint8_t, uint16_t, uint32_t
 
 cdef struct can_frame:
   long address
@@ -11,6 +12,12 @@ cdef struct can_frame:
   long src
 
 cdef extern void can_list_to_can_capnp_cpp(const vector[can_frame] &can_list, string &out, bool sendCan, bool valid)
+cdef extern void can_arrays_to_can_capnp_cpp(size_t n, const uint32_t *addresses, const uint16_t *bus_times,
+                                             const uint8_t *dat, const uint32_t *lengths, const uint8_t *srcs,
+                                             string &out, bool sendCan, bool valid)
+cdef extern long can_capnp_to_can_arrays_cpp(const uint8_t *data, size_t size, bool sendCan,
+                                             uint32_t *addresses, uint16_t *bus_times, uint8_t *dat, uint32_t *lengths,
+                                             uint8_t *srcs, size_t capacity, size_t dat_capacity, size_t *dat_size)
 
 def can_list_to_can_capnp(can_msgs, msgtype='can', valid=True):
   cdef vector[can_frame] can_list
@@ -24,3 +31,68 @@ def can_list_to_can_capnp(can_msgs, msgtype='can', valid=True):
   cdef string out
   can_list_to_can_capnp_cpp(can_list, out, msgtype == 'sendcan', valid)
   return out
+
+def can_arrays_to_can_capnp(const uint32_t[::1] addresses, const uint16_t[::1] bus_times, const uint8_t[::1] dat,
+                            const uint32_t[::1] lengths, const uint8_t[::1] srcs, n=None, msgtype='can', valid=True):
+  """can_list_to_can_capnp of the first n messages of arrays, the dat of message i
+  is the next lengths[i] bytes of dat"""
+  cdef size_t count = addresses.shape[0]
+  if n is not None:
+    count = n
+  if count > addresses.shape[0] or count > bus_times.shape[0] or count > lengths.shape[0] or count > srcs.shape[0]:
+    raise ValueError("n is more than the messages in the arrays")
+
+  cdef size_t dat_size = 0
+  cdef size_t i
+  for i in range(count):
+    dat_size += lengths[i]
+  if dat_size > <size_t>dat.shape[0]:
+    raise ValueError("lengths add up to more than dat")
+
+  cdef string out
+  if count == 0:
+    can_arrays_to_can_capnp_cpp(0, NULL, NULL, NULL, NULL, NULL, out, msgtype == 'sendcan', valid)
+    return out
+
+  cdef const uint8_t *dat_ptr = NULL
+  if dat_size > 0:
+    dat_ptr = &dat[0]
+  can_arrays_to_can_capnp_cpp(count, &addresses[0], &bus_times[0], dat_ptr, &lengths[0], &srcs[0],
+                              out, msgtype == 'sendcan', valid)
+  return out
+
+def can_capnp_to_can_arrays(const uint8_t[::1] event, uint32_t[::1] addresses, uint16_t[::1] bus_times,
+                            uint8_t[::1] dat, uint32_t[::1] lengths, uint8_t[::1] srcs, msgtype='can'):
+  """Reads the messages of a raw can or sendcan event into arrays.
+
+  Returns:
+    (n, dat_size): the number of messages and the bytes of dat they have, n is -1
+    if the event is another one. When the messages or their dat don't fit the
+    arrays are only partly filled, and it has to be read again with larger ones.
+  """
+  cdef size_t capacity = min(addresses.shape[0], bus_times.shape[0], lengths.shape[0], srcs.shape[0])
+  cdef size_t dat_capacity = dat.shape[0]
+  cdef size_t dat_size = 0
+  # stand ins for empty arrays, nothing is written to them with no room
+  cdef uint32_t no_address, no_length
+  cdef uint16_t no_bus_time
+  cdef uint8_t no_src, no_dat
+  cdef uint32_t *addresses_ptr = &no_address
+  cdef uint16_t *bus_times_ptr = &no_bus_time
+  cdef uint32_t *lengths_ptr = &no_length
+  cdef uint8_t *srcs_ptr = &no_src
+  cdef uint8_t *dat_ptr = &no_dat
+
+  if event.shape[0] == 0:
+    return -1, 0
+  if capacity > 0:
+    addresses_ptr = &addresses[0]
+    bus_times_ptr = &bus_times[0]
+    lengths_ptr = &lengths[0]
+    srcs_ptr = &srcs[0]
+  if dat_capacity > 0:
+    dat_ptr = &dat[0]
+
+  n = can_capnp_to_can_arrays_cpp(&event[0], event.shape[0], msgtype == 'sendcan', addresses_ptr, bus_times_ptr,
+                                  dat_ptr, lengths_ptr, srcs_ptr, capacity, dat_capacity, &dat_size)
+  return n, dat_size
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# Picks the CAN messages with a few addresses out of raw can/sendcan events
+# without decoding the rest. The CanData list is read straight from the capnp
+# wire format, so only the matching messages become Python objects.
+import sys
+import struct
+
+import cereal.messaging as messaging
+from cereal import log
+
+_EVENT = log.Event.schema
+_CAN_DATA = log.CanData.schema
+
+# layout of Event and CanData, from the schema so a field move can't go unnoticed
+_DISCRIMINANT_OFFSET = _EVENT.node.struct.discriminantOffset * 2  # bytes into the data section
+_DISCRIMINANTS = {w: _EVENT.fields[w].proto.discriminantValue for w in ('can', 'sendcan')}
+_LIST_PTR = {w: _EVENT.fields[w].proto.slot.offset for w in ('can', 'sendcan')}
+_ADDRESS_SHIFT = _CAN_DATA.fields['address'].proto.slot.offset * 32
+_BUS_TIME_SHIFT = _CAN_DATA.fields['busTime'].proto.slot.offset * 16
+_SRC_SHIFT = _CAN_DATA.fields['src'].proto.slot.offset * 8
+_DAT_PTR = _CAN_DATA.fields['dat'].proto.slot.offset
+assert _ADDRESS_SHIFT + 32 <= 64 and _BUS_TIME_SHIFT + 16 <= 64 and _SRC_SHIFT + 8 <= 64
+# words are read in native byte order, capnp is little endian
+assert sys.byteorder == "little"
+
+_STRUCT, _LIST, _FAR = 0, 1, 2
+_LIST_BYTE, _LIST_COMPOSITE = 2, 7
+
+
+class UnsupportedLayout(Exception):
+  pass
+
+
+class _Message():
+  """Words and segment start offsets of a flat array capnp message"""
+  def __init__(self, dat):
+    if len(dat) < 8 or len(dat) % 8:
+      raise UnsupportedLayout("bad message size")
+    self.dat = dat
+    self.words = memoryview(dat).cast('B').cast('Q')
+
+    n_segments = struct.unpack_from("<I", dat)[0] + 1
+    sizes = struct.unpack_from("<%dI" % n_segments, dat, 4)
+    pos = (2 + n_segments) // 2
+    self.segment_starts = []
+    for size in sizes:
+      self.segment_starts.append(pos)
+      pos += size
+    if pos > len(self.words):
+      raise UnsupportedLayout("truncated message")
+
+  def follow(self, pos):
+    """Follows the pointer at word pos, returns (pointer, target word) where
+    pointer is the word carrying the kind and size of what it points to"""
+    ptr = self.words[pos]
+    if ptr & 3 != _FAR:
+      return ptr, pos + 1 + _signed_offset(ptr)
+
+    pad = self.segment_starts[ptr >> 32] + ((ptr >> 3) & 0x1FFFFFFF)
+    if not (ptr >> 2) & 1:
+      # single far, the landing pad is a regular pointer
+      return self.follow(pad)
+
+    # double far, far pointer to the content followed by a tag
+    content = self.words[pad]
+    return self.words[pad + 1], self.segment_starts[content >> 32] + ((content >> 3) & 0x1FFFFFFF)
+
+
+def _signed_offset(ptr):
+  offset = (ptr & 0xFFFFFFFF) >> 2
+  return offset - (1 << 30) if offset & (1 << 29) else offset
+
+
+def scan_can_capnp(dat, which='can'):
+  """Finds the CanData list of a raw can or sendcan event.
+
+  Returns:
+    (message, words, ptr_offset, stride): the data word of every message,
+    and where its dat pointer is for read_dat. No words if dat is another event.
+  """
+  m = _Message(dat)
+
+  ptr, root = m.follow(m.segment_starts[0])
+  if ptr == 0:
+    return m, [], 0, 0
+  if ptr & 3 != _STRUCT:
+    raise UnsupportedLayout("root is not a struct")
+  data_words, ptr_count = (ptr >> 32) & 0xFFFF, ptr >> 48
+
+  discriminant = 0
+  if _DISCRIMINANT_OFFSET + 2 <= data_words * 8:
+    discriminant = struct.unpack_from("<H", dat, root * 8 + _DISCRIMINANT_OFFSET)[0]
+  if discriminant != _DISCRIMINANTS[which] or _LIST_PTR[which] >= ptr_count:
+    return m, [], 0, 0
+
+  ptr, tag_pos = m.follow(root + data_words + _LIST_PTR[which])
+  if ptr == 0:
+    return m, [], 0, 0
+  if ptr & 3 != _LIST or (ptr >> 32) & 7 != _LIST_COMPOSITE:
+    raise UnsupportedLayout("can list is not a struct list")
+
+  # the tag word of a composite list is laid out like a struct pointer with the element count as offset
+  tag = m.words[tag_pos]
+  n = (tag & 0xFFFFFFFF) >> 2
+  data_words, ptr_count = (tag >> 32) & 0xFFFF, tag >> 48
+  stride = data_words + ptr_count
+  start = tag_pos + 1
+  if data_words < 1 or ptr_count <= _DAT_PTR or start + n * stride > len(m.words):
+    raise UnsupportedLayout("unexpected CanData layout")
+
+  return m, m.words[start:start + n * stride:stride].tolist(), start + data_words + _DAT_PTR, stride
+
+
+def unpack_can_data(word):
+  """(address, busTime, src) from the data word of a CanData"""
+  return (word >> _ADDRESS_SHIFT) & 0xFFFFFFFF, (word >> _BUS_TIME_SHIFT) & 0xFFFF, (word >> _SRC_SHIFT) & 0xFF
+
+
+def read_dat(m, ptr_pos):
+  ptr, target = m.follow(ptr_pos)
+  if ptr == 0:
+    return b""
+  if ptr & 3 != _LIST or (ptr >> 32) & 7 != _LIST_BYTE:
+    raise UnsupportedLayout("dat is not a byte list")
+  return bytes(m.dat[target * 8:target * 8 + (ptr >> 35)])
+
+
+def _filter_decoded(dat, addrs, ranges, src_filter, which):
+  ret = []
+  evt = log.Event.from_bytes(dat)
+  if evt.which() != which:
+    return ret
+  for msg in getattr(evt, which):
+    if src_filter is not None and msg.src not in src_filter:
+      continue
+    if msg.address in addrs or any(lo <= msg.address <= hi for lo, hi in ranges):
+      ret.append((msg.address, msg.busTime, bytes(msg.dat), msg.src))
+  return ret
+
+
+def filter_can_capnp(dat, addrs, ranges=(), src_filter=None, which='can'):
+  """Same as can_capnp_to_can_list on the decoded event, but only for messages
+  whose address is in addrs or in one of the inclusive (lo, hi) ranges.
+  Layouts the scanner doesn't handle are decoded the regular way."""
+  addrs = addrs if isinstance(addrs, (set, frozenset)) else set(addrs)
+  try:
+    m, words, ptr_offset, stride = scan_can_capnp(dat, which)
+    ret = []
+    for i, w in enumerate(words):
+      address = (w >> _ADDRESS_SHIFT) & 0xFFFFFFFF
+      if address in addrs or (ranges and any(lo <= address <= hi for lo, hi in ranges)):
+        address, bus_time, src = unpack_can_data(w)
+        if src_filter is None or src in src_filter:
+          ret.append((address, bus_time, read_dat(m, ptr_offset + i * stride), src))
+    return ret
+  except (UnsupportedLayout, IndexError, ValueError, struct.error):
+    return _filter_decoded(dat, addrs, ranges, src_filter, which)
+
+
+class CanFilter():
+  """can_recv for panda.python.uds.CanClient reading a can socket, returns
+  (address, busTime, dat, src) of the messages with the given addresses only"""
+  def __init__(self, sock, addrs, ranges=(), bus=None, wait_for_one=False):
+    self.sock = sock
+    self.addrs = set(addrs)
+    self.ranges = ranges
+    self.src_filter = None if bus is None else [bus]
+    self.wait_for_one = wait_for_one
+
+  def __call__(self):
+    ret = []
+    for dat in messaging.drain_sock_raw(self.sock, wait_for_one=self.wait_for_one):
+      ret += filter_can_capnp(dat, self.addrs, self.ranges, self.src_filter)
+    return ret
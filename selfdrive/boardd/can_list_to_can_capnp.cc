@@ -1,6 +1,7 @@
 #include <vector>
 #include <tuple>
 #include <string>
+#include <cstring>
 #include "common/timing.h"
 #include <capnp/serialize.h>
 #include "cereal/gen/cpp/log.capnp.h"
@@ -34,4 +35,64 @@ void can_list_to_can_capnp_cpp(const std::vector<can_frame> &can_list, std::stri
   out.append((const char *)bytes.begin(), bytes.size());
 }
 
+// same as can_list_to_can_capnp_cpp, the dat of message i is the next lengths[i] bytes of dat
+void can_arrays_to_can_capnp_cpp(size_t n, const uint32_t *addresses, const uint16_t *bus_times,
+                                 const uint8_t *dat, const uint32_t *lengths, const uint8_t *srcs,
+                                 std::string &out, bool sendCan, bool valid) {
+  capnp::MallocMessageBuilder msg;
+  cereal::Event::Builder event = msg.initRoot<cereal::Event>();
+  event.setLogMonoTime(nanos_since_boot());
+  event.setValid(valid);
+
+  auto canData = sendCan ? event.initSendcan(n) : event.initCan(n);
+  size_t pos = 0;
+  for (size_t i = 0; i < n; i++) {
+    canData[i].setAddress(addresses[i]);
+    canData[i].setBusTime(bus_times[i]);
+    canData[i].setDat(kj::arrayPtr(dat + pos, lengths[i]));
+    canData[i].setSrc(srcs[i]);
+    pos += lengths[i];
+  }
+  auto words = capnp::messageToFlatArray(msg);
+  auto bytes = words.asBytes();
+  out.append((const char *)bytes.begin(), bytes.size());
+}
+
+// Reads the messages of a can or sendcan event into arrays with room for capacity messages and
+// dat_capacity bytes of dat, nothing is written past those. Returns the number of messages, or -1
+// if the event is another one. *dat_size is set to the dat bytes of the messages that had room,
+// a return over capacity or a *dat_size over dat_capacity means the arrays were too small.
+long can_capnp_to_can_arrays_cpp(const uint8_t *data, size_t size, bool sendCan,
+                                 uint32_t *addresses, uint16_t *bus_times, uint8_t *dat, uint32_t *lengths,
+                                 uint8_t *srcs, size_t capacity, size_t dat_capacity, size_t *dat_size) {
+  auto amsg = kj::heapArray<capnp::word>((size / sizeof(capnp::word)) + 1);
+  memcpy(amsg.begin(), data, size);
+
+  capnp::FlatArrayMessageReader cmsg(amsg);
+  cereal::Event::Reader event = cmsg.getRoot<cereal::Event>();
+  capnp::List<cereal::CanData>::Reader canData;
+  if (sendCan && event.isSendcan()) {
+    canData = event.getSendcan();
+  } else if (!sendCan && event.isCan()) {
+    canData = event.getCan();
+  } else {
+    return -1;
+  }
+
+  size_t pos = 0;
+  for (size_t i = 0; i < canData.size() && i < capacity; i++) {
+    auto d = canData[i].getDat();
+    addresses[i] = canData[i].getAddress();
+    bus_times[i] = canData[i].getBusTime();
+    lengths[i] = d.size();
+    srcs[i] = canData[i].getSrc();
+    if (pos + d.size() <= dat_capacity) {
+      memcpy(dat + pos, d.begin(), d.size());
+    }
+    pos += d.size();
+  }
+  *dat_size = pos;
+  return canData.size();
+}
+
 }
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# Time per frame of building sendcan from the tuple list controlsd gets from a
+# car controller, and of reading can back into a list, against CanBatch kept
+# from one frame to the next.
+import time
+import random
+
+from cereal import log
+from selfdrive.boardd.boardd import CanBatch, can_list_to_can_capnp, can_capnp_to_can_list
+from selfdrive.boardd.tests.test_can_filter import random_can_list
+
+FRAMES = 1000
+# what car controllers send per frame, and a quiet to a busy car on can
+SENDCAN_MSGS = [4, 12, 30]
+CAN_MSGS = [20, 60, 150]
+
+
+def bench(name, f, frames):
+  t = time.perf_counter()
+  for frame in frames:
+    f(frame)
+  print("%-16s %7.1f us/frame" % (name, (time.perf_counter() - t) / len(frames) * 1e6))
+
+
+if __name__ == "__main__":
+  random.seed(0)
+  for n in SENDCAN_MSGS:
+    print("sendcan, %d msgs/frame" % n)
+    frames = [[[addr, 0, dat, bus] for addr, _, dat, bus in random_can_list(n)] for _ in range(FRAMES)]
+    bench("list", lambda can_sends: can_list_to_can_capnp(can_sends, msgtype='sendcan'), frames)
+
+    batch = CanBatch()
+    def build(can_sends):
+      batch.clear()
+      batch.extend(can_sends)
+      return batch.to_capnp('sendcan')
+    bench("CanBatch", build, frames)
+
+  for n in CAN_MSGS:
+    print("can, %d msgs/frame" % n)
+    packets = [can_list_to_can_capnp(random_can_list(n)) for _ in range(FRAMES)]
+    bench("decoded list", lambda dat: can_capnp_to_can_list(log.Event.from_bytes(dat).can), packets)
+
+    batch = CanBatch()
+    bench("CanBatch", batch.from_capnp, packets)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+import time
+import random
+
+from cereal import log
+from selfdrive.boardd.boardd import can_list_to_can_capnp
+from selfdrive.boardd.can_filter import filter_can_capnp
+from selfdrive.boardd.tests.test_can_filter import random_can_list
+
+# boardd publishes can at 100Hz, a busy car has ~2000-6000 msgs/s over its buses
+RATE = 100
+MSGS_PER_PACKET = [20, 60, 150]
+# what an IsoTpParallelQuery for a fw version query listens to
+RX_ADDRS = {0x7e8, 0x7b8, 0x7a9, 0x758, 0x18daf1e0}
+SECONDS = 10
+
+
+def filter_decoded(packets):
+  # what IsoTpParallelQuery.rx did with drain_sock
+  ret = []
+  for dat in packets:
+    evt = log.Event.from_bytes(dat)
+    for msg in evt.can:
+      if msg.src == 1 and msg.address in RX_ADDRS:
+        ret.append((msg.address, msg.busTime, msg.dat, msg.src))
+  return ret
+
+
+def filter_raw(packets):
+  ret = []
+  for dat in packets:
+    ret += filter_can_capnp(dat, RX_ADDRS, src_filter=[1])
+  return ret
+
+
+def bench(name, f, packets):
+  t = time.perf_counter()
+  f(packets)
+  dt = time.perf_counter() - t
+  print("%-10s %8.1f us/packet, %5.1f%% of one core at %dHz" % (name, dt / len(packets) * 1e6, dt / SECONDS * 100, RATE))
+
+
+if __name__ == "__main__":
+  random.seed(0)
+  for n in MSGS_PER_PACKET:
+    packets = [can_list_to_can_capnp(random_can_list(n)) for _ in range(RATE * SECONDS)]
+    print("%d msgs/packet, %d msgs/s" % (n, n * RATE))
+    bench("decoded", filter_decoded, packets)
+    bench("raw", filter_raw, packets)
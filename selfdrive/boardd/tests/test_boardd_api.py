@@ -73,5 +73,78 @@ class TestBoarddApiMethods(unittest.TestCase):
     self.assertTrue(elapsed_new < elapsed_old / 2)
 
 
+class TestCanBatch(unittest.TestCase):
+  def assertSameEvent(self, m, m_ref, which):
+    ev, ev_ref = log.Event.from_bytes(m), log.Event.from_bytes(m_ref)
+    self.assertEqual(ev.which(), ev_ref.which())
+    self.assertEqual(ev.valid, ev_ref.valid)
+    self.assertEqual(boardd.can_capnp_to_can_list(getattr(ev, which)),
+                     boardd.can_capnp_to_can_list(getattr(ev_ref, which)))
+
+  def test_arrays_to_capnp(self):
+    for i in range(200):
+      can_list, cnt = generate_random_can_data_list()
+      addresses = np.array([m[0] for m in can_list], dtype=np.uint32)
+      bus_times = np.array([m[1] for m in can_list], dtype=np.uint16)
+      lengths = np.array([len(m[2]) for m in can_list], dtype=np.uint32)
+      srcs = np.array([m[3] for m in can_list], dtype=np.uint8)
+      dat = b"".join(m[2] for m in can_list)
+
+      for msgtype in ['can', 'sendcan']:
+        m = boardd.can_arrays_to_can_capnp(addresses, bus_times, dat, lengths, srcs, msgtype=msgtype, valid=bool(i % 2))
+        m_ref = boardd.can_list_to_can_capnp(can_list, msgtype, valid=bool(i % 2))
+        self.assertSameEvent(m, m_ref, msgtype)
+
+      # only the first n
+      n = random.randint(0, cnt)
+      m = boardd.can_arrays_to_can_capnp(addresses, bus_times, dat, lengths, srcs, n=n)
+      self.assertSameEvent(m, boardd.can_list_to_can_capnp(can_list[:n]), 'can')
+
+  def test_arrays_too_short(self):
+    addresses = np.zeros(2, dtype=np.uint32)
+    bus_times = np.zeros(2, dtype=np.uint16)
+    srcs = np.zeros(2, dtype=np.uint8)
+    lengths = np.array([8, 8], dtype=np.uint32)
+    with self.assertRaises(ValueError):
+      boardd.can_arrays_to_can_capnp(addresses, bus_times, bytes(15), lengths, srcs)
+    with self.assertRaises(ValueError):
+      boardd.can_arrays_to_can_capnp(addresses, bus_times, bytes(16), lengths, srcs, n=3)
+
+  def test_round_trip(self):
+    # small to start with, so it has to grow
+    batch = boardd.CanBatch(capacity=1, dat_capacity=1)
+    for i in range(500):
+      can_list, _ = generate_random_can_data_list()
+      can_list = [tuple(m) for m in can_list]
+      msgtype = ['can', 'sendcan'][i % 2]
+
+      batch.clear()
+      batch.extend(can_list)
+      self.assertEqual(len(batch), len(can_list))
+      self.assertEqual(batch.to_can_list(), can_list)
+      m = batch.to_capnp(msgtype)
+      self.assertSameEvent(m, boardd.can_list_to_can_capnp(can_list, msgtype), msgtype)
+
+      # read back into another batch that had other messages
+      other = boardd.CanBatch(capacity=random.randint(1, 64), dat_capacity=random.randint(1, 512))
+      other.extend(generate_random_can_data_list()[0])
+      self.assertEqual(other.from_capnp(m, msgtype), len(can_list))
+      self.assertEqual(other.to_can_list(), can_list)
+      self.assertEqual(other.get_dat(len(can_list) - 1), can_list[-1][2])
+
+  def test_other_events(self):
+    batch = boardd.CanBatch()
+    batch.extend(generate_random_can_data_list()[0])
+    self.assertEqual(batch.from_capnp(boardd.can_list_to_can_capnp([], 'can'), 'can'), 0)
+    self.assertEqual(batch.to_can_list(), [])
+
+    m = boardd.can_list_to_can_capnp([(0x123, 0, b"\x01", 0)], 'sendcan')
+    self.assertEqual(batch.from_capnp(m, 'can'), 0)
+    self.assertEqual(batch.from_capnp(m, 'sendcan'), 1)
+
+    dat = log.Event.new_message(carState={'vEgo': 1.0}).to_bytes()
+    self.assertEqual(batch.from_capnp(dat, 'can'), 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import random
+import struct
+import unittest
+
+import capnp
+from cereal import log
+from selfdrive.boardd.boardd import can_capnp_to_can_list, can_list_to_can_capnp
+from selfdrive.boardd.can_filter import filter_can_capnp, scan_can_capnp, unpack_can_data
+
+ADDRS = {0x7e8, 0x18daf1e0, 0x750}
+RANGES = [(0x18DAF100, 0x18DAF1FF)]
+
+
+def random_can_list(n):
+  addrs = list(ADDRS) + [0x18daf101, 0x7e0, 0x2e4]
+  return [[random.choice(addrs) if random.random() < 0.3 else random.randint(0, 0x7ff), random.randint(0, 0xffff),
+           bytes(random.getrandbits(8) for _ in range(random.randint(0, 8))), random.randint(0, 3)] for _ in range(n)]
+
+
+def to_multi_segment(can_list, which):
+  """Event split over many small segments, so most pointers are far pointers"""
+  builder = capnp._MallocMessageBuilder(8)
+  evt = builder.init_root(log.Event)
+  msgs = evt.init(which, len(can_list))
+  for i, (address, bus_time, dat, src) in enumerate(can_list):
+    msgs[i].address = address
+    msgs[i].busTime = bus_time
+    msgs[i].dat = dat
+    msgs[i].src = src
+
+  segments = [bytes(s) for s in builder.get_segments_for_output()]
+  header = struct.pack("<I", len(segments) - 1) + b"".join(struct.pack("<I", len(s) // 8) for s in segments)
+  return header.ljust((len(header) + 7) // 8 * 8, b"\x00") + b"".join(segments)
+
+
+def filter_decoded(dat, src_filter, which):
+  evt = log.Event.from_bytes(dat)
+  return [m for m in can_capnp_to_can_list(getattr(evt, which), src_filter)
+          if m[0] in ADDRS or any(lo <= m[0] <= hi for lo, hi in RANGES)]
+
+
+class TestCanFilter(unittest.TestCase):
+  def setUp(self):
+    random.seed(0)
+
+  def test_scan(self):
+    can_list = random_can_list(200)
+    _, words, _, _ = scan_can_capnp(can_list_to_can_capnp(can_list))
+    self.assertEqual([unpack_can_data(w) for w in words], [(m[0], m[1], m[3]) for m in can_list])
+
+  def test_filter(self):
+    for _ in range(200):
+      can_list = random_can_list(random.randint(0, 300))
+      for which in ('can', 'sendcan'):
+        for dat in (can_list_to_can_capnp(can_list, msgtype=which), to_multi_segment(can_list, which)):
+          for src_filter in (None, [1], [0, 2]):
+            self.assertEqual(filter_can_capnp(dat, ADDRS, RANGES, src_filter, which),
+                             filter_decoded(dat, src_filter, which))
+
+  def test_other_events(self):
+    dat = can_list_to_can_capnp(random_can_list(10), msgtype='sendcan')
+    self.assertEqual(filter_can_capnp(dat, ADDRS, RANGES), [])
+
+    evt = log.Event.new_message()
+    evt.init('carState')
+    self.assertEqual(filter_can_capnp(evt.to_bytes(), ADDRS, RANGES), [])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 import struct
 import traceback
+from collections import defaultdict, namedtuple
+from functools import lru_cache
 from typing import Any
 
 from tqdm import tqdm
@@ -103,86 +105,152 @@ REQUESTS = [
 ]
 
 
+# ECUs that have to respond for a car to match, see is_essential_ecu
+ESSENTIAL_ECUS = [Ecu.engine, Ecu.eps, Ecu.esp, Ecu.fwdRadar, Ecu.fwdCamera, Ecu.vsa, Ecu.electricBrakeBooster]
+
+# max number of addresses in one query
+MAX_QUERY_ADDRS = 128
+
+# one query of the plan: request and response sequence of REQUESTS[request_idx], sent to addrs
+FwQuery = namedtuple('FwQuery', ['request_idx', 'request', 'response', 'addrs'])
+
+
 def chunks(l, n=128):
   for i in range(0, len(l), n):
     yield l[i:i + n]
 
 
-def match_fw_to_car(fw_versions):
-  candidates = FW_VERSIONS
-  invalid = []
+def is_essential_ecu(candidate, ecu_type):
+  if ecu_type == Ecu.esp and candidate in [TOYOTA.RAV4, TOYOTA.COROLLA, TOYOTA.HIGHLANDER]:
+    return False
+
+  # TODO: COROLLA_TSS2 engine can show on two different addresses
+  if ecu_type == Ecu.engine and candidate in [TOYOTA.COROLLA_TSS2, TOYOTA.CHR]:
+    return False
+
+  return ecu_type in ESSENTIAL_ECUS
+
+
+class FwIndex():
+  """Inverted index of a FW_VERSIONS table: which cars accept a version on an
+  address, and which cars need an address to respond at all"""
+  def __init__(self, fw_table):
+    self.candidates = set(fw_table.keys())
+    self.ecu_candidates = defaultdict(set)  # (addr, sub_addr) -> cars with an ECU there
+    self.version_candidates = defaultdict(set)  # ((addr, sub_addr), version) -> cars accepting it
+    self.required = defaultdict(set)  # (addr, sub_addr) -> cars that need a version from it
+
+    for candidate, fws in fw_table.items():
+      expected = {}
+      for ecu, expected_versions in fws.items():
+        addr = ecu[1:]
+        # two ECUs on one address both have to accept the version
+        expected[addr] = expected[addr] & set(expected_versions) if addr in expected else set(expected_versions)
+        if is_essential_ecu(candidate, ecu[0]):
+          self.required[addr].add(candidate)
+
+      for addr, versions in expected.items():
+        self.ecu_candidates[addr].add(candidate)
+        for version in versions:
+          self.version_candidates[(addr, version)].add(candidate)
+
+  def match(self, fw_versions_dict):
+    invalid = set()
+    for addr, version in fw_versions_dict.items():
+      if addr in self.ecu_candidates:
+        invalid |= self.ecu_candidates[addr] - self.version_candidates.get((addr, version), set())
+
+    for addr, candidates in self.required.items():
+      if addr not in fw_versions_dict:
+        invalid |= candidates
+
+    return self.candidates - invalid
 
+
+@lru_cache(maxsize=None)
+def get_fw_index():
+  return FwIndex(FW_VERSIONS)
+
+
+def match_fw_to_car(fw_versions):
   fw_versions_dict = {}
   for fw in fw_versions:
     addr = fw.address
     sub_addr = fw.subAddress if fw.subAddress != 0 else None
     fw_versions_dict[(addr, sub_addr)] = fw.fwVersion
 
-  for candidate, fws in candidates.items():
-    for ecu, expected_versions in fws.items():
-      ecu_type = ecu[0]
-      addr = ecu[1:]
-      found_version = fw_versions_dict.get(addr, None)
-      ESSENTIAL_ECUS = [Ecu.engine, Ecu.eps, Ecu.esp, Ecu.fwdRadar, Ecu.fwdCamera, Ecu.vsa, Ecu.electricBrakeBooster]
-      if ecu_type == Ecu.esp and candidate in [TOYOTA.RAV4, TOYOTA.COROLLA, TOYOTA.HIGHLANDER] and found_version is None:
-        continue
-
-      # TODO: COROLLA_TSS2 engine can show on two different addresses
-      if ecu_type == Ecu.engine and candidate in [TOYOTA.COROLLA_TSS2, TOYOTA.CHR] and found_version is None:
-        continue
-
-      # ignore non essential ecus
-      if ecu_type not in ESSENTIAL_ECUS and found_version is None:
-        continue
-
-      if found_version not in expected_versions:
-        invalid.append(candidate)
-        break
+  return get_fw_index().match(fw_versions_dict)
 
-  return set(candidates.keys()) - set(invalid)
 
+def build_query_plan(versions):
+  """Turns a {brand: {car: {(ecu, addr, sub_addr): [versions]}}} table into
+  the ECU type of every address and a list of waves of queries.
 
-def get_fw_versions(logcan, sendcan, bus, extra=None, timeout=0.1, debug=False, progress=False):
+  Every (request, address) pair is queried once. Queries in one wave go out at
+  the same time and don't share an address, and an address gets its requests
+  in REQUESTS order, so the version of an address is still the response to the
+  last request it answered. ECUs using a subaddress share their address with
+  the rest behind the same gateway and are asked one at a time.
+  """
   ecu_types = {}
-
-  # Extract ECU adresses to query from fingerprints
-  # ECUs using a subadress need be queried one by one, the rest can be done in parallel
-  addrs = []
-  parallel_addrs = []
-
-  versions = get_attr_from_cars('FW_VERSIONS', combine_brands=False)
-  if extra is not None:
-    versions.update(extra)
+  parallel_addrs = {}  # (addr, None) -> brands
+  sub_addrs = {}  # (addr, sub_addr) -> brands
 
   for brand, brand_versions in versions.items():
     for c in brand_versions.values():
       for ecu_type, addr, sub_addr in c.keys():
-        a = (brand, addr, sub_addr)
-        if a not in ecu_types:
-          ecu_types[(addr, sub_addr)] = ecu_type
+        ecu_types.setdefault((addr, sub_addr), ecu_type)
+        addrs = parallel_addrs if sub_addr is None else sub_addrs
+        addrs.setdefault((addr, sub_addr), set()).add(brand)
+
+  # (request_idx, addrs) in the order they were sent one after another before
+  entries = []
+  for addrs in [parallel_addrs] + [{a: b} for a, b in sub_addrs.items()]:
+    for request_idx, (brand, _, _) in enumerate(REQUESTS):
+      matching = [a for a, brands in addrs.items() if brand in brands or 'any' in brands]
+      for addr_chunk in chunks(matching, MAX_QUERY_ADDRS):
+        entries.append((request_idx, addr_chunk))
+
+  waves = []  # [{request_idx: [addrs]}]
+  last_wave = {}  # addr -> wave of its last query
+  for request_idx, addr_chunk in entries:
+    w = max([last_wave[a[0]] + 1 for a in addr_chunk if a[0] in last_wave], default=0)
+    while w < len(waves) and sum(len(a) for a in waves[w].values()) + len(addr_chunk) > MAX_QUERY_ADDRS:
+      w += 1
+    if w == len(waves):
+      waves.append({})
+    waves[w].setdefault(request_idx, []).extend(addr_chunk)
+    for a in addr_chunk:
+      last_wave[a[0]] = w
+
+  plan = []
+  for wave in waves:
+    plan.append([FwQuery(i, REQUESTS[i][1], REQUESTS[i][2], addrs) for i, addrs in sorted(wave.items())])
+  return ecu_types, plan
+
+
+@lru_cache(maxsize=None)
+def get_query_plan():
+  return build_query_plan(get_attr_from_cars('FW_VERSIONS', combine_brands=False))
 
-        if sub_addr is None:
-          if a not in parallel_addrs:
-            parallel_addrs.append(a)
-        else:
-          if [a] not in addrs:
-            addrs.append([a])
 
-  addrs.insert(0, parallel_addrs)
+def get_fw_versions(logcan, sendcan, bus, extra=None, timeout=0.1, debug=False, progress=False):
+  if extra is None:
+    ecu_types, plan = get_query_plan()
+  else:
+    versions = get_attr_from_cars('FW_VERSIONS', combine_brands=False)
+    versions.update(extra)
+    ecu_types, plan = build_query_plan(versions)
 
   fw_versions = {}
-  for i, addr in enumerate(tqdm(addrs, disable=not progress)):
-    for addr_chunk in chunks(addr):
-      for brand, request, response in REQUESTS:
-        try:
-          addrs = [(a, s) for (b, a, s) in addr_chunk if b in (brand, 'any')]
-
-          if addrs:
-            query = IsoTpParallelQuery(sendcan, logcan, bus, addrs, request, response, debug=debug)
-            t = 2 * timeout if i == 0 else timeout
-            fw_versions.update(query.get_data(t))
-        except Exception:
-          cloudlog.warning(f"FW query exception: {traceback.format_exc()}")
+  for i, wave in enumerate(tqdm(plan, disable=not progress)):
+    try:
+      queries = [(q.addrs, q.request, q.response) for q in wave]
+      query = IsoTpParallelQuery.multi(sendcan, logcan, bus, queries, debug=debug)
+      t = 2 * timeout if i == 0 else timeout
+      fw_versions.update(query.get_data(t))
+    except Exception:
+      cloudlog.warning(f"FW query exception: {traceback.format_exc()}")
 
   # Build capnp list to put into CarParams
   car_fw = []
@@ -1,10 +1,12 @@
 from cereal import car, log
 from selfdrive.car import apply_std_steer_torque_limits
-from selfdrive.car.hyundai.hyundaican import create_lkas11, create_clu11, create_lfa_mfa, create_mdps12
+from selfdrive.car.hyundai.hyundaican import create_lkas11, create_clu11, create_lfa_mfa, create_mdps12, \
+                                             patch_lkas11, patch_clu11, patch_mdps12
 from selfdrive.car.hyundai.values import Buttons, SteerLimitParams, CAR, STEER_THRESHOLD
 from opendbc.can.packer import CANPacker
+from opendbc.can.patcher import MessagePatcher
 from selfdrive.config import Conversions as CV
-from common.numpy_fast import interp
+from selfdrive.controls.lib.atom_tune import AtomTuneSchedule
 
 # speed controller
 from selfdrive.car.hyundai.spdcontroller  import SpdController
@@ -25,7 +27,9 @@ class CarController():
     self.CP = CP
     self.apply_steer_last = 0
     self.car_fingerprint = CP.carFingerprint
+    self.dbc_name = dbc_name
     self.packer = CANPacker(dbc_name)
+    self.patchers = {}
     self.steer_rate_limited = False
     self.resume_cnt = 0
     self.lkas11_cnt = 0
@@ -43,6 +47,7 @@ class CarController():
     self.vRel = 0
 
     self.timer1 = tm.CTime1000("time")
+    self.cv_tune = AtomTuneSchedule('cvKPH', 'cvBPV', ('cvsMaxV', 'cvsdUpV', 'cvsdDnV'), max_rows=21)
     self.model_speed = 0
     self.model_sum = 0
     
@@ -112,32 +117,7 @@ class CarController():
 
 
   def atom_tune( self, v_ego_kph, cv_value ):  # cV(곡률에 의한 변화)
-    self.cv_KPH = self.CP.atomTuning.cvKPH
-    self.cv_BPV = self.CP.atomTuning.cvBPV
-    self.cv_sMaxV  = self.CP.atomTuning.cvsMaxV
-    self.cv_sdUpV = self.CP.atomTuning.cvsdUpV
-    self.cv_sdDnV = self.CP.atomTuning.cvsdDnV
-
-    self.steerMAX = []
-    self.steerdUP = []
-    self.steerdDN = []
-
-    # Max
-    nPos = 0
-    for sCV in self.cv_BPV:  
-      self.steerMAX.append( interp( cv_value, sCV, self.cv_sMaxV[nPos] ) )
-      self.steerdUP.append( interp( cv_value, sCV, self.cv_sdUpV[nPos] ) )
-      self.steerdDN.append( interp( cv_value, sCV, self.cv_sdDnV[nPos] ) )
-      nPos += 1
-      if nPos > 20:
-        break
-
-    MAX = interp( v_ego_kph, self.cv_KPH, self.steerMAX )
-    UP  = interp( v_ego_kph, self.cv_KPH, self.steerdUP )
-    DN  = interp( v_ego_kph, self.cv_KPH, self.steerdDN )
-
-    #str_log1 = 'ego={:.1f} /{:.1f}/{:.1f}/{:.1f} {}'.format(v_ego_kph,  MAX, UP, DN, self.steerMAX )
-    #trace1.printf2( '{}'.format( str_log1 ) )      
+    MAX, UP, DN = self.cv_tune.get(self.CP)( v_ego_kph, cv_value )
     return MAX, UP, DN
 
 
@@ -234,6 +214,39 @@ class CarController():
         self.SC = SpdctrlNormal()
 
 
+  def get_patcher( self, name, signals ):
+    # the signals create_ functions get from the parser are the ones kept from the received frame
+    if name not in self.patchers:
+      self.patchers[name] = MessagePatcher(self.dbc_name, name, keep=set(signals))
+    return self.patchers[name]
+
+  # the forwarded messages are patched into the last received frame when there is one,
+  # packed from the parsed signals otherwise
+  def make_lkas11( self, CS, buses, apply_steer, steer_req, sys_warning, c ):
+    dat = CS.raw_frame("LKAS11")
+    if dat is None:
+      return [create_lkas11(self.packer, self.lkas11_cnt, self.car_fingerprint, apply_steer, steer_req,
+                            CS.lkas11, sys_warning, self.hud_sys_state, c, bus) for bus in buses]
+
+    p = self.get_patcher("LKAS11", CS.lkas11)
+    x = patch_lkas11(p, dat, self.lkas11_cnt, self.car_fingerprint, apply_steer, steer_req,
+                     sys_warning, self.hud_sys_state, c)
+    return [p.make_can_msg(x, bus) for bus in buses]
+
+  def make_clu11( self, CS, frame, button, speed=None, bus=0 ):
+    dat = CS.raw_frame("CLU11")
+    if dat is None:
+      return create_clu11(self.packer, frame, CS.clu11, button, speed, bus)
+    p = self.get_patcher("CLU11", CS.clu11)
+    return p.make_can_msg(patch_clu11(p, dat, frame, button, speed), bus)
+
+  def make_mdps12( self, CS, frame ):
+    dat = CS.raw_frame("MDPS12")
+    if dat is None:
+      return create_mdps12(self.packer, frame, CS.mdps12)
+    p = self.get_patcher("MDPS12", CS.mdps12)
+    return p.make_can_msg(patch_mdps12(p, dat, frame), 2)
+
 #  c:car.CarControl(car.capnp), CS:CarState  CP:CarInterface.get_params
   def update(self, c, CS, frame, sm, CP ):
     if self.CP != CP:
@@ -278,23 +291,18 @@ class CarController():
       self.lkas11_cnt = CS.lkas11["CF_Lkas_MsgCount"] + 1
     self.lkas11_cnt %= 0x10
 
-    can_sends.append( create_lkas11(self.packer, self.lkas11_cnt, self.car_fingerprint, apply_steer, steer_req,
-                                    CS.lkas11, sys_warning, self.hud_sys_state, c ) )
-
-
-    if CS.mdps_bus or CS.scc_bus == 1: # send lkas11 bus 1 if mdps is on bus 1
-      can_sends.append( create_lkas11(self.packer, self.lkas11_cnt, self.car_fingerprint, apply_steer, steer_req,
-                                      CS.lkas11, sys_warning, self.hud_sys_state, c, 1 ) )
+    lkas11_buses = [0, 1] if CS.mdps_bus or CS.scc_bus == 1 else [0] # send lkas11 bus 1 if mdps is on bus 1
+    can_sends += self.make_lkas11( CS, lkas11_buses, apply_steer, steer_req, sys_warning, c )
 
     if CS.mdps_bus: # send clu11 to mdps if it is not on bus 0
       clu11_speed = CS.clu_Vanz
       enabled_speed = 60
       if clu11_speed > enabled_speed or not lkas_active:
         enabled_speed = clu11_speed
-      can_sends.append( create_clu11(self.packer, frame, CS.clu11, Buttons.NONE, enabled_speed, CS.mdps_bus) )
+      can_sends.append( self.make_clu11(CS, frame, Buttons.NONE, enabled_speed, CS.mdps_bus) )
 
     # send mdps12 to LKAS to prevent LKAS error if no cancel cmd
-    can_sends.append( create_mdps12(self.packer, frame, CS.mdps12) )
+    can_sends.append( self.make_mdps12(CS, frame) )
 
     str_log1 = 'torg:{:5.0f}/{:5.0f}/{:5.0f}  CV={:5.1f}/{:5.1f}'.format(  apply_steer, new_steer, dst_steer, self.model_speed, self.model_sum  )
     str_log2 = 'limit={:.0f} tm={:.1f} '.format( apply_steer_limit, self.timer1.sampleTime()  )
@@ -306,7 +314,7 @@ class CarController():
       trace1.printf2( '{}'.format( str_log2 ) )
 
     if pcm_cancel_cmd and self.CP.longcontrolEnabled:
-      can_sends.append( create_clu11(self.packer, frame, CS.clu11, Buttons.CANCEL) )
+      can_sends.append( self.make_clu11(CS, frame, Buttons.CANCEL) )
 
     elif CS.out.cruiseState.standstill:
       # run only first time when the car stopped
@@ -316,7 +324,7 @@ class CarController():
         self.resume_cnt = 0
       # when lead car starts moving, create 6 RES msgs
       elif CS.lead_distance != self.last_lead_distance and (frame - self.last_resume_frame) > 5:
-        can_sends.append(create_clu11(self.packer, self.resume_cnt, CS.clu11, Buttons.RES_ACCEL))
+        can_sends.append(self.make_clu11(CS, self.resume_cnt, Buttons.RES_ACCEL))
         self.resume_cnt += 1
         # interval after 6 msgs
         if self.resume_cnt > 5:
@@ -328,7 +336,7 @@ class CarController():
     elif run_speed_ctrl and self.SC != None:
       is_sc_run = self.SC.update( CS, sm, self )
       if is_sc_run:
-        can_sends.append(create_clu11(self.packer, self.resume_cnt, CS.clu11, self.SC.btn_type, self.SC.sc_clu_speed ))
+        can_sends.append(self.make_clu11(CS, self.resume_cnt, self.SC.btn_type, self.SC.sc_clu_speed ))
         self.resume_cnt += 1
       else:
         self.resume_cnt = 0
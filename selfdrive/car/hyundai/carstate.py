@@ -2,6 +2,7 @@ from cereal import car
 from selfdrive.car.hyundai.values import DBC, STEER_THRESHOLD, FEATURES, EV_HYBRID
 from selfdrive.car.interfaces import CarStateBase
 from opendbc.can.parser import CANParser
+from selfdrive.boardd.can_filter import filter_can_capnp
 from selfdrive.config import Conversions as CV
 from selfdrive.car.hyundai.spdcontroller  import SpdController
 from selfdrive.car.hyundai.values import Buttons
@@ -9,6 +10,14 @@ from selfdrive.car.hyundai.values import Buttons
 
 GearShifter = car.CarState.GearShifter
 
+# messages the car controller sends on modified, their raw frames are kept too
+FORWARDED_ADDRS = {
+  "LKAS11": 832,
+  "CLU11": 1265,
+  "MDPS12": 593,
+}
+FORWARDED_ADDR_SET = set(FORWARDED_ADDRS.values())
+
 
 
 
@@ -50,6 +59,15 @@ class CarState(CarStateBase):
 
     self.SC = SpdController()
 
+    # (address, bus) -> last received frame
+    self.raw_frames = {}
+    # where the parsers get the forwarded messages from
+    self.raw_buses = {
+      "LKAS11": 2,
+      "CLU11": 0,
+      "MDPS12": 1 if self.mdps_bus else 0,
+    }
+
   def update(self, cp, cp2, cp_cam):
     cp_mdps = cp2 if self.mdps_bus else cp
     cp_sas = cp2 if self.sas_bus else cp
@@ -162,6 +180,15 @@ class CarState(CarStateBase):
     return ret
 
 
+  def update_raw(self, can_strings):
+    for dat in can_strings:
+      for address, _, frame, src in filter_can_capnp(dat, FORWARDED_ADDR_SET):
+        self.raw_frames[(address, src)] = frame
+
+  def raw_frame(self, name):
+    return self.raw_frames.get((FORWARDED_ADDRS[name], self.raw_buses[name]))
+
+
   def update_blinker(self, cp):
     self.TSigLHSw = cp.vl["CGW1"]['CF_Gway_TSigLHSw']
     self.TSigRHSw = cp.vl["CGW1"]['CF_Gway_TSigRHSw']
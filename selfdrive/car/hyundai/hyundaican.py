@@ -5,6 +5,18 @@ from selfdrive.car.hyundai.values import CAR, CHECKSUM
 hyundai_checksum = crcmod.mkCrcFun(0x11D, initCrc=0xFD, rev=False, xorOut=0xdf)
 
 
+def lkas11_checksum(car_fingerprint, dat):
+  if car_fingerprint in CHECKSUM["crc8"]:
+    # CRC Checksum as seen on 2019 Hyundai Santa Fe
+    return hyundai_checksum(dat[:6] + dat[7:8])
+  elif car_fingerprint in CHECKSUM["6B"]:
+    # Checksum of first 6 Bytes, as seen on 2018 Kia Sorento
+    return sum(dat[:6]) % 256
+  else:
+    # Checksum of first 6 Bytes and last Byte as seen on 2018 Kia Stinger
+    return (sum(dat[:6]) + dat[7]) % 256
+
+
 def create_lkas11(packer, frame, car_fingerprint, apply_steer, steer_req,
                   lkas11, sys_warning, sys_state, CC, bus = 0 ):
   values = copy.deepcopy( lkas11 )
@@ -46,19 +58,7 @@ def create_lkas11(packer, frame, car_fingerprint, apply_steer, steer_req,
     values["CF_Lkas_Bca_R"] = 0
 
   dat = packer.make_can_msg("LKAS11", 0, values)[2]
-
-  if car_fingerprint in CHECKSUM["crc8"]:
-    # CRC Checksum as seen on 2019 Hyundai Santa Fe
-    dat = dat[:6] + dat[7:8]
-    checksum = hyundai_checksum(dat)
-  elif car_fingerprint in CHECKSUM["6B"]:
-    # Checksum of first 6 Bytes, as seen on 2018 Kia Sorento
-    checksum = sum(dat[:6]) % 256
-  else:
-    # Checksum of first 6 Bytes and last Byte as seen on 2018 Kia Stinger
-    checksum = (sum(dat[:6]) + dat[7]) % 256
-
-  values["CF_Lkas_Chksum"] = checksum
+  values["CF_Lkas_Chksum"] = lkas11_checksum(car_fingerprint, dat)
 
   return packer.make_can_msg("LKAS11", bus, values)
 
@@ -97,6 +97,10 @@ def create_lfa_mfa(packer, frame, enabled):
 
 
 
+def scc12_checksum(dat):
+  return 16 - sum([sum(divmod(i, 16)) for i in dat]) % 16
+
+
 def create_scc12(packer, apply_accel, enabled, cnt, scc12):
   values = copy.deepcopy( scc12 )
   #values = scc12
@@ -108,7 +112,7 @@ def create_scc12(packer, apply_accel, enabled, cnt, scc12):
   values["CR_VSM_ChkSum"] = 0
 
   dat = packer.make_can_msg("SCC12", 0, values)[2]
-  values["CR_VSM_ChkSum"] = 16 - sum([sum(divmod(i, 16)) for i in dat]) % 16
+  values["CR_VSM_ChkSum"] = scc12_checksum(dat)
 
   return packer.make_can_msg("SCC12", 0, values)
 
@@ -126,4 +130,61 @@ def create_mdps12(packer, frame, mdps12):
   checksum = sum(dat) % 256
   values["CF_Mdps_Chksum2"] = checksum
 
-  return packer.make_can_msg("MDPS12", 2, values)
\ No newline at end of file
+  return packer.make_can_msg("MDPS12", 2, values)
+
+
+# The same frames as the create_ functions above, from the last received frame
+# instead of its parsed signals. Only the changed signals, the counter and the
+# checksum are patched into its bytes, see opendbc.can.patcher. The patchers
+# are made with the signals the create_ functions would get as keep.
+
+def patch_lkas11(patcher, dat, frame, car_fingerprint, apply_steer, steer_req,
+                 sys_warning, sys_state, CC):
+  p = patcher
+  x = p.mirror(dat)
+  x = p.set(x, "CF_Lkas_LdwsSysState", sys_state)
+  x = p.set(x, "CF_Lkas_SysWarning", 3 if sys_warning else 0)
+  x = p.set(x, "CR_Lkas_StrToqReq", apply_steer)
+  x = p.set(x, "CF_Lkas_ActToi", steer_req)
+  x = p.set(x, "CF_Lkas_ToiFlt", 0)
+  x = p.set(x, "CF_Lkas_MsgCount", frame % 0x10)
+  x = p.set(x, "CF_Lkas_Chksum", 0)
+
+  if car_fingerprint in [CAR.SONATA, CAR.PALISADE]:
+    x = p.set(x, "CF_Lkas_Bca_R", int(CC.hudControl.leftLaneVisible) + (int(CC.hudControl.rightLaneVisible) << 1))
+    x = p.set(x, "CF_Lkas_LdwsOpt_USM", 2)
+    x = p.set(x, "CF_Lkas_FcwOpt_USM", 2 if CC.enabled else 1)
+    x = p.set(x, "CF_Lkas_SysWarning", 4 if sys_warning else 0)
+  elif car_fingerprint == CAR.HYUNDAI_GENESIS:
+    x = p.set(x, "CF_Lkas_Bca_R", 2)
+  elif car_fingerprint == CAR.KIA_OPTIMA:
+    x = p.set(x, "CF_Lkas_Bca_R", 0)
+
+  return p.set(x, "CF_Lkas_Chksum", lkas11_checksum(car_fingerprint, p.to_bytes(x)))
+
+
+def patch_clu11(patcher, dat, frame, button, speed=None):
+  x = patcher.mirror(dat)
+  if speed is not None:
+    x = patcher.set(x, "CF_Clu_Vanz", speed)
+  x = patcher.set(x, "CF_Clu_CruiseSwState", button)
+  return patcher.set(x, "CF_Clu_AliveCnt1", frame % 0x10)
+
+
+def patch_scc12(patcher, dat, apply_accel, enabled, cnt, acc_mode):
+  x = patcher.mirror(dat)
+  if enabled and acc_mode == 1:
+    x = patcher.set(x, "aReqMax", apply_accel)
+    x = patcher.set(x, "aReqMin", apply_accel)
+  x = patcher.set(x, "CR_VSM_Alive", cnt)
+  x = patcher.set(x, "CR_VSM_ChkSum", 0)
+  return patcher.set(x, "CR_VSM_ChkSum", scc12_checksum(patcher.to_bytes(x)))
+
+
+def patch_mdps12(patcher, dat, frame):
+  x = patcher.mirror(dat)
+  x = patcher.set(x, "CF_Mdps_ToiActive", 0)
+  x = patcher.set(x, "CF_Mdps_ToiUnavail", 1)
+  x = patcher.set(x, "CF_Mdps_MsgCount2", frame % 0x100)
+  x = patcher.set(x, "CF_Mdps_Chksum2", 0)
+  return patcher.set(x, "CF_Mdps_Chksum2", sum(patcher.to_bytes(x)) % 256)
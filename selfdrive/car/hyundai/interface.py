@@ -5,6 +5,7 @@ from selfdrive.car.hyundai.values import Ecu, ECU_FINGERPRINT, CAR, FINGERPRINTS
 from selfdrive.car import STD_CARGO_KG, scale_rot_inertia, scale_tire_stiffness, is_ecu_disconnected, gen_empty_fingerprint
 from selfdrive.car.interfaces import CarInterfaceBase, MAX_CTRL_SPEED
 from selfdrive.atom_conf import AtomConf
+from selfdrive.controls.lib.atom_tune import tune_changed
 from common.params import Params
 
 ATOMC = AtomConf()
@@ -331,7 +332,9 @@ class CarInterface(CarInterfaceBase):
 
     CP.steerRateCost = ATOMC.steerRateCost
     CP.steerLimitTimer = ATOMC.steerLimitTimer
-    
+
+    # CP is changed in place, have the gain schedules compiled from it again
+    tune_changed()
     return CP
 
   def update(self, c, can_strings):
@@ -340,6 +343,7 @@ class CarInterface(CarInterfaceBase):
     self.cp_cam.update_strings(can_strings)
 
     ret = self.CS.update(self.cp, self.cp2, self.cp_cam)
+    self.CS.update_raw(can_strings)
     ret.canValid = self.cp.can_valid and self.cp_cam.can_valid
 
 
@@ -11,6 +11,7 @@ from selfdrive.config import Conversions as CV
 from selfdrive.controls.lib.planner import calc_cruise_accel_limits
 from selfdrive.controls.lib.speed_smoother import speed_smoother
 from selfdrive.controls.lib.long_mpc import LongitudinalMpc
+from selfdrive.controls.lib.model_speed import ModelSpeed
 
 from selfdrive.car.hyundai.values import Buttons
 from common.numpy_fast import clip, interp
@@ -69,7 +70,7 @@ class SpdController():
         self.seq_step_debug = 0
         self.long_curv_timer = 0
 
-        self.path_x = np.arange(192)
+        self.model_speed = ModelSpeed()
 
         self.traceSC = trace1.Loger("SPD_CTRL")
 
@@ -111,31 +112,13 @@ class SpdController():
 
     def calc_va(self, sm, v_ego):
         md = sm['model']
-        if len(md.path.poly):
-            path = list(md.path.poly)
-
+        self.model_speed.update(sm)
+        if self.model_speed.valid:
             self.l_poly = np.array(md.leftLane.poly)
             self.r_poly = np.array(md.rightLane.poly)
-            #self.p_poly = np.array(md.path.poly)
-
-            # Curvature of polynomial https://en.wikipedia.org/wiki/Curvature#Curvature_of_the_graph_of_a_function
-            # y = a x^3 + b x^2 + c x + d, y' = 3 a x^2 + 2 b x + c, y'' = 6 a x + 2 b
-            # k = y'' / (1 + y'^2)^1.5
-            # TODO: compute max speed without using a list of points and without numpy
-            y_p = 3 * path[0] * self.path_x**2 + \
-                2 * path[1] * self.path_x + path[2]
-            y_pp = 6 * path[0] * self.path_x + 2 * path[1]
-            curv = y_pp / (1. + y_p**2)**1.5
-
-            a_y_max = 2.975 - v_ego * 0.0375  # ~1.85 @ 75mph, ~2.6 @ 25mph
-            v_curvature = np.sqrt(a_y_max / np.clip(np.abs(curv), 1e-4, None))
-            model_speed = np.min(v_curvature)
-            # Don't slow down below 20mph
-            model_speed = max(30.0 * CV.KPH_TO_MS, model_speed)
-
-            model_sum = curv[2] * 1000.  #np.sum( curv, 0 )
-
-            model_speed = model_speed * CV.MS_TO_KPH
+
+            model_speed = self.model_speed.speed_limit(v_ego) * CV.MS_TO_KPH
+            model_sum = self.model_speed.curvature(2) * 1000.
             if model_speed > MAX_SPEED:
                 model_speed = MAX_SPEED
         else:
@@ -5,8 +5,12 @@ from functools import partial
 import cereal.messaging as messaging
 from selfdrive.swaglog import cloudlog
 from selfdrive.boardd.boardd import can_list_to_can_capnp
+from selfdrive.boardd.can_filter import filter_can_capnp
 from panda.python.uds import CanClient, IsoTpMessage, FUNCTIONAL_ADDRS, get_rx_addr_for_tx_addr
 
+# response addresses to functional (broadcast) requests
+FUNCTIONAL_RESPONSE_RANGES = [(0x7E8, 0x7EF), (0x18DAF100, 0x18DAF1FF)]
+
 
 class IsoTpParallelQuery():
   def __init__(self, sendcan, logcan, bus, addrs, request, response, functional_addr=False, debug=False):
@@ -25,22 +29,38 @@ class IsoTpParallelQuery():
       else:
         self.real_addrs.append((a, None))
 
+    # request and response sequence of every address
+    self.requests = {tx_addr: (request, response) for tx_addr in self.real_addrs}
+
     self.msg_addrs = {tx_addr: get_rx_addr_for_tx_addr(tx_addr[0]) for tx_addr in self.real_addrs}
+    self.rx_addrs = set(self.msg_addrs.values())
     self.msg_buffer = defaultdict(list)
 
+  @classmethod
+  def multi(cls, sendcan, logcan, bus, queries, debug=False):
+    """Sends different requests to different addresses at the same time.
+    queries is a list of (addrs, request, response), every address may only be in one of them"""
+    query = cls(sendcan, logcan, bus, [], [], [], debug=debug)
+    for addrs, request, response in queries:
+      for a in addrs:
+        tx_addr = a if isinstance(a, tuple) else (a, None)
+        assert tx_addr not in query.requests, f"address queried twice: {tx_addr}"
+        query.real_addrs.append(tx_addr)
+        query.requests[tx_addr] = (request, response)
+        query.msg_addrs[tx_addr] = get_rx_addr_for_tx_addr(tx_addr[0])
+    query.rx_addrs = set(query.msg_addrs.values())
+    return query
+
   def rx(self):
     """Drain can socket and sort messages into buffers based on address"""
-    can_packets = messaging.drain_sock(self.logcan, wait_for_one=True)
-
-    for packet in can_packets:
-      for msg in packet.can:
-        if msg.src == self.bus:
-          if self.functional_addr:
-            if (0x7E8 <= msg.address <= 0x7EF) or (0x18DAF100 <= msg.address <= 0x18DAF1FF):
-              fn_addr = next(a for a in FUNCTIONAL_ADDRS if msg.address - a <= 32)
-              self.msg_buffer[fn_addr].append((msg.address, msg.busTime, msg.dat, msg.src))
-          elif msg.address in self.msg_addrs.values():
-            self.msg_buffer[msg.address].append((msg.address, msg.busTime, msg.dat, msg.src))
+    for dat in messaging.drain_sock_raw(self.logcan, wait_for_one=True):
+      if self.functional_addr:
+        for msg in filter_can_capnp(dat, (), FUNCTIONAL_RESPONSE_RANGES, [self.bus]):
+          fn_addr = next(a for a in FUNCTIONAL_ADDRS if msg[0] - a <= 32)
+          self.msg_buffer[fn_addr].append(msg)
+      else:
+        for msg in filter_can_capnp(dat, self.rx_addrs, src_filter=[self.bus]):
+          self.msg_buffer[msg[0]].append(msg)
 
   def _can_tx(self, tx_addr, dat, bus):
     """Helper function to send single message"""
@@ -67,7 +87,7 @@ class IsoTpParallelQuery():
     return msgs
 
   def _drain_rx(self):
-    messaging.drain_sock(self.logcan)
+    messaging.drain_sock_raw(self.logcan)
     self.msg_buffer = defaultdict(list)
 
   def get_data(self, timeout):
@@ -87,7 +107,7 @@ class IsoTpParallelQuery():
       max_len = 8 if sub_addr is None else 7
 
       msg = IsoTpMessage(can_client, timeout=0, max_len=max_len, debug=self.debug)
-      msg.send(self.request[0])
+      msg.send(self.requests[tx_addr][0][0])
 
       msgs[tx_addr] = msg
       request_counter[tx_addr] = 0
@@ -107,13 +127,14 @@ class IsoTpParallelQuery():
         if not dat:
           continue
 
+        request, response = self.requests[tx_addr]
         counter = request_counter[tx_addr]
-        expected_response = self.response[counter]
+        expected_response = response[counter]
         response_valid = dat[:len(expected_response)] == expected_response
 
         if response_valid:
-          if counter + 1 < len(self.request):
-            msg.send(self.request[counter + 1])
+          if counter + 1 < len(request):
+            msg.send(request[counter + 1])
             request_counter[tx_addr] += 1
           else:
             results[tx_addr] = dat[len(expected_response):]
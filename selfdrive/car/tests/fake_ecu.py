@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import struct
+import threading
+
+import cereal.messaging as messaging
+from panda.python.uds import get_rx_addr_for_tx_addr
+from selfdrive.boardd.boardd import can_list_to_can_capnp
+from selfdrive.boardd.can_filter import filter_can_capnp
+from selfdrive.car.fw_versions import REQUESTS
+
+NEGATIVE_RESPONSE = 0x7F
+REQUEST_OUT_OF_RANGE = 0x31
+
+
+class FakeEcu():
+  """ISO-TP server side of one ECU, answering requests on (addr, sub_addr) from a
+  {request: response} table, and a negative response to everything else"""
+  def __init__(self, addr, sub_addr, responses, bus):
+    self.addr = addr
+    self.sub_addr = sub_addr
+    self.responses = responses
+    self.bus = bus
+    self.tx_addr = get_rx_addr_for_tx_addr(addr)
+    self.max_len = 8 if sub_addr is None else 7
+
+    self.rx_dat = b""
+    self.rx_len = 0
+    self.tx_dat = b""
+    self.tx_idx = 0
+
+  def _frame(self, dat):
+    dat = dat.ljust(self.max_len, b"\x00")
+    if self.sub_addr is not None:
+      dat = bytes([self.sub_addr]) + dat
+    return [self.tx_addr, 0, dat, self.bus]
+
+  def _respond(self, request):
+    response = self.responses.get(request)
+    if response is None:
+      response = bytes([NEGATIVE_RESPONSE, request[0], REQUEST_OUT_OF_RANGE])
+
+    if len(response) < self.max_len:
+      return [self._frame(bytes([len(response)]) + response)]
+
+    # first frame, the rest is sent on flow control
+    self.tx_dat = response
+    self.tx_idx = 0
+    return [self._frame(struct.pack("!H", 0x1000 | len(response)) + response[:self.max_len - 2])]
+
+  def rx(self, dat):
+    """Handles one CAN frame sent to this ECU, returns the frames to send back"""
+    if self.sub_addr is not None:
+      if dat[0] != self.sub_addr:
+        return []
+      dat = dat[1:]
+
+    frame_type = dat[0] >> 4
+    if frame_type == 0x0:
+      return self._respond(dat[1:1 + (dat[0] & 0xF)])
+
+    if frame_type == 0x1:
+      self.rx_len = ((dat[0] & 0xF) << 8) + dat[1]
+      self.rx_dat = dat[2:]
+      return [self._frame(b"\x30\x00\x00")]
+
+    if frame_type == 0x2:
+      self.rx_dat += dat[1:1 + self.rx_len - len(self.rx_dat)]
+      if len(self.rx_dat) == self.rx_len:
+        return self._respond(self.rx_dat)
+      return []
+
+    if frame_type == 0x3 and len(self.tx_dat):
+      num_bytes = self.max_len - 1
+      ret = []
+      for i in range(self.max_len - 2, len(self.tx_dat), num_bytes):
+        self.tx_idx += 1
+        ret.append(self._frame(bytes([0x20 | (self.tx_idx & 0xF)]) + self.tx_dat[i:i + num_bytes]))
+      self.tx_dat = b""
+      return ret
+
+    return []
+
+
+def fw_responses(brand, version):
+  """Request -> response table of an ECU of brand reporting version, for all of REQUESTS"""
+  responses = {}
+  for b, request, response in REQUESTS:
+    if b != brand:
+      continue
+    for req, resp in zip(request[:-1], response[:-1]):
+      responses[req] = resp
+    responses[request[-1]] = response[-1] + version
+  return responses
+
+
+class FakeEcuResponder():
+  """Set of fake ECUs on a bus, reading requests from sendcan and answering on can
+  from a thread, the way boardd passes them to and from a real car"""
+  def __init__(self, ecus, bus):
+    self.bus = bus
+    self.ecus = {}
+    for ecu in ecus:
+      self.ecus.setdefault(ecu.addr, []).append(ecu)
+
+    self.sendcan = messaging.sub_sock('sendcan', timeout=10)
+    self.can = messaging.pub_sock('can')
+    self.requests = 0
+
+    self._exit = threading.Event()
+    self._thread = threading.Thread(target=self._run)
+    self._thread.daemon = True
+
+  @classmethod
+  def from_fw_versions(cls, brand, fw_versions, bus):
+    """One ECU per {(ecu, addr, sub_addr): version} entry"""
+    ecus = [FakeEcu(addr, sub_addr, fw_responses(brand, version), bus)
+            for (_, addr, sub_addr), version in fw_versions.items()]
+    return cls(ecus, bus)
+
+  def start(self):
+    self._thread.start()
+
+  def stop(self):
+    self._exit.set()
+    self._thread.join()
+
+  def _run(self):
+    while not self._exit.is_set():
+      for dat in messaging.drain_sock_raw(self.sendcan, wait_for_one=True):
+        out = []
+        for address, _, msg_dat, _ in filter_can_capnp(dat, self.ecus.keys(), src_filter=[self.bus], which='sendcan'):
+          for ecu in self.ecus[address]:
+            self.requests += 1
+            out += ecu.rx(msg_dat)
+        if len(out):
+          self.can.send(can_list_to_can_capnp(out, msgtype='can'))
+
+  def __enter__(self):
+    self.start()
+    return self
+
+  def __exit__(self, *args):
+    self.stop()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import time
+import random
+import unittest
+
+import cereal.messaging as messaging
+from cereal import car
+from selfdrive.car.fingerprints import FW_VERSIONS, get_attr_from_cars
+from selfdrive.car.fw_versions import REQUESTS, build_query_plan, get_fw_versions, \
+                                      is_essential_ecu, match_fw_to_car
+from selfdrive.car.tests.fake_ecu import FakeEcuResponder
+
+
+def match_fw_to_car_scan(fw_versions):
+  """Reference: checks every candidate's full version list"""
+  fw_versions_dict = {}
+  for fw in fw_versions:
+    fw_versions_dict[(fw.address, fw.subAddress if fw.subAddress != 0 else None)] = fw.fwVersion
+
+  invalid = []
+  for candidate, fws in FW_VERSIONS.items():
+    for ecu, expected_versions in fws.items():
+      found_version = fw_versions_dict.get(ecu[1:], None)
+      if not is_essential_ecu(candidate, ecu[0]) and found_version is None:
+        continue
+      if found_version not in expected_versions:
+        invalid.append(candidate)
+        break
+  return set(FW_VERSIONS.keys()) - set(invalid)
+
+
+def make_car_fw(fws):
+  car_fw = []
+  for (ecu, addr, sub_addr), version in fws.items():
+    f = car.CarParams.CarFw.new_message()
+    f.ecu = ecu
+    f.address = addr
+    if sub_addr is not None:
+      f.subAddress = sub_addr
+    f.fwVersion = version
+    car_fw.append(f)
+  return car_fw
+
+
+class TestFwMatch(unittest.TestCase):
+  def test_own_versions(self):
+    for candidate, fws in FW_VERSIONS.items():
+      car_fw = make_car_fw({ecu: versions[0] for ecu, versions in fws.items()})
+      matches = match_fw_to_car(car_fw)
+      self.assertIn(candidate, matches)
+      self.assertEqual(matches, match_fw_to_car_scan(car_fw))
+
+  def test_random_versions(self):
+    random.seed(0)
+    all_versions = {}
+    for fws in FW_VERSIONS.values():
+      for ecu, versions in fws.items():
+        all_versions.setdefault(ecu, set()).update(versions)
+
+    for fws in FW_VERSIONS.values():
+      for _ in range(20):
+        # drop some ECUs and take some versions from other cars
+        car_fw = make_car_fw({ecu: random.choice(sorted(all_versions[ecu] if random.random() < 0.2 else versions))
+                              for ecu, versions in fws.items() if random.random() > 0.1})
+        self.assertEqual(match_fw_to_car(car_fw), match_fw_to_car_scan(car_fw))
+
+
+class TestQueryPlan(unittest.TestCase):
+  def setUp(self):
+    self.versions = get_attr_from_cars('FW_VERSIONS', combine_brands=False)
+    self.ecu_types, self.plan = build_query_plan(self.versions)
+
+  def test_requests_once(self):
+    expected = set()
+    for brand, brand_versions in self.versions.items():
+      for fws in brand_versions.values():
+        for _, addr, sub_addr in fws.keys():
+          expected |= {(i, (addr, sub_addr)) for i, (b, _, _) in enumerate(REQUESTS) if b == brand}
+
+    queried = [(q.request_idx, a) for wave in self.plan for q in wave for a in q.addrs]
+    self.assertEqual(len(queried), len(set(queried)))
+    self.assertEqual(set(queried), expected)
+
+  def test_waves(self):
+    order = {}
+    for wave in self.plan:
+      addrs = [a[0] for q in wave for a in q.addrs]
+      # an address is only asked one thing at a time
+      self.assertEqual(len(addrs), len(set(addrs)))
+      for q in wave:
+        for a in q.addrs:
+          order.setdefault(a, []).append(q.request_idx)
+
+    # and gets the requests in the same order as before
+    for idxs in order.values():
+      self.assertEqual(idxs, sorted(idxs))
+
+
+class TestFwQuery(unittest.TestCase):
+  def test_fake_ecus(self):
+    logcan = messaging.sub_sock('can')
+    sendcan = messaging.pub_sock('sendcan')
+
+    versions = get_attr_from_cars('FW_VERSIONS', combine_brands=False)
+    for brand, brand_versions in versions.items():
+      candidate, fws = next(iter(brand_versions.items()))
+      fw = {ecu: versions[0] for ecu, versions in fws.items()}
+
+      with FakeEcuResponder.from_fw_versions(brand, fw, 1):
+        time.sleep(0.1)
+        car_fw = get_fw_versions(logcan, sendcan, 1)
+
+      found = {(f.address, f.subAddress if f.subAddress != 0 else None): f.fwVersion for f in car_fw}
+      self.assertEqual(found, {ecu[1:]: version for ecu, version in fw.items()})
+      self.assertIn(candidate, match_fw_to_car(car_fw))
+
+
+if __name__ == "__main__":
+  unittest.main()
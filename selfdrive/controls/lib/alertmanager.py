@@ -1,7 +1,7 @@
+from heapq import heappush, heappop, heapify
 from cereal import car, log
 from common.realtime import DT_CTRL
 from selfdrive.swaglog import cloudlog
-import copy
 
 
 AlertSize = log.ControlsState.AlertSize
@@ -9,39 +9,87 @@ AlertStatus = log.ControlsState.AlertStatus
 VisualAlert = car.CarControl.HUDControl.VisualAlert
 AudibleAlert = car.CarControl.HUDControl.AudibleAlert
 
-class AlertManager():
+# heaps are rebuilt from the active alerts when they have this many more entries
+COMPACT_SLACK = 64
+
 
+class AlertManager():
+  """Active alerts, the current one is the one with the highest priority and
+  then the latest start time, of those the one added first.
+
+  An alert that is added again replaces the one with the same type, priority
+  and duration, as the new one would outrank and outlive it anyway. So alerts
+  added every frame while their event is active don't pile up. Two heaps keep
+  the current alert and the next one to expire, entries of replaced alerts are
+  skipped when they come up.
+  """
   def __init__(self):
-    self.activealerts = []
+    # key -> (alert, start_time, end_time, seq)
+    self.alerts = {}
+    # (-priority, -start_time, seq, key)
+    self.order = []
+    # (end_time, seq, key)
+    self.expiry = []
+    self.seq = 0
 
   def alert_present(self):
-    return len(self.activealerts) > 0
+    return len(self.alerts) > 0
 
   def add_many(self, frame, alerts, enabled=True):
     for a in alerts:
       self.add(frame, a, enabled=enabled)
 
   def add(self, frame, alert, enabled=True):
-    added_alert = copy.copy(alert)
-    added_alert.start_time = frame * DT_CTRL
+    start_time = frame * DT_CTRL
 
     # if new alert is higher priority, log it
-    if not self.alert_present() or added_alert.alert_priority > self.activealerts[0].alert_priority:
-      cloudlog.event('alert_add', alert_type=added_alert.alert_type, enabled=enabled)
-
-    self.activealerts.append(added_alert)
-
-    # sort by priority first and then by start_time
-    self.activealerts.sort(key=lambda k: (k.alert_priority, k.start_time), reverse=True)
+    current = self._current()
+    if current is None or alert.alert_priority > current[0].alert_priority:
+      cloudlog.event('alert_add', alert_type=alert.alert_type, enabled=enabled)
+
+    duration = max(alert.duration_sound, alert.duration_hud_alert, alert.duration_text)
+    key = (alert.alert_type, alert.alert_priority, duration)
+    entry = self.alerts.get(key)
+    if entry is not None and entry[1] == start_time:
+      # added again in the same frame, the first one stays ahead of it
+      return
+
+    self.seq += 1
+    self.alerts[key] = (alert, start_time, start_time + duration, self.seq)
+    heappush(self.order, (-alert.alert_priority, -start_time, self.seq, key))
+    heappush(self.expiry, (start_time + duration, self.seq, key))
+
+    if len(self.order) > 2 * len(self.alerts) + COMPACT_SLACK:
+      self._compact()
+
+  def _is_active(self, seq, key):
+    entry = self.alerts.get(key)
+    return entry is not None and entry[3] == seq
+
+  def _current(self):
+    while self.order:
+      _, _, seq, key = self.order[0]
+      if self._is_active(seq, key):
+        return self.alerts[key]
+      heappop(self.order)
+    return None
+
+  def _compact(self):
+    self.order = [(-a.alert_priority, -start_time, seq, key) for key, (a, start_time, _, seq) in self.alerts.items()]
+    self.expiry = [(end_time, seq, key) for key, (_, _, end_time, seq) in self.alerts.items()]
+    heapify(self.order)
+    heapify(self.expiry)
 
   def process_alerts(self, frame):
     cur_time = frame * DT_CTRL
 
     # first get rid of all the expired alerts
-    self.activealerts = [a for a in self.activealerts if a.start_time +
-                         max(a.duration_sound, a.duration_hud_alert, a.duration_text) > cur_time]
+    while self.expiry and self.expiry[0][0] <= cur_time:
+      _, seq, key = heappop(self.expiry)
+      if self._is_active(seq, key):
+        del self.alerts[key]
 
-    current_alert = self.activealerts[0] if self.alert_present() else None
+    current = self._current()
 
     # start with assuming no alerts
     self.alert_type = ""
@@ -53,16 +101,17 @@ class AlertManager():
     self.audible_alert = AudibleAlert.none
     self.alert_rate = 0.
 
-    if current_alert:
+    if current:
+      current_alert, start_time, _, _ = current
       self.alert_type = current_alert.alert_type
 
-      if current_alert.start_time + current_alert.duration_sound > cur_time:
+      if start_time + current_alert.duration_sound > cur_time:
         self.audible_alert = current_alert.audible_alert
 
-      if current_alert.start_time + current_alert.duration_hud_alert > cur_time:
+      if start_time + current_alert.duration_hud_alert > cur_time:
         self.visual_alert = current_alert.visual_alert
 
-      if current_alert.start_time + current_alert.duration_text > cur_time:
+      if start_time + current_alert.duration_text > cur_time:
         self.alert_text_1 = current_alert.alert_text_1
         self.alert_text_2 = current_alert.alert_text_2
         self.alert_status = current_alert.alert_status
@@ -0,0 +1,134 @@
+from bisect import bisect_left
+from functools import lru_cache
+
+from common.numpy_fast import interp
+
+# bumped by tune_changed, every AtomTuneSchedule compiles its tables again on the next get
+_tune_generation = 0
+
+
+def tune_changed():
+  """To be called after the atomTuning of a CarParams was changed in place, like by live tune"""
+  global _tune_generation
+  _tune_generation += 1
+
+
+def _segment(xp, inv_width, n, x):
+  """(lo, hi, w) so fp[lo] + w * (fp[hi] - fp[lo]) is interp(x, xp, fp) for fp with n values"""
+  hi = bisect_left(xp, x)
+  if hi == 0:
+    return 0, 0, 0.
+  if hi == len(xp):
+    return n - 1, n - 1, 0.
+  return hi - 1, hi, (x - xp[hi - 1]) * inv_width[hi - 1]
+
+
+def _inv_width(xp):
+  return [1. / (b - a) for a, b in zip(xp[:-1], xp[1:])]
+
+
+def _is_regular(speed_bp, value_bp, tables):
+  """True if interp of these tables is continuous and linear between the breakpoints,
+  what the grid of GainSchedule can hold exactly"""
+  if not value_bp or len(value_bp) < len(speed_bp) or any(a > b for a, b in zip(speed_bp[:-1], speed_bp[1:])):
+    return False
+  for i, bp in enumerate(value_bp):
+    if not bp or any(a >= b for a, b in zip(bp[:-1], bp[1:])):
+      return False
+    # past the last breakpoint interp gives the last value of the row, not the one of the last breakpoint
+    if any(len(t) <= i or len(t[i]) < len(bp) or t[i][len(bp) - 1] != t[i][-1] for t in tables):
+      return False
+  return True
+
+
+class GainSchedule():
+  """A speed x value table of atomTuning, like sRKPH x sRBPV with sRlqrkiV.
+
+  Each speed breakpoint has a row with breakpoints of its own over the value
+  (steering angle or curvature), and one list of values per table. The rows
+  are resampled once at the union of all row breakpoints, where they are still
+  linear in between, so a lookup is a bilinear interpolation in one grid.
+  Only the first max_rows rows are used, like the atom_tune loops did.
+
+  Tables that don't fit the grid, like unsorted breakpoints or a row with a
+  last value other than the one of its last breakpoint, are looked up with
+  interp row by row as the atom_tune loops did, so a bad live tune gives the
+  same gains it always did.
+  """
+  def __init__(self, speed_bp, value_bp, tables, max_rows):
+    value_bp = value_bp[:max_rows]
+    self.n_rows = len(value_bp)
+    self.speed_bp = list(speed_bp)
+    self.regular = _is_regular(speed_bp, value_bp, tables)
+    if not self.regular:
+      self.row_bp = [list(bp) for bp in value_bp]
+      self.tables = [list(t) for t in tables]
+      return
+
+    self.speed_inv_width = [1. / (b - a) if b > a else 0. for a, b in zip(self.speed_bp[:-1], self.speed_bp[1:])]
+    self.value_bp = sorted(set(x for bp in value_bp for x in bp))
+    self.value_inv_width = _inv_width(self.value_bp)
+    # grids[table][row][i] is the table at speed row and value_bp[i]
+    self.grids = [[interp(self.value_bp, bp, t[i][:len(bp)]) for i, bp in enumerate(value_bp)] for t in tables]
+
+  def __call__(self, v, x):
+    """Every table at speed v and value x"""
+    if not self.regular:
+      return [interp(v, self.speed_bp, row) for row in self.rows(x)]
+
+    s0, s1, ws = _segment(self.speed_bp, self.speed_inv_width, self.n_rows, v)
+    x0, x1, wx = _segment(self.value_bp, self.value_inv_width, len(self.value_bp), x)
+    ret = []
+    for grid in self.grids:
+      r0, r1 = grid[s0], grid[s1]
+      a = r0[x0] + wx * (r0[x1] - r0[x0])
+      b = r1[x0] + wx * (r1[x1] - r1[x0])
+      ret.append(a + ws * (b - a))
+    return ret
+
+  def rows(self, x):
+    """Every table at value x, as a list with one value per speed row"""
+    if not self.regular:
+      return [[interp(x, bp, t[i]) for i, bp in enumerate(self.row_bp)] for t in self.tables]
+
+    x0, x1, wx = _segment(self.value_bp, self.value_inv_width, len(self.value_bp), x)
+    return [[r[x0] + wx * (r[x1] - r[x0]) for r in grid] for grid in self.grids]
+
+
+@lru_cache(maxsize=32)
+def compile_schedule(speed_bp, value_bp, tables, max_rows):
+  """GainSchedule of tuples, the same tables give the same schedule"""
+  return GainSchedule(speed_bp, value_bp, tables, max_rows)
+
+
+def _as_tuple(l):
+  # capnp lists of lists to something hashable
+  return l if isinstance(l, (int, float)) else tuple(_as_tuple(x) for x in l)
+
+
+class AtomTuneSchedule():
+  """GainSchedule of atomTuning fields of a CarParams.
+
+  get is cheap as long as it's given the same CarParams, the tables are read and
+  compiled again for another CarParams or after tune_changed.
+  """
+  def __init__(self, speed_field, bp_field, table_fields, max_rows):
+    self.speed_field = speed_field
+    self.bp_field = bp_field
+    self.table_fields = table_fields
+    self.max_rows = max_rows
+
+    self.CP = None
+    self.generation = None
+    self.schedule = None
+
+  def get(self, CP):
+    if CP is not self.CP or self.generation != _tune_generation:
+      atomTuning = CP.atomTuning
+      self.schedule = compile_schedule(_as_tuple(getattr(atomTuning, self.speed_field)),
+                                       _as_tuple(getattr(atomTuning, self.bp_field)),
+                                       tuple(_as_tuple(getattr(atomTuning, f)) for f in self.table_fields),
+                                       self.max_rows)
+      self.CP = CP
+      self.generation = _tune_generation
+    return self.schedule
@@ -0,0 +1,658 @@
+from collections import namedtuple
+from itertools import product
+from math import atan2, sqrt
+from multiprocessing import Pool
+
+import numpy as np
+
+from cereal import car
+from common.realtime import DT_DMON
+from selfdrive.controls.lib import driver_monitor as dm
+
+# Replays DriverStatus over a whole drive at once, for tuning the thresholds.
+# What only depends on a frame (pose, blink, face detection, policy) is computed
+# for all frames with numpy. The offset learning, the distraction filter and the
+# awareness state machine run as one loop over the frames, over plain floats in
+# evaluate, and over arrays with an element per set of params in evaluate_grid,
+# so a whole grid costs little more than one. Same float operations in the same
+# order as DriverStatus, so the results are identical, not close.
+
+EventName = car.CarEvent.EventName
+NO_ALERT = -1
+
+# every module constant DriverStatus reads, lower case without the underscore
+_PARAM_NAMES = [
+  "awareness_time", "awareness_pre_time_till_terminal", "awareness_prompt_time_till_terminal",
+  "distracted_time", "distracted_pre_time_till_terminal", "distracted_prompt_time_till_terminal",
+  "face_threshold", "eye_threshold",
+  "blink_threshold", "blink_threshold_slack", "blink_threshold_strict",
+  "pitch_weight", "posestd_threshold",
+  "metric_threshold", "metric_threshold_slack", "metric_threshold_strict",
+  "pitch_pos_allowance", "pitch_natural_offset", "yaw_natural_offset",
+  "hi_std_timeout", "hi_std_fallback_time", "distracted_filter_ts",
+  "pose_calib_min_speed", "pose_offset_min_count", "pose_offset_max_count",
+  "recovery_factor_max", "recovery_factor_min",
+]
+DriverMonitorParams = namedtuple("DriverMonitorParams", _PARAM_NAMES,
+                                 defaults=[getattr(dm, "_" + name.upper()) for name in _PARAM_NAMES])
+
+
+def param_grid(**values):
+  """DriverMonitorParams for every combination of the values, defaults for the rest,
+  like param_grid(distracted_time=[8., 11.], metric_threshold=[0.4, 0.5])"""
+  names = list(values)
+  return [DriverMonitorParams(**dict(zip(names, combo))) for combo in product(*values.values())]
+
+
+class DriverMonitorInputs():
+  """What DriverStatus gets for each driverState frame, as arrays of length n.
+
+  orientation, position and orientation_std are the driverState arrays, (n, 3),
+  (n, 2) and (n, 3), valid is False where any of the driverState arrays was
+  empty. engaged_prob is the model's engagedProb last seen before the frame,
+  nan before the first. extra_updates maps a frame to the
+  (ctrl_active, standstill) of the DriverStatus.update(driver_engaged=True)
+  calls dmonitoringd makes on carState before it.
+  """
+  def __init__(self, orientation, position, orientation_std, face_prob,
+               left_eye_prob, right_eye_prob, left_blink_prob, right_blink_prob,
+               cal_rpy, car_speed, op_engaged, driver_engaged, ctrl_active, standstill,
+               engaged_prob=None, valid=None, extra_updates=None, is_rhd=False):
+    self.n = len(face_prob)
+    f = lambda a: np.asarray(a, dtype=np.float64)
+    b = lambda a: np.asarray(a, dtype=bool)
+    position = f(position).reshape(self.n, 2)
+    orientation = f(orientation).reshape(self.n, 3)
+    orientation_std = f(orientation_std).reshape(self.n, 3)
+    cal_rpy = np.broadcast_to(f(cal_rpy), (self.n, 3))
+
+    self.position = position
+    self.face_prob = f(face_prob)
+    self.left_eye_prob = f(left_eye_prob)
+    self.right_eye_prob = f(right_eye_prob)
+    self.left_blink_prob = f(left_blink_prob)
+    self.right_blink_prob = f(right_blink_prob)
+    self.car_speed = f(car_speed)
+    self.op_engaged = b(op_engaged)
+    self.driver_engaged = b(driver_engaged)
+    self.ctrl_active = b(ctrl_active)
+    self.standstill = b(standstill)
+    self.engaged_prob = np.full(self.n, np.nan) if engaged_prob is None else f(engaged_prob)
+    self.valid = np.ones(self.n, dtype=bool) if valid is None else b(valid)
+    self.extra_updates = extra_updates or {}
+    self.is_rhd = is_rhd
+
+    # face_orientation_from_net, math.atan2 to stay bit exact
+    face_x = (position[:, 0] + .5) * dm.W - dm.W + dm.FULL_W
+    face_y = (position[:, 1] + .5) * dm.H
+    yaw_focal = np.array([atan2(x, dm.RESIZED_FOCAL) for x in (face_x - dm.FULL_W//2).tolist()])
+    pitch_focal = np.array([atan2(y, dm.RESIZED_FOCAL) for y in (face_y - dm.H//2).tolist()])
+    pitch = orientation[:, 0] + pitch_focal
+    yaw = -orientation[:, 1] + yaw_focal
+    self.pitch = pitch - cal_rpy[:, 1]
+    self.yaw = yaw - cal_rpy[:, 2] * (1 - 2 * int(is_rhd))
+    self.model_std_max = np.maximum(orientation_std[:, 0], orientation_std[:, 1])
+
+  @classmethod
+  def from_driver_states(cls, driver_states, cal_rpy, car_speed, op_engaged, driver_engaged, ctrl_active, standstill, **kwargs):
+    """From driverState messages, or anything with their fields"""
+    n = len(driver_states)
+    orientation, position, orientation_std = np.zeros((n, 3)), np.zeros((n, 2)), np.zeros((n, 3))
+    valid = np.zeros(n, dtype=bool)
+    for i, ds in enumerate(driver_states):
+      if len(ds.faceOrientation) == 0 or len(ds.facePosition) == 0 or len(ds.faceOrientationStd) == 0 or len(ds.facePositionStd) == 0:
+        continue
+      orientation[i] = list(ds.faceOrientation)[:3]
+      position[i] = list(ds.facePosition)[:2]
+      orientation_std[i] = list(ds.faceOrientationStd)[:3]
+      valid[i] = True
+    get = lambda field: [getattr(ds, field) for ds in driver_states]
+    return cls(orientation, position, orientation_std, get("faceProb"),
+               get("leftEyeProb"), get("rightEyeProb"), get("leftBlinkProb"), get("rightBlinkProb"),
+               cal_rpy, car_speed, op_engaged, driver_engaged, ctrl_active, standstill, valid=valid, **kwargs)
+
+  @classmethod
+  def from_logs(cls, lr, is_rhd=False):
+    """What dmonitoringd would have seen, from the events of a log"""
+    from selfdrive.locationd.calibration_helpers import Calibration
+
+    driver_states, cal_rpys, speeds, enableds, engageds, standstills, engaged_probs = [], [], [], [], [], [], []
+    extra_updates = {}
+    cal_rpy = [0, 0, 0]
+    v_ego, enabled, v_cruise_last, driver_engaged, standstill = 0., False, 0, False, True
+    engaged_prob = np.nan
+    for msg in lr:
+      which = msg.which()
+      if which == 'liveCalibration':
+        if msg.liveCalibration.calStatus == Calibration.CALIBRATED and len(msg.liveCalibration.rpyCalib) == 3:
+          cal_rpy = list(msg.liveCalibration.rpyCalib)
+      elif which == 'carState':
+        cs = msg.carState
+        v_ego, enabled = cs.vEgo, cs.cruiseState.enabled
+        driver_engaged = len(cs.buttonEvents) > 0 or cs.cruiseState.speed != v_cruise_last or cs.steeringPressed
+        standstill = cs.standstill or cs.steeringPressed
+        if driver_engaged:
+          extra_updates.setdefault(len(driver_states), []).append((enabled, standstill))
+        v_cruise_last = cs.cruiseState.speed
+      elif which == 'model':
+        engaged_prob = msg.model.meta.engagedProb
+      elif which == 'driverState':
+        driver_states.append(msg.driverState)
+        cal_rpys.append(cal_rpy)
+        speeds.append(v_ego)
+        enableds.append(enabled)
+        engageds.append(driver_engaged)
+        standstills.append(standstill)
+        engaged_probs.append(engaged_prob)
+
+    return cls.from_driver_states(driver_states, np.array(cal_rpys).reshape(-1, 3), speeds, enableds, engageds, enableds, standstills,
+                                  engaged_prob=engaged_probs, extra_updates=extra_updates, is_rhd=is_rhd)
+
+
+class DriverMonitorResult():
+  """DriverStatus after each frame, arrays like the dMonitoringState fields.
+  alert is the EventName DriverStatus.update added, NO_ALERT if none."""
+  FIELDS = ["awareness", "awareness_active", "awareness_passive", "step_change", "face_detected",
+            "distracted", "low_std", "hi_stds", "pitch_offset", "pitch_valid_count", "yaw_offset",
+            "yaw_valid_count", "low_acc", "alert", "terminal_alert_cnt", "terminal_time"]
+
+  def __init__(self, params, **arrays):
+    self.params = params
+    for name in self.FIELDS:
+      setattr(self, name, arrays.get(name))
+
+  def summary(self):
+    """Frames in each alert, and the alerts that started"""
+    alert = self.alert
+    started = alert[(alert != NO_ALERT) & (np.r_[NO_ALERT, alert[:-1]] != alert)]
+    ret = {"frames": len(alert), "distracted_frames": int(self.distracted.sum()),
+           "terminal_alerts": int((np.diff(np.r_[0, self.terminal_alert_cnt]) > 0).sum())}
+    for name, event in EventName.schema.enumerants.items():
+      frames = int((alert == event).sum())
+      if frames:
+        ret[name] = {"frames": frames, "count": int((started == event).sum())}
+    return ret
+
+
+def _interp_policy(ep, strict, default, slack):
+  # numpy_fast.interp(ep, [0, 0.5, 1], [strict, default, slack]) for ep in [0, 1]
+  return np.where(ep <= 0., strict,
+                  np.where(ep <= 0.5, (ep - 0) * (default - strict) / (0.5 - 0) + strict,
+                           (ep - 0.5) * (slack - default) / (1 - 0.5) + default))
+
+
+def _frame_values(inputs, p, frames=slice(None)):
+  """The parts of get_pose that only depend on the frame, (frames, len(grid))
+  arrays for p, the params of the grid as arrays"""
+  low_std = inputs.model_std_max[frames, None] < p.posestd_threshold
+  left_blink = inputs.left_blink_prob[frames, None] * (inputs.left_eye_prob[frames, None] > p.eye_threshold)
+  right_blink = inputs.right_blink_prob[frames, None] * (inputs.right_eye_prob[frames, None] > p.eye_threshold)
+  position = inputs.position[frames]
+  in_view = (np.abs(position[:, 0]) <= 0.4) & (np.abs(position[:, 1]) <= 0.45)
+  face_detected = (inputs.face_prob[frames, None] > p.face_threshold) & in_view[:, None]
+
+  # set_policy, factors stay 1 until the first model
+  engaged_prob = inputs.engaged_prob[frames, None]
+  has_policy = ~np.isnan(engaged_prob)
+  ep = np.where(has_policy, np.minimum(engaged_prob, 0.8) / 0.8, 0.)
+  pose_cfactor = np.where(has_policy, _interp_policy(ep, p.metric_threshold_strict, p.metric_threshold, p.metric_threshold_slack) / p.metric_threshold, 1.)
+  blink_cfactor = np.where(has_policy, _interp_policy(ep, p.blink_threshold_strict, p.blink_threshold, p.blink_threshold_slack) / p.blink_threshold, 1.)
+
+  metric_limit = p.metric_threshold * pose_cfactor
+  blink_distracted = (left_blink + right_blink) * 0.5 > p.blink_threshold * blink_cfactor
+  calib_ok = face_detected & (inputs.car_speed[frames, None] > p.pose_calib_min_speed) & low_std
+  return low_std, face_detected, metric_limit, blink_distracted, calib_ok
+
+
+def _grid_arrays(grid):
+  return DriverMonitorParams(*[np.array(values) for values in zip(*grid)])
+
+
+def evaluate(inputs, params=DriverMonitorParams()):
+  """DriverMonitorResult of DriverStatus with the params, calling get_pose and
+  update for every frame of the inputs"""
+  p = params
+  n = inputs.n
+  low_std, face_detected, metric_limit, blink_distracted, calib_ok = \
+    [a[:, 0].tolist() for a in _frame_values(inputs, _grid_arrays([params]))]
+  valid = inputs.valid.tolist()
+  pitch, yaw, model_std_max = inputs.pitch.tolist(), inputs.yaw.tolist(), inputs.model_std_max.tolist()
+  op_engaged, driver_engaged = inputs.op_engaged.tolist(), inputs.driver_engaged.tolist()
+  ctrl_active, standstill = inputs.ctrl_active.tolist(), inputs.standstill.tolist()
+
+  out = {name: [] for name in DriverMonitorResult.FIELDS}
+
+  # RunningStatFilter of pitch and yaw: raw M, S, n and filtered M, S, n
+  offset_max = p.pose_offset_max_count
+  pitch_stat, yaw_stat = [0., 0., 0, 0., 0., 0], [0., 0., 0, 0., 0., 0]
+  def push(stat, x):
+    M, S, cnt = stat[0], stat[1], stat[2]
+    std_last = sqrt(S / (cnt - 1.)) if cnt >= 2 else 0.
+    cnt += 1
+    M_new = M + (x - M) / cnt
+    S = S + (x - M) * (x - M_new)
+    std = sqrt(S / (cnt - 1.)) if cnt >= 2 else 0.
+    stat[0], stat[1], stat[2] = M_new, S, cnt
+    if std - std_last <= 0:
+      fM, fS, fcnt = stat[3], stat[4], stat[5]
+      if offset_max < 0 or fcnt < offset_max:
+        fcnt += 1
+      if fcnt == 0:
+        stat[3] = x
+      else:
+        fM_new = fM + (x - fM) / fcnt
+        stat[3], stat[4] = fM_new, fS + (x - fM) * (x - fM_new)
+      stat[5] = fcnt
+  pose_calibrated = False
+
+  filter_k = (DT_DMON / p.distracted_filter_ts) / (1. + DT_DMON / p.distracted_filter_ts)
+  filter_x = 0.
+
+  # DriverStatus state
+  awareness = awareness_active = awareness_passive = 1.
+  active_monitoring_mode = True
+  step_change = 0.
+  hi_stds = 0
+  terminal_alert_cnt = terminal_time = 0
+  threshold_prompt = p.distracted_prompt_time_till_terminal / p.distracted_time
+  threshold_pre = 0.
+  pose_low_std, face, distracted = True, False, False
+
+  def set_timers(active_monitoring):
+    nonlocal awareness, awareness_active, awareness_passive, threshold_pre, threshold_prompt, step_change, active_monitoring_mode
+    if active_monitoring_mode and awareness <= threshold_prompt:
+      step_change = DT_DMON / p.distracted_time if active_monitoring else 0.
+      return
+    elif awareness <= 0.:
+      return
+
+    if active_monitoring:
+      if not active_monitoring_mode:
+        awareness_passive = 1
+        awareness = 1
+      threshold_pre = p.distracted_pre_time_till_terminal / p.distracted_time
+      threshold_prompt = p.distracted_prompt_time_till_terminal / p.distracted_time
+      step_change = DT_DMON / p.distracted_time
+      active_monitoring_mode = True
+    else:
+      if active_monitoring_mode:
+        awareness_active = 1
+        awareness = 1
+      threshold_pre = p.awareness_pre_time_till_terminal / p.awareness_time
+      threshold_prompt = p.awareness_prompt_time_till_terminal / p.awareness_time
+      step_change = DT_DMON / p.awareness_time
+      active_monitoring_mode = False
+
+  def update(driver_engaged, ctrl_active, standstill):
+    """DriverStatus.update, returns (low_acc, alert)"""
+    nonlocal awareness, awareness_active, awareness_passive, terminal_alert_cnt, terminal_time
+    if (driver_engaged and awareness > 0) or not ctrl_active:
+      terminal_time = 0
+      terminal_alert_cnt = 0
+      awareness = 1.
+      awareness_active = 1.
+      awareness_passive = 1.
+      return False, NO_ALERT
+
+    driver_attentive = filter_x < 0.37
+    awareness_prev = awareness
+    low_acc = face and hi_stds * DT_DMON > p.hi_std_timeout
+
+    if driver_attentive and face and pose_low_std and awareness > 0:
+      awareness = min(awareness + ((p.recovery_factor_max - p.recovery_factor_min)*(1.-awareness) + p.recovery_factor_min)*step_change, 1.)
+      if awareness == 1.:
+        awareness_passive = min(awareness_passive + step_change, 1.)
+      if awareness > threshold_prompt:
+        return low_acc, NO_ALERT
+
+    if (not (face and hi_stds * DT_DMON <= p.hi_std_fallback_time) or (filter_x > 0.63 and distracted and face)) and \
+       not (standstill and awareness - step_change <= threshold_prompt):
+      awareness = max(awareness - step_change, -0.1)
+
+    alert = NO_ALERT
+    if standstill:
+      terminal_time = 0
+      awareness = 1.
+      awareness_active = 1.
+      awareness_passive = 1.
+
+    if awareness <= 0.:
+      if terminal_time > 3:
+        alert = EventName.driverDistracted if active_monitoring_mode else EventName.driverUnresponsive
+      else:
+        awareness = threshold_prompt
+        terminal_time += 1
+      if awareness_prev > 0.:
+        terminal_alert_cnt += 1
+    elif awareness <= threshold_prompt:
+      alert = EventName.promptDriverDistracted if active_monitoring_mode else EventName.promptDriverUnresponsive
+    elif awareness <= threshold_pre:
+      alert = EventName.preDriverDistracted if active_monitoring_mode else EventName.preDriverUnresponsive
+    return low_acc, alert
+
+  set_timers(True)
+  extra_updates = inputs.extra_updates
+  for i in range(n):
+    for extra in extra_updates.get(i, ()):
+      update(True, *extra)
+
+    if valid[i]:
+      # get_pose
+      pose_low_std, face = low_std[i], face_detected[i]
+      if not pose_calibrated:
+        pitch_error = pitch[i] - p.pitch_natural_offset
+        yaw_error = yaw[i] - p.yaw_natural_offset
+      else:
+        pitch_error = pitch[i] - pitch_stat[3]
+        yaw_error = yaw[i] - yaw_stat[3]
+      if pitch_error > 0.:
+        pitch_error = max(pitch_error - p.pitch_pos_allowance, 0.)
+      pitch_error *= p.pitch_weight
+      distracted = sqrt(yaw_error**2 + pitch_error**2) > metric_limit[i] or blink_distracted[i]
+      filter_x = (1. - filter_k) * filter_x + filter_k * distracted
+
+      if calib_ok[i] and (not op_engaged[i] or not distracted):
+        push(pitch_stat, pitch[i])
+        push(yaw_stat, yaw[i])
+        pose_calibrated = pitch_stat[5] > p.pose_offset_min_count and yaw_stat[5] > p.pose_offset_min_count
+
+      is_model_uncertain = hi_stds * DT_DMON > p.hi_std_fallback_time
+      set_timers(face and not is_model_uncertain)
+      if face and not pose_low_std:
+        if not is_model_uncertain:
+          m = model_std_max[i]
+          step_change *= max(0, (m-0.5)*(m-2))
+        hi_stds += 1
+      elif face and pose_low_std:
+        hi_stds = 0
+
+    low_acc, alert = update(driver_engaged[i], ctrl_active[i], standstill[i])
+
+    out["awareness"].append(awareness)
+    out["awareness_active"].append(awareness_active)
+    out["awareness_passive"].append(awareness_passive)
+    out["step_change"].append(step_change)
+    out["face_detected"].append(face)
+    out["distracted"].append(distracted)
+    out["low_std"].append(pose_low_std)
+    out["hi_stds"].append(hi_stds)
+    out["pitch_offset"].append(pitch_stat[3])
+    out["pitch_valid_count"].append(pitch_stat[5])
+    out["yaw_offset"].append(yaw_stat[3])
+    out["yaw_valid_count"].append(yaw_stat[5])
+    out["low_acc"].append(low_acc)
+    out["alert"].append(alert)
+    out["terminal_alert_cnt"].append(terminal_alert_cnt)
+    out["terminal_time"].append(terminal_time)
+
+  return DriverMonitorResult(params, **{name: np.array(v) for name, v in out.items()})
+
+
+class _GridStat():
+  """RunningStatFilter of every params of a grid"""
+  def __init__(self, size, max_trackable):
+    self.M, self.S, self.n = np.zeros(size), np.zeros(size), np.zeros(size, dtype=np.int64)
+    self.fM, self.fS, self.fn = np.zeros(size), np.zeros(size), np.zeros(size, dtype=np.int64)
+    self.max_trackable = max_trackable
+
+  def push(self, idx, x):
+    # S stays 0 until n is 2, so S / max(n - 1, 1) is the variance or 0 like RunningStat's
+    M, S, n = self.M[idx], self.S[idx], self.n[idx]
+    std_last = np.sqrt(S / np.maximum(n - 1., 1.))
+    n = n + 1
+    M_new = M + (x - M) / n
+    S = S + (x - M) * (x - M_new)
+    self.M[idx], self.S[idx], self.n[idx] = M_new, S, n
+
+    idx = idx[np.sqrt(S / np.maximum(n - 1., 1.)) - std_last <= 0]
+    if len(idx):
+      fM, fS, fn = self.fM[idx], self.fS[idx], self.fn[idx]
+      max_trackable = self.max_trackable[idx]
+      fn = np.where((max_trackable < 0) | (fn < max_trackable), fn + 1, fn)
+      fM_new = np.where(fn == 0, x, fM + (x - fM) / np.maximum(fn, 1))
+      # new arrays, the ones of earlier frames are kept in the results
+      self.fM, self.fn = self.fM.copy(), self.fn.copy()
+      self.fM[idx], self.fS[idx], self.fn[idx] = fM_new, np.where(fn == 0, fS, fS + (x - fM) * (x - fM_new)), fn
+
+
+class _GridSummary():
+  """DriverMonitorResult.summary of every params of a grid, added up a frame at a time"""
+  def __init__(self, size):
+    self.rows = np.arange(size)
+    self.names = list(EventName.schema.enumerants.keys())
+    self.columns = np.full(max(EventName.schema.enumerants.values()) + 2, len(self.names))  # NO_ALERT is the last
+    self.columns[list(EventName.schema.enumerants.values())] = np.arange(len(self.names))
+    self.alert_frames = np.zeros((size, len(self.names) + 1), dtype=np.int64)
+    self.alert_started = np.zeros((size, len(self.names) + 1), dtype=np.int64)
+    self.last_alert = np.full(size, NO_ALERT)
+    self.last_terminal_alert_cnt = np.zeros(size, dtype=np.int64)
+    self.distracted_frames = np.zeros(size, dtype=np.int64)
+    self.terminal_alerts = np.zeros(size, dtype=np.int64)
+    self.frames = 0
+
+  def add(self, s):
+    self.frames += 1
+    self.distracted_frames += s["distracted"]
+    self.terminal_alerts += s["terminal_alert_cnt"] > self.last_terminal_alert_cnt
+    self.last_terminal_alert_cnt = s["terminal_alert_cnt"]
+    alert = s["alert"]
+    columns = self.columns[alert]
+    self.alert_frames[self.rows, columns] += 1
+    started = alert != self.last_alert
+    if np.count_nonzero(started):
+      self.alert_started[self.rows[started], columns[started]] += 1
+    self.last_alert = alert
+
+  def summaries(self):
+    ret = []
+    for j in self.rows:
+      summary = {"frames": self.frames, "distracted_frames": int(self.distracted_frames[j]),
+                 "terminal_alerts": int(self.terminal_alerts[j])}
+      for k, name in enumerate(self.names):
+        if self.alert_frames[j, k]:
+          summary[name] = {"frames": int(self.alert_frames[j, k]), "count": int(self.alert_started[j, k])}
+      ret.append(summary)
+    return ret
+
+
+FRAME_BLOCK = 1024
+
+
+def _run_grid(inputs, grid, record):
+  """evaluate for every params of the grid, all of them a frame at a time with
+  numpy, calling record with the state after each frame"""
+  p = _grid_arrays(grid)
+  size = len(grid)
+  valid = inputs.valid.tolist()
+  pitch, yaw, model_std_max = inputs.pitch.tolist(), inputs.yaw.tolist(), inputs.model_std_max.tolist()
+  op_engaged, driver_engaged = inputs.op_engaged.tolist(), inputs.driver_engaged.tolist()
+  ctrl_active, standstill = inputs.ctrl_active.tolist(), inputs.standstill.tolist()
+
+  pitch_stat, yaw_stat = _GridStat(size, p.pose_offset_max_count), _GridStat(size, p.pose_offset_max_count)
+  pose_calibrated = np.zeros(size, dtype=bool)
+
+  filter_k = (DT_DMON / p.distracted_filter_ts) / (1. + DT_DMON / p.distracted_filter_ts)
+  filter_x = np.zeros(size)
+
+  distracted_pre = p.distracted_pre_time_till_terminal / p.distracted_time
+  distracted_prompt = p.distracted_prompt_time_till_terminal / p.distracted_time
+  distracted_step = DT_DMON / p.distracted_time
+  awareness_pre = p.awareness_pre_time_till_terminal / p.awareness_time
+  awareness_prompt = p.awareness_prompt_time_till_terminal / p.awareness_time
+  awareness_step = DT_DMON / p.awareness_time
+  recovery_range = p.recovery_factor_max - p.recovery_factor_min
+
+  # DriverStatus state, _set_timers(True) of __init__ already done
+  s = {
+    "awareness": np.ones(size), "awareness_active": np.ones(size), "awareness_passive": np.ones(size),
+    "active_monitoring_mode": np.ones(size, dtype=bool), "step_change": distracted_step.copy(),
+    "hi_stds": np.zeros(size, dtype=np.int64), "terminal_alert_cnt": np.zeros(size, dtype=np.int64),
+    "terminal_time": np.zeros(size, dtype=np.int64), "threshold_prompt": distracted_prompt.copy(),
+    "threshold_pre": distracted_pre.copy(), "low_std": np.ones(size, dtype=bool),
+    "face_detected": np.zeros(size, dtype=bool), "distracted": np.zeros(size, dtype=bool),
+  }
+  everything, nothing = np.ones(size, dtype=bool), np.zeros(size, dtype=bool)
+  no_low_acc, no_alert = nothing, np.full(size, NO_ALERT)
+
+  def set_timers(active_monitoring):
+    awareness, mode = s["awareness"], s["active_monitoring_mode"]
+    held = mode & (awareness <= s["threshold_prompt"])
+    change = ~held & (awareness > 0.)
+    step_change = np.where(active_monitoring, distracted_step, np.where(held, 0., awareness_step))
+    s["step_change"] = np.where(held | change, step_change, s["step_change"])
+
+    switched = change & (active_monitoring != mode)
+    if np.count_nonzero(switched):
+      s["awareness_passive"] = np.where(switched & ~mode, 1, s["awareness_passive"])
+      s["awareness_active"] = np.where(switched & mode, 1, s["awareness_active"])
+      s["awareness"] = np.where(switched, 1, awareness)
+      mode = mode ^ switched
+      s["active_monitoring_mode"] = mode
+      # thresholds only change with the mode
+      s["threshold_pre"] = np.where(mode, distracted_pre, awareness_pre)
+      s["threshold_prompt"] = np.where(mode, distracted_prompt, awareness_prompt)
+
+  def update(driver_engaged, ctrl_active, standstill):
+    s["low_acc"], s["alert"] = no_low_acc, no_alert
+    if not ctrl_active:
+      reset(everything)
+      return
+
+    awareness, step_change, prompt = s["awareness"], s["step_change"], s["threshold_prompt"]
+    face, hi_stds, mode = s["face_detected"], s["hi_stds"], s["active_monitoring_mode"]
+    engaged = (awareness > 0) if driver_engaged else nothing
+    if np.count_nonzero(engaged) == size:
+      reset(everything)
+      return
+    live = ~engaged
+    awareness_prev = awareness
+    s["low_acc"] = live & face & (hi_stds * DT_DMON > p.hi_std_timeout)
+
+    counting = live
+    recovering = live & (filter_x < 0.37) & face & s["low_std"] & (awareness > 0)
+    if np.count_nonzero(recovering):
+      awareness = np.where(recovering, np.minimum(awareness + (recovery_range*(1.-awareness) + p.recovery_factor_min)*step_change, 1.), awareness)
+      s["awareness_passive"] = np.where(recovering & (awareness == 1.), np.minimum(s["awareness_passive"] + step_change, 1.), s["awareness_passive"])
+      counting = live & ~(recovering & (awareness > prompt))
+
+    if np.count_nonzero(counting):
+      decrease = counting & (~(face & (hi_stds * DT_DMON <= p.hi_std_fallback_time)) | ((filter_x > 0.63) & s["distracted"] & face))
+      if standstill:
+        decrease &= ~(awareness - step_change <= prompt)
+      awareness = np.where(decrease, np.maximum(awareness - step_change, -0.1), awareness)
+
+      terminal_time = s["terminal_time"]
+      if standstill:
+        terminal_time = np.where(counting, 0, terminal_time)
+        awareness = np.where(counting, 1., awareness)
+        s["awareness_active"] = np.where(counting, 1., s["awareness_active"])
+        s["awareness_passive"] = np.where(counting, 1., s["awareness_passive"])
+
+      terminal = counting & (awareness <= 0.)
+      if np.count_nonzero(terminal):
+        red = terminal & (terminal_time > 3)
+        held = terminal & ~red
+        awareness = np.where(held, prompt, awareness)
+        terminal_time = terminal_time + held
+        s["terminal_alert_cnt"] = s["terminal_alert_cnt"] + (terminal & (awareness_prev > 0.))
+      else:
+        red = terminal
+      s["terminal_time"] = terminal_time
+
+      orange = counting & ~terminal & (awareness <= prompt)
+      green = counting & ~terminal & ~orange & (awareness <= s["threshold_pre"])
+      s["alert"] = np.where(red, np.where(mode, EventName.driverDistracted, EventName.driverUnresponsive),
+                   np.where(orange, np.where(mode, EventName.promptDriverDistracted, EventName.promptDriverUnresponsive),
+                   np.where(green, np.where(mode, EventName.preDriverDistracted, EventName.preDriverUnresponsive), NO_ALERT)))
+    s["awareness"] = awareness
+    if np.count_nonzero(engaged):
+      reset(engaged)
+
+  def reset(mask):
+    s["terminal_time"] = np.where(mask, 0, s["terminal_time"])
+    s["terminal_alert_cnt"] = np.where(mask, 0, s["terminal_alert_cnt"])
+    for name in ("awareness", "awareness_active", "awareness_passive"):
+      s[name] = np.where(mask, 1., s[name])
+
+  extra_updates = inputs.extra_updates
+  for i in range(inputs.n):
+    if i % FRAME_BLOCK == 0:
+      block = slice(i, i + FRAME_BLOCK)
+      low_std, face_detected, metric_limit, blink_distracted, calib_ok = _frame_values(inputs, p, block)
+    b = i % FRAME_BLOCK
+
+    for extra in extra_updates.get(i, ()):
+      update(True, *extra)
+
+    if valid[i]:
+      # get_pose
+      s["low_std"], s["face_detected"] = low_std[b], face_detected[b]
+      pitch_error = pitch[i] - np.where(pose_calibrated, pitch_stat.fM, p.pitch_natural_offset)
+      yaw_error = yaw[i] - np.where(pose_calibrated, yaw_stat.fM, p.yaw_natural_offset)
+      pitch_error = np.where(pitch_error > 0., np.maximum(pitch_error - p.pitch_pos_allowance, 0.), pitch_error)
+      pitch_error = pitch_error * p.pitch_weight
+      # ** 2 of Python floats is pow(), float_power is too where x * x isn't always the same
+      distracted = (np.sqrt(np.float_power(yaw_error, 2) + np.float_power(pitch_error, 2)) > metric_limit[b]) | blink_distracted[b]
+      s["distracted"] = distracted
+      filter_x = (1. - filter_k) * filter_x + filter_k * distracted
+
+      pushed = calib_ok[b] & ~distracted if op_engaged[i] else calib_ok[b]
+      idx = pushed.nonzero()[0]
+      if len(idx):
+        pitch_stat.push(idx, pitch[i])
+        yaw_stat.push(idx, yaw[i])
+        pose_calibrated = (pitch_stat.fn > p.pose_offset_min_count) & (yaw_stat.fn > p.pose_offset_min_count)
+
+      face, hi_stds = s["face_detected"], s["hi_stds"]
+      is_model_uncertain = hi_stds * DT_DMON > p.hi_std_fallback_time
+      set_timers(face & ~is_model_uncertain)
+      uncertain_face = face & ~s["low_std"]
+      if np.count_nonzero(uncertain_face):
+        m = model_std_max[i]
+        s["step_change"] = np.where(uncertain_face & ~is_model_uncertain, s["step_change"] * max(0, (m-0.5)*(m-2)), s["step_change"])
+      s["hi_stds"] = np.where(uncertain_face, hi_stds + 1, np.where(face, 0, hi_stds))
+
+    update(driver_engaged[i], ctrl_active[i], standstill[i])
+
+    s["pitch_offset"], s["pitch_valid_count"] = pitch_stat.fM, pitch_stat.fn
+    s["yaw_offset"], s["yaw_valid_count"] = yaw_stat.fM, yaw_stat.fn
+    record(s)
+
+
+def evaluate_grid(inputs, grid, fields=DriverMonitorResult.FIELDS):
+  """evaluate for every params of the grid, only keeping the fields of the results"""
+  out = {name: [] for name in fields}
+  def record(s):
+    for name in fields:
+      out[name].append(s[name])
+  _run_grid(inputs, grid, record)
+
+  stacked = {name: np.array(values).reshape(inputs.n, len(grid)) for name, values in out.items()}
+  return [DriverMonitorResult(params, **{name: a[:, j] for name, a in stacked.items()}) for j, params in enumerate(grid)]
+
+
+GRID_CHUNK = 1024
+
+_sweep_inputs = None
+
+def _init_sweep(inputs):
+  global _sweep_inputs
+  _sweep_inputs = inputs
+
+def _sweep_chunk(grid):
+  summary = _GridSummary(len(grid))
+  _run_grid(_sweep_inputs, grid, summary.add)
+  return summary.summaries()
+
+
+def sweep(inputs, grid, jobs=None):
+  """summary() of evaluate for every params of the grid, chunks of the grid
+  evaluated together on jobs processes"""
+  chunks = [grid[i:i + GRID_CHUNK] for i in range(0, len(grid), GRID_CHUNK)]
+  if jobs == 1 or len(chunks) == 1:
+    _init_sweep(inputs)
+    summaries = [_sweep_chunk(chunk) for chunk in chunks]
+  else:
+    with Pool(jobs, initializer=_init_sweep, initargs=(inputs,)) as pool:
+      summaries = pool.map(_sweep_chunk, chunks)
+  return [summary for chunk in summaries for summary in chunk]
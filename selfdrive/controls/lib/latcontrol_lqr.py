@@ -1,9 +1,9 @@
 import numpy as np
 from selfdrive.controls.lib.drive_helpers import get_steer_max
+from selfdrive.controls.lib.atom_tune import AtomTuneSchedule
 from common.numpy_fast import clip
 from common.realtime import DT_CTRL
 from cereal import log
-from common.numpy_fast import interp
 from selfdrive.config import Conversions as CV
 
 class LatControlLQR():
@@ -25,6 +25,8 @@ class LatControlLQR():
     self.sat_count_rate = 1.0 * DT_CTRL
     self.sat_limit = CP.steerLimitTimer
 
+    self.tune = AtomTuneSchedule('sRKPH', 'sRBPV', ('sRlqrkiV', 'sRlqrscaleV'), max_rows=11)
+
     self.reset()
 
   def reset(self):
@@ -46,26 +48,7 @@ class LatControlLQR():
 
 
   def atom_tune( self, v_ego_kph, sr_value, CP ):  # 조향각에 따른 변화.
-    self.sr_KPH = CP.atomTuning.sRKPH
-    self.sr_BPV = CP.atomTuning.sRBPV
-    self.sR_lqr_kiV  = CP.atomTuning.sRlqrkiV
-    self.sR_lqr_scaleV = CP.atomTuning.sRlqrscaleV
-
-    self.ki = []
-    self.scale = []
-
-    nPos = 0
-    for steerRatio in self.sr_BPV:  # steerRatio
-      self.ki.append( interp( sr_value, steerRatio, self.sR_lqr_kiV[nPos] ) )
-      self.scale.append( interp( sr_value, steerRatio, self.sR_lqr_scaleV[nPos] ) )
-      nPos += 1
-      if nPos > 10:
-        break
-
-    rt_ki = interp( v_ego_kph, self.sr_KPH, self.ki )
-    rt_scale  = interp( v_ego_kph, self.sr_KPH, self.scale )
-     
-    return rt_ki, rt_scale
+    return self.tune.get(CP)(v_ego_kph, sr_value)
 
   def update(self, active, CS, CP, path_plan):
     lqr_log = log.ControlsState.LateralLQRState.new_message()
@@ -1,9 +1,9 @@
 from selfdrive.controls.lib.pid import PIController
 from selfdrive.controls.lib.drive_helpers import get_steer_max
+from selfdrive.controls.lib.atom_tune import AtomTuneSchedule
 from cereal import car
 from cereal import log
 from selfdrive.config import Conversions as CV
-from common.numpy_fast import interp
 
 import common.log as trace1
 
@@ -19,35 +19,22 @@ class LatControlPID():
                             (CP.lateralTuning.pid.kiBP, CP.lateralTuning.pid.kiV),
                             k_f=CP.lateralTuning.pid.kf, pos_limit=1.0, sat_limit=CP.steerLimitTimer)
 
+    self.tune = AtomTuneSchedule('sRKPH', 'sRBPV', ('sRpidKiV', 'sRpidKpV'), max_rows=11)
+    self.schedule = None
+    self.MsV = []
+
 
 
   def reset(self):
     self.pid.reset()
 
   def atom_tune( self, v_ego_kph, sr_value, CP ):  # 조향각에 따른 변화.
-    self.sr_KPH = CP.atomTuning.sRKPH
-    self.sr_BPV = CP.atomTuning.sRBPV
-    self.sR_pid_KiV  = CP.atomTuning.sRpidKiV
-    self.sR_pid_KpV = CP.atomTuning.sRpidKpV
-
-    self.KiV = []
-    self.KpV = []
-    self.MsV = []
-
-    nPos = 0
-    for angle in self.sr_BPV:  # angle
-      self.KiV.append( interp( sr_value, angle, self.sR_pid_KiV[nPos] ) )
-      self.KpV.append( interp( sr_value, angle, self.sR_pid_KpV[nPos] ) )
-      nPos += 1
-      if nPos > 10:
-        break
-
-    for kph in self.sr_KPH:
-      self.MsV.append( kph * CV.KPH_TO_MS )
-
-    #rt_Ki = interp( v_ego_kph, self.sr_KPH, self.Ki )
-    #rt_Kp  = interp( v_ego_kph, self.sr_KPH, self.Kp )
-    return self.MsV, self.KiV, self.KpV
+    schedule = self.tune.get(CP)
+    if schedule is not self.schedule:
+      self.schedule = schedule
+      self.MsV = [kph * CV.KPH_TO_MS for kph in schedule.speed_bp]
+    KiV, KpV = schedule.rows( sr_value )
+    return self.MsV, KiV, KpV
 
   def linear2_tune( self, CS, CP ):  # angle(조향각에 의한 변화)
     v_ego_kph = CS.vEgo * CV.MS_TO_KPH
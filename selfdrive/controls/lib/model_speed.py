@@ -0,0 +1,124 @@
+import math
+from selfdrive.config import Conversions as CV
+
+# the path polynomial is evaluated on integer distances in [0, PATH_X_MAX] meters
+PATH_X_MAX = 191
+MIN_CURVATURE = 1e-4
+MIN_MODEL_SPEED = 30.0 * CV.KPH_TO_MS  # Don't slow down below 20mph
+
+_ROOT_TOL = 1e-6
+
+
+def _poly_eval(c, x):
+  # c is ordered from the highest power down, as in numpy.polyval
+  y = 0.
+  for k in c:
+    y = y * x + k
+  return y
+
+
+def _poly_deriv(c):
+  n = len(c) - 1
+  return [k * (n - i) for i, k in enumerate(c[:-1])]
+
+
+def _real_roots(c, lo, hi):
+  """Real roots of polynomial c in [lo, hi]. The derivative roots split the
+     interval into monotonic pieces, each holding at most one root."""
+  while len(c) > 1 and c[0] == 0.:
+    c = c[1:]
+  if len(c) < 2:
+    return []
+  if len(c) == 2:
+    x = -c[1] / c[0]
+    return [x] if lo <= x <= hi else []
+
+  knots = [lo] + _real_roots(_poly_deriv(c), lo, hi) + [hi]
+  roots = []
+  for a, b in zip(knots[:-1], knots[1:]):
+    fa, fb = _poly_eval(c, a), _poly_eval(c, b)
+    if fa == 0.:
+      roots.append(a)
+    elif fa * fb < 0.:
+      while b - a > _ROOT_TOL:
+        m = 0.5 * (a + b)
+        fm = _poly_eval(c, m)
+        if fa * fm <= 0.:
+          b = m
+        else:
+          a, fa = m, fm
+      roots.append(0.5 * (a + b))
+  if _poly_eval(c, hi) == 0.:
+    roots.append(hi)
+  return roots
+
+
+def poly_curvature(poly, x):
+  # Curvature of polynomial https://en.wikipedia.org/wiki/Curvature#Curvature_of_the_graph_of_a_function
+  # y = a x^3 + b x^2 + c x + d, y' = 3 a x^2 + 2 b x + c, y'' = 6 a x + 2 b
+  # k = y'' / (1 + y'^2)^1.5
+  y_p = 3 * poly[0] * x**2 + 2 * poly[1] * x + poly[2]
+  y_pp = 6 * poly[0] * x + 2 * poly[1]
+  return y_pp / (1. + y_p**2)**1.5
+
+
+def max_abs_curvature(poly, x_max=PATH_X_MAX):
+  """Max of |k(x)| over the integers 0..x_max, same as evaluating every point.
+
+  Between two critical points k is monotonic, so the max over the grid is at
+  the ends or at an integer next to a root of
+  k' ~ y''' (1 + y'^2) - 3 y' y''^2, which is a quartic in x.
+  """
+  a, b, c = 3. * poly[0], 2. * poly[1], float(poly[2])  # y' = a x^2 + b x + c
+  d, e = 6. * poly[0], 2. * poly[1]                       # y'' = d x + e
+  # y'^2 and y''^2 expanded
+  yp2 = [a * a, 2 * a * b, b * b + 2 * a * c, 2 * b * c, c * c]
+  ypp2 = [d * d, 2 * d * e, e * e]
+  # y' * y''^2
+  cross = [0.] * 5
+  for i, p in enumerate([a, b, c]):
+    for j, q in enumerate(ypp2):
+      cross[i + j] += p * q
+  num = [d * p - 3. * q for p, q in zip(yp2, cross)]
+  num[-1] += d
+
+  candidates = {0, x_max}
+  for r in _real_roots(num, 0., float(x_max)):
+    candidates.add(min(max(int(math.floor(r)), 0), x_max))
+    candidates.add(min(max(int(math.ceil(r)), 0), x_max))
+  return max(abs(poly_curvature(poly, x)) for x in candidates)
+
+
+def curvature_speed_limit(max_curv, v_ego):
+  """Max speed in m/s keeping lateral accel under a speed dependent limit"""
+  a_y_max = 2.975 - v_ego * 0.0375  # ~1.85 @ 75mph, ~2.6 @ 25mph
+  v_curvature = math.sqrt(max(a_y_max, 0.) / max(max_curv, MIN_CURVATURE))
+  return max(MIN_MODEL_SPEED, v_curvature)
+
+
+class ModelSpeed():
+  """Curvature of the model path, computed once per model message and shared
+     by everything that wants a curvature limited speed in the same process."""
+  def __init__(self):
+    self.mono_time = None
+    self.valid = False
+    self.max_curv = 0.
+    self.poly = [0., 0., 0., 0.]
+
+  def update(self, sm):
+    mono_time = sm.logMonoTime['model']
+    if mono_time == self.mono_time:
+      return
+    self.mono_time = mono_time
+
+    path = sm['model'].path
+    self.valid = len(path.poly) > 0
+    if self.valid:
+      self.poly = list(path.poly)
+      self.max_curv = max_abs_curvature(self.poly)
+
+  def curvature(self, x):
+    return poly_curvature(self.poly, x)
+
+  def speed_limit(self, v_ego):
+    return curvature_speed_limit(self.max_curv, v_ego)
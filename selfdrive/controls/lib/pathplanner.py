@@ -5,6 +5,7 @@ from selfdrive.swaglog import cloudlog
 from selfdrive.controls.lib.lateral_mpc import libmpc_py
 from selfdrive.controls.lib.drive_helpers import MPC_COST_LAT
 from selfdrive.controls.lib.lane_planner import LanePlanner
+from selfdrive.controls.lib.atom_tune import AtomTuneSchedule
 from selfdrive.config import Conversions as CV
 from common.params import Params
 from common.numpy_fast import interp
@@ -64,6 +65,8 @@ class PathPlanner():
     self.last_cloudlog_t = 0
     self.steer_rate_cost = CP.steerRateCost
     self.steerRatio = CP.steerRatio    
+    self.steer_ratio_tune = AtomTuneSchedule('sRKPH', 'sRBPV', ('sRsteerRatioV',), max_rows=21)
+    self.actuator_delay_tune = AtomTuneSchedule('sRKPH', 'sRBPV', ('sRsteerActuatorDelayV',), max_rows=11)
     
 
     self.setup_mpc()
@@ -133,38 +136,12 @@ class PathPlanner():
     self.angle_steers_des_time = 0.0
 
 
-  def atom_tune( self, v_ego_kph, sr_value,  atomTuning ):  # 조향각에 따른 변화.
-    self.sr_KPH = atomTuning.sRKPH
-    self.sr_BPV = atomTuning.sRBPV
-    self.sr_steerRatioV = atomTuning.sRsteerRatioV
-    self.sr_SteerRatio = []
-
-    nPos = 0
-    for steerRatio in self.sr_BPV:  # steerRatio
-      self.sr_SteerRatio.append( interp( sr_value, steerRatio, self.sr_steerRatioV[nPos] ) )
-      nPos += 1
-      if nPos > 20:
-        break
-
-    steerRatio = interp( v_ego_kph, self.sr_KPH, self.sr_SteerRatio )
-
+  def atom_tune( self, v_ego_kph, sr_value, CP ):  # 조향각에 따른 변화.
+    steerRatio, = self.steer_ratio_tune.get(CP)( v_ego_kph, sr_value )
     return steerRatio
 
-  def atom_actuatorDelay( self, v_ego_kph, sr_value, atomTuning ):
-    self.sr_KPH = atomTuning.sRKPH
-    self.sr_BPV = atomTuning.sRBPV
-    self.sr_ActuatorDelayV = atomTuning.sRsteerActuatorDelayV
-    self.sr_ActuatorDelay = []
-
-    nPos = 0
-    for steerRatio in self.sr_BPV:
-      self.sr_ActuatorDelay.append( interp( sr_value, steerRatio, self.sr_ActuatorDelayV[nPos] ) )
-      nPos += 1
-      if nPos > 10:
-        break
-
-    actuatorDelay = interp( v_ego_kph, self.sr_KPH, self.sr_ActuatorDelay )
-
+  def atom_actuatorDelay( self, v_ego_kph, sr_value, CP ):
+    actuatorDelay, = self.actuator_delay_tune.get(CP)( v_ego_kph, sr_value )
     return actuatorDelay
 
 
@@ -196,7 +173,7 @@ class PathPlanner():
     
 
     lateralsRatom = CP.lateralsRatom
-    atomTuning = CP.atomTuning
+    tune_CP = CP
 
     #if atomTuning is None or lateralsRatom is None:
     #print('carparams={} steerRatio={}  carParams_valid={}'.format(sm.updated['carParams'], sm['carParams'].steerRatio, self.carParams_valid ) )
@@ -206,7 +183,7 @@ class PathPlanner():
 
     if self.carParams_valid:
       lateralsRatom = sm['carParams'].lateralsRatom
-      atomTuning = sm['carParams'].atomTuning
+      tune_CP = sm['carParams']
 
 
     v_ego = sm['carState'].vEgo
@@ -242,11 +219,11 @@ class PathPlanner():
       #xp = [-5,0,5]
       #fp = [0.4, 0.7, 0.4] 
       #self.steer_rate_cost = interp( angle_steers, xp, fp )
-      steerRatio = self.atom_tune( v_ego_kph, angle_steers, atomTuning )
+      steerRatio = self.atom_tune( v_ego_kph, angle_steers, tune_CP )
       self.steerRatio = self.atom_steer( steerRatio, 2, 1)
 
     #actuatorDelay = CP.steerActuatorDelay
-    steerActuatorDelay = self.atom_actuatorDelay( v_ego_kph, angle_steers, atomTuning )
+    steerActuatorDelay = self.atom_actuatorDelay( v_ego_kph, angle_steers, tune_CP )
 
     # Run MPC
     self.angle_steers_des_prev = self.angle_steers_des_mpc
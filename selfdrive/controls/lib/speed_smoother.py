@@ -1,3 +1,5 @@
+import math
+
 import numpy as np
 
 
@@ -12,6 +14,11 @@ def get_delta_out_limits(aEgo, aMax, aMin, jMax, jMin):
   return tDelta
 
 
+def _sqrt(x):
+  # nan for negative x like np.sqrt, only with limits of the wrong sign
+  return math.sqrt(x) if x >= 0. else float('nan')
+
+
 def speed_smoother(vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts):
 
   dV = vT - vEgo
@@ -62,7 +69,7 @@ def speed_smoother(vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts):
     jMax = jMaxcopy
 
   # small addition needed to avoid numerical issues with sqrt of ~zero
-  aPeak = np.sqrt((0.5 * aEgo**2 / jMax + dV + 1e-9) / (0.5 / jMax - 0.5 / jMin))
+  aPeak = _sqrt((0.5 * aEgo**2 / jMax + dV + 1e-9) / (0.5 / jMax - 0.5 / jMin))
 
   if aPeak > aMax:
     aPeak = aMax
@@ -97,3 +104,121 @@ def speed_smoother(vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts):
   aEgo *= -1 if flipped else 1
 
   return float(vEgo), float(aEgo)
+
+
+# Batch versions, arrays in and out, elementwise the same floats as speed_smoother.
+# Both sides of every branch are computed and picked with np.where, the way
+# the scalar code evaluates them: squares with float_power as Python's **
+# does, and min/max that don't propagate nan like the builtins.
+
+def _sq(x):
+  return np.float_power(x, 2)
+
+
+def _min(a, b):
+  return np.where(b < a, b, a)
+
+
+def _max(a, b):
+  return np.where(b > a, b, a)
+
+
+def speed_smoother_batch(vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts):
+  """speed_smoother over arrays of states, targets and limits, broadcast
+  against each other. Returns arrays of the speeds and accelerations."""
+  vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts = np.broadcast_arrays(
+    *(np.asarray(x, dtype=np.float64) for x in (vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts)))
+
+  with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+    dV = vT - vEgo
+
+    # recover quickly if dV is positive and aEgo is negative or viceversa
+    jMax = np.where((dV > 0.) & (aEgo < 0.), jMax * 3., jMax)
+    jMin = np.where((dV < 0.) & (aEgo > 0.), jMin * 3., jMin)
+
+    above = aEgo > aMax
+    below = ~above & (aEgo < aMin)
+    tDelta = np.where(above, (aMax - aEgo) / jMin, np.where(below, (aMin - aEgo) / jMax, 0.))
+
+    # the ones that stay out of the limits for all of ts
+    early = ts <= tDelta
+    early_below = early & (aEgo < aMin)
+    early_above = early & ~early_below & (aEgo > aMax)
+    early_j = np.where(early_below, jMax, jMin)
+    v_early = vEgo + (ts * aEgo + 0.5 * _sq(ts) * early_j)
+    a_early = aEgo + ts * early_j
+
+    shift_above = 0.5 * (_sq(aMax) - _sq(aEgo)) / jMin
+    shift_below = 0.5 * (_sq(aMin) - _sq(aEgo)) / jMax
+    dV = np.where(above, dV - shift_above, np.where(below, dV - shift_below, dV))
+    vEgo = np.where(above, vEgo + shift_above, np.where(below, vEgo + shift_below, vEgo))
+    aEgo = np.where(above, aEgo + tDelta * jMin, np.where(below, aEgo + tDelta * jMax, aEgo))
+
+    ts = ts - tDelta
+
+    jLim = np.where(aEgo >= 0, jMin, jMax)
+    # if we reduce the accel to zero immediately, how much delta speed we generate?
+    dv_min_shift = - 0.5 * _sq(aEgo) / jLim
+
+    # flip signs so we can consider only one case
+    flipped = dV < dv_min_shift
+    dV = np.where(flipped, -dV, dV)
+    vEgo = np.where(flipped, -vEgo, vEgo)
+    aEgo = np.where(flipped, -aEgo, aEgo)
+    aMax = np.where(flipped, -aMin, aMax)
+    jMax, jMin = np.where(flipped, -jMin, jMax), np.where(flipped, -jMax, jMin)
+
+    # small addition needed to avoid numerical issues with sqrt of ~zero
+    aPeak = np.sqrt((0.5 * _sq(aEgo) / jMax + dV + 1e-9) / (0.5 / jMax - 0.5 / jMin))
+
+    capped = aPeak > aMax
+    aPeak = np.where(capped, aMax, aPeak)
+    t1 = (aPeak - aEgo) / jMax
+    vChange = dV - 0.5 * (_sq(aPeak) - _sq(aEgo)) / jMax + 0.5 * _sq(aPeak) / jMin
+    t2 = np.where(vChange < aPeak * ts, t1 + vChange / aPeak, t1 + ts)
+    t3 = t2 - aPeak / jMin
+    # with aPeak <= 0 there is no solution, so stop after t1
+    no_solution = capped & (aPeak <= 0)
+    t2 = np.where(no_solution, t1 + ts + 1e-9, np.where(capped, t2, t1))
+    t3 = np.where(no_solution, t2, np.where(capped, t3, t2 - aPeak / jMin))
+
+    dt1 = _min(ts, t1)
+    dt2 = _max(_min(ts, t2) - t1, 0.)
+    dt3 = _max(_min(ts, t3) - t2, 0.)
+
+    done = ts > t3
+    vEgo = np.where(done, vEgo + dV,
+                    vEgo + (aEgo * dt1 + 0.5 * _sq(dt1) * jMax + aPeak * dt2 + aPeak * dt3 + 0.5 * _sq(dt3) * jMin))
+    aEgo = np.where(done, 0., aEgo + (jMax * dt1 + dt3 * jMin))
+
+    sign = np.where(flipped, -1., 1.)
+    vEgo = vEgo * sign
+    aEgo = aEgo * sign
+
+    early = early_below | early_above
+    return np.where(early, v_early, vEgo), np.where(early, a_early, aEgo)
+
+
+def speed_profile(vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts, n):
+  """Jerk limited profile towards vT: speed_smoother stepped n times by ts.
+
+  Returns the speeds and accelerations after each step, arrays with a last
+  axis of n. Takes scalars for one profile, or arrays for as many profiles
+  at once, broadcast like speed_smoother_batch.
+  """
+  args = (vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts)
+  if all(np.ndim(x) == 0 for x in args):
+    # one profile is quicker without numpy
+    vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts = (float(x) for x in args)
+    v, a = np.empty(n), np.empty(n)
+    for i in range(n):
+      vEgo, aEgo = speed_smoother(vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts)
+      v[i], a[i] = vEgo, aEgo
+    return v, a
+
+  vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts = np.broadcast_arrays(*(np.asarray(x, dtype=np.float64) for x in args))
+  v, a = np.empty(vEgo.shape + (n,)), np.empty(vEgo.shape + (n,))
+  for i in range(n):
+    vEgo, aEgo = speed_smoother_batch(vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts)
+    v[..., i], a[..., i] = vEgo, aEgo
+  return v, a
@@ -83,6 +83,30 @@ def dyn_ss_sol(sa, u, VM):
   return -solve(A, B) * sa
 
 
+def dyn_ss_sol_scalar(sa, u, VM):
+  """Closed form of dyn_ss_sol, the 2x2 system is solved with Cramer's rule
+
+  Args:
+    sa: Steering angle [rad]
+    u: Speed [m/s]
+    VM: Vehicle model
+
+  Returns:
+    Tuple with steady state lateral speed [m/s] and rotational speed [rad/s]
+  """
+  a00 = - (VM.cF + VM.cR) / (VM.m * u)
+  a01 = - (VM.cF * VM.aF - VM.cR * VM.aR) / (VM.m * u) - u
+  a10 = - (VM.cF * VM.aF - VM.cR * VM.aR) / (VM.j * u)
+  a11 = - (VM.cF * VM.aF**2 + VM.cR * VM.aR**2) / (VM.j * u)
+  b0 = (VM.cF + VM.chi * VM.cR) / VM.m / VM.sR
+  b1 = (VM.cF * VM.aF - VM.chi * VM.cR * VM.aR) / VM.j / VM.sR
+
+  det = a00 * a11 - a01 * a10
+  v = (a01 * b1 - a11 * b0) / det * sa
+  r = (a10 * b0 - a00 * b1) / det * sa
+  return v, r
+
+
 def calc_slip_factor(VM):
   """The slip factor is a measure of how the curvature changes with speed
   it's positive for Oversteering vehicle, negative (usual case) otherwise.
@@ -106,14 +130,24 @@ class VehicleModel():
 
     self.cF_orig = CP.tireStiffnessFront
     self.cR_orig = CP.tireStiffnessRear
+
+    self.stiffness_factor = None
     self.update_params(1.0, CP.steerRatio)
 
   def update_params(self, stiffness_factor, steer_ratio):
     """Update the vehicle model with a new stiffness factor and steer ratio"""
+    if stiffness_factor == self.stiffness_factor and steer_ratio == self.sR:
+      return
+
+    self.stiffness_factor = stiffness_factor
     self.cF = stiffness_factor * self.cF_orig
     self.cR = stiffness_factor * self.cR_orig
     self.sR = steer_ratio
 
+    # everything below only depends on the parameters, not on speed
+    self.sf = calc_slip_factor(self)
+    self.cf_num = (1. - self.chi) / self.l
+
   def steady_state_sol(self, sa, u):
     """Returns the steady state solution.
 
@@ -128,7 +162,8 @@ class VehicleModel():
       2x1 matrix with steady state solution (lateral speed, rotational speed)
     """
     if u > 0.1:
-      return dyn_ss_sol(sa, u, self)
+      v, r = dyn_ss_sol_scalar(sa, u, self)
+      return np.array([[v], [r]])
     else:
       return kin_ss_sol(sa, u, self)
 
@@ -154,8 +189,7 @@ class VehicleModel():
     Returns:
       Curvature factor [1/m]
     """
-    sf = calc_slip_factor(self)
-    return (1. - self.chi) / (1. - sf * u**2) / self.l
+    return self.cf_num / (1. - self.sf * u**2)
 
   def get_steer_from_curvature(self, curv, u):
     """Calculates the required steering wheel angle for a given curvature
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# Time per control cycle of AlertManager with events held active, every active
+# event adds its alert every frame like controlsd does, with the list based
+# AlertManager and with the deduplicating one.
+import time
+
+from selfdrive.controls.lib.alertmanager import AlertManager
+from selfdrive.controls.lib.events import Priority
+from selfdrive.controls.tests.test_alertmanager import LegacyAlertManager, make_alert
+
+FRAMES = 1000
+DURATIONS = [(0., 0., .2), (.1, .1, .5), (0., 2., 3.)]
+PRIORITIES = [Priority.LOWEST, Priority.LOW, Priority.MID, Priority.HIGH]
+
+
+def bench(AM, alerts, frames):
+  t = time.perf_counter()
+  for frame in range(frames):
+    AM.add_many(frame, alerts)
+    AM.process_alerts(frame)
+  return (time.perf_counter() - t) / frames * 1e6
+
+
+if __name__ == "__main__":
+  for n in [1, 10, 50, 100]:
+    alerts = [make_alert(str(i), PRIORITIES[i % len(PRIORITIES)], DURATIONS[i % len(DURATIONS)]) for i in range(n)]
+    # the list based one gets slower the longer events are held, until the first alerts expire
+    t_ref = bench(LegacyAlertManager(), alerts, FRAMES // 10 if n > 10 else FRAMES)
+    t = bench(AlertManager(), alerts, FRAMES)
+    print("%3d active events %10.1f us -> %6.1f us per cycle, %5.2f us per event" % (n, t_ref, t, t / n))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# Time per control cycle of the atom_tune lookups of LatControlLQR, LatControlPID,
+# PathPlanner and the Hyundai CarController, with the per cycle interp loops they
+# had and with the compiled gain schedules.
+import time
+import random
+
+from cereal import car
+from selfdrive.controls.lib.atom_tune import AtomTuneSchedule
+from selfdrive.controls.tests.test_atom_tune import atom_tune_reference
+
+N = 20000
+
+# speed x value schedule of every controller: (speed, breakpoints, tables, rows looked at)
+LOOKUPS = {
+  'lqr': ('sRKPH', 'sRBPV', ('sRlqrkiV', 'sRlqrscaleV'), 11),
+  'pid': ('sRKPH', 'sRBPV', ('sRpidKiV', 'sRpidKpV'), 11),
+  'steerRatio': ('sRKPH', 'sRBPV', ('sRsteerRatioV',), 21),
+  'actuatorDelay': ('sRKPH', 'sRBPV', ('sRsteerActuatorDelayV',), 11),
+  'hyundai cv': ('cvKPH', 'cvBPV', ('cvsMaxV', 'cvsdUpV', 'cvsdDnV'), 21),
+}
+
+
+def get_CP():
+  # the kegman_conf defaults
+  CP = car.CarParams.new_message()
+  a = CP.atomTuning
+  a.cvKPH = [10, 30, 40]
+  a.cvBPV = [[30, 80, 255], [100, 150, 255], [100, 150, 255]]
+  a.cvsMaxV = [[150, 130, 100], [255, 250, 200], [255, 255, 200]]
+  a.cvsdUpV = [[1, 1, 1], [3, 2, 1], [3, 3, 3]]
+  a.cvsdDnV = [[2, 2, 1], [5, 3, 2], [7, 7, 5]]
+  a.sRKPH = [30, 60]
+  a.sRBPV = [[-5, 0, 5], [-5, 0, 5]]
+  a.sRlqrkiV = [[0.0, 0.0, 0.0], [0.02, 0.02, 0.02]]
+  a.sRlqrscaleV = [[1900, 2200, 1900], [1800, 2000, 1800]]
+  a.sRpidKiV = [[0.02, 0.01, 0.02], [0.03, 0.02, 0.03]]
+  a.sRpidKpV = [[0.2, 0.15, 0.2], [0.25, 0.2, 0.25]]
+  a.sRsteerRatioV = [[15.1, 15.2, 15.1], [15.3, 15.6, 15.3]]
+  a.sRsteerActuatorDelayV = [[0.325, 0.3, 0.325], [0.325, 0.5, 0.325]]
+  return CP.as_reader()
+
+
+def bench(f, inputs):
+  t = time.perf_counter()
+  for v, x in inputs:
+    f(v, x)
+  return (time.perf_counter() - t) / len(inputs) * 1e6
+
+
+if __name__ == "__main__":
+  CP = get_CP()
+  rng = random.Random(0)
+  inputs = [(rng.uniform(0, 120), rng.uniform(-20, 20)) for _ in range(N)]
+
+  total_ref, total = 0., 0.
+  for name, (speed, bp, tables, max_rows) in LOOKUPS.items():
+    def reference(v, x):
+      # reading the capnp lists every cycle is part of what the controllers did
+      a = CP.atomTuning
+      return atom_tune_reference(v, x, getattr(a, speed), getattr(a, bp), [getattr(a, t) for t in tables], max_rows)
+
+    tune = AtomTuneSchedule(speed, bp, tables, max_rows)
+    if name == 'pid':
+      compiled = lambda v, x: tune.get(CP).rows(x)
+    else:
+      compiled = lambda v, x: tune.get(CP)(v, x)
+
+    t_ref, t = bench(reference, inputs), bench(compiled, inputs)
+    total_ref += t_ref
+    total += t
+    print("%-14s %7.2f us -> %5.2f us" % (name, t_ref, t))
+  print("%-14s %7.2f us -> %5.2f us per cycle" % ("total", total_ref, total))
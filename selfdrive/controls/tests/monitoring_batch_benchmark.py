@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# Time to replay an hour of driverState through DriverStatus frame by frame,
+# through evaluate, and per set of params of a sweep.
+import time
+
+from selfdrive.controls.lib.driver_monitor_batch import evaluate, param_grid, sweep
+from selfdrive.controls.tests.test_monitoring_batch import make_inputs, random_drive, run_streaming
+
+FRAMES = 36000  # an hour at 10 Hz
+
+
+if __name__ == "__main__":
+  drive = random_drive(0, FRAMES)
+
+  t = time.perf_counter()
+  run_streaming(drive)
+  t_streaming = time.perf_counter() - t
+
+  t = time.perf_counter()
+  inputs = make_inputs(drive)
+  t_inputs = time.perf_counter() - t
+
+  t = time.perf_counter()
+  evaluate(inputs)
+  t_evaluate = time.perf_counter() - t
+
+  grid = param_grid(distracted_time=[8., 11., 15., 20.], distracted_prompt_time_till_terminal=[4., 6.],
+                    metric_threshold=[0.3, 0.35, 0.4, 0.45, 0.5, 0.55, 0.6, 0.65],
+                    blink_threshold=[0.4, 0.5, 0.6, 0.7], face_threshold=[0.3, 0.4, 0.5, 0.6])
+  t = time.perf_counter()
+  sweep(inputs, grid)
+  t_sweep = time.perf_counter() - t
+
+  print("DriverStatus     %6.2f s" % t_streaming)
+  print("inputs           %6.2f s" % t_inputs)
+  print("evaluate         %6.2f s, %4.1fx" % (t_evaluate, t_streaming / t_evaluate))
+  print("sweep of %d    %6.2f s, %6.3f s per params" % (len(grid), t_sweep, t_sweep / len(grid)))
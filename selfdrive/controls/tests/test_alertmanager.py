@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+import copy
+import random
+import unittest
+
+from common.realtime import DT_CTRL
+from selfdrive.controls.lib.alertmanager import AlertManager, COMPACT_SLACK, AlertSize, AlertStatus, \
+                                                VisualAlert, AudibleAlert
+from selfdrive.controls.lib.events import Alert, EVENTS, EVENT_NAME, Priority
+
+OUTPUTS = ["alert_type", "alert_text_1", "alert_text_2", "alert_status", "alert_size",
+           "visual_alert", "audible_alert", "alert_rate"]
+
+
+class LegacyAlertManager():
+  # the list based AlertManager, a copy of every alert added every frame
+  def __init__(self):
+    self.activealerts = []
+
+  def add_many(self, frame, alerts, enabled=True):
+    for alert in alerts:
+      added_alert = copy.copy(alert)
+      added_alert.start_time = frame * DT_CTRL
+      self.activealerts.append(added_alert)
+    # sorted once per frame, the sort is stable so that's the same as sorting after every append
+    self.activealerts.sort(key=lambda k: (k.alert_priority, k.start_time), reverse=True)
+
+  def process_alerts(self, frame):
+    cur_time = frame * DT_CTRL
+    self.activealerts = [a for a in self.activealerts if a.start_time +
+                         max(a.duration_sound, a.duration_hud_alert, a.duration_text) > cur_time]
+    current_alert = self.activealerts[0] if len(self.activealerts) else None
+
+    self.alert_type = ""
+    self.alert_text_1 = ""
+    self.alert_text_2 = ""
+    self.alert_status = AlertStatus.normal
+    self.alert_size = AlertSize.none
+    self.visual_alert = VisualAlert.none
+    self.audible_alert = AudibleAlert.none
+    self.alert_rate = 0.
+
+    if current_alert:
+      self.alert_type = current_alert.alert_type
+      if current_alert.start_time + current_alert.duration_sound > cur_time:
+        self.audible_alert = current_alert.audible_alert
+      if current_alert.start_time + current_alert.duration_hud_alert > cur_time:
+        self.visual_alert = current_alert.visual_alert
+      if current_alert.start_time + current_alert.duration_text > cur_time:
+        self.alert_text_1 = current_alert.alert_text_1
+        self.alert_text_2 = current_alert.alert_text_2
+        self.alert_status = current_alert.alert_status
+        self.alert_size = current_alert.alert_size
+        self.alert_rate = current_alert.alert_rate
+
+
+def event_alerts():
+  # every static alert in EVENTS, named like Events.create_alerts names them
+  ret = []
+  for e, alerts in EVENTS.items():
+    for alert in alerts.values():
+      if isinstance(alert, Alert):
+        alert = copy.copy(alert)
+        alert.alert_type = EVENT_NAME[e]
+        ret.append(alert)
+  return ret
+
+
+def make_alert(alert_type, priority, durations, text="text"):
+  alert = Alert(text, "", AlertStatus.normal, AlertSize.small, priority, VisualAlert.none,
+                AudibleAlert.none, *durations)
+  alert.alert_type = alert_type
+  return alert
+
+
+class TestAlertManager(unittest.TestCase):
+  def assertSameOutput(self, AM, ref, frame):
+    for name in OUTPUTS:
+      self.assertEqual(getattr(AM, name), getattr(ref, name), msg="%s at frame %d" % (name, frame))
+
+  def run_events(self, alerts, frames, seed):
+    rng = random.Random(seed)
+    AM, ref = AlertManager(), LegacyAlertManager()
+    # events come and go, some stay active for a long time
+    active = set()
+    for frame in range(frames):
+      if rng.random() < 0.1:
+        active ^= {rng.randrange(len(alerts))}
+      while len(active) > 10:
+        active.pop()
+      added = [alerts[i] for i in sorted(active)]
+      if rng.random() < 0.05:
+        added += [rng.choice(alerts)] * 2
+      rng.shuffle(added)
+
+      AM.add_many(frame, added)
+      AM.process_alerts(frame)
+      ref.add_many(frame, added)
+      ref.process_alerts(frame)
+      self.assertSameOutput(AM, ref, frame)
+      self.assertEqual(AM.alert_present(), len(ref.activealerts) > 0)
+
+  def test_same_as_legacy_events(self):
+    alerts = event_alerts()
+    for seed in range(5):
+      self.run_events(alerts, 1000, seed)
+
+  def test_same_as_legacy_same_type(self):
+    # alerts of one event with different priorities and durations, like one event for several event types
+    alerts = [make_alert("a", p, d, text=str(i)) for i, (p, d) in enumerate([
+      (Priority.LOW, (0., 0., .2)), (Priority.LOW, (0., 2., 3.)), (Priority.MID, (.1, .1, .5)),
+      (Priority.MID, (0., 0., .5)), (Priority.HIGH, (1., 1., 1.))])]
+    alerts += [make_alert("b", Priority.LOW, (0., 0., .2)), make_alert("c", Priority.LOW, (.3, .3, .3))]
+    for seed in range(20):
+      self.run_events(alerts, 500, seed)
+
+  def test_held_alerts_not_piling_up(self):
+    AM = AlertManager()
+    alerts = [make_alert(str(i), Priority.LOW, (0., 0., .2)) for i in range(50)]
+    for frame in range(2000):
+      AM.add_many(frame, alerts)
+      AM.process_alerts(frame)
+    self.assertEqual(len(AM.alerts), 50)
+    self.assertLessEqual(len(AM.order), 2 * 50 + COMPACT_SLACK + 1)
+    self.assertLessEqual(len(AM.expiry), 2 * 50 + COMPACT_SLACK + 1)
+
+    # and gone once they expire
+    AM.process_alerts(2000 + int(.2 / DT_CTRL))
+    self.assertFalse(AM.alert_present())
+    self.assertEqual(AM.alert_type, "")
+
+
+if __name__ == "__main__":
+  unittest.main()
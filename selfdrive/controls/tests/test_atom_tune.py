@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+import random
+import unittest
+
+from cereal import car
+from common.numpy_fast import interp
+from selfdrive.config import Conversions as CV
+from selfdrive.car.interfaces import CarInterfaceBase
+import selfdrive.controls.lib.atom_tune as atom_tune
+from selfdrive.controls.lib.atom_tune import AtomTuneSchedule, GainSchedule, tune_changed
+
+
+def atom_tune_reference(v_ego_kph, sr_value, speed_bp, value_bp, tables, max_rows):
+  # the per cycle loops the controllers had, every table interpolated over the value and then over speed
+  rows = [[] for _ in tables]
+  nPos = 0
+  for bp in value_bp:
+    for row, t in zip(rows, tables):
+      row.append(interp(sr_value, bp, t[nPos]))
+    nPos += 1
+    if nPos >= max_rows:
+      break
+  return [interp(v_ego_kph, speed_bp, row) for row in rows], rows
+
+
+def random_table(rng, n_speeds, n_rows):
+  speed_bp = sorted(rng.sample(range(0, 150), n_speeds))
+  value_bp = []
+  for _ in range(n_rows):
+    n = rng.randint(1, 6)
+    value_bp.append(sorted(rng.sample([x / 2. for x in range(-90, 90)], n)))
+  tables = [[[rng.uniform(-10, 10) for _ in bp] for bp in value_bp] for _ in range(3)]
+  return speed_bp, value_bp, tables
+
+
+def atom_tuning_CP():
+  CP = car.CarParams.new_message()
+  CP.atomTuning.sRKPH = [30, 60]
+  CP.atomTuning.sRBPV = [[-5, 0, 5], [-5, 0, 5]]
+  CP.atomTuning.sRlqrkiV = [[0.0, 0.0, 0.0], [0.02, 0.02, 0.02]]
+  CP.atomTuning.sRlqrscaleV = [[1900, 2200, 1900], [1800, 2000, 1800]]
+  return CP
+
+
+class TestGainSchedule(unittest.TestCase):
+  def assertValuesEqual(self, values, ref, msg=None):
+    self.assertEqual(len(values), len(ref))
+    for v, r in zip(values, ref):
+      self.assertAlmostEqual(v, r, delta=1e-9 * max(1., abs(r)), msg=msg)
+
+  def test_same_as_atom_tune(self):
+    rng = random.Random(0)
+    for _ in range(300):
+      n_speeds = rng.randint(1, 5)
+      max_rows = rng.choice([11, 21])
+      speed_bp, value_bp, tables = random_table(rng, n_speeds, n_speeds + rng.randint(0, 2))
+      schedule = GainSchedule(speed_bp, value_bp, tables, max_rows)
+
+      xs = [x for bp in value_bp for x in bp] + [rng.uniform(-60, 60) for _ in range(20)]
+      vs = speed_bp + [rng.uniform(-10, 160) for _ in range(20)]
+      for v in vs:
+        for x in xs:
+          ref, ref_rows = atom_tune_reference(v, x, speed_bp, value_bp, tables, max_rows)
+          self.assertValuesEqual(schedule(v, x), ref, msg=(speed_bp, value_bp, v, x))
+          for row, ref_row in zip(schedule.rows(x), ref_rows):
+            self.assertValuesEqual(row, ref_row)
+
+  def test_max_rows(self):
+    # rows after max_rows were never looked at, the last used one applies above the last speed
+    speed_bp = [10., 20.]
+    value_bp = [[0.]] * 3
+    tables = [[[1.], [2.], [100.]]]
+    self.assertEqual(GainSchedule(speed_bp, value_bp, tables, 2)(50., 0.), [2.])
+    self.assertEqual(GainSchedule(speed_bp, value_bp, tables, 3)(50., 0.), [100.])
+
+  def test_irregular_tables(self):
+    # looked up like interp does, without raising where interp doesn't
+    cases = [
+      ([10., 20.], [[0., 1.], [0., 1.]], [[[1., 2., 3.], [4., 5., 6.]]]),  # last value past the last breakpoint
+      ([10.], [[1., 0.]], [[[1., 2.]]]),  # unsorted
+      ([10., 20.], [[0., 0., 1.], [-1., 1.]], [[[1., 2., 3.], [4., 5.]]]),  # duplicate
+      ([20., 10.], [[0.], [1.]], [[[1.], [2.]]]),  # unsorted speeds
+    ]
+    for speed_bp, value_bp, tables in cases:
+      schedule = GainSchedule(speed_bp, value_bp, tables, 11)
+      self.assertFalse(schedule.regular)
+      for v in [0., 10., 15., 20., 30.]:
+        for x in [-2., -1., 0., 0.5, 1., 2.]:
+          ref, ref_rows = atom_tune_reference(v, x, speed_bp, value_bp, tables, 11)
+          self.assertValuesEqual(schedule(v, x), ref, msg=(speed_bp, value_bp, v, x))
+          for row, ref_row in zip(schedule.rows(x), ref_rows):
+            self.assertValuesEqual(row, ref_row)
+
+  def test_more_values_than_breakpoints(self):
+    # interp gives the last value of a row past its last breakpoint
+    schedule = GainSchedule([10.], [[0., 1.]], [[[1., 2., 3.]]], 11)
+    self.assertEqual(schedule(10., 0.5), [1.5])
+    self.assertEqual(schedule(10., 1.), [2.])
+    self.assertEqual(schedule(10., 2.), [3.])
+
+    # that is the value of the last breakpoint in the defaults of get_std_params, which fit the grid
+    speed_bp = [30., 40., 80.]
+    value_bp = [[0.], [0.], [0.]]
+    tables = ([[13.95, 13.85, 13.95], [13.9, 13.8, 13.9], [14.1, 13.85, 14.1]],)
+    schedule = GainSchedule(speed_bp, value_bp, tables, 21)
+    self.assertTrue(schedule.regular)
+    for v in [0., 35., 60., 100.]:
+      for x in [-10., 0., 10.]:
+        ref, _ = atom_tune_reference(v, x, speed_bp, value_bp, tables, 21)
+        self.assertValuesEqual(schedule(v, x), ref)
+
+
+class TestAtomTuneSchedule(unittest.TestCase):
+  def test_carparams(self):
+    CP = atom_tuning_CP()
+    tune = AtomTuneSchedule('sRKPH', 'sRBPV', ('sRlqrkiV', 'sRlqrscaleV'), max_rows=11)
+    a = CP.atomTuning
+    for v in [0., 30., 45., 60., 100.]:
+      for x in [-10., -5., -2., 0., 3., 5., 10.]:
+        ref, _ = atom_tune_reference(v, x, a.sRKPH, a.sRBPV, (a.sRlqrkiV, a.sRlqrscaleV), 11)
+        values = tune.get(CP)(v, x)
+        for value, r in zip(values, ref):
+          self.assertAlmostEqual(value, r)
+
+  def test_recompiled_on_change(self):
+    CP = atom_tuning_CP()
+    tune = AtomTuneSchedule('sRKPH', 'sRBPV', ('sRlqrkiV', 'sRlqrscaleV'), max_rows=11)
+    # the same tables from another CarParams compile to the same schedule
+    schedule = tune.get(CP.as_reader())
+    self.assertIs(tune.get(CP), schedule)
+    self.assertIs(tune.get(CP), schedule)
+
+    # changed in place, like live tune does
+    CP.atomTuning.sRlqrscaleV = [[1500, 1500, 1500], [1500, 1500, 1500]]
+    self.assertIs(tune.get(CP), schedule)
+    tune_changed()
+    self.assertEqual(tune.get(CP)(40., 0.)[1], 1500.)
+
+  def test_pid_rows(self):
+    CP = atom_tuning_CP()
+    CP.atomTuning.sRpidKiV = [[0.02, 0.01, 0.02], [0.03, 0.02, 0.03]]
+    CP.atomTuning.sRpidKpV = [[0.2, 0.15, 0.2], [0.25, 0.2, 0.25]]
+    KiV, KpV = AtomTuneSchedule('sRKPH', 'sRBPV', ('sRpidKiV', 'sRpidKpV'), max_rows=11).get(CP).rows(2.5)
+    self.assertAlmostEqual(KiV[0], 0.015)
+    self.assertAlmostEqual(KpV[1], 0.225)
+    # speeds are in m/s to the pid controller, still interpolated the same
+    self.assertAlmostEqual(interp(45 * CV.KPH_TO_MS, [30 * CV.KPH_TO_MS, 60 * CV.KPH_TO_MS], KiV), 0.02)
+
+  def test_std_params_defaults(self):
+    # the atomTuning every car other than Hyundai gets, with one breakpoint and three values per row
+    CP = CarInterfaceBase.get_std_params("mock", {}, False)
+    a = CP.atomTuning
+    tunes = [
+      (AtomTuneSchedule('sRKPH', 'sRBPV', ('sRlqrkiV', 'sRlqrscaleV'), max_rows=11), (a.sRlqrkiV, a.sRlqrscaleV), 11),
+      (AtomTuneSchedule('sRKPH', 'sRBPV', ('sRpidKiV', 'sRpidKpV'), max_rows=11), (a.sRpidKiV, a.sRpidKpV), 11),
+      (AtomTuneSchedule('sRKPH', 'sRBPV', ('sRsteerRatioV',), max_rows=21), (a.sRsteerRatioV,), 21),
+      (AtomTuneSchedule('sRKPH', 'sRBPV', ('sRsteerActuatorDelayV',), max_rows=11), (a.sRsteerActuatorDelayV,), 11),
+    ]
+    for tune, tables, max_rows in tunes:
+      schedule = tune.get(CP)
+      for v in [0., 30., 50., 100.]:
+        for x in [-5., 0., 5.]:
+          ref, _ = atom_tune_reference(v, x, a.sRKPH, a.sRBPV, tables, max_rows)
+          for value, r in zip(schedule(v, x), ref):
+            self.assertAlmostEqual(value, r)
+
+  def tearDown(self):
+    atom_tune.compile_schedule.cache_clear()
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import unittest
+import numpy as np
+
+from selfdrive.config import Conversions as CV
+from selfdrive.controls.lib.model_speed import ModelSpeed, max_abs_curvature, curvature_speed_limit
+
+
+def model_speed_reference(path, v_ego):
+  # the original 192 point evaluation from planner.py
+  path_x = np.arange(192)
+  y_p = 3 * path[0] * path_x**2 + 2 * path[1] * path_x + path[2]
+  y_pp = 6 * path[0] * path_x + 2 * path[1]
+  curv = y_pp / (1. + y_p**2)**1.5
+
+  a_y_max = 2.975 - v_ego * 0.0375
+  v_curvature = np.sqrt(a_y_max / np.clip(np.abs(curv), 1e-4, None))
+  return max(30.0 * CV.KPH_TO_MS, np.min(v_curvature)), curv
+
+
+class FakePath():
+  def __init__(self, poly):
+    self.poly = poly
+
+
+class FakeModel():
+  def __init__(self, poly):
+    self.path = FakePath(poly)
+
+
+class FakeSubMaster():
+  def __init__(self, poly, mono_time):
+    self.logMonoTime = {'model': mono_time}
+    self.data = {'model': FakeModel(poly)}
+
+  def __getitem__(self, s):
+    return self.data[s]
+
+
+class TestModelSpeed(unittest.TestCase):
+  def setUp(self):
+    self.rng = np.random.RandomState(0)
+
+  def random_poly(self):
+    scale = 10. ** self.rng.randint(-7, -2)
+    return [self.rng.randn() * scale, self.rng.randn() * scale * 30.,
+            self.rng.randn() * 0.05, self.rng.randn()]
+
+  def test_max_curvature_matches_grid(self):
+    for _ in range(5000):
+      path = self.random_poly()
+      _, curv = model_speed_reference(path, 0.)
+      np.testing.assert_allclose(max_abs_curvature(path), np.max(np.abs(curv)), rtol=1e-9)
+
+  def test_speed_limit_matches_reference(self):
+    for _ in range(1000):
+      path = self.random_poly()
+      v_ego = self.rng.uniform(0., 40.)
+      ref, _ = model_speed_reference(path, v_ego)
+      np.testing.assert_allclose(curvature_speed_limit(max_abs_curvature(path), v_ego), ref, rtol=1e-9)
+
+  def test_straight_path(self):
+    self.assertEqual(max_abs_curvature([0., 0., 0., 1.]), 0.)
+    self.assertEqual(max_abs_curvature([0., 0., 0.3, 1.]), 0.)
+
+  def test_cached_per_model_frame(self):
+    ms = ModelSpeed()
+    ms.update(FakeSubMaster([], 1))
+    self.assertFalse(ms.valid)
+
+    path = self.random_poly()
+    ms.update(FakeSubMaster(path, 2))
+    self.assertTrue(ms.valid)
+    max_curv = ms.max_curv
+
+    # same logMonoTime, the polynomial is not looked at again
+    ms.update(FakeSubMaster([0., 0., 0., 0.], 2))
+    self.assertEqual(ms.max_curv, max_curv)
+
+    ms.update(FakeSubMaster([0., 0., 0., 0.], 3))
+    self.assertEqual(ms.max_curv, 0.)
+
+
+if __name__ == "__main__":
+  unittest.main()
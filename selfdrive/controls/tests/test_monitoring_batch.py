@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+import math
+import random
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+from cereal import log
+from selfdrive.controls.lib.events import Events
+from selfdrive.controls.lib import driver_monitor
+from selfdrive.controls.lib.driver_monitor import DriverStatus
+from selfdrive.locationd.calibration_helpers import Calibration
+from selfdrive.controls.lib.driver_monitor_batch import DriverMonitorInputs, DriverMonitorParams, DriverMonitorResult, \
+                                                        NO_ALERT, evaluate, evaluate_grid, param_grid, sweep
+
+
+class FakeDriverState():
+  def __init__(self, rnd, mode):
+    self.faceOrientation = [rnd.gauss(0, 0.1), rnd.gauss(0, 0.1), rnd.gauss(0, 0.1)]
+    self.facePosition = [rnd.gauss(0, 0.1), rnd.gauss(0, 0.1)]
+    std = rnd.uniform(0, 0.1)
+    self.faceOrientationStd = [std, rnd.uniform(0, 0.1), std]
+    self.facePositionStd = [std, std]
+    self.faceProb = rnd.uniform(0.5, 1.)
+    self.leftEyeProb = rnd.uniform(0.5, 1.)
+    self.rightEyeProb = rnd.uniform(0.5, 1.)
+    self.leftBlinkProb = rnd.uniform(0., 0.3)
+    self.rightBlinkProb = rnd.uniform(0., 0.3)
+
+    if mode == 'looking_away':
+      self.faceOrientation[1] += rnd.choice([-0.6, 0.6])
+    elif mode == 'eyes_closed':
+      self.leftBlinkProb = self.rightBlinkProb = rnd.uniform(0.5, 1.)
+    elif mode == 'no_face':
+      self.faceProb = rnd.uniform(0., 0.3)
+    elif mode == 'uncertain':
+      self.faceOrientationStd[0] = rnd.uniform(0.1, 1.5)
+    elif mode == 'empty':
+      self.faceOrientation = []
+
+
+MODES = ['attentive', 'looking_away', 'eyes_closed', 'no_face', 'uncertain', 'empty']
+
+
+def random_drive(seed, n=4000):
+  """driverStates and what else DriverStatus gets, in segments of a few seconds"""
+  rnd = random.Random(seed)
+  ds, cal_rpy, speed, op_engaged, driver_engaged, standstill, engaged_prob = [], [], [], [], [], [], []
+  extra_updates = {}
+  ep = float('nan')
+  while len(ds) < n:
+    mode = rnd.choices(MODES, weights=[4, 3, 1, 1, 1, 0.2])[0]
+    rpy = [0., rnd.gauss(0, 0.05), rnd.gauss(0, 0.05)]
+    v = rnd.choice([0., 5., 20., 30.])
+    engaged = rnd.random() < 0.8
+    stopped = v == 0. and rnd.random() < 0.5
+    for _ in range(rnd.randint(10, 600)):
+      if rnd.random() < 0.01:
+        ep = rnd.uniform(0., 1.)
+      if rnd.random() < 0.005:
+        extra_updates[len(ds)] = [(engaged, stopped)] * rnd.randint(1, 3)
+      ds.append(FakeDriverState(rnd, mode))
+      cal_rpy.append(rpy)
+      speed.append(v)
+      op_engaged.append(engaged)
+      driver_engaged.append(rnd.random() < 0.002)
+      standstill.append(stopped)
+      engaged_prob.append(ep)
+  return ds, cal_rpy, speed, op_engaged, driver_engaged, standstill, engaged_prob, extra_updates
+
+
+def run_streaming(drive, params=DriverMonitorParams(), is_rhd=False):
+  """DriverStatus frame by frame, with the module constants set to the params"""
+  ds, cal_rpy, speed, op_engaged, driver_engaged, standstill, engaged_prob, extra_updates = drive
+  constants = {"_" + name.upper(): value for name, value in params._asdict().items()}
+  out = {name: [] for name in DriverMonitorResult.FIELDS}
+  with mock.patch.multiple(driver_monitor, **constants):
+    DS = DriverStatus()
+    DS.is_rhd_region = is_rhd
+    for i in range(len(ds)):
+      for ctrl_active, stopped in extra_updates.get(i, ()):
+        DS.update(Events(), True, ctrl_active, stopped)
+      if not math.isnan(engaged_prob[i]):
+        DS.set_policy(SimpleNamespace(meta=SimpleNamespace(engagedProb=engaged_prob[i])))
+      e = Events()
+      DS.get_pose(ds[i], cal_rpy[i], speed[i], op_engaged[i])
+      DS.update(e, driver_engaged[i], op_engaged[i], standstill[i])
+
+      names = list(e.names)
+      out["low_acc"].append(driver_monitor.EventName.driverMonitorLowAcc in names)
+      alerts = [n for n in names if n != driver_monitor.EventName.driverMonitorLowAcc]
+      out["alert"].append(alerts[0] if alerts else NO_ALERT)
+      out["awareness"].append(DS.awareness)
+      out["awareness_active"].append(DS.awareness_active)
+      out["awareness_passive"].append(DS.awareness_passive)
+      out["step_change"].append(DS.step_change)
+      out["face_detected"].append(DS.face_detected)
+      out["distracted"].append(DS.driver_distracted)
+      out["low_std"].append(DS.pose.low_std)
+      out["hi_stds"].append(DS.hi_stds)
+      out["pitch_offset"].append(DS.pose.pitch_offseter.filtered_stat.mean())
+      out["pitch_valid_count"].append(DS.pose.pitch_offseter.filtered_stat.n)
+      out["yaw_offset"].append(DS.pose.yaw_offseter.filtered_stat.mean())
+      out["yaw_valid_count"].append(DS.pose.yaw_offseter.filtered_stat.n)
+      out["terminal_alert_cnt"].append(DS.terminal_alert_cnt)
+      out["terminal_time"].append(DS.terminal_time)
+  return out
+
+
+def make_inputs(drive, is_rhd=False):
+  ds, cal_rpy, speed, op_engaged, driver_engaged, standstill, engaged_prob, extra_updates = drive
+  return DriverMonitorInputs.from_driver_states(ds, cal_rpy, speed, op_engaged, driver_engaged, op_engaged, standstill,
+                                                engaged_prob=engaged_prob, extra_updates=extra_updates, is_rhd=is_rhd)
+
+
+class TestMonitoringBatch(unittest.TestCase):
+  def assertSameResult(self, result, expected):
+    for name in DriverMonitorResult.FIELDS:
+      # exactly the same floats, not close
+      np.testing.assert_array_equal(getattr(result, name), np.array(expected[name]), err_msg=name)
+
+  def assertSameAsStreaming(self, drive, params=DriverMonitorParams(), is_rhd=False):
+    expected = run_streaming(drive, params, is_rhd)
+    result = evaluate(make_inputs(drive, is_rhd), params)
+    self.assertSameResult(result, expected)
+    return result
+
+  def test_same_as_streaming(self):
+    results = [self.assertSameAsStreaming(random_drive(seed, 8000), is_rhd=seed % 2 == 1) for seed in range(4)]
+    # the drives get through the interesting parts
+    self.assertTrue(any(np.any(r.alert != NO_ALERT) for r in results))
+    self.assertTrue(any(np.any(r.low_acc) for r in results))
+    self.assertTrue(all(np.any(r.pitch_valid_count > driver_monitor._POSE_OFFSET_MIN_COUNT) for r in results))
+
+  def test_grid_same_as_streaming(self):
+    drive = random_drive(30)
+    inputs = make_inputs(drive)
+    grid = param_grid(distracted_time=[8., 30.], distracted_pre_time_till_terminal=[6., 16.],
+                      distracted_prompt_time_till_terminal=[4.], awareness_time=[20., 70.],
+                      metric_threshold=[0.3, 0.4], face_threshold=[0.4, 0.7], posestd_threshold=[0.14, 0.5],
+                      pose_offset_min_count=[100, 600], pose_offset_max_count=[300])
+    results = evaluate_grid(inputs, grid)
+    self.assertEqual(len(results), len(grid))
+    for params, result in zip(grid[::7], results[::7]):
+      self.assertSameResult(result, run_streaming(drive, params))
+    for params, result in zip(grid, results):
+      self.assertSameResult(result, evaluate(inputs, params).__dict__)
+
+  def test_same_as_streaming_with_params(self):
+    drive = random_drive(10)
+    for params in param_grid(distracted_time=[8., 11.], distracted_pre_time_till_terminal=[6.],
+                             distracted_prompt_time_till_terminal=[4.], metric_threshold=[0.3, 0.5], blink_threshold=[0.4],
+                             pose_offset_min_count=[100], pose_offset_max_count=[300], hi_std_fallback_time=[5]):
+      result = self.assertSameAsStreaming(drive, params)
+      self.assertTrue(np.any(result.terminal_alert_cnt > 0))
+
+  def test_from_logs(self):
+    def event(which, t, **fields):
+      return log.Event.new_message(logMonoTime=t, **{which: fields}).as_reader()
+
+    driver_state = {"faceOrientation": [0.1, 0.2, 0.], "facePosition": [0.1, -0.1], "faceOrientationStd": [0.1, 0.1, 0.1],
+                    "facePositionStd": [0.1, 0.1], "faceProb": 0.9, "leftEyeProb": 0.9, "rightEyeProb": 0.9}
+    msgs = [
+      event('driverState', 0, **driver_state),
+      event('liveCalibration', 1, calStatus=Calibration.CALIBRATED, rpyCalib=[0., 0.01, 0.02]),
+      event('carState', 2, vEgo=20., cruiseState={"enabled": True, "speed": 25.}),
+      event('model', 3, meta={"engagedProb": 0.7}),
+      event('driverState', 4, faceProb=0.2),
+      event('carState', 5, vEgo=21., steeringPressed=True, cruiseState={"enabled": True, "speed": 25.}),
+      event('driverState', 6, **driver_state),
+    ]
+    inputs = DriverMonitorInputs.from_logs(msgs)
+    self.assertEqual(inputs.n, 3)
+    self.assertEqual(inputs.valid.tolist(), [True, False, True])
+    self.assertEqual(inputs.car_speed.tolist(), [0., 20., 21.])
+    self.assertEqual(inputs.op_engaged.tolist(), [False, True, True])
+    # a changed cruise speed and the steering wheel touch
+    self.assertEqual(inputs.driver_engaged.tolist(), [False, True, True])
+    self.assertEqual(inputs.standstill.tolist(), [True, False, True])
+    self.assertEqual(inputs.extra_updates, {1: [(True, False)], 2: [(True, True)]})
+    self.assertTrue(math.isnan(inputs.engaged_prob[0]))
+    self.assertAlmostEqual(inputs.engaged_prob[1], 0.7, places=6)
+    self.assertNotEqual(inputs.pitch[0], inputs.pitch[2])  # calibrated in between
+
+  def test_sweep(self):
+    inputs = make_inputs(random_drive(20, 1500))
+    grid = param_grid(distracted_time=[15., 30.], face_threshold=[0.4, 0.6])
+    self.assertEqual(len(grid), 4)
+    self.assertEqual(grid[1].face_threshold, 0.6)
+    self.assertEqual(grid[1].awareness_time, driver_monitor._AWARENESS_TIME)
+
+    summaries = sweep(inputs, grid)
+    self.assertEqual(summaries, [evaluate(inputs, params).summary() for params in grid])
+    # in chunks on other processes
+    with mock.patch('selfdrive.controls.lib.driver_monitor_batch.GRID_CHUNK', 3):
+      self.assertEqual(summaries, sweep(inputs, grid, jobs=2))
+    # distracted sooner with the shorter time
+    self.assertGreater(summaries[0].get('promptDriverDistracted', {}).get('frames', 0),
+                       summaries[2].get('promptDriverDistracted', {}).get('frames', 0))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+import math
+import random
+import unittest
+
+import numpy as np
+
+from selfdrive.controls.lib.speed_smoother import get_delta_out_limits, speed_profile, speed_smoother, \
+                                                  speed_smoother_batch
+
+
+def speed_smoother_np(vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts):
+  """speed_smoother as it was with np.sqrt, what the others are checked against"""
+  dV = vT - vEgo
+
+  if dV > 0. and aEgo < 0.:
+    jMax *= 3.
+  elif dV < 0. and aEgo > 0.:
+    jMin *= 3.
+
+  tDelta = get_delta_out_limits(aEgo, aMax, aMin, jMax, jMin)
+
+  if (ts <= tDelta):
+    if (aEgo < aMin):
+      vEgo += ts * aEgo + 0.5 * ts**2 * jMax
+      aEgo += ts * jMax
+      return vEgo, aEgo
+    elif (aEgo > aMax):
+      vEgo += ts * aEgo + 0.5 * ts**2 * jMin
+      aEgo += ts * jMin
+      return vEgo, aEgo
+
+  if aEgo > aMax:
+    dV -= 0.5 * (aMax**2 - aEgo**2) / jMin
+    vEgo += 0.5 * (aMax**2 - aEgo**2) / jMin
+    aEgo += tDelta * jMin
+  elif aEgo < aMin:
+    dV -= 0.5 * (aMin**2 - aEgo**2) / jMax
+    vEgo += 0.5 * (aMin**2 - aEgo**2) / jMax
+    aEgo += tDelta * jMax
+
+  ts -= tDelta
+
+  jLim = jMin if aEgo >= 0 else jMax
+  dv_min_shift = - 0.5 * aEgo**2 / jLim
+
+  flipped = False
+  if dV < dv_min_shift:
+    flipped = True
+    dV *= -1
+    vEgo *= -1
+    aEgo *= -1
+    aMax = -aMin
+    jMaxcopy = -jMin
+    jMin = -jMax
+    jMax = jMaxcopy
+
+  aPeak = np.sqrt((0.5 * aEgo**2 / jMax + dV + 1e-9) / (0.5 / jMax - 0.5 / jMin))
+
+  if aPeak > aMax:
+    aPeak = aMax
+    t1 = (aPeak - aEgo) / jMax
+    if aPeak <= 0:
+      t2 = t1 + ts + 1e-9
+      t3 = t2
+    else:
+      vChange = dV - 0.5 * (aPeak**2 - aEgo**2) / jMax + 0.5 * aPeak**2 / jMin
+      if vChange < aPeak * ts:
+        t2 = t1 + vChange / aPeak
+      else:
+        t2 = t1 + ts
+      t3 = t2 - aPeak / jMin
+  else:
+    t1 = (aPeak - aEgo) / jMax
+    t2 = t1
+    t3 = t2 - aPeak / jMin
+
+  dt1 = min(ts, t1)
+  dt2 = max(min(ts, t2) - t1, 0.)
+  dt3 = max(min(ts, t3) - t2, 0.)
+
+  if ts > t3:
+    vEgo += dV
+    aEgo = 0.
+  else:
+    vEgo += aEgo * dt1 + 0.5 * dt1**2 * jMax + aPeak * dt2 + aPeak * dt3 + 0.5 * dt3**2 * jMin
+    aEgo += jMax * dt1 + dt3 * jMin
+
+  vEgo *= -1 if flipped else 1
+  aEgo *= -1 if flipped else 1
+
+  return float(vEgo), float(aEgo)
+
+
+def random_args(rnd):
+  """A state, target and limits, with some of the edge cases planner runs into"""
+  vEgo = rnd.choice([0., rnd.uniform(0., 40.)])
+  vT = rnd.choice([vEgo, 0., rnd.uniform(0., 40.), vEgo + rnd.uniform(-0.01, 0.01)])
+  aMax = rnd.uniform(0.1, 2.)
+  aMin = rnd.uniform(-4., -0.3)
+  if rnd.random() < 0.5:
+    # planner's jerk limits are the accel limits
+    jMax, jMin = max(0.1, aMax), min(-0.1, aMin)
+  else:
+    jMax, jMin = rnd.uniform(0.05, 3.), rnd.uniform(-5., -0.05)
+  aEgo = rnd.choice([0., aMax, aMin, rnd.uniform(-6., 4.), rnd.uniform(aMin, aMax)])
+  ts = rnd.choice([0.05, 0.2, rnd.uniform(0., 3.), 10.])
+  return vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts
+
+
+def random_cases(seed, n):
+  rnd = random.Random(seed)
+  return [random_args(rnd) for _ in range(n)]
+
+
+class TestSpeedSmoother(unittest.TestCase):
+  def assertSameFloat(self, result, expected):
+    # the same floats, and the same signs of zeros
+    self.assertEqual(len(result), len(expected))
+    for r, e in zip(result, expected):
+      if math.isnan(e):
+        self.assertTrue(math.isnan(r), (result, expected))
+      else:
+        self.assertEqual((r, math.copysign(1, r)), (e, math.copysign(1, e)), (result, expected))
+
+  def test_scalar_same_as_numpy(self):
+    for args in random_cases(0, 20000):
+      result = speed_smoother(*args)
+      self.assertSameFloat(result, speed_smoother_np(*args))
+      self.assertTrue(all(type(x) is float for x in result))
+
+  def test_scalar_wrong_limits(self):
+    # jerk limits of the wrong sign make np.sqrt of a negative number
+    args = (10., 0., 20., 1., -1., -0.5, -1., 0.2)
+    with np.errstate(invalid='ignore'):
+      expected = speed_smoother_np(*args)
+    self.assertSameFloat(speed_smoother(*args), expected)
+
+  def test_batch_same_as_scalar(self):
+    cases = random_cases(1, 20000)
+    v, a = speed_smoother_batch(*np.array(cases).T)
+    for i, args in enumerate(cases):
+      self.assertSameFloat((v[i], a[i]), speed_smoother(*args))
+
+  def test_batch_broadcast(self):
+    ts = np.linspace(0., 5., 11)
+    v, a = speed_smoother_batch(10., 0.5, 20., 1.5, -2., 1.5, -2., ts)
+    self.assertEqual(v.shape, (11,))
+    for i in range(len(ts)):
+      self.assertSameFloat((v[i], a[i]), speed_smoother(10., 0.5, 20., 1.5, -2., 1.5, -2., ts[i]))
+
+    v, a = speed_smoother_batch(np.zeros((2, 3)), 0., [[5.], [10.]], 1., -1., 1., -1., 0.2)
+    self.assertEqual(v.shape, (2, 3))
+    self.assertEqual(a.shape, (2, 3))
+
+  def test_profile_same_as_stepping(self):
+    cases = random_cases(2, 200)
+    v, a = speed_profile(*np.array(cases).T, n=100)
+    self.assertEqual(v.shape, (200, 100))
+    for i, args in enumerate(cases):
+      vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts = args
+      v_scalar, a_scalar = speed_profile(*args, n=100)
+      for j in range(100):
+        vEgo, aEgo = speed_smoother_np(vEgo, aEgo, vT, aMax, aMin, jMax, jMin, ts)
+        self.assertSameFloat((v[i, j], a[i, j]), (vEgo, aEgo))
+        self.assertSameFloat((v_scalar[j], a_scalar[j]), (vEgo, aEgo))
+
+  def test_profile_limits(self):
+    rnd = random.Random(3)
+    cases = np.array(random_cases(3, 500))
+    aMax, aMin, jMax, jMin = cases[:, 3], cases[:, 4], cases[:, 5], cases[:, 6]
+    aEgo = np.array([rnd.uniform(lo, hi) for lo, hi in zip(aMin, aMax)])
+    ts = 0.2
+    v, a = speed_profile(cases[:, 0], aEgo, cases[:, 2], aMax, aMin, jMax, jMin, ts, 3000)
+
+    # accel stays within its limits, changes no faster than the jerk limits
+    # (three times as fast to recover), and the speed gets to the target
+    self.assertTrue(np.all(a <= aMax[:, None] + 1e-6) and np.all(a >= aMin[:, None] - 1e-6))
+    jerk = np.diff(np.concatenate([aEgo[:, None], a], axis=1)) / ts
+    self.assertTrue(np.all(jerk <= 3 * jMax[:, None] + 1e-6) and np.all(jerk >= 3 * jMin[:, None] - 1e-6))
+    np.testing.assert_allclose(v[:, -1], cases[:, 2], atol=1e-6)
+    np.testing.assert_allclose(a[:, -1], 0., atol=1e-6)
+
+
+if __name__ == "__main__":
+  unittest.main()
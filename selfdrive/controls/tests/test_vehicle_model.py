@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+import unittest
+import numpy as np
+from cereal import car
+
+from selfdrive.controls.lib.vehicle_model import VehicleModel, dyn_ss_sol, dyn_ss_sol_scalar, calc_slip_factor
+
+
+def random_car_params(rng):
+  CP = car.CarParams.new_message()
+  CP.mass = rng.uniform(1000., 2500.)
+  CP.wheelbase = rng.uniform(2.3, 3.2)
+  CP.centerToFront = CP.wheelbase * rng.uniform(0.35, 0.5)
+  CP.rotationalInertia = rng.uniform(1500., 4500.)
+  CP.tireStiffnessFront = rng.uniform(8e4, 3e5)
+  CP.tireStiffnessRear = rng.uniform(8e4, 3e5)
+  CP.steerRatio = rng.uniform(10., 18.)
+  CP.steerRatioRear = rng.uniform(-0.1, 0.1)
+  return CP
+
+
+def curvature_factor_reference(VM, u):
+  sf = calc_slip_factor(VM)
+  return (1. - VM.chi) / (1. - sf * u**2) / VM.l
+
+
+class TestVehicleModel(unittest.TestCase):
+  def setUp(self):
+    self.rng = np.random.RandomState(0)
+
+  def test_dyn_ss_sol_matches_matrix_solution(self):
+    for _ in range(500):
+      VM = VehicleModel(random_car_params(self.rng))
+      VM.update_params(self.rng.uniform(0.5, 2.0), self.rng.uniform(10., 18.))
+      sa = self.rng.uniform(-0.5, 0.5)
+      u = self.rng.uniform(0.2, 50.)
+
+      x = dyn_ss_sol(sa, u, VM)
+      v, r = dyn_ss_sol_scalar(sa, u, VM)
+      np.testing.assert_allclose([v, r], x[:, 0], rtol=1e-9, atol=1e-12)
+      np.testing.assert_allclose(VM.steady_state_sol(sa, u), x, rtol=1e-9, atol=1e-12)
+
+  def test_curvature_matches_reference(self):
+    for _ in range(500):
+      VM = VehicleModel(random_car_params(self.rng))
+      VM.update_params(self.rng.uniform(0.5, 2.0), self.rng.uniform(10., 18.))
+      sa = self.rng.uniform(-0.5, 0.5)
+      u = self.rng.uniform(0., 50.)
+
+      cf = curvature_factor_reference(VM, u)
+      np.testing.assert_allclose(VM.curvature_factor(u), cf, rtol=1e-12)
+      np.testing.assert_allclose(VM.calc_curvature(sa, u), cf * sa / VM.sR, rtol=1e-12, atol=1e-15)
+      if abs(sa) > 1e-3:
+        np.testing.assert_allclose(VM.get_steer_from_curvature(cf * sa / VM.sR, u), sa, rtol=1e-9)
+
+  def test_update_params(self):
+    VM = VehicleModel(random_car_params(self.rng))
+    sf = VM.sf
+
+    # same parameters are skipped, others take effect
+    VM.update_params(1.0, VM.sR)
+    self.assertIs(VM.sf, sf)
+
+    VM.update_params(1.3, 15.)
+    self.assertNotEqual(VM.sf, sf)
+    for u in np.linspace(0., 40., 41):
+      np.testing.assert_allclose(VM.curvature_factor(u), curvature_factor_reference(VM, u), rtol=1e-12)
+      np.testing.assert_allclose(VM.yaw_rate(1., u), curvature_factor_reference(VM, u) * u / 15., rtol=1e-12, atol=1e-15)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# Replays the driver monitoring of recorded drives with other thresholds, like
+#   dmonitoring_sweep.py rlog.bz2 ... --param distracted_time=8,11,15 --param metric_threshold=0.4,0.5
+# and prints how often each set of them alerts.
+import argparse
+import json
+
+from selfdrive.controls.lib.driver_monitor_batch import DriverMonitorInputs, DriverMonitorParams, param_grid, sweep
+from tools.lib.logreader import MultiLogIterator
+
+SERVICES = ['driverState', 'carState', 'liveCalibration', 'model']
+
+
+def parse_param(s):
+  name, values = s.split("=")
+  if name not in DriverMonitorParams._fields:
+    raise argparse.ArgumentTypeError("no param %s, one of %s" % (name, ", ".join(DriverMonitorParams._fields)))
+  return name, [float(v) for v in values.split(",")]
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Driver monitoring alerts of recorded drives over a grid of thresholds",
+                                   formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  parser.add_argument("logs", nargs='+', help="rlogs of a drive, in order")
+  parser.add_argument("--param", type=parse_param, action='append', default=[], help="name=value,value,...")
+  parser.add_argument("--rhd", action='store_true', help="right hand drive")
+  parser.add_argument("--jobs", type=int, help="processes, all cores by default")
+  parser.add_argument("--json", action='store_true', help="print the summaries as JSON")
+  args = parser.parse_args()
+
+  inputs = DriverMonitorInputs.from_logs(MultiLogIterator(args.logs, services=SERVICES, sort_by_time=True), is_rhd=args.rhd)
+  grid = param_grid(**dict(args.param))
+  summaries = sweep(inputs, grid, jobs=args.jobs)
+
+  names = [name for name, _ in args.param]
+  for params, summary in zip(grid, summaries):
+    values = {name: getattr(params, name) for name in names}
+    if args.json:
+      print(json.dumps({"params": values, **summary}))
+      continue
+    alerts = ", ".join("%s %d (%.0f s)" % (k, v["count"], v["frames"] * 0.1) for k, v in summary.items() if isinstance(v, dict))
+    print("%s: %d frames, %d distracted, %d terminal, %s" % (
+      " ".join("%s=%g" % kv for kv in values.items()) or "defaults", summary["frames"], summary["distracted_frames"],
+      summary["terminal_alerts"], alerts or "no alerts"))
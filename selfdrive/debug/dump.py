@@ -8,6 +8,7 @@ from hexdump import hexdump
 from cereal import log
 import cereal.messaging as messaging
 from cereal.services import service_list
+from tools.lib.projection import Projection, WRITERS, project_logs
 
 if __name__ == "__main__":
 
@@ -18,27 +19,50 @@ if __name__ == "__main__":
   parser.add_argument('--dump-json', action='store_true')
   parser.add_argument('--no-print', action='store_true')
   parser.add_argument('--addr', default='127.0.0.1')
-  parser.add_argument('--values', help='values to monitor (instead of entire event)')
+  parser.add_argument('--values', help='values to monitor (instead of entire event), like carState.vEgo,logMonoTime')
+  parser.add_argument('--format', choices=sorted(WRITERS), default='text', help='output of --values')
+  parser.add_argument('--log', nargs='+', help='read --values from recorded logs instead of sockets')
   parser.add_argument("socket", type=str, nargs='*', help="socket name")
   args = parser.parse_args()
 
+  projection = None
+  if args.values:
+    projection = Projection([s.strip() for s in args.values.split(",")])
+    writer = WRITERS[args.format](sys.stdout, projection)
+
+  if args.log:
+    if projection is None:
+      parser.error("--log needs --values")
+    for row in project_logs(projection, args.log):
+      writer.write(row)
+    sys.exit(0)
+
   if args.addr != "127.0.0.1":
     os.environ["ZMQ"] = "1"
     messaging.context = messaging.Context()
 
   poller = messaging.Poller()
 
-  for m in args.socket if len(args.socket) > 0 else service_list:
-    sock = messaging.sub_sock(m, poller, addr=args.addr)
-
-  values = None
-  if args.values:
-    values = [s.strip().split(".") for s in args.values.split(",")]
+  services = args.socket
+  if len(services) == 0:
+    # only the services the values are in
+    services = service_list if projection is None or projection.services is None else sorted(projection.services)
+  socks = {}
+  for m in services:
+    socks[messaging.sub_sock(m, poller, addr=args.addr)] = m
 
   while 1:
     polld = poller.poll(1000)
     for sock in polld:
       msg = sock.receive()
+
+      if projection is not None and not args.no_print:
+        row = projection.project_raw(msg, socks[sock])
+        if row is not None:
+          writer.write(row)
+          sys.stdout.flush()
+        continue
+
       evt = log.Event.from_bytes(msg)
 
       if not args.no_print:
@@ -51,14 +75,5 @@ if __name__ == "__main__":
           print(json.loads(msg))
         elif args.dump_json:
           print(json.dumps(evt.to_dict()))
-        elif values:
-          print("logMonotime = {}".format(evt.logMonoTime))
-          for value in values:
-            if hasattr(evt, value[0]):
-              item = evt
-              for key in value:
-                item = getattr(item, key)
-              print("{} = {}".format(".".join(value), item))
-          print("")
         else:
           print(evt)
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# Per process CPU and memory profile of a drive from the procLog that proclogd
+# records every 2s. Sustained CPU spikes are flagged, together with the
+# controlsd lag and thermal state while they lasted, and a JSON report is
+# written for comparing builds.
+#
+# Sample usage:
+#   python selfdrive/debug/proclog_profile.py rlog.bz2 ... --out report.json
+#   python selfdrive/debug/proclog_profile.py rlog.bz2 ... --baseline old_report.json
+import sys
+import json
+import argparse
+from collections import defaultdict
+
+import numpy as np
+
+from cereal import log
+from common.realtime import DT_CTRL
+from selfdrive.debug.live_cpu_and_temp import cputime_busy, cputime_total, proc_cputime_total, proc_name
+from tools.lib.logreader import MultiLogIterator
+
+SERVICES = ['procLog', 'controlsState', 'thermal']
+THERMAL_STATUS = log.ThermalData.ThermalStatus.schema.enumerants
+
+# a spike is CPU above the median of the process by this much, in % of one core,
+# and this many times the median, for at least SPIKE_MIN_DURATION seconds
+SPIKE_MIN_DELTA = 10.
+SPIKE_RATIO = 1.5
+SPIKE_MIN_DURATION = 4.
+
+# cumLagMs drops by at most one DT_CTRL a frame, when controlsd catches up with
+# frames back to back. Dropping more than that over the frames between two
+# controlsState, give or take this much, is controlsd restarting
+LAG_RESET_MS = 5.
+
+# regressions flagged by --baseline, in % of one core and MB
+CPU_TOLERANCE = 2.
+RSS_TOLERANCE = 20.
+
+
+def accumulate_lag(t, cum_lag_ms):
+  """cumLagMs of controlsd added up over its restarts, which start it over from 0.
+
+  qlogs only keep every nth controlsState, n is taken from the usual time
+  between them. Between two of them there are at least n frames, and as many
+  as fit in the time between when some are missing.
+  """
+  lag = np.zeros(len(t))
+  if len(t) < 2:
+    return lag
+  dt = np.diff(t)
+  n = max(1, int(round(np.median(dt) / DT_CTRL)))
+  total = 0.
+  for i in range(1, len(t)):
+    frames = max(n, int(round(dt[i - 1] / DT_CTRL)))
+    drop = cum_lag_ms[i - 1] - cum_lag_ms[i]
+    if drop > frames * DT_CTRL * 1000. + LAG_RESET_MS:
+      # restarted, the lag starts over from 0
+      total += cum_lag_ms[i]
+    else:
+      total -= drop
+    lag[i] = total
+  return lag
+
+
+def percentiles(x):
+  x = np.asarray(x, dtype=np.float64)
+  if len(x) == 0:
+    return None
+  return {
+    'mean': float(np.mean(x)),
+    'p50': float(np.percentile(x, 50)),
+    'p95': float(np.percentile(x, 95)),
+    'max': float(np.max(x)),
+  }
+
+
+class ProcLogSeries():
+  """CPU and RSS time series of every process from consecutive procLogs,
+  with controlsd lag and thermal state alongside.
+
+  The CPU use of a process is the change of its CPU times between two procLogs
+  over the time between them, in % of one core. Processes with the same name
+  are summed, so a restarted process continues its series.
+  """
+  def __init__(self):
+    self.t = []
+    self.cpu = defaultdict(dict)  # name -> sample -> % of one core
+    self.rss = defaultdict(dict)  # name -> sample -> MB
+    self.cpu_total = []  # % of all cores
+    self.prev = None
+    self.start_t = None
+
+    self.lag_t, self.cum_lag_ms, self._lag = [], [], None
+    self.thermal_t, self.thermal_status, self.cpu_temp = [], [], []
+
+  def add_proclog(self, t, proclog):
+    procs = {(p.pid, p.startTime): (proc_name(p), proc_cputime_total(p), p.memRss) for p in proclog.procs}
+    cores = {c.cpuNum: (cputime_busy(c), cputime_total(c)) for c in proclog.cpuTimes}
+
+    if self.prev is None:
+      self.start_t = t
+    else:
+      prev_t, prev_procs, prev_cores = self.prev
+      dt = t - prev_t
+      if dt > 0:
+        i = len(self.t)
+        self.t.append(t)
+        for key, (name, cpu_time, rss) in procs.items():
+          if key in prev_procs:
+            cpu = (cpu_time - prev_procs[key][1]) / dt * 100.
+            self.cpu[name][i] = self.cpu[name].get(i, 0.) + cpu
+          self.rss[name][i] = self.rss[name].get(i, 0.) + rss / 1e6
+
+        busy = sum(b - prev_cores[n][0] for n, (b, _) in cores.items() if n in prev_cores)
+        total = sum(tt - prev_cores[n][1] for n, (_, tt) in cores.items() if n in prev_cores)
+        self.cpu_total.append(busy / total * 100. if total > 0 else 0.)
+    self.prev = (t, procs, cores)
+
+  def add_controls_state(self, t, cum_lag_ms):
+    self.lag_t.append(t)
+    self.cum_lag_ms.append(cum_lag_ms)
+    self._lag = None
+
+  @property
+  def lag(self):
+    """controlsd lag in ms built up since the first controlsState, at each of lag_t"""
+    if self._lag is None:
+      self._lag = accumulate_lag(self.lag_t, self.cum_lag_ms)
+    return self._lag
+
+  def add_thermal(self, t, thermal):
+    self.thermal_t.append(t)
+    self.thermal_status.append(THERMAL_STATUS[str(thermal.thermalStatus)])
+    self.cpu_temp.append(np.mean([thermal.cpu0, thermal.cpu1, thermal.cpu2, thermal.cpu3]) / 10.)
+
+  def add(self, msg):
+    t = msg.logMonoTime / 1e9
+    w = msg.which()
+    if w == 'procLog':
+      self.add_proclog(t, msg.procLog)
+    elif w == 'controlsState':
+      self.add_controls_state(t, msg.controlsState.cumLagMs)
+    elif w == 'thermal':
+      self.add_thermal(t, msg.thermal)
+
+  def series(self, d):
+    """Sample numbers, times and values of one process, a sample is over the
+    time from the procLog before it to its own"""
+    idx = np.array(sorted(d), dtype=np.int64)
+    return idx, np.array([self.t[i] for i in idx]), np.array([d[i] for i in idx])
+
+  def sample_start(self, i):
+    return self.t[i - 1] if i > 0 else self.start_t
+
+  def lag_between(self, t0, t1):
+    """controlsd lag in ms that built up between t0 and t1"""
+    if len(self.lag_t) < 2:
+      return None
+    return float(np.interp(t1, self.lag_t, self.lag) - np.interp(t0, self.lag_t, self.lag))
+
+  def thermal_between(self, t0, t1):
+    t = np.array(self.thermal_t)
+    sel = (t >= t0) & (t <= t1)
+    if not np.any(sel):
+      return None, None
+    status = max(np.array(self.thermal_status)[sel])
+    return [k for k, v in THERMAL_STATUS.items() if v == status][0], float(np.max(np.array(self.cpu_temp)[sel]))
+
+
+def find_spikes(start, end, cpu, min_delta=SPIKE_MIN_DELTA, ratio=SPIKE_RATIO, min_duration=SPIKE_MIN_DURATION):
+  """(first, last) index pairs of runs of samples where cpu is well above its
+  median, sample i is over the time from start[i] to end[i]"""
+  if len(cpu) < 2:
+    return []
+  median = np.median(cpu)
+  high = (cpu - median >= min_delta) & (cpu >= median * ratio)
+
+  spikes = []
+  i = 0
+  while i < len(cpu):
+    if not high[i]:
+      i += 1
+      continue
+    j = i
+    while j + 1 < len(cpu) and high[j + 1]:
+      j += 1
+    if end[j] - start[i] >= min_duration:
+      spikes.append((i, j))
+    i = j + 1
+  return spikes
+
+
+def build_report(series, include_series=False, **spike_kwargs):
+  if len(series.t) == 0:
+    return {'samples': 0, 'processes': {}}
+
+  t0 = series.start_t
+  duration = series.t[-1] - t0
+  lag_total = series.lag_between(t0, series.t[-1])
+  lag_rate = lag_total / duration if lag_total is not None and duration > 0 else None
+
+  report = {
+    'samples': len(series.t),
+    'duration_s': duration,
+    'system': {
+      'cpu': percentiles(series.cpu_total),
+      'controls_lag_ms': lag_total,
+      'controls_lag_ms_per_s': lag_rate,
+      'thermal_status_max': series.thermal_between(-np.inf, np.inf)[0],
+      'cpu_temp': percentiles(series.cpu_temp),
+    },
+    'processes': {},
+  }
+
+  # lag built up over each sample, to see which processes it goes along with
+  sample_lag = None
+  if lag_total is not None:
+    sample_lag = np.array([series.lag_between(series.sample_start(i), t) for i, t in enumerate(series.t)])
+
+  for name in sorted(set(series.cpu) | set(series.rss)):
+    idx, t, cpu = series.series(series.cpu[name])
+    start = np.array([series.sample_start(i) for i in idx])
+    _, rss_t, rss = series.series(series.rss[name])
+    proc = {
+      'cpu': percentiles(cpu),
+      'rss_mb': percentiles(rss),
+    }
+    if len(rss) > 1 and rss_t[-1] > rss_t[0]:
+      proc['rss_mb']['growth_per_hour'] = float(np.polyfit(rss_t - t0, rss, 1)[0] * 3600.)
+
+    if sample_lag is not None and len(cpu) > 2 and np.std(cpu) > 0:
+      lag = sample_lag[idx]
+      if np.std(lag) > 0:
+        proc['controls_lag_corr'] = float(np.corrcoef(cpu, lag)[0, 1])
+
+    proc['spikes'] = []
+    for i, j in find_spikes(start, t, cpu, **spike_kwargs):
+      lag = series.lag_between(start[i], t[j])
+      thermal_status, cpu_temp = series.thermal_between(start[i], t[j])
+      proc['spikes'].append({
+        'start_s': float(start[i] - t0),
+        'duration_s': float(t[j] - start[i]),
+        'cpu_mean': float(np.mean(cpu[i:j + 1])),
+        'cpu_max': float(np.max(cpu[i:j + 1])),
+        'controls_lag_ms': lag,
+        'controls_lag_ms_per_s': lag / (t[j] - start[i]) if lag is not None else None,
+        'thermal_status_max': thermal_status,
+        'cpu_temp_max': cpu_temp,
+      })
+
+    if include_series:
+      proc['series'] = {
+        'cpu_t': (t - t0).tolist(), 'cpu': cpu.tolist(),
+        'rss_t': (rss_t - t0).tolist(), 'rss_mb': rss.tolist(),
+      }
+    report['processes'][name] = proc
+  return report
+
+
+def compare_reports(baseline, report, cpu_tolerance=CPU_TOLERANCE, rss_tolerance=RSS_TOLERANCE):
+  """Processes that use more CPU on average or more memory at most than in baseline,
+  and ones that are new"""
+  regressions = []
+  for name, proc in report['processes'].items():
+    base = baseline['processes'].get(name)
+    if base is None:
+      regressions.append({'process': name, 'new': True})
+      continue
+    for key, stat, tolerance in [('cpu', 'mean', cpu_tolerance), ('rss_mb', 'max', rss_tolerance)]:
+      if proc[key] is None or base[key] is None:
+        continue
+      diff = proc[key][stat] - base[key][stat]
+      if diff > tolerance:
+        regressions.append({'process': name, 'value': '%s_%s' % (key, stat),
+                            'baseline': base[key][stat], 'current': proc[key][stat], 'diff': diff})
+  return regressions
+
+
+def profile_logs(log_paths, **kwargs):
+  series = ProcLogSeries()
+  for msg in MultiLogIterator(log_paths, services=SERVICES):
+    series.add(msg)
+  return build_report(series, **kwargs)
+
+
+def print_report(report, n=15):
+  if report['samples'] == 0:
+    print("no procLog in the logs")
+    return
+  system = report['system']
+  print("%d procLog samples over %.0f s, CPU %.1f%% mean %.1f%% max, controlsd lag %s ms" % (
+    report['samples'], report['duration_s'], system['cpu']['mean'], system['cpu']['max'],
+    "%.1f" % system['controls_lag_ms'] if system['controls_lag_ms'] is not None else "-"))
+
+  procs = sorted(report['processes'].items(), key=lambda kv: -(kv[1]['cpu'] or {'mean': 0.})['mean'])
+  print("%70s %8s %8s %8s %9s %7s" % ("process", "cpu avg", "cpu p95", "cpu max", "rss max", "spikes"))
+  for name, proc in procs[:n]:
+    if proc['cpu'] is None:
+      continue
+    print("%70s %7.1f%% %7.1f%% %7.1f%% %6.1f MB %7d" % (name[-70:], proc['cpu']['mean'], proc['cpu']['p95'],
+                                                     proc['cpu']['max'], proc['rss_mb']['max'], len(proc['spikes'])))
+
+  for name, proc in procs:
+    for s in proc['spikes']:
+      lag = "%.1f ms" % s['controls_lag_ms'] if s['controls_lag_ms'] is not None else "-"
+      print("spike %s at %.0f s for %.0f s: %.1f%% mean, controlsd lag %s, thermal %s" % (
+        name, s['start_s'], s['duration_s'], s['cpu_mean'], lag, s['thermal_status_max']))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="CPU and memory profile of the processes in recorded logs",
+                                   formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  parser.add_argument("logs", nargs='+', help="rlogs or qlogs of a drive, in order")
+  parser.add_argument("--out", help="write the report as JSON to this file")
+  parser.add_argument("--series", action='store_true', help="include the CPU and RSS series in the report")
+  parser.add_argument("--baseline", help="report of an earlier build to compare with")
+  parser.add_argument("--spike-delta", type=float, default=SPIKE_MIN_DELTA, help="%% of one core above the median")
+  parser.add_argument("--spike-duration", type=float, default=SPIKE_MIN_DURATION, help="seconds")
+  args = parser.parse_args()
+
+  report = profile_logs(args.logs, include_series=args.series, min_delta=args.spike_delta,
+                        min_duration=args.spike_duration)
+  print_report(report)
+
+  if args.out:
+    with open(args.out, "w") as f:
+      json.dump(report, f, indent=2)
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      regressions = compare_reports(json.load(f), report)
+    for r in regressions:
+      print("regression:", json.dumps(r))
+    sys.exit(1 if len(regressions) else 0)
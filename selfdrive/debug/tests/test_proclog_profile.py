@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from cereal import log
+from selfdrive.debug.proclog_profile import ProcLogSeries, build_report, compare_reports, find_spikes, profile_logs
+
+DT = 2.
+SAMPLES = 60
+SPIKE = range(20, 25)  # procLogs after which modeld was busy
+
+
+def make_proclog(t, cpu_times, rss):
+  msg = log.Event.new_message()
+  msg.logMonoTime = int(t * 1e9)
+  pl = msg.init('procLog')
+  cpus = pl.init('cpuTimes', 1)
+  cpus[0].cpuNum = 0
+  cpus[0].user = sum(cpu_times.values())
+  cpus[0].idle = t * len(cpu_times) - cpus[0].user
+  procs = pl.init('procs', len(cpu_times))
+  for p, (name, cpu_time) in zip(procs, sorted(cpu_times.items())):
+    p.pid, p.startTime = name[1], 1.
+    p.name = name[0]
+    p.cpuUser = cpu_time
+    p.memRss = rss[name[0]]
+  return msg
+
+
+def make_drive():
+  """procLogs of a drive with modeld busy and controlsd lagging for SPIKE, and
+  the cumLagMs of controlsd at 10Hz, thermal at 2Hz"""
+  msgs = []
+  cpu_times = {}
+  cum_lag = 0.
+  for k in range(SAMPLES + 1):
+    t = 100. + k * DT
+    if k > 0:
+      busy = (k - 1) in SPIKE
+      ui = ('ui', 10 if k < 30 else 11)
+      if k == 30:
+        # ui restarted with another pid
+        del cpu_times[('ui', 10)]
+      for name, cpu in [(('controlsd', 1), 0.3), (('modeld', 2), 0.9 if busy else 0.4), (ui, 0.1)]:
+        cpu_times[name] = cpu_times.get(name, 0.) + cpu * DT
+
+      for m in range(20):
+        tc = t - DT + (m + 1) * DT / 20
+        cum_lag += 5. if busy else 0.
+        msg = log.Event.new_message()
+        msg.logMonoTime = int(tc * 1e9)
+        msg.init('controlsState').cumLagMs = cum_lag
+        msgs.append(msg)
+      for m in range(4):
+        msg = log.Event.new_message()
+        msg.logMonoTime = int((t - DT + (m + 0.5) * DT / 4) * 1e9)
+        th = msg.init('thermal')
+        th.thermalStatus = 'yellow' if busy else 'green'
+        th.cpu0 = th.cpu1 = th.cpu2 = th.cpu3 = 700 if busy else 500
+        msgs.append(msg)
+
+    rss = {'controlsd': 100e6, 'modeld': 200e6, 'ui': 50e6 + k * 1e6}
+    msgs.append(make_proclog(t, cpu_times, rss))
+  return sorted(msgs, key=lambda m: m.logMonoTime)
+
+
+def drive_series():
+  series = ProcLogSeries()
+  for msg in make_drive():
+    series.add(msg)
+  return series
+
+
+class TestProcLogProfile(unittest.TestCase):
+  def test_cpu_and_rss(self):
+    report = build_report(drive_series())
+    self.assertEqual(report['samples'], SAMPLES)
+    self.assertAlmostEqual(report['duration_s'], SAMPLES * DT)
+
+    procs = report['processes']
+    self.assertAlmostEqual(procs['controlsd']['cpu']['mean'], 30., places=3)
+    self.assertAlmostEqual(procs['modeld']['cpu']['max'], 90., places=3)
+    self.assertAlmostEqual(procs['modeld']['cpu']['p50'], 40., places=3)
+    # no CPU use for the restarted ui in its first procLog, the rest of its samples continue
+    self.assertEqual(len(procs['ui']['spikes']), 0)
+    self.assertAlmostEqual(procs['ui']['cpu']['max'], 10., places=3)
+    self.assertEqual(len(build_report(drive_series(), include_series=True)['processes']['ui']['series']['cpu']),
+                     SAMPLES - 2)
+    self.assertAlmostEqual(procs['controlsd']['rss_mb']['max'], 100.)
+    self.assertAlmostEqual(procs['ui']['rss_mb']['growth_per_hour'], 1. / DT * 3600., places=3)
+    self.assertAlmostEqual(procs['controlsd']['rss_mb']['growth_per_hour'], 0., places=6)
+
+    system = report['system']
+    self.assertAlmostEqual(system['controls_lag_ms'], len(SPIKE) * 20 * 5.)
+    self.assertEqual(system['thermal_status_max'], 'yellow')
+    self.assertAlmostEqual(system['cpu_temp']['max'], 70.)
+
+  def test_spikes(self):
+    report = build_report(drive_series())
+    spikes = report['processes']['modeld']['spikes']
+    self.assertEqual(len(spikes), 1)
+    s = spikes[0]
+    self.assertAlmostEqual(s['start_s'], SPIKE[0] * DT)
+    self.assertAlmostEqual(s['duration_s'], len(SPIKE) * DT)
+    self.assertAlmostEqual(s['cpu_mean'], 90., places=3)
+    self.assertAlmostEqual(s['controls_lag_ms'], len(SPIKE) * 20 * 5.)
+    self.assertAlmostEqual(s['controls_lag_ms_per_s'], 20 * 5. / DT)
+    self.assertEqual(s['thermal_status_max'], 'yellow')
+    self.assertAlmostEqual(s['cpu_temp_max'], 70.)
+    self.assertGreater(report['processes']['modeld']['controls_lag_corr'], 0.99)
+    self.assertEqual(report['processes']['controlsd']['spikes'], [])
+
+    # too short to be sustained
+    self.assertEqual(build_report(drive_series(), min_duration=len(SPIKE) * DT + 1)['processes']['modeld']['spikes'], [])
+
+  def test_find_spikes(self):
+    cpu = [10, 10, 50, 50, 10, 50, 10, 10]
+    end = [2. * (i + 1) for i in range(len(cpu))]
+    start = [e - 2. for e in end]
+    self.assertEqual(find_spikes(start, end, cpu, min_duration=4.), [(2, 3)])
+    self.assertEqual(find_spikes(start, end, cpu, min_duration=2.), [(2, 3), (5, 5)])
+    self.assertEqual(find_spikes(start, end, cpu, min_delta=50.), [])
+
+  def test_lag_reset(self):
+    # controlsd restarting starts cumLagMs over, that isn't negative lag
+    series = ProcLogSeries()
+    for i, lag in enumerate([0., 10., 20., 0., 5.]):
+      series.add_controls_state(i * 0.01, lag)
+    self.assertAlmostEqual(series.lag_between(0, 0.04), 25.)
+    # and catching up isn't a restart
+    series.add_controls_state(0.1, -30.)
+    self.assertAlmostEqual(series.lag_between(0, 0.1), -10.)
+
+  def test_lag_catch_up(self):
+    # a 200 ms frame, then controlsd catching up with frames 1 ms apart, each
+    # taking 10 ms off cumLagMs, isn't controlsd restarting over and over
+    series = ProcLogSeries()
+    t, lag = 0., 0.
+    for _ in range(100):
+      t += 0.01
+      series.add_controls_state(t, lag)
+    t += 0.2
+    lag += 190.
+    series.add_controls_state(t, lag)
+    while lag > 0.:
+      t += 0.001
+      lag = max(lag - 9., 0.)
+      series.add_controls_state(t, lag)
+    for _ in range(100):
+      t += 0.01
+      series.add_controls_state(t, lag)
+    self.assertAlmostEqual(series.lag_between(0, t), 0.)
+    self.assertAlmostEqual(max(series.lag), 190.)
+
+    # and in qlogs, with every 100th frame
+    series = ProcLogSeries()
+    for i, lag in enumerate([0., 300., 0., 0., 500., 20.]):
+      series.add_controls_state(i * 1., lag)
+    self.assertAlmostEqual(series.lag_between(0, 5.), 20.)
+
+  def test_report_from_logs(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      fn = os.path.join(tmpdir, "rlog")
+      with open(fn, "wb") as f:
+        f.write(b"".join(m.to_bytes() for m in make_drive()))
+      report = profile_logs([fn], include_series=True)
+    finally:
+      shutil.rmtree(tmpdir)
+
+    report = json.loads(json.dumps(report))
+    self.assertEqual(report, json.loads(json.dumps(build_report(drive_series(), include_series=True))))
+    # nothing to take the CPU use of the first procLog from
+    self.assertEqual(len(report['processes']['modeld']['series']['cpu']), SAMPLES - 1)
+    self.assertEqual(len(report['processes']['modeld']['series']['rss_mb']), SAMPLES)
+
+  def test_compare(self):
+    base = build_report(drive_series())
+    report = json.loads(json.dumps(base))
+    self.assertEqual(compare_reports(base, report), [])
+
+    report['processes']['modeld']['cpu']['mean'] += 5.
+    report['processes']['ui']['rss_mb']['max'] += 50.
+    report['processes']['camerad'] = report['processes']['ui']
+    regressions = compare_reports(base, report)
+    self.assertEqual(sorted((r['process'], r.get('value')) for r in regressions),
+                     [('camerad', None), ('modeld', 'cpu_mean'), ('ui', 'rss_mb_max')])
+
+
+if __name__ == "__main__":
+  unittest.main()
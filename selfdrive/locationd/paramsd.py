@@ -6,6 +6,7 @@ import numpy as np
 
 import cereal.messaging as messaging
 from cereal import car, log
+from cereal.services import service_list
 from common.params import Params, put_nonblocking
 from selfdrive.locationd.models.car_kf import CarKalman, ObservationKind, States
 from selfdrive.locationd.models.constants import GENERATED_DIR
@@ -15,6 +16,37 @@ KalmanStatus = log.LiveLocationKalman.Status
 
 CARSTATE_DECIMATION = 5
 
+# liveParameters go out at the rate in the service list, and as soon as a
+# learned value moved by more than its threshold since the last one sent
+PUBLISH_RATE = service_list['liveParameters'].frequency  # Hz
+PUBLISH_THRESHOLDS = {
+  'steerRatio': 0.01,
+  'stiffnessFactor': 0.001,
+  'angleOffsetAverage': 0.01,  # deg
+  'angleOffset': 0.05,  # deg
+}
+PERSIST_INTERVAL = 60.  # s
+
+NO_EXTRA_ARGS = [[]]
+
+
+class ObservationBuffer:
+  """Single observations as (1, 1, 1) views into preallocated blocks. Views
+  aren't handed out twice, the filter keeps them around for rewinding."""
+  def __init__(self, block_size=1024):
+    self.block_size = block_size
+    self.block = np.empty((block_size, 1, 1))
+    self.i = 0
+
+  def get(self, value):
+    if self.i == self.block_size:
+      self.block = np.empty((self.block_size, 1, 1))
+      self.i = 0
+    z = self.block[self.i:self.i + 1]
+    z[0, 0, 0] = value
+    self.i += 1
+    return z
+
 
 class ParamsLearner:
   def __init__(self, CP, steer_ratio, stiffness_factor, angle_offset):
@@ -27,6 +59,13 @@ class ParamsLearner:
     self.kf.filter.set_stiffness_front(CP.tireStiffnessFront)  # pylint: disable=no-member
     self.kf.filter.set_stiffness_rear(CP.tireStiffnessRear)  # pylint: disable=no-member
 
+    # noise of the kinds that don't come with their own, and the constant observation
+    self.R = {kind: self.kf.get_R(kind, 1) for kind in (ObservationKind.STEER_ANGLE,
+                                                        ObservationKind.ROAD_FRAME_X_SPEED,
+                                                        ObservationKind.ANGLE_OFFSET_FAST)}
+    self.zero_angle_offset_fast = np.zeros((1, 1, 1))
+    self.obs = ObservationBuffer()
+
     self.active = False
 
     self.speed = 0
@@ -43,12 +82,14 @@ class ParamsLearner:
       yaw_rate_std = msg.angularVelocityCalibrated.std[2]
 
       if self.active:
+        # observations made at the same time go through one filter step
+        batches = []
         if msg.inputsOK and msg.posenetOK and msg.status == KalmanStatus.valid:
-          self.kf.predict_and_observe(t,
-                                      ObservationKind.ROAD_FRAME_YAW_RATE,
-                                      np.array([[[-yaw_rate]]]),
-                                      np.array([np.atleast_2d(yaw_rate_std**2)]))
-        self.kf.predict_and_observe(t, ObservationKind.ANGLE_OFFSET_FAST, np.array([[[0]]]))
+          batches.append((ObservationKind.ROAD_FRAME_YAW_RATE, self.obs.get(-yaw_rate),
+                          self.obs.get(yaw_rate_std**2), NO_EXTRA_ARGS))
+        batches.append((ObservationKind.ANGLE_OFFSET_FAST, self.zero_angle_offset_fast,
+                        self.R[ObservationKind.ANGLE_OFFSET_FAST], NO_EXTRA_ARGS))
+        self.kf.filter.predict_and_update_batches(t, batches)
 
     elif which == 'carState':
       self.carstate_counter += 1
@@ -61,8 +102,12 @@ class ParamsLearner:
         self.active = self.speed > 5 and in_linear_region
 
         if self.active:
-          self.kf.predict_and_observe(t, ObservationKind.STEER_ANGLE, np.array([[[math.radians(msg.steeringAngle)]]]))
-          self.kf.predict_and_observe(t, ObservationKind.ROAD_FRAME_X_SPEED, np.array([[[self.speed]]]))
+          self.kf.filter.predict_and_update_batches(t, [
+            (ObservationKind.STEER_ANGLE, self.obs.get(math.radians(msg.steeringAngle)),
+             self.R[ObservationKind.STEER_ANGLE], NO_EXTRA_ARGS),
+            (ObservationKind.ROAD_FRAME_X_SPEED, self.obs.get(self.speed),
+             self.R[ObservationKind.ROAD_FRAME_X_SPEED], NO_EXTRA_ARGS),
+          ])
 
     if not self.active:
       # Reset time when stopped so uncertainty doesn't grow
@@ -70,6 +115,68 @@ class ParamsLearner:
       self.kf.filter.reset_rewind()
 
 
+class ParamsPublisher:
+  """Decides when the learned values go out as liveParameters and when
+  they're saved to the LiveParameters param"""
+  def __init__(self, CP, publish_rate=PUBLISH_RATE, thresholds=PUBLISH_THRESHOLDS):
+    self.CP = CP
+    self.min_sr, self.max_sr = 0.3 * CP.steerRatio, 2.0 * CP.steerRatio
+    self.publish_interval = 1. / publish_rate
+    self.thresholds = thresholds
+
+    self.last_sent = None
+    self.next_publish_t = None
+    self.next_save_t = None
+
+  def get_values(self, x):
+    values = {
+      'steerRatio': x[States.STEER_RATIO].item(),
+      'stiffnessFactor': x[States.STIFFNESS].item(),
+      'angleOffsetAverage': math.degrees(x[States.ANGLE_OFFSET].item()),
+    }
+    values['angleOffset'] = values['angleOffsetAverage'] + math.degrees(x[States.ANGLE_OFFSET_FAST].item())
+    values['valid'] = all((
+      abs(values['angleOffsetAverage']) < 10.0,
+      abs(values['angleOffset']) < 10.0,
+      0.5 <= values['stiffnessFactor'] <= 2.0,
+      self.min_sr <= values['steerRatio'] <= self.max_sr,
+    ))
+    return values
+
+  def update(self, t, x):
+    """Values to send at time t, None when the last ones sent are recent and close enough"""
+    values = self.get_values(x)
+    due = self.next_publish_t is None or t >= self.next_publish_t
+    if not due and values['valid'] == self.last_sent['valid'] and \
+       all(abs(values[k] - self.last_sent[k]) <= threshold for k, threshold in self.thresholds.items()):
+      return None
+
+    if due:
+      # kept at the rate, even when a message comes late
+      self.next_publish_t = t if self.next_publish_t is None else self.next_publish_t
+      self.next_publish_t += self.publish_interval
+      if self.next_publish_t <= t:
+        self.next_publish_t = t + self.publish_interval
+    self.last_sent = values
+    return values
+
+  def to_save(self, t, x):
+    """LiveParameters to save at time t, once every PERSIST_INTERVAL"""
+    if self.next_save_t is None:
+      self.next_save_t = t + PERSIST_INTERVAL
+    if t < self.next_save_t:
+      return None
+
+    self.next_save_t = t + PERSIST_INTERVAL
+    values = self.get_values(x)
+    return {
+      'carFingerprint': self.CP.carFingerprint,
+      'steerRatio': values['steerRatio'],
+      'stiffnessFactor': values['stiffnessFactor'],
+      'angleOffsetAverage': values['angleOffsetAverage'],
+    }
+
+
 def main(sm=None, pm=None):
   if sm is None:
     sm = messaging.SubMaster(['liveLocationKalman', 'carState'])
@@ -102,9 +209,8 @@ def main(sm=None, pm=None):
 
 
   learner = ParamsLearner(CP, params['steerRatio'], params['stiffnessFactor'], math.radians(params['angleOffsetAverage']))
-  min_sr, max_sr = 0.3 * CP.steerRatio, 2.0 * CP.steerRatio
+  publisher = ParamsPublisher(CP)
 
-  i = 0
   while True:
     sm.update()
 
@@ -118,36 +224,27 @@ def main(sm=None, pm=None):
     # TODO: make sure controlsd knows when there is no gyro
 
     if sm.updated['carState']:
-      msg = messaging.new_message('liveParameters')
-      msg.logMonoTime = sm.logMonoTime['carState']
+      t = sm.logMonoTime['carState'] * 1e-9
+      x = learner.kf.x
 
-      msg.liveParameters.valid = True  # TODO: Check if learned values are sane
-      msg.liveParameters.posenetValid = True
-      msg.liveParameters.sensorValid = True
+      values = publisher.update(t, x)
+      if values is not None:
+        msg = messaging.new_message('liveParameters')
+        msg.logMonoTime = sm.logMonoTime['carState']
 
-      x = learner.kf.x
-      msg.liveParameters.steerRatio = float(x[States.STEER_RATIO])
-      msg.liveParameters.stiffnessFactor = float(x[States.STIFFNESS])
-      msg.liveParameters.angleOffsetAverage = math.degrees(x[States.ANGLE_OFFSET])
-      msg.liveParameters.angleOffset = msg.liveParameters.angleOffsetAverage + math.degrees(x[States.ANGLE_OFFSET_FAST])
-      msg.liveParameters.valid = all((
-        abs(msg.liveParameters.angleOffsetAverage) < 10.0,
-        abs(msg.liveParameters.angleOffset) < 10.0,
-        0.5 <= msg.liveParameters.stiffnessFactor <= 2.0,
-        min_sr <= msg.liveParameters.steerRatio <= max_sr,
-      ))
-
-      i += 1
-      if i % 6000 == 0:   # once a minute
-        params = {
-          'carFingerprint': CP.carFingerprint,
-          'steerRatio': msg.liveParameters.steerRatio,
-          'stiffnessFactor': msg.liveParameters.stiffnessFactor,
-          'angleOffsetAverage': msg.liveParameters.angleOffsetAverage,
-        }
-        put_nonblocking("LiveParameters", json.dumps(params))
+        msg.liveParameters.posenetValid = True
+        msg.liveParameters.sensorValid = True
+        msg.liveParameters.steerRatio = values['steerRatio']
+        msg.liveParameters.stiffnessFactor = values['stiffnessFactor']
+        msg.liveParameters.angleOffsetAverage = values['angleOffsetAverage']
+        msg.liveParameters.angleOffset = values['angleOffset']
+        msg.liveParameters.valid = values['valid']
 
-      pm.send('liveParameters', msg)
+        pm.send('liveParameters', msg)
+
+      params = publisher.to_save(t, x)
+      if params is not None:
+        put_nonblocking("LiveParameters", json.dumps(params))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# CPU time of paramsd replaying carState and liveLocationKalman, with a filter
+# step per observation and liveParameters on every carState as before, and
+# with the batched observations and decimated liveParameters.
+#
+# usage: paramsd_benchmark.py [rlog ...], a simulated ten minute drive without logs
+import math
+import sys
+import time
+
+import cereal.messaging as messaging
+from selfdrive.locationd.models.car_kf import States
+from selfdrive.locationd.paramsd import ParamsLearner, ParamsPublisher
+from selfdrive.locationd.test.test_paramsd import get_CP, handle_log_per_observation, simulated_drive
+from tools.lib.logreader import MultiLogIterator
+
+
+def fill_msg(msg, values):
+  msg.liveParameters.posenetValid = True
+  msg.liveParameters.sensorValid = True
+  for name, value in values.items():
+    setattr(msg.liveParameters, name, value)
+
+
+def replay_per_observation(CP, msgs):
+  learner = ParamsLearner(CP, CP.steerRatio, 1.0, 0.0)
+  publisher = ParamsPublisher(CP)
+  sent = 0
+  for evt in msgs:
+    which = evt.which()
+    handle_log_per_observation(learner, evt.logMonoTime * 1e-9, which, getattr(evt, which))
+    if which == 'carState':
+      msg = messaging.new_message('liveParameters')
+      msg.logMonoTime = evt.logMonoTime
+      fill_msg(msg, publisher.get_values(learner.kf.x))
+      msg.to_bytes()
+      sent += 1
+  return learner, sent
+
+
+def replay_batched(CP, msgs):
+  learner = ParamsLearner(CP, CP.steerRatio, 1.0, 0.0)
+  publisher = ParamsPublisher(CP)
+  sent = 0
+  for evt in msgs:
+    which = evt.which()
+    t = evt.logMonoTime * 1e-9
+    learner.handle_log(t, which, getattr(evt, which))
+    if which == 'carState':
+      values = publisher.update(t, learner.kf.x)
+      if values is not None:
+        msg = messaging.new_message('liveParameters')
+        msg.logMonoTime = evt.logMonoTime
+        fill_msg(msg, values)
+        msg.to_bytes()
+        sent += 1
+  return learner, sent
+
+
+def timed(f, *args):
+  t = time.process_time()
+  ret = f(*args)
+  return time.process_time() - t, ret
+
+
+if __name__ == "__main__":
+  if len(sys.argv) > 1:
+    lr = MultiLogIterator(sys.argv[1:], services=['carParams', 'carState', 'liveLocationKalman'], sort_by_time=True)
+    msgs = list(lr)
+    CPs = [m.carParams for m in msgs if m.which() == 'carParams']
+    CP = CPs[0] if CPs else get_CP()
+    msgs = [m for m in msgs if m.which() != 'carParams']
+  else:
+    CP = get_CP()
+    msgs = simulated_drive(CP, 600)
+
+  duration = (msgs[-1].logMonoTime - msgs[0].logMonoTime) * 1e-9
+  t_before, (before, sent_before) = timed(replay_per_observation, CP, msgs)
+  t_after, (after, sent_after) = timed(replay_batched, CP, msgs)
+
+  print("%d messages, %.0f s of driving" % (len(msgs), duration))
+  print("per observation  %6.2f s CPU, %4.1f%% of a core, %d liveParameters" % (t_before, 100 * t_before / duration, sent_before))
+  print("batched          %6.2f s CPU, %4.1f%% of a core, %d liveParameters, %.1fx" %
+        (t_after, 100 * t_after / duration, sent_after, t_before / t_after))
+  print("steer ratio %.4f, %.4f  angle offset %.4f, %.4f deg" % (
+        after.kf.x[States.STEER_RATIO].item(), before.kf.x[States.STEER_RATIO].item(),
+        math.degrees(after.kf.x[States.ANGLE_OFFSET].item()), math.degrees(before.kf.x[States.ANGLE_OFFSET].item())))
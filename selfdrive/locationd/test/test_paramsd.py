@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import math
+import unittest
+
+import numpy as np
+
+from cereal import car, log
+from selfdrive.car import CivicParams
+from selfdrive.car.honda.values import CAR
+from selfdrive.controls.lib.vehicle_model import VehicleModel
+from selfdrive.locationd.models.car_kf import ObservationKind, States
+from selfdrive.locationd.paramsd import CARSTATE_DECIMATION, PERSIST_INTERVAL, ParamsLearner, ParamsPublisher
+
+KalmanStatus = log.LiveLocationKalman.Status
+
+
+def get_CP():
+  return car.CarParams.new_message(
+    carFingerprint=CAR.CIVIC,
+    mass=CivicParams.MASS,
+    wheelbase=CivicParams.WHEELBASE,
+    centerToFront=CivicParams.CENTER_TO_FRONT,
+    rotationalInertia=CivicParams.ROTATIONAL_INERTIA,
+    tireStiffnessFront=CivicParams.TIRE_STIFFNESS_FRONT,
+    tireStiffnessRear=CivicParams.TIRE_STIFFNESS_REAR,
+    steerRatio=15.38,
+  )
+
+
+def initial_state(CP):
+  x = np.zeros(8)
+  x[States.STEER_RATIO] = CP.steerRatio
+  x[States.STIFFNESS] = 1.0
+  return x
+
+
+def simulated_drive(CP, duration, sr=14.5, x=1.0, ao=-1.0, seed=0, t0=10.):
+  """carState at 100 Hz and liveLocationKalman at 20 Hz of a car with other
+  params than CP, the yaw rates a little late, out of order with carState"""
+  rnd = np.random.RandomState(seed)
+  VM = VehicleModel(CP)
+  VM.update_params(x, sr)
+
+  msgs = []
+  for i in range(int(duration * 100)):
+    t = t0 + i * 0.01
+    speed = 25. + 10. * math.sin(2 * math.pi * i / 10000.)
+    if 300 <= i % 6000 < 600:
+      speed = 3.  # slow enough to stop learning
+    steering_angle = 10. * math.sin(2 * math.pi * i / 2000.) + ao
+    pressed = i % 1000 < 100
+    msgs.append(log.Event.new_message(logMonoTime=int(t * 1e9), carState={
+      'vEgo': speed, 'steeringAngle': steering_angle, 'steeringPressed': pressed}).as_reader())
+
+    if i % 5 == 2:
+      yaw_rate = VM.yaw_rate(math.radians(steering_angle - ao), speed)
+      msgs.append(log.Event.new_message(logMonoTime=int((t - 0.035) * 1e9), liveLocationKalman={
+        'angularVelocityCalibrated': {'value': [0., 0., -yaw_rate + rnd.normal(0., 0.002)], 'std': [0.01, 0.01, 0.002]},
+        'inputsOK': i % 1000 != 502,
+        'posenetOK': True,
+        'status': KalmanStatus.valid,
+      }).as_reader())
+  return msgs
+
+
+def handle_log_per_observation(learner, t, which, msg):
+  """What handle_log did before observations were batched, a filter step per observation"""
+  if which == 'liveLocationKalman':
+    yaw_rate = msg.angularVelocityCalibrated.value[2]
+    yaw_rate_std = msg.angularVelocityCalibrated.std[2]
+
+    if learner.active:
+      if msg.inputsOK and msg.posenetOK and msg.status == KalmanStatus.valid:
+        learner.kf.predict_and_observe(t,
+                                       ObservationKind.ROAD_FRAME_YAW_RATE,
+                                       np.array([[[-yaw_rate]]]),
+                                       np.array([np.atleast_2d(yaw_rate_std**2)]))
+      learner.kf.predict_and_observe(t, ObservationKind.ANGLE_OFFSET_FAST, np.array([[[0]]]))
+
+  elif which == 'carState':
+    learner.carstate_counter += 1
+    if learner.carstate_counter % CARSTATE_DECIMATION == 0:
+      learner.steering_angle = msg.steeringAngle
+      learner.steering_pressed = msg.steeringPressed
+      learner.speed = msg.vEgo
+
+      in_linear_region = abs(learner.steering_angle) < 45 or not learner.steering_pressed
+      learner.active = learner.speed > 5 and in_linear_region
+
+      if learner.active:
+        learner.kf.predict_and_observe(t, ObservationKind.STEER_ANGLE, np.array([[[math.radians(msg.steeringAngle)]]]))
+        learner.kf.predict_and_observe(t, ObservationKind.ROAD_FRAME_X_SPEED, np.array([[[learner.speed]]]))
+
+  if not learner.active:
+    learner.kf.filter.filter_time = t
+    learner.kf.filter.reset_rewind()
+
+
+class TestParamsd(unittest.TestCase):
+  def setUp(self):
+    self.CP = get_CP()
+
+  def test_batched_same_as_per_observation(self):
+    batched = ParamsLearner(self.CP, self.CP.steerRatio, 1.0, 0.0)
+    per_observation = ParamsLearner(self.CP, self.CP.steerRatio, 1.0, 0.0)
+
+    for msg in simulated_drive(self.CP, 300):
+      t = msg.logMonoTime * 1e-9
+      batched.handle_log(t, msg.which(), getattr(msg, msg.which()))
+      handle_log_per_observation(per_observation, t, msg.which(), getattr(msg, msg.which()))
+
+    # exactly, the predict steps dropped between same time observations were by 0 s
+    np.testing.assert_array_equal(batched.kf.x, per_observation.kf.x)
+    np.testing.assert_array_equal(batched.kf.P, per_observation.kf.P)
+    self.assertLess(batched.kf.x[States.STEER_RATIO].item(), self.CP.steerRatio - 0.1)
+
+  def test_publish_rate(self):
+    publisher = ParamsPublisher(self.CP, publish_rate=10.)
+    x = initial_state(self.CP)
+
+    sent = [t for t in np.arange(0., 10., 0.01) if publisher.update(t, x) is not None]
+    self.assertEqual(len(sent), 100)
+    np.testing.assert_allclose(np.diff(sent), 0.1, atol=0.011)
+
+  def test_publish_on_change(self):
+    publisher = ParamsPublisher(self.CP, publish_rate=1.)
+    x = initial_state(self.CP)
+    self.assertIsNotNone(publisher.update(0., x))
+
+    # small changes wait for the next one at the rate
+    x[States.STEER_RATIO] += 0.005
+    x[States.ANGLE_OFFSET_FAST] += math.radians(0.01)
+    self.assertIsNone(publisher.update(0.01, x))
+
+    x[States.STEER_RATIO] += 0.01
+    values = publisher.update(0.02, x)
+    self.assertAlmostEqual(values['steerRatio'], self.CP.steerRatio + 0.015)
+    self.assertAlmostEqual(values['angleOffset'], 0.01)
+    self.assertTrue(values['valid'])
+
+    x[States.ANGLE_OFFSET_FAST] += math.radians(0.1)
+    self.assertIsNotNone(publisher.update(0.03, x))
+    self.assertIsNone(publisher.update(0.04, x))
+
+    # and when they stop being valid
+    x[States.STIFFNESS] = 2.0
+    self.assertTrue(publisher.update(0.05, x)['valid'])
+    x[States.STIFFNESS] = 2.0005
+    self.assertFalse(publisher.update(0.06, x)['valid'])
+
+  def test_save_interval(self):
+    publisher = ParamsPublisher(self.CP)
+    x = initial_state(self.CP)
+
+    saved = [(t, params) for t, params in ((t, publisher.to_save(t, x)) for t in np.arange(10., 200., 0.01))
+             if params is not None]
+    self.assertEqual(len(saved), 3)
+    self.assertAlmostEqual(saved[0][0], 10. + PERSIST_INTERVAL, delta=0.011)
+    self.assertEqual(saved[0][1], {'carFingerprint': CAR.CIVIC, 'steerRatio': self.CP.steerRatio,
+                                   'stiffnessFactor': 1.0, 'angleOffsetAverage': 0.0})
+
+
+if __name__ == "__main__":
+  unittest.main()
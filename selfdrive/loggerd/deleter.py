@@ -1,36 +1,234 @@
 #!/usr/bin/env python3
 import os
+import json
+import time
 import shutil
 import threading
 from selfdrive.swaglog import cloudlog
-from selfdrive.loggerd.config import ROOT, get_available_bytes, get_available_percent
-from selfdrive.loggerd.uploader import listdir_by_creation
+from selfdrive.loggerd.config import ROOT
+from selfdrive.loggerd.uploader import listdir_by_creation, get_directory_sort, UPLOAD_ATTR_NAME
+from common.xattr import getxattr
 
 MIN_BYTES = 5 * 1024 * 1024 * 1024
 MIN_PERCENT = 10
 
+# once under the minimum, free up to a bit more so a new segment doesn't start the deleter again right away
+TARGET_BYTES = 6 * 1024 * 1024 * 1024
+TARGET_PERCENT = 12
 
-def deleter_thread(exit_event):
-  while not exit_event.is_set():
-    out_of_bytes = get_available_bytes(default=MIN_BYTES + 1) < MIN_BYTES
-    out_of_percent = get_available_percent(default=MIN_PERCENT + 1) < MIN_PERCENT
+# longest an eviction pass runs before free space is checked again
+MAX_EVICT_TIME = 1.
+
+# segments with this attribute set on their directory are never deleted
+PRESERVE_ATTR_NAME = 'user.preserve'
+PRESERVE_ATTR_VALUE = b'1'
+
+# order in which files are deleted, within uploaded and then not uploaded files.
+# large video goes before the logs, qlogs are kept the longest
+EVICTION_PRIORITY = {
+  "fcamera.hevc": 0,
+  "ecamera.hevc": 0,
+  "dcamera.hevc": 0,
+  "rlog.bz2": 1,
+  "qcamera.ts": 2,
+  "qlog.bz2": 3,
+}
+DEFAULT_EVICTION_PRIORITY = 0
+
+
+def get_index_path(root):
+  # next to the data directory, not in it, so it doesn't look like a segment to the uploader
+  return os.path.join(os.path.dirname(os.path.normpath(root)), ".deleter_index.json")
+
+
+def _has_xattr(path, name, value):
+  try:
+    return getxattr(path, name) == value
+  except OSError:
+    return False
+
+
+def _get_size(path):
+  """Size of a file, or of all the files below a directory"""
+  if os.path.isdir(path) and not os.path.islink(path):
+    return sum(os.path.getsize(os.path.join(dp, f)) for dp, _, fns in os.walk(path) for f in fns)
+  return os.path.getsize(path)
+
+
+def bytes_to_free(min_bytes, min_percent, root=None):
+  """Bytes to delete to have both min_bytes and min_percent available, 0 if there are"""
+  try:
+    statvfs = os.statvfs(root or ROOT)
+  except OSError:
+    return 0
+  available = statvfs.f_bavail * statvfs.f_frsize
+  total = statvfs.f_blocks * statvfs.f_frsize
+  return int(max(0, min_bytes - available, min_percent / 100. * total - available))
+
+
+class SegmentIndex():
+  """Size and upload state of every file in the data directory, persisted so a
+  restart doesn't need to look at every file again.
 
-    if out_of_percent or out_of_bytes:
-      # remove the earliest directory we can
-      dirs = listdir_by_creation(ROOT)
-      for delete_dir in dirs:
-        delete_path = os.path.join(ROOT, delete_dir)
+  A segment directory is re-listed when its mtime changes, the upload flag of
+  files not uploaded yet and the preserve flag are read on every update, as
+  setting an xattr doesn't change the mtime.
+  """
+  def __init__(self, root, path=None):
+    self.root = root
+    self.path = path
+    # segment -> {"mtime": mtime_ns, "locked": bool, "preserve": bool, "files": {name: [size, uploaded]}}
+    self.segments = {}
+    self.dirty = False
+    self.load()
 
-        if any(name.endswith(".lock") for name in os.listdir(delete_path)):
+  def load(self):
+    if self.path is None:
+      return
+    try:
+      with open(self.path) as f:
+        self.segments = json.load(f)
+    except (OSError, ValueError):
+      self.segments = {}
+
+  def save(self):
+    if self.path is None or not self.dirty:
+      return
+    try:
+      tmp_path = self.path + ".tmp"
+      with open(tmp_path, "w") as f:
+        json.dump(self.segments, f)
+      os.replace(tmp_path, self.path)
+      self.dirty = False
+    except OSError:
+      cloudlog.exception("deleter: saving index failed")
+
+  def _scan(self, segment, path, mtime_ns):
+    with os.scandir(path) as it:
+      entries = list(it)
+    files = {}
+    cached = self.segments.get(segment, {}).get("files", {})
+    locked = False
+    for entry in entries:
+      name = entry.name
+      if name.endswith(".lock"):
+        locked = True
+        continue
+      fn = entry.path
+      try:
+        # directories in a segment are deleted as a whole, anything else that isn't a file is left alone
+        if not entry.is_file() and not entry.is_dir(follow_symlinks=False):
           continue
+        size = _get_size(fn)
+      except OSError:
+        continue
+      uploaded = name in cached and cached[name][1] and cached[name][0] == size
+      files[name] = [size, uploaded or _has_xattr(fn, UPLOAD_ATTR_NAME, b'1')]
+
+    # a change in the same mtime tick as this listing wouldn't be noticed, look again next time
+    recent = time.time() - mtime_ns / 1e9 < 1.
+    return {
+      "mtime": None if recent else mtime_ns,
+      "locked": locked,
+      "preserve": False,
+      "files": files,
+    }
+
+  def update(self):
+    segments = listdir_by_creation(self.root)
+    for segment in set(self.segments) - set(segments):
+      del self.segments[segment]
+      self.dirty = True
+
+    for segment in segments:
+      path = os.path.join(self.root, segment)
+      try:
+        st = os.stat(path)
+        seg = self.segments.get(segment)
+        if seg is None or seg["mtime"] != st.st_mtime_ns:
+          seg = self._scan(segment, path, st.st_mtime_ns)
+          self.dirty = True
+        else:
+          for name, f in seg["files"].items():
+            if not f[1] and _has_xattr(os.path.join(path, name), UPLOAD_ATTR_NAME, b'1'):
+              f[1] = True
+              self.dirty = True
+      except NotADirectoryError:
+        continue
+      except OSError:
+        cloudlog.exception("deleter: indexing %s failed" % path)
+        self.segments.pop(segment, None)
+        continue
+
+      seg["preserve"] = _has_xattr(path, PRESERVE_ATTR_NAME, PRESERVE_ATTR_VALUE)
+      self.segments[segment] = seg
+
+  def candidates(self):
+    """Files that may be deleted as (segment, name, size), in the order they should be"""
+    ret = []
+    for age, segment in enumerate(sorted(self.segments, key=get_directory_sort)):
+      seg = self.segments[segment]
+      if seg["locked"] or seg["preserve"]:
+        continue
+      for name, (size, uploaded) in seg["files"].items():
+        key = (not uploaded, EVICTION_PRIORITY.get(name, DEFAULT_EVICTION_PRIORITY), age, name)
+        ret.append((key, segment, name, size))
+    ret.sort()
+    return [c[1:] for c in ret]
 
-        try:
-          cloudlog.info("deleting %s" % delete_path)
-          shutil.rmtree(delete_path)
-          break
-        except OSError:
-          cloudlog.exception("issue deleting %s" % delete_path)
-      exit_event.wait(.1)
+  def remove(self, segment, name):
+    """Deletes a file or directory, and the segment directory with it when it was the last one"""
+    seg = self.segments[segment]
+    path = os.path.join(self.root, segment)
+    fn = os.path.join(path, name)
+    try:
+      if os.path.isdir(fn) and not os.path.islink(fn):
+        shutil.rmtree(fn)
+      else:
+        os.remove(fn)
+    except FileNotFoundError:
+      pass
+    del seg["files"][name]
+    seg["mtime"] = None
+    self.dirty = True
+
+    if not seg["files"]:
+      shutil.rmtree(path)
+      del self.segments[segment]
+
+
+def evict(index, needed_bytes, max_time=MAX_EVICT_TIME):
+  """Deletes files in eviction order until needed_bytes are freed or max_time
+  has passed, returns (files deleted, bytes freed)"""
+  deadline = time.monotonic() + max_time
+  deleted, freed = 0, 0
+  for segment, name, size in index.candidates():
+    if freed >= needed_bytes or time.monotonic() > deadline:
+      break
+    try:
+      cloudlog.info("deleting %s" % os.path.join(index.root, segment, name))
+      index.remove(segment, name)
+      deleted += 1
+      freed += size
+    except OSError:
+      cloudlog.exception("issue deleting %s" % os.path.join(index.root, segment, name))
+  return deleted, freed
+
+
+def deleter_thread(exit_event):
+  index = SegmentIndex(ROOT, get_index_path(ROOT))
+  clearing = False
+  while not exit_event.is_set():
+    if clearing or bytes_to_free(MIN_BYTES, MIN_PERCENT) > 0:
+      needed = bytes_to_free(TARGET_BYTES, TARGET_PERCENT)
+      clearing = needed > 0
+      deleted = 0
+      if clearing:
+        index.update()
+        deleted, _ = evict(index, needed)
+        index.save()
+      # when nothing could be deleted, don't keep rescanning
+      exit_event.wait(.1 if deleted or not clearing else 5)
     else:
       exit_event.wait(30)
 
@@ -1,30 +1,52 @@
 import os
 import time
+import shutil
+import tempfile
 import threading
 import unittest
 from collections import namedtuple
 
 import selfdrive.loggerd.deleter as deleter
+import selfdrive.loggerd.uploader as uploader
 from common.timeout import Timeout, TimeoutException
+from common.xattr import setxattr
 
 from selfdrive.loggerd.tests.loggerd_tests_common import UploaderTestCase
 
 Stats = namedtuple("Stats", ['f_bavail', 'f_blocks', 'f_frsize'])
 
 
-class TestDeleter(UploaderTestCase):
+class DeleterTestCase(UploaderTestCase):
   def fake_statvfs(self, d):
-    return self.fake_stats
+    if self.disk_size is None:
+      return self.fake_stats
+    # free space of a disk holding only the files under root
+    used = sum(os.path.getsize(os.path.join(dp, f)) for dp, _, fns in os.walk(self.root) for f in fns)
+    return Stats(f_bavail=(self.disk_size - used) // 4096, f_blocks=self.disk_size // 4096, f_frsize=4096)
+
+  def set_disk(self, size, min_free, target_free):
+    self.disk_size = size
+    deleter.MIN_BYTES, deleter.MIN_PERCENT = min_free, 0
+    deleter.TARGET_BYTES, deleter.TARGET_PERCENT = target_free, 0
 
   def setUp(self):
-    self.f_type = "fcamera.hevc"
-    super(TestDeleter, self).setUp()
+    super(DeleterTestCase, self).setUp()
     self.fake_stats = Stats(f_bavail=0, f_blocks=10, f_frsize=4096)
+    self.disk_size = None
+    self.limits = (deleter.MIN_BYTES, deleter.MIN_PERCENT, deleter.TARGET_BYTES, deleter.TARGET_PERCENT)
     deleter.os.statvfs = self.fake_statvfs
     deleter.ROOT = self.root
 
+    self.index_dir = tempfile.mkdtemp()
+    self.index_path = os.path.join(self.index_dir, "index.json")
+    self.get_index_path = deleter.get_index_path
+    deleter.get_index_path = lambda root: self.index_path
+
   def tearDown(self):
-    super(TestDeleter, self).tearDown()
+    deleter.MIN_BYTES, deleter.MIN_PERCENT, deleter.TARGET_BYTES, deleter.TARGET_PERCENT = self.limits
+    deleter.get_index_path = self.get_index_path
+    shutil.rmtree(self.index_dir)
+    super(DeleterTestCase, self).tearDown()
 
   def start_thread(self):
     self.end_event = threading.Event()
@@ -36,6 +58,12 @@ class TestDeleter(UploaderTestCase):
     self.end_event.set()
     self.del_thread.join()
 
+
+class TestDeleter(DeleterTestCase):
+  def setUp(self):
+    self.f_type = "fcamera.hevc"
+    super(TestDeleter, self).setUp()
+
   def test_delete(self):
     f_path = self.make_file_with_data(self.seg_dir, self.f_type, 1)
 
@@ -55,6 +83,10 @@ class TestDeleter(UploaderTestCase):
     self.seg_dir = self.seg_format.format(self.seg_num)
     f_path_2 = self.make_file_with_data(self.seg_dir, self.f_type)
 
+    # deleting one of the files is enough
+    size = os.path.getsize(f_path_1)
+    self.set_disk(100 * size, 98 * size + 1, 98 * size + size // 2)
+
     self.start_thread()
 
     with Timeout(5, "Timeout waiting for file to be deleted"):
@@ -104,5 +136,147 @@ class TestDeleter(UploaderTestCase):
     self.assertTrue(os.path.exists(f_path), "File deleted when locked")
 
 
+class TestEviction(DeleterTestCase):
+  SIZES_MB = {"fcamera.hevc": .4, "dcamera.hevc": .3, "rlog.bz2": .2, "qcamera.ts": .05, "qlog.bz2": .02}
+
+  def make_segment(self, seg_num, uploaded=(), lock=False):
+    seg_dir = self.seg_format.format(seg_num)
+    for fn, size in self.SIZES_MB.items():
+      f_path = self.make_file_with_data(seg_dir, fn, size, lock=lock and fn == "rlog.bz2")
+      if fn in uploaded:
+        setxattr(f_path, uploader.UPLOAD_ATTR_NAME, uploader.UPLOAD_ATTR_VALUE)
+    return seg_dir
+
+  def make_tree(self, n):
+    return [self.make_segment(i) for i in range(n)]
+
+  def age_tree(self):
+    # changes within the last second are always looked at again
+    t = time.time() - 10
+    for d in os.listdir(self.root):
+      os.utime(os.path.join(self.root, d), (t, t))
+
+  def get_index(self):
+    index = deleter.SegmentIndex(self.root, self.index_path)
+    index.update()
+    return index
+
+  def test_eviction_order(self):
+    segs = self.make_tree(3)
+    for fn in ("fcamera.hevc", "qlog.bz2"):
+      setxattr(os.path.join(self.root, segs[2], fn), uploader.UPLOAD_ATTR_NAME, uploader.UPLOAD_ATTR_VALUE)
+
+    # uploaded files before anything else, then video of all segments before the logs, oldest first
+    expected = [
+      (segs[2], "fcamera.hevc"), (segs[2], "qlog.bz2"),
+      (segs[0], "dcamera.hevc"), (segs[0], "fcamera.hevc"),
+      (segs[1], "dcamera.hevc"), (segs[1], "fcamera.hevc"),
+      (segs[2], "dcamera.hevc"),
+      (segs[0], "rlog.bz2"), (segs[1], "rlog.bz2"), (segs[2], "rlog.bz2"),
+      (segs[0], "qcamera.ts"), (segs[1], "qcamera.ts"), (segs[2], "qcamera.ts"),
+      (segs[0], "qlog.bz2"), (segs[1], "qlog.bz2"),
+    ]
+    self.assertEqual([(seg, fn) for seg, fn, _ in self.get_index().candidates()], expected)
+
+  def test_preserve_and_lock(self):
+    segs = self.make_tree(3)
+    setxattr(os.path.join(self.root, segs[0]), deleter.PRESERVE_ATTR_NAME, deleter.PRESERVE_ATTR_VALUE)
+    locked = self.make_segment(3, lock=True)
+
+    index = self.get_index()
+    self.assertEqual({seg for seg, _, _ in index.candidates()}, {segs[1], segs[2]})
+
+    deleted, _ = deleter.evict(index, float('inf'))
+    self.assertEqual(deleted, 2 * len(self.SIZES_MB))
+    self.assertEqual(sorted(os.listdir(self.root)), sorted([segs[0], locked]))
+    self.assertEqual(len(os.listdir(os.path.join(self.root, segs[0]))), len(self.SIZES_MB))
+
+  def test_evict_to_target(self):
+    segs = self.make_tree(5)
+    index = self.get_index()
+
+    fcamera_size = os.path.getsize(os.path.join(self.root, segs[0], "fcamera.hevc"))
+    deleted, freed = deleter.evict(index, 2.5 * fcamera_size)
+    self.assertGreaterEqual(freed, 2.5 * fcamera_size)
+
+    # stops once enough is freed, qlogs are untouched
+    self.assertLess(deleted, len(segs) * 2)
+    for seg in segs:
+      self.assertTrue(os.path.exists(os.path.join(self.root, seg, "qlog.bz2")))
+
+    # the whole segment goes with its last file
+    deleter.evict(index, float('inf'))
+    self.assertEqual(os.listdir(self.root), [])
+    self.assertEqual(index.segments, {})
+
+  def test_evict_subdirectory(self):
+    seg = self.make_segment(0)
+    sub_file = self.make_file_with_data(os.path.join(seg, "sub"), "x", .1)
+    os.mkfifo(os.path.join(self.root, seg, "fifo"))
+    index = self.get_index()
+
+    # a directory goes as a whole with the size of what's in it, other special files are skipped
+    sizes = {name: size for _, name, size in index.candidates()}
+    self.assertEqual(sizes["sub"], os.path.getsize(sub_file))
+    self.assertNotIn("fifo", sizes)
+
+    deleted, _ = deleter.evict(index, float('inf'))
+    self.assertEqual(deleted, len(self.SIZES_MB) + 1)
+    self.assertEqual(os.listdir(self.root), [])
+
+  def test_evict_bounded_time(self):
+    self.make_tree(3)
+    index = self.get_index()
+    deleted, _ = deleter.evict(index, float('inf'), max_time=0.)
+    self.assertLessEqual(deleted, 1)
+
+  def test_index_persisted(self):
+    segs = self.make_tree(4)
+    self.age_tree()
+    index = self.get_index()
+    index.save()
+
+    index = deleter.SegmentIndex(self.root, self.index_path)
+    self.assertEqual(set(index.segments), set(segs))
+    scanned = []
+    scan = index._scan
+    index._scan = lambda segment, *args: scanned.append(segment) or scan(segment, *args)
+
+    index.update()
+    self.assertEqual(scanned, [])
+
+    # a new file and an upload are both picked up
+    self.make_file_with_data(segs[1], "ecamera.hevc")
+    setxattr(os.path.join(self.root, segs[2], "rlog.bz2"), uploader.UPLOAD_ATTR_NAME, uploader.UPLOAD_ATTR_VALUE)
+    index.update()
+    self.assertEqual(scanned, [segs[1]])
+    self.assertIn("ecamera.hevc", index.segments[segs[1]]["files"])
+    self.assertTrue(index.segments[segs[2]]["files"]["rlog.bz2"][1])
+
+    shutil.rmtree(os.path.join(self.root, segs[3]))
+    index.update()
+    self.assertNotIn(segs[3], index.segments)
+
+  def test_deleter_thread_to_target(self):
+    self.make_tree(10)
+    seg_size = int(sum(self.SIZES_MB.values()) * 1024 * 1024)
+    # two and a half segments over the minimum, clear up to the target
+    self.set_disk(20 * seg_size, 12 * seg_size + seg_size // 2, 14 * seg_size)
+
+    self.start_thread()
+    with Timeout(10, "Timeout waiting for deleter to reach target"):
+      while deleter.bytes_to_free(deleter.TARGET_BYTES, 0) > 0:
+        time.sleep(0.01)
+    time.sleep(0.2)
+    self.join_thread()
+
+    self.assertEqual(deleter.bytes_to_free(deleter.TARGET_BYTES, 0), 0)
+    # didn't delete much more than needed, and the qlogs are all still there
+    self.assertLess(self.fake_statvfs(self.root).f_bavail * 4096, 15 * seg_size)
+    qlogs = [fn for _, _, fns in os.walk(self.root) for fn in fns if fn == "qlog.bz2"]
+    self.assertEqual(len(qlogs), 10)
+    self.assertTrue(os.path.exists(self.index_path))
+
+
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+import os
+import sys
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import traceback
+import multiprocessing
+
+MANEUVER_PROCESSES = ['radard', 'controlsd', 'plannerd', 'dmonitoringd']
+MAX_RETRIES = 3
+
+
+def run_maneuver(k):
+  """Runs maneuver k against its own radard, controlsd, plannerd and dmonitoringd.
+
+  Runs in a pool worker with a params directory and msgq namespace
+  (OPENPILOT_PREFIX) of its own, so maneuvers running side by side don't see
+  each other's params or messages. Returns (k, valid, error)."""
+  params_path = tempfile.mkdtemp(prefix="params_")
+  prefix = "maneuver%d_%d_" % (k, os.getpid())
+  os.environ['PARAMS_PATH'] = params_path
+  os.environ['OPENPILOT_PREFIX'] = prefix
+  os.environ['NO_CAN_TIMEOUT'] = "1"
+  try:
+    # imported here so nothing touches params or sockets before the environment is set
+    import selfdrive.manager as manager
+    from selfdrive.test.longitudinal_maneuvers.test_longitudinal import maneuvers, setup_params, OUTPUT_DIR
+
+    setup_params()
+    for p in MANEUVER_PROCESSES:
+      manager.prepare_managed_process(p)
+
+    man = maneuvers[k]
+    valid = False
+    for _ in range(MAX_RETRIES):
+      for p in MANEUVER_PROCESSES:
+        manager.start_managed_process(p)
+      try:
+        plot, valid = man.evaluate()
+        plot.write_plot(OUTPUT_DIR, "maneuver" + str(k + 1).zfill(2))
+      finally:
+        for p in MANEUVER_PROCESSES:
+          manager.kill_managed_process(p)
+
+      if valid:
+        break
+    return k, valid, None
+  except Exception:
+    return k, False, traceback.format_exc()
+  finally:
+    shutil.rmtree(params_path, ignore_errors=True)
+    for fn in glob.glob(os.path.join("/dev/shm", prefix + "*")):
+      os.remove(fn)
+
+
+def run_maneuvers(indices, jobs=None):
+  """Runs the maneuvers with the given indices over jobs processes, yields
+  (k, valid, error) in completion order"""
+  if not len(indices):
+    return
+  if os.getenv("ZMQ"):
+    # ZMQ ports aren't namespaced by OPENPILOT_PREFIX, maneuvers can't share the machine
+    jobs = 1
+  else:
+    # each maneuver keeps four daemons and the plant busy
+    jobs = jobs or max(1, multiprocessing.cpu_count() // 2)
+  ctx = multiprocessing.get_context("spawn")
+  with ctx.Pool(jobs, maxtasksperchild=1) as pool:
+    yield from pool.imap_unordered(run_maneuver, indices)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Run the longitudinal maneuvers in parallel")
+  parser.add_argument("-j", "--jobs", type=int, default=None, help="number of maneuvers run at once")
+  parser.add_argument("maneuvers", type=int, nargs="*", help="maneuver numbers, all by default")
+  args = parser.parse_args()
+
+  from selfdrive.test.longitudinal_maneuvers.test_longitudinal import maneuvers, setup_output
+  setup_output()
+
+  indices = [m - 1 for m in args.maneuvers] or list(range(len(maneuvers)))
+  t = time.monotonic()
+  failed = []
+  for k, valid, error in run_maneuvers(indices, args.jobs):
+    print("maneuver %d %s: %s" % (k + 1, "passed" if valid else "FAILED", maneuvers[k].title))
+    if error is not None:
+      print(error)
+    if not valid:
+      failed.append(k + 1)
+
+  print("%d maneuvers in %.1f s, failed: %s" % (len(indices), time.monotonic() - t, failed or "none"))
+  sys.exit(1 if failed else 0)
@@ -77,6 +77,44 @@ def car_plant(pos, speed, grade, gas, brake):
   # TODO: lateral model
   return speed, acceleration
 
+# signals the plant publishes, as (signal, message)
+CAR_SIGNALS, _ = get_can_signals(CP)
+
+VLS = namedtuple('vls', [
+  'XMISSION_SPEED',
+  'WHEEL_SPEED_FL', 'WHEEL_SPEED_FR', 'WHEEL_SPEED_RL', 'WHEEL_SPEED_RR',
+  'STEER_ANGLE', 'STEER_ANGLE_RATE', 'STEER_TORQUE_SENSOR', 'STEER_TORQUE_MOTOR',
+  'LEFT_BLINKER', 'RIGHT_BLINKER',
+  'GEAR',
+  'WHEELS_MOVING',
+  'BRAKE_ERROR_1', 'BRAKE_ERROR_2',
+  'SEATBELT_DRIVER_LAMP', 'SEATBELT_DRIVER_LATCHED',
+  'BRAKE_PRESSED', 'BRAKE_SWITCH',
+  'CRUISE_BUTTONS',
+  'ESP_DISABLED',
+  'HUD_LEAD',
+  'USER_BRAKE',
+  'STEER_STATUS',
+  'GEAR_SHIFTER',
+  'PEDAL_GAS',
+  'CRUISE_SETTING',
+  'ACC_STATUS',
+
+  'CRUISE_SPEED_PCM',
+  'CRUISE_SPEED_OFFSET',
+
+  'DOOR_OPEN_FL', 'DOOR_OPEN_FR', 'DOOR_OPEN_RL', 'DOOR_OPEN_RR',
+
+  'CAR_GAS',
+  'MAIN_ON',
+  'EPB_STATE',
+  'BRAKE_HOLD_ACTIVE',
+  'INTERCEPTOR_GAS',
+  'INTERCEPTOR_GAS2',
+  'IMPERIAL_UNIT',
+  'MOTOR_TORQUE',
+])
+
 def get_car_can_parser():
   dbc_f = 'honda_civic_touring_2016_can_generated'
   signals = [
@@ -172,13 +210,6 @@ class Plant():
     return float(self.rk.frame) / self.rate
 
   def step(self, v_lead=0.0, cruise_buttons=None, grade=0.0, publish_model = True):
-    gen_signals, gen_checks = get_can_signals(CP)
-    sgs = [s[0] for s in gen_signals]
-    msgs = [s[1] for s in gen_signals]
-    cks_msgs = set(check[0] for check in gen_checks)
-    cks_msgs.add(0x18F)
-    cks_msgs.add(0x30C)
-
     # ******** get messages sent to the car ********
     can_strings = messaging.drain_sock_raw(Plant.sendcan, wait_for_one=self.response_seen)
 
@@ -240,41 +271,7 @@ class Plant():
       print("%6.2f m  %6.2f m/s  %6.2f m/s2   %.2f ang   gas: %.2f  brake: %.2f  steer: %5.2f     lead_rel: %6.2f m  %6.2f m/s" % (distance, speed, acceleration, self.angle_steer, gas, brake, steer_torque, d_rel, v_rel))
 
     # ******** publish the car ********
-    vls_tuple = namedtuple('vls', [
-           'XMISSION_SPEED',
-           'WHEEL_SPEED_FL', 'WHEEL_SPEED_FR', 'WHEEL_SPEED_RL', 'WHEEL_SPEED_RR',
-           'STEER_ANGLE', 'STEER_ANGLE_RATE', 'STEER_TORQUE_SENSOR', 'STEER_TORQUE_MOTOR',
-           'LEFT_BLINKER', 'RIGHT_BLINKER',
-           'GEAR',
-           'WHEELS_MOVING',
-           'BRAKE_ERROR_1', 'BRAKE_ERROR_2',
-           'SEATBELT_DRIVER_LAMP', 'SEATBELT_DRIVER_LATCHED',
-           'BRAKE_PRESSED', 'BRAKE_SWITCH',
-           'CRUISE_BUTTONS',
-           'ESP_DISABLED',
-           'HUD_LEAD',
-           'USER_BRAKE',
-           'STEER_STATUS',
-           'GEAR_SHIFTER',
-           'PEDAL_GAS',
-           'CRUISE_SETTING',
-           'ACC_STATUS',
-
-           'CRUISE_SPEED_PCM',
-           'CRUISE_SPEED_OFFSET',
-
-           'DOOR_OPEN_FL', 'DOOR_OPEN_FR', 'DOOR_OPEN_RL', 'DOOR_OPEN_RR',
-
-           'CAR_GAS',
-           'MAIN_ON',
-           'EPB_STATE',
-           'BRAKE_HOLD_ACTIVE',
-           'INTERCEPTOR_GAS',
-           'INTERCEPTOR_GAS2',
-           'IMPERIAL_UNIT',
-           'MOTOR_TORQUE',
-           ])
-    vls = vls_tuple(
+    vls = VLS(
            self.speed_sensor(speed),
            self.speed_sensor(speed), self.speed_sensor(speed), self.speed_sensor(speed), self.speed_sensor(speed),
            self.angle_steer, self.angle_steer_rate, 0, 0,  # Steer torque sensor
@@ -310,6 +307,8 @@ class Plant():
            )
 
     # TODO: publish each message at proper frequency
+    sgs = [sg[0] for sg in CAR_SIGNALS]
+    msgs = [sg[1] for sg in CAR_SIGNALS]
     can_msgs = []
     for msg in set(msgs):
       msg_struct = {}
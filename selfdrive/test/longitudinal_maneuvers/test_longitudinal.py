@@ -10,9 +10,10 @@ matplotlib.use('svg')
 from selfdrive.config import Conversions as CV
 from selfdrive.car.honda.values import CruiseButtons as CB
 from selfdrive.test.longitudinal_maneuvers.maneuver import Maneuver
-import selfdrive.manager as manager
 from common.params import Params
 
+OUTPUT_DIR = os.path.join(os.getcwd(), 'out/longitudinal')
+
 
 def create_dir(path):
   try:
@@ -295,7 +296,7 @@ maneuvers = [
 # maneuvers = [maneuvers[6]]
 
 def setup_output():
-  output_dir = os.path.join(os.getcwd(), 'out/longitudinal')
+  output_dir = OUTPUT_DIR
   if not os.path.exists(os.path.join(output_dir, "index.html")):
     # write test output header
 
@@ -320,23 +321,23 @@ def setup_output():
     with open(os.path.join(output_dir, "index.html"), "w") as f:
       f.write(view_html)
 
+def setup_params():
+  params = Params()
+  params.clear_all()
+  params.put("Passive", "1" if os.getenv("PASSIVE") else "0")
+  params.put("OpenpilotEnabledToggle", "1")
+  params.put("CommunityFeaturesToggle", "1")
+
 class LongitudinalControl(unittest.TestCase):
   @classmethod
   def setUpClass(cls):
-    os.environ['NO_CAN_TIMEOUT'] = "1"
+    from selfdrive.test.longitudinal_maneuvers.parallel_maneuvers import run_maneuvers
 
     setup_output()
 
-    params = Params()
-    params.clear_all()
-    params.put("Passive", "1" if os.getenv("PASSIVE") else "0")
-    params.put("OpenpilotEnabledToggle", "1")
-    params.put("CommunityFeaturesToggle", "1")
-
-    manager.prepare_managed_process('radard')
-    manager.prepare_managed_process('controlsd')
-    manager.prepare_managed_process('plannerd')
-    manager.prepare_managed_process('dmonitoringd')
+    # every maneuver runs in a process of its own, several at once
+    jobs = int(os.getenv("JOBS")) if os.getenv("JOBS") else None
+    cls.results = {k: (valid, error) for k, valid, error in run_maneuvers(list(range(len(maneuvers))), jobs)}
 
   @classmethod
   def tearDownClass(cls):
@@ -349,29 +350,11 @@ class LongitudinalControl(unittest.TestCase):
 
 def run_maneuver_worker(k):
   man = maneuvers[k]
-  output_dir = os.path.join(os.getcwd(), 'out/longitudinal')
 
   def run(self):
     print(man.title)
-    valid = False
-
-    for retries in range(3):
-      manager.start_managed_process('radard')
-      manager.start_managed_process('controlsd')
-      manager.start_managed_process('plannerd')
-      manager.start_managed_process('dmonitoringd')
-
-      plot, valid = man.evaluate()
-      plot.write_plot(output_dir, "maneuver" + str(k + 1).zfill(2))
-
-      manager.kill_managed_process('radard')
-      manager.kill_managed_process('controlsd')
-      manager.kill_managed_process('plannerd')
-      manager.kill_managed_process('dmonitoringd')
-
-      if valid:
-        break
-
+    valid, error = self.results[k]
+    self.assertIsNone(error)
     self.assertTrue(valid)
 
   return run
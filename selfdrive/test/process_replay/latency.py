@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+import json
+import time
+import bisect
+import importlib
+import threading
+from collections import defaultdict
+
+# functions timed for each replayed process, as (module, class, method)
+TIMED_STEPS = {
+  "controlsd": [("selfdrive.controls.controlsd", "Controls", "step")],
+  "radard": [("selfdrive.controls.radard", "RadarD", "update")],
+  "plannerd": [("selfdrive.controls.lib.planner", "Planner", "update"),
+               ("selfdrive.controls.lib.pathplanner", "PathPlanner", "update")],
+}
+
+# histogram bin edges in ms, roughly log spaced
+HIST_BINS_MS = [0.05, 0.1, 0.2, 0.5, 1., 2., 5., 10., 20., 50., 100.]
+PERCENTILES = [50, 90, 99]
+
+# default allowed relative increase over the baseline before a step is flagged
+DEFAULT_THRESHOLD = 0.2
+
+_blocked = threading.local()
+
+
+def add_blocked_time(dt):
+  """Called by the fake sockets for time spent waiting on the replay harness,
+  which is subtracted from the step that was running on this thread"""
+  _blocked.t = getattr(_blocked, "t", 0.) + dt
+
+
+def _blocked_time():
+  return getattr(_blocked, "t", 0.)
+
+
+class StepTimer():
+  """Times the main step functions of a replayed process.
+
+  Time the step spends blocked in FakeSocket/FakeSubMaster/FakePubMaster
+  waiting for the harness is not counted, so the samples are compute time.
+  """
+  def __init__(self, proc_name):
+    self.proc_name = proc_name
+    self.samples = defaultdict(list)
+    self.patched = []
+
+  def _wrap(self, name, f):
+    samples = self.samples[name]
+
+    def timed(*args, **kwargs):
+      blocked = _blocked_time()
+      t = time.perf_counter()
+      try:
+        return f(*args, **kwargs)
+      finally:
+        samples.append((time.perf_counter() - t - (_blocked_time() - blocked)) * 1e3)
+    return timed
+
+  def __enter__(self):
+    for module, cls_name, method in TIMED_STEPS.get(self.proc_name, []):
+      cls = getattr(importlib.import_module(module), cls_name)
+      f = getattr(cls, method)
+      self.patched.append((cls, method, f))
+      setattr(cls, method, self._wrap("%s.%s" % (cls_name, method), f))
+    return self
+
+  def __exit__(self, *args):
+    for cls, method, f in self.patched:
+      setattr(cls, method, f)
+    self.patched = []
+
+  def summary(self):
+    return {name: summarize(samples) for name, samples in self.samples.items()}
+
+
+def summarize(samples_ms):
+  s = sorted(samples_ms)
+  ret = {
+    "count": len(s),
+    "mean": sum(s) / len(s) if len(s) else 0.,
+    "max": s[-1] if len(s) else 0.,
+    "bins": HIST_BINS_MS,
+    "hist": [0] * (len(HIST_BINS_MS) + 1),
+  }
+  for p in PERCENTILES:
+    ret["p%d" % p] = s[min(len(s) - 1, int(len(s) * p / 100.))] if len(s) else 0.
+  for x in s:
+    ret["hist"][bisect.bisect_right(HIST_BINS_MS, x)] += 1
+  return ret
+
+
+def compare_latency(results, baseline, threshold=DEFAULT_THRESHOLD, stats=("p50", "p90")):
+  """Returns a list of (segment, proc, step, stat, baseline, current) for every
+  stat that is more than threshold (relative) above the baseline"""
+  regressions = []
+  for segment, procs in results.items():
+    for proc, steps in procs.items():
+      for step, summary in steps.items():
+        ref = baseline.get(segment, {}).get(proc, {}).get(step)
+        if ref is None:
+          continue
+        for stat in stats:
+          if summary[stat] > ref[stat] * (1. + threshold):
+            regressions.append((segment, proc, step, stat, ref[stat], summary[stat]))
+  return regressions
+
+
+def format_latency(results, regressions=()):
+  out = ""
+  for segment, procs in results.items():
+    out += "***** latency for segment %s *****\n" % segment
+    for proc, steps in procs.items():
+      for step, s in sorted(steps.items()):
+        out += "\t%s %s: n=%d mean=%.3fms p50=%.3fms p90=%.3fms p99=%.3fms max=%.3fms\n" % \
+               (proc, step, s["count"], s["mean"], s["p50"], s["p90"], s["p99"], s["max"])
+  for segment, proc, step, stat, ref, cur in regressions:
+    out += "REGRESSION %s %s %s %s: %.3fms -> %.3fms\n" % (segment, proc, step, stat, ref, cur)
+  return out
+
+
+def save_latency(fn, results):
+  with open(fn, "w") as f:
+    json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_latency(fn):
+  with open(fn) as f:
+    return json.load(f)
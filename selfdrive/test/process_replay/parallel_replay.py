@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tempfile
+import traceback
+import multiprocessing
+from collections import namedtuple
+
+# one unit of work: replay proc_name on the segment log at rlog_fn and compare
+# its output with the reference log at cmp_log_fn
+ReplayTask = namedtuple('ReplayTask', ['segment', 'proc_name', 'rlog_fn', 'cmp_log_fn', 'ignore_fields', 'ignore_msgs', 'timed'])
+
+
+def run_task(task):
+  """Runs in a pool worker. Every task gets a fresh process (maxtasksperchild=1),
+  so the fake sockets, module state and threads of the replayed daemon can't leak
+  between tasks, and a params directory of its own, so clear_all() in
+  replay_process doesn't wipe the params of a replay running next to it."""
+  params_path = tempfile.mkdtemp(prefix="params_")
+  os.environ['PARAMS_PATH'] = params_path
+  try:
+    # imported here so nothing touches params before PARAMS_PATH is set
+    from selfdrive.test.process_replay.latency import StepTimer
+    from selfdrive.test.process_replay.process_replay import CONFIGS
+    from selfdrive.test.process_replay.test_processes import test_process
+    from tools.lib.logreader import LogReader
+
+    cfg = next(c for c in CONFIGS if c.proc_name == task.proc_name)
+    step_timer = StepTimer(cfg.proc_name) if task.timed else None
+    diff = test_process(cfg, LogReader(task.rlog_fn), task.cmp_log_fn, task.ignore_fields, task.ignore_msgs, step_timer)
+    return task.segment, task.proc_name, diff, step_timer.summary() if task.timed else None
+  except Exception:
+    return task.segment, task.proc_name, "replay failed:\n" + traceback.format_exc(), None
+  finally:
+    shutil.rmtree(params_path, ignore_errors=True)
+
+
+def run_tasks(tasks, jobs=None):
+  """Spreads tasks over a pool of jobs processes (one per core by default) and
+  yields (segment, proc_name, diff, latency) as each replay finishes, in completion order"""
+  if not len(tasks):
+    return
+  jobs = jobs or multiprocessing.cpu_count()
+  ctx = multiprocessing.get_context("spawn")
+  with ctx.Pool(jobs, maxtasksperchild=1) as pool:
+    yield from pool.imap_unordered(run_task, tasks)
@@ -2,8 +2,10 @@
 import capnp
 import os
 import sys
+import time
 import threading
 import importlib
+from contextlib import nullcontext
 
 if "CI" in os.environ:
   def tqdm(x):
@@ -18,10 +20,12 @@ import cereal.messaging as messaging
 from common.params import Params
 from cereal.services import service_list
 from collections import namedtuple
+from selfdrive.test.process_replay.latency import add_blocked_time
 
 ProcessConfig = namedtuple('ProcessConfig', ['proc_name', 'pub_sub', 'ignore', 'init_callback', 'should_recv_callback'])
 
 def wait_for_event(evt):
+  t = time.perf_counter()
   if not evt.wait(15):
     if threading.currentThread().getName() == "MainThread":
       # tested process likely died. don't let test just hang
@@ -29,6 +33,8 @@ def wait_for_event(evt):
     else:
       # done testing this process, let it die
       sys.exit(0)
+  # not part of the tested process' compute time
+  add_blocked_time(time.perf_counter() - t)
 
 class FakeSocket:
   def __init__(self, wait=True):
@@ -253,7 +259,13 @@ CONFIGS = [
   ),
 ]
 
-def replay_process(cfg, lr):
+def replay_process(cfg, lr, step_timer=None):
+  """Replays lr through cfg.proc_name and returns its output messages.
+  If a latency.StepTimer is given, it records the compute time of each step."""
+  with step_timer if step_timer is not None else nullcontext():
+    return _replay_process(cfg, lr)
+
+def _replay_process(cfg, lr):
   sub_sockets = [s for _, sub in cfg.pub_sub.items() for s in sub]
   pub_sockets = [s for s in cfg.pub_sub.keys() if s != 'can']
 
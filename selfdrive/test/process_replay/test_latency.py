@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+import time
+import unittest
+
+from selfdrive.test.process_replay import latency
+from selfdrive.test.process_replay.latency import StepTimer, add_blocked_time, compare_latency, summarize
+
+
+class Stepper():
+  def step(self, blocked):
+    time.sleep(0.002)
+    # pretend the step waited on the harness for this long
+    time.sleep(blocked)
+    add_blocked_time(blocked)
+
+
+class TestLatency(unittest.TestCase):
+  def test_summarize(self):
+    s = summarize([float(x) for x in range(1, 101)])
+    self.assertEqual(s["count"], 100)
+    self.assertEqual(s["max"], 100.)
+    self.assertEqual(s["p50"], 51.)
+    self.assertEqual(s["p99"], 100.)
+    self.assertEqual(sum(s["hist"]), 100)
+
+  def test_blocked_time_not_counted(self):
+    latency.TIMED_STEPS["test"] = [(__name__, "Stepper", "step")]
+    try:
+      with StepTimer("test") as timer:
+        for _ in range(5):
+          Stepper().step(0.02)
+      self.assertEqual(Stepper.step.__name__, "step")
+    finally:
+      del latency.TIMED_STEPS["test"]
+
+    samples = timer.samples["Stepper.step"]
+    self.assertEqual(len(samples), 5)
+    for ms in samples:
+      self.assertGreater(ms, 1.5)
+      self.assertLess(ms, 15.)
+
+  def test_compare(self):
+    baseline = {"seg": {"plannerd": {"Planner.update": summarize([1.] * 10)}}}
+    same = {"seg": {"plannerd": {"Planner.update": summarize([1.1] * 10)}}}
+    slower = {"seg": {"plannerd": {"Planner.update": summarize([1.5] * 10)}}}
+    self.assertEqual(compare_latency(same, baseline, 0.2), [])
+    self.assertEqual(len(compare_latency(slower, baseline, 0.2)), 2)
+    self.assertEqual(compare_latency(slower, baseline, 1.0), [])
+
+
+if __name__ == "__main__":
+  unittest.main()
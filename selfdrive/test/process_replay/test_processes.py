@@ -6,6 +6,9 @@ from typing import Any
 
 from selfdrive.car.car_helpers import interface_names
 from selfdrive.test.process_replay.compare_logs import compare_logs
+from selfdrive.test.process_replay.latency import (DEFAULT_THRESHOLD, StepTimer, compare_latency,
+                                                   format_latency, load_latency, save_latency)
+from selfdrive.test.process_replay.parallel_replay import ReplayTask, run_tasks
 from selfdrive.test.process_replay.process_replay import (CONFIGS,
                                                           replay_process)
 from tools.lib.logreader import LogReader
@@ -49,11 +52,11 @@ def get_segment(segment_name, original=True):
   return rlog_url
 
 
-def test_process(cfg, lr, cmp_log_fn, ignore_fields=[], ignore_msgs=[]):
+def test_process(cfg, lr, cmp_log_fn, ignore_fields=[], ignore_msgs=[], step_timer=None):
   url = BASE_URL + os.path.basename(cmp_log_fn)
   cmp_log_msgs = list(LogReader(url))
 
-  log_msgs = replay_process(cfg, lr)
+  log_msgs = replay_process(cfg, lr, step_timer)
 
   # check to make sure openpilot is engaged in the route
   # TODO: update routes so enable check can run
@@ -116,8 +119,17 @@ if __name__ == "__main__":
                         help="Extra fields or msgs to ignore (e.g. carState.events)")
   parser.add_argument("--ignore-msgs", type=str, nargs="*", default=[],
                         help="Msgs to ignore (e.g. carEvents)")
+  parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Replay (segment, process) pairs in this many parallel workers, 0 for one per core")
+  parser.add_argument("--latency", action="store_true",
+                        help="Time every step of the tested processes and save the results to latency.json")
+  parser.add_argument("--latency-baseline", type=str, default=None,
+                        help="Compare the step latencies against this file, implies --latency")
+  parser.add_argument("--latency-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed relative increase in step latency over the baseline")
   args = parser.parse_args()
 
+  timed = args.latency or args.latency_baseline is not None
   cars_whitelisted = len(args.whitelist_cars) > 0
   procs_whitelisted = len(args.whitelist_procs) > 0
 
@@ -137,17 +149,20 @@ if __name__ == "__main__":
     assert len(untested) == 0, "Cars missing routes: %s" % (str(untested))
 
   results: Any = {}
+  latency: Any = {}
+  tasks = []
   for car_brand, segment in segments:
     if (cars_whitelisted and car_brand.upper() not in args.whitelist_cars) or \
        (not cars_whitelisted and car_brand.upper() in args.blacklist_cars):
       continue
 
-    print("***** testing route segment %s *****\n" % segment)
-
     results[segment] = {}
+    latency[segment] = {}
 
     rlog_fn = get_segment(segment)
-    lr = LogReader(rlog_fn)
+    if args.jobs == 1:
+      print("***** testing route segment %s *****\n" % segment)
+      lr = LogReader(rlog_fn)
 
     for cfg in CONFIGS:
       if (procs_whitelisted and cfg.proc_name not in args.whitelist_procs) or \
@@ -155,13 +170,33 @@ if __name__ == "__main__":
         continue
 
       cmp_log_fn = os.path.join(process_replay_dir, "%s_%s_%s.bz2" % (segment, cfg.proc_name, ref_commit))
-      results[segment][cfg.proc_name] = test_process(cfg, lr, cmp_log_fn, args.ignore_fields, args.ignore_msgs)
+      if args.jobs == 1:
+        step_timer = StepTimer(cfg.proc_name) if timed else None
+        results[segment][cfg.proc_name] = test_process(cfg, lr, cmp_log_fn, args.ignore_fields, args.ignore_msgs, step_timer)
+        if timed:
+          latency[segment][cfg.proc_name] = step_timer.summary()
+      else:
+        tasks.append(ReplayTask(segment, cfg.proc_name, rlog_fn, cmp_log_fn, args.ignore_fields, args.ignore_msgs, timed))
+
+  for segment, proc_name, diff, proc_latency in run_tasks(tasks, args.jobs):
+    print("***** finished %s on route segment %s *****" % (proc_name, segment))
+    results[segment][proc_name] = diff
+    if proc_latency is not None:
+      latency[segment][proc_name] = proc_latency
 
   diff1, diff2, failed = format_diff(results, ref_commit)
   with open(os.path.join(process_replay_dir, "diff.txt"), "w") as f:
     f.write(diff2)
   print(diff1)
 
+  if timed:
+    save_latency(os.path.join(process_replay_dir, "latency.json"), latency)
+    regressions = []
+    if args.latency_baseline is not None:
+      regressions = compare_latency(latency, load_latency(args.latency_baseline), args.latency_threshold)
+      failed = failed or len(regressions) > 0
+    print(format_latency(latency, regressions))
+
   print("TEST", "FAILED" if failed else "SUCCEEDED")
 
   print("\n\nTo update the reference logs for this test run:")
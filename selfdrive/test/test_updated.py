@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+import os
+import json
+import shutil
+import stat
+import subprocess
+import tempfile
+import unittest
+
+import selfdrive.updated as updated
+
+
+def git(cwd, *args):
+  return subprocess.check_output(["git", "-c", "user.name=test", "-c", "user.email=test@test.com", *args],
+                                 cwd=cwd, stderr=subprocess.STDOUT, encoding='utf8')
+
+
+def write(root, rel, dat):
+  path = os.path.join(root, rel)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  with open(path, "w") as f:
+    f.write(dat)
+
+
+def tree_contents(root):
+  """Every object under root: type, permissions and content or link target"""
+  ret = {}
+  for dirpath, dirnames, filenames in os.walk(root):
+    for name in dirnames + filenames:
+      path = os.path.join(dirpath, name)
+      st = os.lstat(path)
+      if stat.S_ISLNK(st.st_mode):
+        content = os.readlink(path)
+      elif stat.S_ISREG(st.st_mode):
+        with open(path, "rb") as f:
+          content = f.read()
+      else:
+        content = None
+      ret[os.path.relpath(path, root)] = (stat.S_IFMT(st.st_mode), stat.S_IMODE(st.st_mode), content)
+  return ret
+
+
+class TestIncrementalFinalize(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+    self.origin = os.path.join(self.tmp, "origin")
+    self.src = os.path.join(self.tmp, "merged")
+    self.dst = os.path.join(self.tmp, "finalized")
+    self.state_file = os.path.join(self.tmp, "finalized.json")
+
+    os.mkdir(self.origin)
+    git(self.origin, "init", "-q")
+    write(self.origin, ".gitignore", "*.o\n")
+    write(self.origin, "RELEASES.md", "Version 0.1\n")
+    write(self.origin, "keep/a.py", "a = 1\n")
+    write(self.origin, "keep/b.py", "b = 1\n")
+    write(self.origin, "changed/c.py", "c = 1\n")
+    write(self.origin, "changed/removed.py", "removed\n")
+    write(self.origin, "changed/run.sh", "#!/bin/sh\n")
+    write(self.origin, "becomes_file/d.py", "d = 1\n")
+    write(self.origin, "becomes_dir", "e\n")
+    os.symlink("keep/a.py", os.path.join(self.origin, "link"))
+    self.commit("first")
+
+    git(self.tmp, "clone", "-q", self.origin, self.src)
+    updated.setup_git_options(self.src)
+    write(self.src, "build/lib.o", "built\n")
+    os.mkdir(self.dst)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def commit(self, msg):
+    git(self.origin, "add", "-A")
+    git(self.origin, "commit", "-q", "-m", msg)
+
+  def update_src(self):
+    # what attempt_update does in the overlay
+    git(self.src, "fetch", "-q")
+    git(self.src, "reset", "-q", "--hard", "@{u}")
+
+  def change_origin(self):
+    write(self.origin, "changed/c.py", "c = 2\n")
+    os.remove(os.path.join(self.origin, "changed/removed.py"))
+    write(self.origin, "changed/new.py", "new = 1\n")
+    os.chmod(os.path.join(self.origin, "changed/run.sh"), 0o755)
+    shutil.rmtree(os.path.join(self.origin, "becomes_file"))
+    write(self.origin, "becomes_file", "d\n")
+    os.remove(os.path.join(self.origin, "becomes_dir"))
+    write(self.origin, "becomes_dir/e.py", "e = 1\n")
+    os.remove(os.path.join(self.origin, "link"))
+    os.symlink("keep/b.py", os.path.join(self.origin, "link"))
+    write(self.origin, "added/deep/f.py", "f = 1\n")
+    self.commit("second")
+
+  def inode(self, rel):
+    return os.lstat(os.path.join(self.dst, rel)).st_ino
+
+  def assertSameTree(self):
+    self.assertEqual(tree_contents(self.dst), tree_contents(self.src))
+
+  def test_first_finalize_copies(self):
+    updated.finalize_from_ovfs(self.src, self.dst, self.state_file)
+    self.assertSameTree()
+    with open(self.state_file) as f:
+      self.assertEqual(json.load(f)["commit"], git(self.src, "rev-parse", "HEAD").strip())
+
+  def test_incremental(self):
+    updated.finalize_from_ovfs(self.src, self.dst, self.state_file)
+    unchanged = ["keep/a.py", "keep/b.py", "RELEASES.md", "build/lib.o"]
+    inodes = {rel: self.inode(rel) for rel in unchanged}
+
+    self.change_origin()
+    self.update_src()
+    # a local change and a new build product
+    write(self.src, "keep/b.py", "b = 2\n")
+    write(self.src, "build/other.o", "built\n")
+    unchanged.remove("keep/b.py")
+
+    self.assertTrue(updated.finalize_from_ovfs_incremental(self.src, self.dst, self.state_file))
+    self.assertSameTree()
+    for rel in unchanged:
+      self.assertEqual(self.inode(rel), inodes[rel], msg=rel)
+    self.assertEqual(git(self.dst, "rev-parse", "HEAD"), git(self.src, "rev-parse", "HEAD"))
+
+    # local changes that are gone again, like after git clean
+    git(self.src, "checkout", "--", "keep/b.py")
+    git(self.src, "clean", "-q", "-xdf")
+    self.assertTrue(updated.finalize_from_ovfs_incremental(self.src, self.dst, self.state_file))
+    self.assertSameTree()
+    self.assertEqual(self.inode("keep/a.py"), inodes["keep/a.py"])
+
+  def test_nothing_new(self):
+    updated.finalize_from_ovfs(self.src, self.dst, self.state_file)
+    inodes = {rel: self.inode(rel) for rel in tree_contents(self.dst)}
+    self.assertTrue(updated.finalize_from_ovfs_incremental(self.src, self.dst, self.state_file))
+    self.assertSameTree()
+    # nothing is written again
+    self.assertEqual({rel: self.inode(rel) for rel in tree_contents(self.dst)}, inodes)
+
+  def test_falls_back_to_copy(self):
+    # no complete finalized copy
+    self.assertFalse(updated.finalize_from_ovfs_incremental(self.src, self.dst, self.state_file))
+    write(self.dst, "stale.py", "stale\n")
+    updated.finalize_from_ovfs(self.src, self.dst, self.state_file)
+    self.assertSameTree()
+
+    # commit of the last finalize not in the repo anymore
+    with open(self.state_file, "w") as f:
+      json.dump({"commit": "0" * 40, "local": []}, f)
+    self.change_origin()
+    self.update_src()
+    updated.finalize_from_ovfs(self.src, self.dst, self.state_file)
+    self.assertSameTree()
+    self.assertTrue(os.path.isfile(self.state_file))
+
+  def test_interrupted(self):
+    updated.finalize_from_ovfs(self.src, self.dst, self.state_file)
+    self.change_origin()
+    self.update_src()
+
+    sync_object = updated.sync_object
+    def fail(src, dst, rel):
+      if rel == "changed/c.py":
+        raise OSError("interrupted")
+      sync_object(src, dst, rel)
+    updated.sync_object = fail
+    try:
+      with self.assertRaises(OSError):
+        updated.finalize_from_ovfs_incremental(self.src, self.dst, self.state_file)
+    finally:
+      updated.sync_object = sync_object
+
+    # half done isn't used to start from
+    self.assertFalse(os.path.exists(self.state_file))
+    updated.finalize_from_ovfs(self.src, self.dst, self.state_file)
+    self.assertSameTree()
+
+
+if __name__ == "__main__":
+  unittest.main()
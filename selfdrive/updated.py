@@ -23,15 +23,17 @@
 # disable this service.
 
 import os
+import json
 import datetime
 import subprocess
 import psutil
-from stat import S_ISREG, S_ISDIR, S_ISLNK, S_IMODE, ST_MODE, ST_INO, ST_UID, ST_GID, ST_ATIME, ST_MTIME
+from stat import S_ISREG, S_ISDIR, S_ISLNK, S_IMODE, S_IFMT, ST_MODE, ST_INO, ST_UID, ST_GID, ST_ATIME, ST_MTIME
 import shutil
 import signal
 from pathlib import Path
 import fcntl
 import threading
+from contextlib import contextmanager
 from cffi import FFI
 
 from common.basedir import BASEDIR
@@ -44,6 +46,8 @@ OVERLAY_UPPER = os.path.join(STAGING_ROOT, "upper")
 OVERLAY_METADATA = os.path.join(STAGING_ROOT, "metadata")
 OVERLAY_MERGED = os.path.join(STAGING_ROOT, "merged")
 FINALIZED = os.path.join(STAGING_ROOT, "finalized")
+# commit and locally changed paths FINALIZED was last finalized from, only there while it's complete
+FINALIZED_STATE = os.path.join(STAGING_ROOT, "finalized.json")
 
 NICE_LOW_PRIORITY = ["nice", "-n", "19"]
 SHORT = os.getenv("SHORT") is not None
@@ -258,16 +262,184 @@ def finalize_from_ovfs_hardlink():
   cloudlog.info("done finalizing overlay")
 
 
-def finalize_from_ovfs_copy():
+def finalize_from_ovfs_copy(src=OVERLAY_MERGED, dst=FINALIZED):
   """Take the current OverlayFS merged view and finalize a copy outside of
   OverlayFS, ready to be swapped-in at BASEDIR. Copy using shutil.copytree"""
 
   cloudlog.info("creating finalized version of the overlay")
-  shutil.rmtree(FINALIZED)
-  shutil.copytree(OVERLAY_MERGED, FINALIZED, symlinks=True)
+  shutil.rmtree(dst)
+  shutil.copytree(src, dst, symlinks=True)
   cloudlog.info("done finalizing overlay")
 
 
+def git_paths(cmd, cwd):
+  """Paths printed by a git command run with -z"""
+  return [p for p in run(NICE_LOW_PRIORITY + cmd, cwd).split('\0') if p]
+
+
+def local_changes(cwd):
+  """Paths in a checkout that differ from HEAD: changed tracked files, and
+  untracked files including ignored ones like build products"""
+  changed = git_paths(["git", "diff", "--name-only", "--no-renames", "-z", "HEAD"], cwd)
+  untracked = git_paths(["git", "ls-files", "-z", "--others"], cwd)
+  return set(changed) | set(untracked)
+
+
+def save_finalized_state(src, state_file):
+  state = {
+    "commit": run(["git", "rev-parse", "HEAD"], src).rstrip(),
+    "local": sorted(local_changes(src)),
+  }
+  with open(state_file, "w") as f:
+    json.dump(state, f)
+
+
+def same_object(st, dst_st):
+  if S_IFMT(st.st_mode) != S_IFMT(dst_st.st_mode) or S_IMODE(st.st_mode) != S_IMODE(dst_st.st_mode):
+    return False
+  return S_ISDIR(st.st_mode) or (st.st_size == dst_st.st_size and st.st_mtime_ns == dst_st.st_mtime_ns)
+
+
+def remove_object(path):
+  if os.path.isdir(path) and not os.path.islink(path):
+    shutil.rmtree(path)
+  elif os.path.lexists(path):
+    os.unlink(path)
+
+
+def sync_object(src, dst, rel):
+  """Makes dst/rel the same as src/rel, with what's already the same left as is.
+  Directories are gone through entry by entry."""
+  src_path, dst_path = os.path.join(src, rel), os.path.join(dst, rel)
+  try:
+    st = os.lstat(src_path)
+  except (FileNotFoundError, NotADirectoryError):
+    remove_object(dst_path)
+    return
+  try:
+    dst_st = os.lstat(dst_path)
+  except (FileNotFoundError, NotADirectoryError):
+    dst_st = None
+
+  if S_ISDIR(st.st_mode):
+    if dst_st is not None and not S_ISDIR(dst_st.st_mode):
+      remove_object(dst_path)
+      dst_st = None
+    if dst_st is None:
+      os.makedirs(dst_path, S_IMODE(st.st_mode))
+    sync_tree(src, dst, rel)
+    shutil.copystat(src_path, dst_path, follow_symlinks=False)
+    return
+
+  if dst_st is not None and same_object(st, dst_st) and \
+     (not S_ISLNK(st.st_mode) or os.readlink(src_path) == os.readlink(dst_path)):
+    return
+
+  # written next to it and moved in place, the old one stays whole until then
+  os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+  tmp_path = dst_path + ".finalize_tmp"
+  remove_object(tmp_path)
+  if S_ISLNK(st.st_mode):
+    os.symlink(os.readlink(src_path), tmp_path)
+    shutil.copystat(src_path, tmp_path, follow_symlinks=False)
+  elif S_ISREG(st.st_mode):
+    shutil.copy2(src_path, tmp_path, follow_symlinks=False)
+  else:
+    # FIFO, socket, etc. Should not happen in OP install dir.
+    cloudlog.error("can't copy this file type: %s" % src_path)
+    return
+  if dst_st is not None and S_ISDIR(dst_st.st_mode):
+    shutil.rmtree(dst_path)
+  os.replace(tmp_path, dst_path)
+
+
+def sync_tree(src, dst, rel):
+  names = set(os.listdir(os.path.join(src, rel)))
+  if os.path.isdir(os.path.join(dst, rel)):
+    names |= set(os.listdir(os.path.join(dst, rel)))
+  for name in sorted(names):
+    sync_object(src, dst, os.path.join(rel, name))
+
+
+def finalize_from_ovfs_incremental(src=OVERLAY_MERGED, dst=FINALIZED, state_file=FINALIZED_STATE):
+  """Bring the finalized copy from the last update up to date with the
+  current OverlayFS merged view. Only the paths that changed between the two
+  commits, or that differ from their commit in either checkout, are written.
+  Everything else is left as is, hardlinks included. Returns False if there
+  is no complete finalized copy to start from."""
+
+  try:
+    with open(state_file) as f:
+      state = json.load(f)
+    old_hash, old_local = state["commit"], state["local"]
+  except (OSError, ValueError, KeyError, TypeError):
+    return False
+
+  cloudlog.info("updating finalized version of the overlay from %s" % old_hash)
+  # not complete until it's written again
+  os.remove(state_file)
+
+  new_hash = run(["git", "rev-parse", "HEAD"], src).rstrip()
+  paths = set(git_paths(["git", "diff", "--name-only", "--no-renames", "-z", old_hash, new_hash], src))
+  paths |= local_changes(src) | set(old_local)
+
+  # objects are never rewritten, so most of .git is skipped by its stat
+  sync_object(src, dst, ".git")
+  parents = set()
+  for rel in sorted(paths):
+    sync_object(src, dst, rel)
+    parent = os.path.dirname(rel)
+    while parent and parent not in parents:
+      parents.add(parent)
+      parent = os.path.dirname(parent)
+
+  # parents after their children, with empty ones that are gone from src removed
+  for rel in sorted(parents, key=len, reverse=True):
+    src_path, dst_path = os.path.join(src, rel), os.path.join(dst, rel)
+    if os.path.isdir(src_path):
+      if os.path.isdir(dst_path):
+        shutil.copystat(src_path, dst_path, follow_symlinks=False)
+    elif os.path.isdir(dst_path) and not os.listdir(dst_path):
+      os.rmdir(dst_path)
+
+  save_finalized_state(src, state_file)
+  cloudlog.info("done updating finalized overlay, %d paths" % len(paths))
+  return True
+
+
+@contextmanager
+def idle_io_priority():
+  """Disk access of the block, and the commands it runs, only gets the time
+  nothing else wants"""
+  if not psutil.LINUX:
+    yield
+    return
+
+  p = psutil.Process()
+  prev = p.ionice()
+  p.ionice(psutil.IOPRIO_CLASS_IDLE)
+  try:
+    yield
+  finally:
+    p.ionice(prev.ioclass, prev.value)
+
+
+def finalize_from_ovfs(src=OVERLAY_MERGED, dst=FINALIZED, state_file=FINALIZED_STATE):
+  """Finalize incrementally from the last finalized copy, or copy the whole
+  tree if there is none or it fails"""
+  with idle_io_priority():
+    try:
+      if finalize_from_ovfs_incremental(src, dst, state_file):
+        return
+    except Exception:
+      cloudlog.exception("incremental finalize failed, copying the whole overlay")
+      if os.path.isfile(state_file):
+        os.remove(state_file)
+
+    finalize_from_ovfs_copy(src, dst)
+    save_finalized_state(src, state_file)
+
+
 def attempt_update():
   cloudlog.info("attempting git update inside staging overlay")
 
@@ -299,7 +471,7 @@ def attempt_update():
     # activated later if the finalize step is interrupted
     remove_consistent_flag()
 
-    finalize_from_ovfs_copy()
+    finalize_from_ovfs()
 
     # Make sure the validity flag lands on disk LAST, only when the local git
     # repo and OP install are in a consistent state.
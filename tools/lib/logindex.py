@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+from collections import namedtuple
+
+INDEX_VERSION = 2
+INDEX_SUFFIX = ".idx"
+
+# start a new chunk after this many uncompressed bytes
+CHUNK_SIZE = 4 << 20
+
+# offset: position of the chunk in the file on disk, only valid when seekable
+# raw_offset: position of the chunk in the uncompressed stream
+# count: number of events in the chunk
+# t0, t1: min and max logMonoTime in the chunk
+# services: services that have at least one event in the chunk
+Chunk = namedtuple("Chunk", ["offset", "raw_offset", "count", "t0", "t1", "services"])
+
+
+def index_path(fn):
+  return fn + INDEX_SUFFIX
+
+
+def log_stat(fn):
+  """Size and mtime of a log, what its index was made for"""
+  st = os.stat(fn)
+  return st.st_size, st.st_mtime_ns
+
+
+class ChunkBuilder():
+  def __init__(self, offset, raw_offset):
+    self.offset = offset
+    self.raw_offset = raw_offset
+    self.raw_size = 0
+    self.count = 0
+    self.t0 = None
+    self.t1 = None
+    self.services = set()
+
+  def add(self, which, mono_time, size):
+    self.raw_size += size
+    self.count += 1
+    self.services.add(which)
+    self.t0 = mono_time if self.t0 is None else min(self.t0, mono_time)
+    self.t1 = mono_time if self.t1 is None else max(self.t1, mono_time)
+
+  def finish(self):
+    return Chunk(self.offset, self.raw_offset, self.count, self.t0, self.t1, sorted(self.services))
+
+
+class LogIndex():
+  """Sidecar index of a log file by service and time.
+
+  The log is split in chunks of consecutive events. When the log was written
+  by LogWriter each chunk is its own compressed stream, so a reader can seek
+  straight to it. Indexes built for existing single stream logs only let the
+  reader skip decoding, not decompressing.
+
+  The size and mtime of the log are kept with it, an index of a log that was
+  written again since is stale and not used.
+  """
+  def __init__(self, compression, seekable, chunks=None, log_stat=None):
+    self.compression = compression
+    self.seekable = seekable
+    self.chunks = chunks if chunks is not None else []
+    self.log_stat = log_stat
+
+  def matches(self, fn):
+    """True if this is an index of log fn as it is now"""
+    try:
+      return self.log_stat is not None and tuple(self.log_stat) == log_stat(fn)
+    except OSError:
+      return False
+
+  def select(self, services=None, start_time=None, end_time=None):
+    ret = []
+    for c in self.chunks:
+      if c.count == 0:
+        continue
+      if services is not None and not services.intersection(c.services):
+        continue
+      if start_time is not None and c.t1 < start_time:
+        continue
+      if end_time is not None and c.t0 >= end_time:
+        continue
+      ret.append(c)
+    return ret
+
+  def save(self, fn):
+    with open(fn, "w") as f:
+      json.dump({
+        "version": INDEX_VERSION,
+        "compression": self.compression,
+        "seekable": self.seekable,
+        "chunks": [list(c) for c in self.chunks],
+        "log_stat": self.log_stat,
+      }, f)
+
+  @classmethod
+  def load(cls, fn):
+    with open(fn) as f:
+      dat = json.load(f)
+    if dat.get("version") != INDEX_VERSION:
+      raise ValueError("unsupported log index version %s in %s" % (dat.get("version"), fn))
+    return cls(dat["compression"], dat["seekable"], [Chunk(*c) for c in dat["chunks"]], dat.get("log_stat"))
+
+
+def load_index(fn):
+  """The index of log fn, None if there is no usable one for the log as it is now"""
+  try:
+    index = LogIndex.load(index_path(fn))
+  except (OSError, ValueError, KeyError, TypeError):
+    return None
+  return index if index.matches(fn) else None
+
+
+def remove_index(fn):
+  try:
+    os.remove(index_path(fn))
+  except FileNotFoundError:
+    pass
+
+
+def build_index(fn, chunk_size=CHUNK_SIZE):
+  """Indexes an existing log in one streaming pass and writes the sidecar file"""
+  from cereal import log as capnp_log
+  from tools.lib.logreader import decompressed_stream, get_compression, iter_frames
+
+  with open(fn, "rb") as f:
+    compression = get_compression(fn, f.peek(4)[:4])
+    index = LogIndex(compression, compression is None)
+
+    raw_offset = 0
+    chunk = ChunkBuilder(0, 0)
+    for frame in iter_frames(decompressed_stream(f, compression)):
+      if chunk.raw_size >= chunk_size:
+        index.chunks.append(chunk.finish())
+        chunk = ChunkBuilder(raw_offset, raw_offset)
+      msg = next(iter(capnp_log.Event.read_multiple_bytes(frame)))
+      chunk.add(msg.which(), msg.logMonoTime, len(frame))
+      raw_offset += len(frame)
+    if chunk.count:
+      index.chunks.append(chunk.finish())
+
+  index.log_stat = log_stat(fn)
+  index.save(index_path(fn))
+  return index
+
+
+if __name__ == "__main__":
+  for log_fn in sys.argv[1:]:
+    idx = build_index(log_fn)
+    print("%s: %d chunks" % (log_fn, len(idx.chunks)))
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+import os
+import sys
+import bz2
+import shutil
+import struct
+import tempfile
+import urllib.parse
+import urllib.request
+import weakref
+
+from cereal import log as capnp_log
+from tools.lib.logindex import load_index
+
+try:
+  import zstandard  # type: ignore
+except ImportError:
+  zstandard = None
+
+# decode messages in blocks of about this many bytes, bounds memory per reader
+DECODE_BLOCK_SIZE = 1 << 20
+
+BZ2_MAGIC = b"BZh"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def is_url(fn):
+  return urllib.parse.urlparse(fn).scheme in ("http", "https")
+
+
+def get_compression(fn, head=b""):
+  if fn.endswith(".bz2") or head.startswith(BZ2_MAGIC):
+    return "bz2"
+  if fn.endswith(".zst") or head.startswith(ZSTD_MAGIC):
+    return "zst"
+  return None
+
+
+def decompressed_stream(f, compression):
+  """Wraps a binary file object in a streaming decompressor"""
+  if compression == "bz2":
+    # handles files made of several concatenated bz2 streams
+    return bz2.BZ2File(f)
+  if compression == "zst":
+    if zstandard is None:
+      raise ImportError("zstandard is required to read %s" % getattr(f, "name", "zstd logs"))
+    return zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+  return f
+
+
+def _read_exact(r, n):
+  dat = r.read(n)
+  while len(dat) < n:
+    more = r.read(n - len(dat))
+    if not more:
+      break
+    dat += more
+  return dat
+
+
+def read_frame(r):
+  """Reads one serialized capnp message from stream r, returns the raw bytes.
+
+  The capnp stream framing is a segment table: uint32 (segment count - 1),
+  uint32 size in words for each segment, padded to 8 bytes, then the segments.
+  """
+  hdr = _read_exact(r, 4)
+  if len(hdr) < 4:
+    return None
+  n = struct.unpack("<I", hdr)[0] + 1
+  sizes = _read_exact(r, 4 * n + (4 if n % 2 == 0 else 0))
+  body_size = 8 * sum(struct.unpack("<%dI" % n, sizes[:4 * n]))
+  body = _read_exact(r, body_size)
+  if len(body) < body_size:
+    raise EOFError("truncated capnp message")
+  return hdr + sizes + body
+
+
+def iter_frames(r):
+  while True:
+    frame = read_frame(r)
+    if frame is None:
+      return
+    yield frame
+
+
+def decode_frames(frames):
+  """Lazily turns raw frames into log.Event readers, a block at a time"""
+  block, block_size = [], 0
+  for frame in frames:
+    block.append(frame)
+    block_size += len(frame)
+    if block_size >= DECODE_BLOCK_SIZE:
+      yield from capnp_log.Event.read_multiple_bytes(b"".join(block))
+      block, block_size = [], 0
+  if block:
+    yield from capnp_log.Event.read_multiple_bytes(b"".join(block))
+
+
+class LogReader():
+  """Streams log.Event messages from a local or remote rlog/qlog.
+
+  Nothing is held in memory beyond one decode block, so multi-gigabyte logs
+  can be iterated. Each iteration reopens the file, so the reader can be
+  iterated more than once. A remote log is downloaded once, on the first
+  iteration, to a temporary file that's removed with the reader. When a
+  sidecar index (see logindex.py) of the log exists, services and
+  start_time/end_time filters skip whole chunks of the file.
+  """
+  def __init__(self, fn, services=None, start_time=None, end_time=None, sort_by_time=False):
+    self.fn = fn
+    self.services = None if services is None else set(services)
+    self.start_time = start_time
+    self.end_time = end_time
+    self.sort_by_time = sort_by_time
+
+    self.index = None if is_url(fn) else load_index(fn)
+    self.local_fn = None if is_url(fn) else fn
+
+  def _download(self):
+    name = os.path.basename(urllib.parse.urlparse(self.fn).path)
+    fd, path = tempfile.mkstemp(suffix="_" + name)
+    weakref.finalize(self, os.remove, path)
+    with os.fdopen(fd, "wb") as f, urllib.request.urlopen(self.fn) as r:
+      shutil.copyfileobj(r, f)
+    return path
+
+  def _open(self):
+    if self.local_fn is None:
+      self.local_fn = self._download()
+    return open(self.local_fn, "rb")  # pylint: disable=consider-using-with
+
+  def _iter_frames(self, f):
+    head = f.peek(4)[:4] if hasattr(f, "peek") else b""
+    compression = self.index.compression if self.index is not None else get_compression(self.fn, head)
+
+    if self.index is None or (self.services is None and self.start_time is None and self.end_time is None):
+      yield from iter_frames(decompressed_stream(f, compression))
+      return
+
+    chunks = self.index.select(self.services, self.start_time, self.end_time)
+    if not chunks:
+      return
+
+    if self.index.seekable:
+      for chunk in chunks:
+        f.seek(chunk.offset)
+        r = decompressed_stream(f, compression)
+        for _ in range(chunk.count):
+          yield read_frame(r)
+    else:
+      # single compressed stream, skip unwanted chunks without decoding them
+      wanted = {c.raw_offset for c in chunks}
+      last = max(wanted)
+      r = decompressed_stream(f, compression)
+      for chunk in self.index.chunks:
+        if chunk.raw_offset > last:
+          return
+        for _ in range(chunk.count):
+          frame = read_frame(r)
+          if chunk.raw_offset in wanted:
+            yield frame
+
+  def frames(self):
+    """Serialized events, only from the chunks the index has for the services
+    and times, the events within them aren't filtered"""
+    with self._open() as f:
+      yield from self._iter_frames(f)
+
+  def _iter_events(self):
+    for msg in decode_frames(self.frames()):
+      if self.services is not None and msg.which() not in self.services:
+        continue
+      if self.start_time is not None and msg.logMonoTime < self.start_time:
+        continue
+      if self.end_time is not None and msg.logMonoTime >= self.end_time:
+        continue
+      yield msg
+
+  def __iter__(self):
+    if self.sort_by_time:
+      return iter(sorted(self._iter_events(), key=lambda m: m.logMonoTime))
+    return self._iter_events()
+
+
+class MultiLogIterator():
+  """Iterates over the logs of several segments in order"""
+  def __init__(self, log_paths, **kwargs):
+    self.log_paths = [p for p in log_paths if p is not None]
+    self.kwargs = kwargs
+
+  def __iter__(self):
+    for fn in self.log_paths:
+      yield from LogReader(fn, **self.kwargs)
+
+
+if __name__ == "__main__":
+  for msg in LogReader(sys.argv[1], services=sys.argv[2:] or None):
+    print(msg)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import bz2
+import capnp
+
+from tools.lib.logindex import CHUNK_SIZE, ChunkBuilder, LogIndex, index_path, log_stat, remove_index
+from tools.lib.logreader import get_compression
+
+try:
+  import zstandard  # type: ignore
+except ImportError:
+  zstandard = None
+
+
+def _new_compressor(compression):
+  if compression == "bz2":
+    return bz2.BZ2Compressor()
+  if compression == "zst":
+    if zstandard is None:
+      raise ImportError("zstandard is required to write zstd logs")
+    return zstandard.ZstdCompressor().compressobj()
+  return None
+
+
+class LogWriter():
+  """Incrementally writes log.Event messages to a (compressed) log file.
+
+  The output is split in chunks, each an independent bz2 stream or zstd frame,
+  so it is still a regular log for any reader. A sidecar index with the file
+  offset, time span and services of every chunk is written on close, which
+  lets LogReader seek without decompressing the whole file. An index left
+  from an earlier log of the same name is removed, even without write_index.
+  """
+  def __init__(self, fn, compression=None, chunk_size=CHUNK_SIZE, write_index=True):
+    self.fn = fn
+    self.compression = compression if compression is not None else get_compression(fn)
+    self.chunk_size = chunk_size
+    self.write_index = write_index
+
+    remove_index(fn)
+    self.f = open(fn, "wb")  # pylint: disable=consider-using-with
+    self.index = LogIndex(self.compression, True)
+    self.raw_offset = 0
+    self.chunk = None
+    self.compressor = None
+
+  def _finish_chunk(self):
+    if self.compressor is not None:
+      self.f.write(self.compressor.flush())
+      self.compressor = None
+    if self.chunk is not None and self.chunk.count:
+      self.index.chunks.append(self.chunk.finish())
+    self.chunk = None
+
+  def write(self, msg):
+    """Appends a message, either a capnp reader/builder or serialized bytes"""
+    if isinstance(msg, bytes):
+      from cereal import log as capnp_log
+      dat = msg
+      msg = next(iter(capnp_log.Event.read_multiple_bytes(dat)))
+    elif isinstance(msg, capnp._DynamicStructBuilder):  # pylint: disable=protected-access
+      dat = msg.to_bytes()
+    else:
+      dat = msg.as_builder().to_bytes()
+
+    if self.chunk is not None and self.chunk.raw_size >= self.chunk_size:
+      self._finish_chunk()
+    if self.chunk is None:
+      self.chunk = ChunkBuilder(self.f.tell(), self.raw_offset)
+      self.compressor = _new_compressor(self.compression)
+
+    self.chunk.add(msg.which(), msg.logMonoTime, len(dat))
+    self.raw_offset += len(dat)
+    self.f.write(self.compressor.compress(dat) if self.compressor is not None else dat)
+
+  def write_many(self, msgs):
+    for msg in msgs:
+      self.write(msg)
+
+  def close(self):
+    if self.f is None:
+      return
+    self._finish_chunk()
+    self.f.close()
+    self.f = None
+    if self.write_index:
+      self.index.log_stat = log_stat(self.fn)
+      self.index.save(index_path(self.fn))
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# Picks a few fields out of events, like carState.vEgo or
+# controlsState.lateralControlState.pidState.p, without converting the rest.
+# Events of services none of the fields are in are skipped by the union tag
+# of the raw message, before they're decoded.
+import csv
+import json
+import struct
+from operator import attrgetter
+
+from cereal import log as capnp_log
+from tools.lib.logreader import LogReader
+
+_EVENT = capnp_log.Event.schema
+_DISCRIMINANT_OFFSET = _EVENT.node.struct.discriminantOffset * 2  # bytes into the data section
+_WHICH = {_EVENT.fields[name].proto.discriminantValue: name for name in _EVENT.union_fields}
+
+META = ["logMonoTime", "service"]
+
+
+def event_which(dat):
+  """which() of a serialized Event from the union tag of its root struct, None
+  when the root pointer isn't a plain struct pointer and it has to be decoded"""
+  if len(dat) < 8:
+    return None
+  n_segments = struct.unpack_from("<I", dat)[0] + 1
+  root = (n_segments + 2) // 2 * 8
+  if root + 8 > len(dat):
+    return None
+  ptr = struct.unpack_from("<Q", dat, root)[0]
+  if ptr & 3 != 0:
+    return None
+
+  offset = (ptr & 0xFFFFFFFF) >> 2
+  if offset & (1 << 29):
+    offset -= 1 << 30
+  data_words = (ptr >> 32) & 0xFFFF
+  if _DISCRIMINANT_OFFSET + 2 > data_words * 8:
+    return _WHICH.get(0)
+  pos = root + 8 + offset * 8 + _DISCRIMINANT_OFFSET
+  if pos < 0 or pos + 2 > len(dat):
+    return None
+  return _WHICH.get(struct.unpack_from("<H", dat, pos)[0])
+
+
+def _field_kind(field):
+  return "group" if field.proto.which() == "group" else field.proto.slot.type.which()
+
+
+def _check_path(path, steps):
+  """Checks the field names of a path against the schema, as far as it goes through structs"""
+  schema, kind = _EVENT, "struct"
+  for step in steps:
+    if kind == "list":
+      # list elements aren't followed
+      return
+    if kind not in ("struct", "group"):
+      raise ValueError("%s: no field %s, not a struct" % (path, step))
+    if isinstance(step, int):
+      raise ValueError("%s: %d is not a list index here" % (path, step))
+    if step not in schema.fieldnames:
+      raise ValueError("%s: no field %s" % (path, step))
+    field = schema.fields[step]
+    kind = _field_kind(field)
+    if kind in ("struct", "group"):
+      schema = field.schema
+
+
+def compile_accessor(steps):
+  """Function getting the field at steps, struct fields and list indices"""
+  if all(isinstance(s, str) for s in steps):
+    return attrgetter(".".join(steps))
+
+  def get(evt):
+    for s in steps:
+      evt = evt[s] if isinstance(s, int) else getattr(evt, s)
+    return evt
+  return get
+
+
+def to_jsonable(v):
+  if v is None or isinstance(v, (bool, int, float, str)):
+    return v
+  if isinstance(v, bytes):
+    return v.hex()
+  if hasattr(v, "to_dict"):
+    return to_jsonable(v.to_dict())
+  if isinstance(v, dict):
+    return {k: to_jsonable(x) for k, x in v.items()}
+  if isinstance(v, (list, tuple)) or hasattr(v, "__len__"):
+    return [to_jsonable(x) for x in v]
+  # enums
+  return str(v)
+
+
+class Projection():
+  """Field paths compiled into accessors, grouped by the service they're in.
+
+  A path starts with a service, like carState.vEgo, or is a field of every
+  event, like logMonoTime. List elements are picked by index, as in
+  can.0.address. Fields that aren't there in an event, like an unset union
+  member, come out as None.
+  """
+  def __init__(self, paths):
+    self.paths = list(paths)
+    self.by_service = {}
+    common = []
+    for path in self.paths:
+      steps = [int(s) if s.isdigit() else s for s in path.split(".")]
+      _check_path(path, steps)
+      accessor = (path, compile_accessor(steps))
+      if steps[0] in _EVENT.union_fields:
+        self.by_service.setdefault(steps[0], []).append(accessor)
+      else:
+        common.append(accessor)
+
+    # with only fields of every event, every service
+    self.services = set(self.by_service) if self.by_service else None
+    self.common = common
+    for service in self.by_service:
+      self.by_service[service] = common + self.by_service[service]
+
+  def wants(self, which):
+    return self.services is None or which in self.services
+
+  def project(self, evt, which=None):
+    """Row of the fields of a decoded event, None if none of them are in its service"""
+    which = evt.which() if which is None else which
+    if not self.wants(which):
+      return None
+    row = {"logMonoTime": evt.logMonoTime, "service": which}
+    for path, get in self.by_service.get(which, self.common):
+      try:
+        row[path] = to_jsonable(get(evt))
+      except Exception:
+        row[path] = None
+    return row
+
+  def project_raw(self, dat, which=None):
+    """project of a serialized event, only decoded if its service has fields"""
+    if which is None:
+      which = event_which(dat)
+    if which is not None and not self.wants(which):
+      return None
+    return self.project(capnp_log.Event.from_bytes(dat), which)
+
+
+def project_logs(projection, log_paths, start_time=None, end_time=None):
+  """Rows of the events in recorded logs that have the fields"""
+  for fn in log_paths:
+    reader = LogReader(fn, services=projection.services, start_time=start_time, end_time=end_time)
+    for frame in reader.frames():
+      row = projection.project_raw(frame)
+      if row is None:
+        continue
+      if start_time is not None and row["logMonoTime"] < start_time:
+        continue
+      if end_time is not None and row["logMonoTime"] >= end_time:
+        continue
+      yield row
+
+
+class JsonWriter():
+  """One JSON object per row and line"""
+  def __init__(self, f, projection):
+    self.f = f
+
+  def write(self, row):
+    self.f.write(json.dumps(row) + "\n")
+
+
+class CsvWriter():
+  """A column per field, empty where a row doesn't have it"""
+  def __init__(self, f, projection):
+    self.writer = csv.writer(f)
+    self.columns = META + [p for p in projection.paths if p not in META]
+    self.writer.writerow(self.columns)
+
+  def write(self, row):
+    self.writer.writerow(["" if row.get(c) is None else (json.dumps(row[c]) if isinstance(row[c], (dict, list)) else row[c])
+                          for c in self.columns])
+
+
+class TextWriter():
+  """What dump.py prints for --values"""
+  def __init__(self, f, projection):
+    self.f = f
+
+  def write(self, row):
+    self.f.write("logMonotime = {}\n".format(row["logMonoTime"]))
+    for path, value in row.items():
+      if path not in META:
+        self.f.write("{} = {}\n".format(path, value))
+    self.f.write("\n")
+
+
+WRITERS = {"text": TextWriter, "json": JsonWriter, "csv": CsvWriter}
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+import os
+import bz2
+import http.server
+import shutil
+import tempfile
+import threading
+import unittest
+from functools import partial
+
+from cereal import log
+from tools.lib.logindex import LogIndex, build_index, index_path
+from tools.lib.logreader import LogReader
+from tools.lib.logwriter import LogWriter
+
+
+def make_msgs(n):
+  msgs = []
+  for i in range(n):
+    if i % 3 == 0:
+      msg = log.Event.new_message()
+      msg.init('carState')
+      msg.carState.vEgo = float(i)
+    else:
+      msg = log.Event.new_message()
+      msg.init('controlsState')
+      msg.controlsState.vEgo = float(i)
+    msg.logMonoTime = i * 1000
+    msgs.append(msg)
+  return msgs
+
+
+class TestLogReader(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.msgs = make_msgs(3000)
+    self.msg_bytes = [m.to_bytes() for m in self.msgs]
+    self.dat = b"".join(self.msg_bytes)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _path(self, fn):
+    return os.path.join(self.tmpdir, fn)
+
+  def assertSameMsgs(self, read, expected):
+    self.assertEqual([m.as_builder().to_bytes() for m in read], expected)
+
+  def test_read_plain_and_bz2(self):
+    with open(self._path("rlog"), "wb") as f:
+      f.write(self.dat)
+    with open(self._path("rlog.bz2"), "wb") as f:
+      f.write(bz2.compress(self.dat))
+
+    for fn in ("rlog", "rlog.bz2"):
+      lr = LogReader(self._path(fn))
+      self.assertSameMsgs(lr, self.msg_bytes)
+      # iterating again reopens the file
+      self.assertEqual(len(list(lr)), len(self.msgs))
+
+  def test_writer_roundtrip(self):
+    fn = self._path("rlog.bz2")
+    with LogWriter(fn, chunk_size=4096) as lw:
+      lw.write_many(self.msgs[:100])
+      for dat in self.msg_bytes[100:]:
+        lw.write(dat)
+
+    # chunks are independent bz2 streams, plain bz2 still reads the file
+    with open(fn, "rb") as f:
+      self.assertEqual(bz2.decompress(f.read()), self.dat)
+
+    index = LogIndex.load(index_path(fn))
+    self.assertTrue(index.seekable)
+    self.assertGreater(len(index.chunks), 1)
+    self.assertEqual(sum(c.count for c in index.chunks), len(self.msgs))
+    self.assertSameMsgs(LogReader(fn), self.msg_bytes)
+
+  def test_filtered_read(self):
+    expected = [dat for m, dat in zip(self.msgs, self.msg_bytes)
+                if m.which() == 'carState' and 1000000 <= m.logMonoTime < 2000000]
+
+    written = self._path("written.bz2")
+    with LogWriter(written, chunk_size=4096) as lw:
+      lw.write_many(self.msgs)
+
+    existing = self._path("existing.bz2")
+    with open(existing, "wb") as f:
+      f.write(bz2.compress(self.dat))
+    build_index(existing, chunk_size=4096)
+    self.assertFalse(LogIndex.load(index_path(existing)).seekable)
+
+    for fn in (written, existing):
+      lr = LogReader(fn, services=['carState'], start_time=1000000, end_time=2000000)
+      self.assertSameMsgs(lr, expected)
+
+  def test_stale_index(self):
+    fn = self._path("rlog.bz2")
+    with LogWriter(fn, chunk_size=4096) as lw:
+      lw.write_many(self.msgs)
+
+    # written again without an index, the old one is removed
+    with LogWriter(fn, chunk_size=4096, write_index=False) as lw:
+      lw.write_many(self.msg_bytes[:1000])
+    self.assertFalse(os.path.exists(index_path(fn)))
+
+    # or changed by anything else, the old one isn't used
+    with LogWriter(fn, chunk_size=4096) as lw:
+      lw.write_many(self.msg_bytes)
+    with open(fn, "wb") as f:
+      f.write(bz2.compress(b"".join(self.msg_bytes[1000:])))
+    expected = [dat for m, dat in zip(self.msgs[1000:], self.msg_bytes[1000:]) if m.which() == 'carState']
+    lr = LogReader(fn, services=['carState'])
+    self.assertIsNone(lr.index)
+    self.assertSameMsgs(lr, expected)
+
+  def test_url_downloaded_once(self):
+    with open(self._path("rlog.bz2"), "wb") as f:
+      f.write(bz2.compress(self.dat))
+
+    requests = []
+    class Handler(http.server.SimpleHTTPRequestHandler):
+      def do_GET(self):
+        requests.append(self.path)
+        super().do_GET()
+
+      def log_message(self, *args):
+        pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), partial(Handler, directory=self.tmpdir))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+      lr = LogReader("http://127.0.0.1:%d/rlog.bz2" % server.server_address[1])
+      self.assertSameMsgs(lr, self.msg_bytes)
+      self.assertSameMsgs(sorted(lr, key=lambda m: m.logMonoTime), self.msg_bytes)
+      self.assertEqual(requests, ["/rlog.bz2"])
+
+      # the download goes with the reader
+      local_fn = lr.local_fn
+      self.assertTrue(os.path.exists(local_fn))
+      del lr
+      self.assertFalse(os.path.exists(local_fn))
+    finally:
+      server.shutdown()
+      server.server_close()
+      thread.join()
+
+  def test_sort_by_time(self):
+    fn = self._path("rlog")
+    with LogWriter(fn) as lw:
+      lw.write_many(reversed(self.msgs))
+    self.assertSameMsgs(LogReader(fn, sort_by_time=True), self.msg_bytes)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+import io
+import os
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+
+from cereal import log
+from tools.lib.logreader import LogReader
+from tools.lib.logwriter import LogWriter
+from tools.lib.projection import Projection, CsvWriter, JsonWriter, TextWriter, event_which, project_logs
+from tools.lib.tests.test_logreader import make_msgs
+
+
+class TestProjection(unittest.TestCase):
+  def test_event_which(self):
+    for service in log.Event.schema.union_fields:
+      msg = log.Event.new_message()
+      kind = log.Event.schema.fields[service].proto.slot.type.which()
+      if kind == 'struct':
+        msg.init(service)
+      elif kind == 'list':
+        msg.init(service, 1)
+      else:
+        setattr(msg, service, b"x" if kind == 'data' else "x")
+      msg.logMonoTime = 123
+      self.assertEqual(event_which(msg.to_bytes()), service)
+    self.assertIsNone(event_which(b""))
+
+  def test_values(self):
+    msg = log.Event.new_message()
+    msg.init('carState')
+    msg.carState.vEgo = 2.5
+    msg.carState.cruiseState.enabled = True
+    msg.logMonoTime = 1000
+
+    p = Projection(["carState.vEgo", "carState.cruiseState.enabled", "logMonoTime", "controlsState.vEgo"])
+    self.assertEqual(p.services, {"carState", "controlsState"})
+    row = p.project_raw(msg.to_bytes())
+    self.assertEqual(row, {"logMonoTime": 1000, "service": "carState",
+                           "carState.vEgo": 2.5, "carState.cruiseState.enabled": True})
+    self.assertEqual(p.project(msg.as_reader()), row)
+
+  def test_list_index(self):
+    msg = log.Event.new_message()
+    msg.init('can', 2)
+    msg.can[1].address = 0x123
+    msg.can[1].dat = b"\x01\x02"
+    p = Projection(["can.1.address", "can.1.dat", "can.5.address"])
+    row = p.project_raw(msg.to_bytes())
+    self.assertEqual(row["can.1.address"], 0x123)
+    self.assertEqual(row["can.1.dat"], "0102")
+    self.assertIsNone(row["can.5.address"])
+
+  def test_bad_paths(self):
+    for path in ["carState.notAField", "carState.vEgo.more", "carState.0", "notAService.vEgo"]:
+      with self.assertRaises(ValueError, msg=path):
+        Projection([path])
+
+  def test_only_common_fields(self):
+    p = Projection(["logMonoTime"])
+    self.assertIsNone(p.services)
+    msg = log.Event.new_message()
+    msg.init('gpsLocation')
+    msg.logMonoTime = 5
+    self.assertEqual(p.project_raw(msg.to_bytes()), {"logMonoTime": 5, "service": "gpsLocation"})
+
+  def test_skips_without_decoding(self):
+    p = Projection(["carState.vEgo"])
+    msg = log.Event.new_message()
+    msg.init('controlsState')
+    dat = msg.to_bytes()
+    self.assertIsNone(p.project_raw(dat))
+    # garbage after the union tag isn't looked at
+    self.assertIsNone(p.project_raw(dat[:len(dat) // 2]))
+
+  def test_writers(self):
+    p = Projection(["carState.vEgo", "controlsState.vEgo"])
+    rows = [p.project(m.as_reader()) for m in make_msgs(4)]
+
+    f = io.StringIO()
+    w = CsvWriter(f, p)
+    for row in rows:
+      w.write(row)
+    f.seek(0)
+    out = list(csv.reader(f))
+    self.assertEqual(out[0], ["logMonoTime", "service", "carState.vEgo", "controlsState.vEgo"])
+    self.assertEqual(out[1], ["0", "carState", "0.0", ""])
+    self.assertEqual(out[2], ["1000", "controlsState", "", "1.0"])
+
+    f = io.StringIO()
+    w = JsonWriter(f, p)
+    for row in rows:
+      w.write(row)
+    self.assertEqual([json.loads(l) for l in f.getvalue().splitlines()], rows)
+
+    f = io.StringIO()
+    TextWriter(f, p).write(rows[0])
+    self.assertEqual(f.getvalue(), "logMonotime = 0\ncarState.vEgo = 0.0\n\n")
+
+
+class TestProjectLogs(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.msgs = make_msgs(3000)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_same_as_decoding(self):
+    fn = os.path.join(self.tmpdir, "rlog.bz2")
+    with LogWriter(fn, chunk_size=4096) as lw:
+      lw.write_many(self.msgs)
+
+    p = Projection(["carState.vEgo", "logMonoTime"])
+    for start_time, end_time in [(None, None), (1000000, 2000000)]:
+      expected = [p.project(m) for m in LogReader(fn, services=['carState'], start_time=start_time, end_time=end_time)]
+      self.assertEqual(list(project_logs(p, [fn], start_time, end_time)), expected)
+      self.assertGreater(len(expected), 0)
+
+
+if __name__ == "__main__":
+  unittest.main()